@@ -0,0 +1,457 @@
+"""
+Pipeline Benchmark Suite.
+
+Measures each stage of the bridge against a simulated target (see
+`target_simulator.py`), so no capture card, HID gadget or target machine is
+needed, and checks the results against per-stage latency budgets and a stored
+baseline:
+
+    python control_node/src/benchmarks.py --baseline        # control_node/bench_baseline.json
+    python control_node/src/benchmarks.py --write-baseline bench_baseline.json
+    python control_node/src/benchmarks.py --baseline bench_baseline.json
+    python control_node/src/benchmarks.py --stages encode,parse --iterations 50
+
+Stages (names are "<group>.<variant>"; --stages selects by prefix):
+- capture.replay: decoding frames of a recorded session (the replay backend)
+- latency.keystroke_to_frame: HID report written until the echo is in a captured
+  frame (the software part of the 200 ms frame-latency requirement)
+- preprocess.full_frame: `VisionPipeline.preprocess_for_ocr`
+- ocr.full_frame / ocr.bands / ocr.lines: `VisionPipeline.recognize` (the structured
+  pass all tools read text through) on the whole frame, on the proposed text
+  blocks, and line by line, each run with an empty OCR cache
+- encode.*: JPEG at several qualities, PNG, and `VisionPipeline.encode_image`
+- parse.dir_listing: `parse_directory_listing` over a 5000-entry listing
+- hid.compile_text: report generation for 1000 characters (dead keys, Alt codes)
+- tool.*: `capture_screen_impl`, `inject_keystrokes_impl` and
+  `scan_directory_impl` end to end
+
+Every stage reports p50/p95/p99/mean/max in milliseconds and the peak Python
+heap (tracemalloc, NumPy buffers included, OpenCV-internal memory not) of one
+extra run. Stages whose dependency is missing (e.g. the Tesseract binary) are
+reported as skipped. The run fails (exit status 1) when a stage's p95 exceeds its
+budget, a stage errors, or a p95 regressed against the baseline by more than the
+tolerance.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import tempfile
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    from .lazy_imports import optional_module
+    from .vision import VisionPipeline, bounding_region
+    from .data_harvester import DataHarvester
+    from .hid import KeyInjector, LAYOUTS, SCANCODE_A, SCANCODE_ESCAPE
+    from .targets import Target
+    from .session_replay import SessionRecorder, SessionReader
+    from .target_simulator import TerminalSimulator
+except ImportError:
+    from lazy_imports import optional_module
+    from vision import VisionPipeline, bounding_region
+    from data_harvester import DataHarvester
+    from hid import KeyInjector, LAYOUTS, SCANCODE_A, SCANCODE_ESCAPE
+    from targets import Target
+    from session_replay import SessionRecorder, SessionReader
+    from target_simulator import TerminalSimulator
+
+cv2 = optional_module("cv2")
+pytesseract = optional_module("pytesseract")
+
+# p95 budgets in milliseconds
+BUDGETS = {
+    "capture.replay": 50,
+    "latency.keystroke_to_frame": 200,
+    "preprocess.full_frame": 100,
+    "ocr.full_frame": 3000,
+    "ocr.bands": 3000,
+    "ocr.lines": 6000,
+    "encode.jpeg_q50": 60,
+    "encode.jpeg_q80": 60,
+    "encode.jpeg_q95": 80,
+    "encode.png": 300,
+    "encode.pipeline": 100,
+    "parse.dir_listing": 200,
+    "hid.compile_text": 50,
+    "tool.capture_screen_raw": 250,
+    "tool.capture_screen_ocr": 4000,
+    "tool.inject_keystrokes": 1500,
+    "tool.scan_directory": 10000,
+}
+DEFAULT_ITERATIONS = 20
+TOOL_ITERATIONS = 3
+WARMUP = 2
+REGRESSION_TOLERANCE = 0.25
+REGRESSION_FLOOR_MS = 1.0  # Differences below this are timer noise
+LISTING_ENTRIES = 5000
+HID_TEXT = ("dir C:\\Users\\sim /s > out.txt & echo Größe: 10 € ^ 5 ê\n" * 20)[:1000]
+LATENCY_TIMEOUT = 2.0
+# Reference results (slowest of three default runs per stage, see manual 3.6)
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bench_baseline.json")
+
+
+class SkipStage(Exception):
+    """A stage cannot run here (missing dependency); the message says why."""
+
+
+def summarize(samples: List[float]) -> Dict:
+    """Nearest-rank percentiles of durations in seconds, in milliseconds."""
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[max(0, math.ceil(q * len(ordered)) - 1)] * 1000, 3)
+    return {"n": len(ordered), "p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99),
+            "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3), "max_ms": pick(1.0)}
+
+
+def run_stage(fn: Callable[[], object], iterations: int = DEFAULT_ITERATIONS, warmup: int = WARMUP) -> Dict:
+    """
+    Times one stage.
+
+    Returns:
+        Dict: The summary (see `summarize`) plus 'peak_kb', or {'skipped': reason}
+            or {'error': message}.
+    """
+    try:
+        for _ in range(warmup):
+            fn()
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - start)
+        # Separate run: tracing allocations would distort the timings
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    except SkipStage as e:
+        return {"skipped": str(e)}
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+    return dict(summarize(samples), peak_kb=round(peak / 1024, 1))
+
+
+def check_results(results: Dict[str, Dict], budgets: Dict[str, float], baseline: Optional[Dict] = None,
+                  tolerance: float = REGRESSION_TOLERANCE) -> List[str]:
+    """
+    Compares stage results with their budgets and an optional baseline.
+
+    Returns:
+        List[str]: One message per violation (empty if the run passes).
+    """
+    failures = []
+    for name, result in results.items():
+        if "error" in result:
+            failures.append(f"{name}: {result['error']}")
+            continue
+        if "skipped" in result:
+            continue
+        p95 = result["p95_ms"]
+        budget = budgets.get(name)
+        if budget is not None and p95 > budget:
+            failures.append(f"{name}: p95 {p95:g} ms exceeds the budget of {budget:g} ms")
+        previous = (baseline or {}).get(name, {}).get("p95_ms")
+        if previous is not None and p95 > previous * (1 + tolerance) and p95 - previous > REGRESSION_FLOOR_MS:
+            failures.append(f"{name}: p95 {p95:g} ms regressed from {previous:g} ms (tolerance {tolerance:.0%})")
+    return failures
+
+
+def directory_listing(entries: int) -> str:
+    """A CMD `dir` listing with the given number of files and directories."""
+    lines = [" Volume in drive C has no label.", "", " Directory of C:\\data", ""]
+    for i in range(entries):
+        if i % 10 == 0:
+            lines.append(f"01/15/2024  09:30 AM    <DIR>          folder {i}")
+        else:
+            lines.append(f"01/15/2024  09:30 AM    {i * 37:>14} file_{i}.log")
+    lines.append(f"{entries} File(s) 123456 bytes")
+    return "\n".join(lines)
+
+
+def text_lines(frame: np.ndarray, threshold: int = 64, padding: int = 2) -> List[List[int]]:
+    """[x, y, width, height] of each text row (bright rows on a dark console)."""
+    rows = (frame.max(axis=2) > threshold).any(axis=1)
+    bands, start = [], None
+    for y, lit in enumerate(np.append(rows, False)):
+        if lit and start is None:
+            start = y
+        elif not lit and start is not None:
+            top = max(0, start - padding)
+            bands.append([0, top, frame.shape[1], min(frame.shape[0], y + padding) - top])
+            start = None
+    return bands
+
+
+class BenchmarkSuite:
+    """
+    Builds the stages around a simulated target and runs them.
+    """
+    def __init__(self, width: int = 1920, height: int = 1080, iterations: int = DEFAULT_ITERATIONS,
+                 session: Optional[str] = None, fps: float = 60.0):
+        """
+        Args:
+            width (int): Frame width of the simulated target.
+            height (int): Frame height of the simulated target.
+            iterations (int): Timed runs per stage (tool stages use at most TOOL_ITERATIONS).
+            session (Optional[str]): Session file for capture.replay (one is recorded from
+                the simulator if omitted).
+            fps (float): Frame rate of the simulated capture.
+        """
+        self.width, self.height, self.fps = width, height, fps
+        self.iterations = iterations
+        self.session = session
+        self.tmp = tempfile.TemporaryDirectory(prefix="vhb-bench-")
+        self.pipeline = VisionPipeline()
+        self._target: Optional[Target] = None
+        self._frame: Optional[np.ndarray] = None
+
+    # --- Fixtures ---
+
+    @property
+    def target(self) -> Target:
+        """Simulated target (no keystroke echo delay, steady cursor)."""
+        if self._target is None:
+            self._target = Target.from_dict({
+                "name": "bench-sim", "layout": "US", "logs_dir": self.tmp.name,
+                "simulator": {"width": self.width, "height": self.height, "fps": self.fps,
+                              "key_latency": 0.0, "command_latency": 0.05, "blink": 0},
+            })
+        return self._target
+
+    @property
+    def frame(self) -> np.ndarray:
+        """A console frame showing a directory listing."""
+        if self._frame is None:
+            sim = TerminalSimulator(width=self.width, height=self.height, key_latency=0.0,
+                                    command_latency=0.0, blink=0)
+            injector = KeyInjector(device_path=os.devnull, layout=sim.layout)
+            for reports in injector.compile_text("dir\ncd ..\ndir\n"):
+                for modifiers, key_code in reports:
+                    sim.feed_report(bytes([modifiers, 0, key_code, 0, 0, 0, 0, 0]))
+            self._frame = sim.render()
+        return self._frame
+
+    def _session_reader(self) -> SessionReader:
+        path = self.session
+        if path is None:
+            path = os.path.join(self.tmp.name, "bench_session.zip")
+            sim = TerminalSimulator(width=self.width, height=self.height, key_latency=0.0,
+                                    command_latency=0.0, blink=0)
+            injector = KeyInjector(device_path=os.devnull, layout=sim.layout)
+            recorder = SessionRecorder(path, target="bench-sim", layout="US", max_pending=1000)
+            for reports in injector.compile_text("dir\necho benchmark\ncd Documents\ndir\n"):
+                for modifiers, key_code in reports:
+                    sim.feed_report(bytes([modifiers, 0, key_code, 0, 0, 0, 0, 0]))
+                    recorder.record_report(modifiers, key_code)
+                recorder.record_frame(sim.render())
+            recorder.close()
+        return SessionReader(path)
+
+    # --- Stages ---
+
+    def _capture_replay(self) -> Callable:
+        reader = self._session_reader()
+        position = [0]
+
+        def grab():
+            frame = reader.frame(position[0] % len(reader))
+            position[0] += 1
+            return frame
+        return grab
+
+    def _keystroke_latency(self) -> Callable:
+        target = self.target
+        period = 1.0 / self.fps
+        count = [0]
+
+        def measure():
+            if count[0] % 50 == 0:  # Keep the input line short
+                target.injector.press_scancode(0, SCANCODE_ESCAPE)
+                time.sleep(3 * period)
+            count[0] += 1
+            before = target.capture.capture_frame()
+            start = time.perf_counter()
+            target.injector.press_scancode(0, SCANCODE_A)  # Includes the 10-30 ms key hold
+            while np.array_equal(target.capture.capture_frame(), before):
+                if time.perf_counter() - start > LATENCY_TIMEOUT:
+                    raise RuntimeError("Keystroke echo did not appear.")
+        return measure
+
+    @staticmethod
+    def _require_ocr():
+        if not pytesseract:
+            raise SkipStage("pytesseract not installed")
+        try:
+            pytesseract.get_tesseract_version()
+        except Exception as e:
+            raise SkipStage(f"tesseract not available ({type(e).__name__})")
+
+    def _ocr_full(self):
+        self._require_ocr()
+        # A new pipeline per run: the per-frame OCR cache would answer repeated runs
+        return VisionPipeline().recognize(self.frame)
+
+    def _ocr_bands(self):
+        self._require_ocr()
+        regions = [bounding_region([r], padding=4) for r in self.pipeline.propose_regions(self.frame)
+                   if r["kind"] == "text"]
+        pipeline = VisionPipeline()
+        return [pipeline.recognize(self.frame, region) for region in regions]
+
+    def _ocr_lines(self):
+        self._require_ocr()
+        pipeline = VisionPipeline()
+        return [pipeline.recognize(self.frame, box) for box in text_lines(self.frame)]
+
+    def _encode(self, ext: str, params: Tuple = ()) -> Callable:
+        def encode():
+            if not cv2:
+                raise SkipStage("OpenCV not installed")
+            ok, buffer = cv2.imencode(ext, self.frame, list(params))
+            if not ok:
+                raise RuntimeError(f"Encoding {ext} failed.")
+            return buffer
+        return encode
+
+    def _tools(self) -> Dict[str, Callable]:
+        try:
+            try:
+                from . import server
+            except ImportError:
+                import server
+        except ImportError as e:
+            raise SkipStage(f"server dependencies missing ({e})")
+        if self.target.name not in server.registry.names():
+            server.registry.add(self.target)
+        name = self.target.name
+
+        def checked(result: str) -> str:
+            if result.startswith("Error"):
+                raise RuntimeError(result)
+            return result
+
+        def capture_ocr():
+            self._require_ocr()
+            return checked(server.capture_screen_impl(mode="ocr_text", target=name))
+
+        def scan():
+            self._require_ocr()
+            return checked(server.scan_directory_impl("C:\\Users\\sim", target=name))
+
+        return {
+            "tool.capture_screen_raw": lambda: checked(server.capture_screen_impl(mode="raw_base64", target=name)),
+            "tool.capture_screen_ocr": capture_ocr,
+            "tool.inject_keystrokes": lambda: checked(server.inject_keystrokes_impl(
+                "echo bench\n", delay_ms=0, verify=False, target=name)),
+            "tool.scan_directory": scan,
+        }
+
+    def stages(self) -> Dict[str, Callable[[], Callable]]:
+        """Stage name -> factory returning the function to time (fixtures are built lazily)."""
+        harvester = DataHarvester(self.tmp.name)
+        listing = directory_listing(LISTING_ENTRIES)
+        stages = {
+            "capture.replay": self._capture_replay,
+            "latency.keystroke_to_frame": self._keystroke_latency,
+            "preprocess.full_frame": lambda: lambda: self.pipeline.preprocess_for_ocr(self.frame),
+            "ocr.full_frame": lambda: self._ocr_full,
+            "ocr.bands": lambda: self._ocr_bands,
+            "ocr.lines": lambda: self._ocr_lines,
+            "encode.pipeline": lambda: lambda: self.pipeline.encode_image(self.frame),
+            "parse.dir_listing": lambda: lambda: harvester.parse_directory_listing(listing),
+            "hid.compile_text": lambda: lambda: KeyInjector(
+                device_path=os.devnull, layout=LAYOUTS["DE"]()).compile_text(HID_TEXT),
+        }
+        if cv2:
+            for quality in (50, 80, 95):
+                stages[f"encode.jpeg_q{quality}"] = (
+                    lambda q=quality: self._encode(".jpg", (cv2.IMWRITE_JPEG_QUALITY, q)))
+            stages["encode.png"] = lambda: self._encode(".png", (cv2.IMWRITE_PNG_COMPRESSION, 3))
+        for name in ("tool.capture_screen_raw", "tool.capture_screen_ocr", "tool.inject_keystrokes",
+                     "tool.scan_directory"):
+            stages[name] = lambda name=name: self._tools()[name]
+        return stages
+
+    def run(self, selected: Optional[List[str]] = None) -> Dict[str, Dict]:
+        """
+        Runs the stages whose name starts with one of `selected` (all if omitted).
+
+        Returns:
+            Dict[str, Dict]: Stage name -> result (see `run_stage`).
+        """
+        results = {}
+        for name, factory in self.stages().items():
+            if selected and not any(name.startswith(prefix) for prefix in selected):
+                continue
+            iterations = min(self.iterations, TOOL_ITERATIONS) if name.startswith("tool.") else self.iterations
+            try:
+                fn = factory()
+            except SkipStage as e:
+                results[name] = {"skipped": str(e)}
+                continue
+            results[name] = run_stage(fn, iterations, warmup=1 if name.startswith("tool.") else WARMUP)
+        return results
+
+    def close(self):
+        if self._target is not None and self._target.simulator is not None:
+            self._target.simulator.stop()
+        self.tmp.cleanup()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages against a simulated target.")
+    parser.add_argument("--stages", help="Comma-separated stage name prefixes (default: all)")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--session", help="Session file for capture.replay (recorded from the simulator if omitted)")
+    parser.add_argument("--budgets", help="JSON file with p95 budgets in ms per stage (merged over the defaults)")
+    parser.add_argument("--baseline", nargs="?", const=DEFAULT_BASELINE,
+                        help="JSON file of a previous run; p95 regressions fail the run "
+                             "(the committed reference baseline if no file is given)")
+    parser.add_argument("--write-baseline", help="Store the stage results as a new baseline")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    budgets = dict(BUDGETS)
+    if args.budgets:
+        with open(args.budgets, encoding="utf-8") as f:
+            budgets.update(json.load(f))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    suite = BenchmarkSuite(args.width, args.height, args.iterations, session=args.session)
+    try:
+        results = suite.run(args.stages.split(",") if args.stages else None)
+    finally:
+        suite.close()
+
+    failures = check_results(results, budgets, baseline, args.tolerance)
+    report = {"stages": results, "failures": failures,
+              "frame": [args.width, args.height], "python": sys.version.split()[0]}
+    if resource is not None:
+        report["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if args.write_baseline:
+        with open(args.write_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    print(json.dumps(report, indent=2))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,369 @@
+"""
+Capture Mode Negotiation Module.
+
+Many UVC HDMI capture dongles default to a slow mode (e.g. raw YUYV at 5 fps
+for 1080p) unless the pixel format is requested explicitly. This module:
+
+- describes capture modes (FOURCC, resolution, FPS),
+- probes the modes a device offers (`v4l2-ctl --list-formats-ext` if available,
+  otherwise by requesting candidate modes and reading back what the driver accepted),
+- benchmarks modes for delivered frame rate, read latency and CPU cost per frame,
+- persists the best mode per device in a JSON profile file, which `ScreenCapture`
+  uses when no mode is configured explicitly.
+"""
+
+import os
+import json
+import re
+import shutil
+import subprocess
+import threading
+import time
+import logging
+from typing import Callable, Dict, List, Optional
+
+try:
+    from .lazy_imports import optional_module
+except ImportError:
+    from lazy_imports import optional_module
+
+cv2 = optional_module("cv2")
+
+# Modes worth trying on typical HDMI dongles when the driver cannot be queried
+DEFAULT_CANDIDATES = [
+    ("MJPG", 1920, 1080, 60), ("MJPG", 1920, 1080, 30),
+    ("YUYV", 1920, 1080, 5), ("NV12", 1920, 1080, 30),
+    ("MJPG", 1280, 720, 60), ("YUYV", 1280, 720, 10),
+]
+
+# Host state next to the other runtime files (the logs directory), not in the source tree
+PROFILES_PATH = os.environ.get("VHB_CAPTURE_PROFILES", os.path.join("logs", "capture_profiles.json"))
+
+
+class CaptureMode:
+    """
+    A capture mode: pixel format (FOURCC), resolution and frame rate.
+    """
+    def __init__(self, fourcc: Optional[str] = None, width: int = 1920, height: int = 1080,
+                 fps: Optional[float] = None):
+        """
+        Args:
+            fourcc (Optional[str]): Pixel format, e.g. "MJPG", "YUYV" (driver default if None).
+            width (int): Frame width in pixels.
+            height (int): Frame height in pixels.
+            fps (Optional[float]): Frame rate (driver default if None).
+        """
+        self.fourcc = fourcc.upper() if fourcc else None
+        self.width = int(width)
+        self.height = int(height)
+        self.fps = float(fps) if fps else None
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "CaptureMode":
+        return cls(data.get("fourcc"), data.get("width", 1920), data.get("height", 1080), data.get("fps"))
+
+    def to_dict(self) -> Dict:
+        return {"fourcc": self.fourcc, "width": self.width, "height": self.height, "fps": self.fps}
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CaptureMode) and self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        fps = f"@{self.fps:g}" if self.fps else ""
+        return f"{self.fourcc or 'default'} {self.width}x{self.height}{fps}"
+
+
+def fourcc_code(fourcc: str) -> int:
+    """Packs a 4-character code into the integer OpenCV expects."""
+    fourcc = (fourcc + "    ")[:4]
+    return sum(ord(c) << (8 * i) for i, c in enumerate(fourcc))
+
+
+def fourcc_name(code) -> Optional[str]:
+    """Unpacks an OpenCV FOURCC integer (None if it is not a readable code)."""
+    try:
+        code = int(code)
+    except (TypeError, ValueError):
+        return None
+    name = "".join(chr((code >> (8 * i)) & 0xFF) for i in range(4))
+    return name.strip() if name.strip().isprintable() and name.strip() else None
+
+
+def apply_mode(cap, mode: CaptureMode):
+    """
+    Requests a mode on an opened `cv2.VideoCapture`.
+
+    The FOURCC is set before the resolution: several UVC drivers only offer the
+    high resolutions/frame rates after switching to a compressed format.
+    """
+    if mode.fourcc:
+        cap.set(cv2.CAP_PROP_FOURCC, fourcc_code(mode.fourcc))
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, mode.width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, mode.height)
+    if mode.fps:
+        cap.set(cv2.CAP_PROP_FPS, mode.fps)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+
+def read_mode(cap) -> Optional[CaptureMode]:
+    """Reads back the mode the driver actually configured (None if unreadable)."""
+    try:
+        return CaptureMode(fourcc_name(cap.get(cv2.CAP_PROP_FOURCC)),
+                           int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                           int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                           float(cap.get(cv2.CAP_PROP_FPS)) or None)
+    except (TypeError, ValueError):
+        return None
+
+
+def mode_accepted(requested: CaptureMode, actual: Optional[CaptureMode]) -> bool:
+    """Whether the driver configured the requested mode (unset fields are not compared)."""
+    if actual is None:
+        return False
+    return ((not requested.fourcc or not actual.fourcc or actual.fourcc == requested.fourcc)
+            and actual.width == requested.width and actual.height == requested.height
+            and (not requested.fps or not actual.fps or abs(actual.fps - requested.fps) < 1))
+
+
+def parse_v4l2_formats(text: str) -> List[CaptureMode]:
+    """
+    Parses the output of `v4l2-ctl --list-formats-ext` into capture modes.
+
+    Args:
+        text (str): Command output.
+
+    Returns:
+        List[CaptureMode]: One mode per (format, size, frame interval).
+    """
+    modes = []
+    fourcc, size = None, None
+    for line in text.splitlines():
+        m = re.search(r"\[\d+\]:\s*'(\w{1,4})'", line)
+        if m:
+            fourcc, size = m.group(1), None
+            continue
+        m = re.search(r"Size:\s*\w+\s+(\d+)x(\d+)", line)
+        if m:
+            size = (int(m.group(1)), int(m.group(2)))
+            continue
+        m = re.search(r"Interval:.*\(([\d.]+)\s*fps\)", line)
+        if m and fourcc and size:
+            modes.append(CaptureMode(fourcc, size[0], size[1], float(m.group(1))))
+    return modes
+
+
+def device_key(device_id: int) -> str:
+    """Identifies a capture device for the profile file (index plus card name if known)."""
+    name_path = f"/sys/class/video4linux/video{device_id}/name"
+    try:
+        with open(name_path, 'r') as f:
+            return f"video{device_id}:{f.read().strip()}"
+    except OSError:
+        return f"video{device_id}"
+
+
+def probe_modes(device_id: int, open_capture: Optional[Callable] = None,
+                candidates: Optional[List[CaptureMode]] = None) -> List[CaptureMode]:
+    """
+    Lists the modes a device supports.
+
+    Uses `v4l2-ctl --list-formats-ext` when installed. Otherwise each candidate mode
+    is requested and kept if the driver accepted it unchanged.
+
+    Args:
+        device_id (int): Video device index.
+        open_capture (Optional[Callable]): Returns an opened VideoCapture for the device
+            (default `cv2.VideoCapture(device_id)`).
+        candidates (Optional[List[CaptureMode]]): Modes to try (default `DEFAULT_CANDIDATES`).
+
+    Returns:
+        List[CaptureMode]: Supported modes.
+    """
+    if open_capture is None and shutil.which("v4l2-ctl"):
+        try:
+            out = subprocess.run(["v4l2-ctl", "-d", f"/dev/video{device_id}", "--list-formats-ext"],
+                                 capture_output=True, text=True, timeout=5).stdout
+            modes = parse_v4l2_formats(out)
+            if modes:
+                return modes
+        except (OSError, subprocess.SubprocessError) as e:
+            logging.debug(f"v4l2-ctl probe failed: {e}")
+
+    if open_capture is None:
+        open_capture = lambda: cv2.VideoCapture(device_id)
+    candidates = candidates or [CaptureMode(*c) for c in DEFAULT_CANDIDATES]
+    supported = []
+    for mode in candidates:
+        cap = open_capture()
+        try:
+            if not cap.isOpened():
+                continue
+            apply_mode(cap, mode)
+            if mode_accepted(mode, read_mode(cap)):
+                supported.append(mode)
+        finally:
+            cap.release()
+    return supported
+
+
+def delivered_fps(capture, completions: List[float]) -> Optional[float]:
+    """
+    Frame rate the device delivers.
+
+    Taken from the capture's own read timestamps (`measured_fps()`, fed by single
+    `read()`/`DQBUF` calls) when it records them. Sources without read timing fall
+    back to the median spacing of consecutive `capture_frame()` returns.
+    """
+    measured = getattr(capture, "measured_fps", None)
+    if callable(measured):
+        fps = measured()
+        if fps:
+            return fps
+    intervals = sorted(b - a for a, b in zip(completions, completions[1:]))
+    if not intervals:
+        return None
+    median = intervals[len(intervals) // 2]
+    return round(1.0 / median, 1) if median > 0 else None
+
+
+def benchmark_mode(capture, frames: int = 20, warmup: int = 3) -> Dict:
+    """
+    Measures one opened capture (anything with `capture_frame()`).
+
+    The frame rate and the per-call latency are separate measurements: a
+    `capture_frame()` call drains the buffer with several reads, so its duration
+    is what a tool waits for a fresh frame, while the frame rate comes from the
+    spacing of single reads (see `delivered_fps`).
+
+    Args:
+        capture: Capture object configured for the mode under test (a `ScreenCapture`,
+            or a replay/synthetic source with the same interface).
+        frames (int): Number of timed frames.
+        warmup (int): Frames read before timing (device start-up).
+
+    Returns:
+        Dict: 'fps' (delivered), 'latency_ms' (mean capture_frame duration), 'cpu_ms'
+            (process CPU time per frame), 'frames' and 'shape'; 'error' on failure.
+    """
+    try:
+        for _ in range(warmup):
+            capture.capture_frame()
+        intervals = getattr(capture, "read_intervals", None)
+        if intervals is not None:
+            intervals.clear()  # Start-up reads are not representative
+        shape, latency, completions = None, 0.0, []
+        cpu = time.process_time()
+        for _ in range(frames):
+            start = time.perf_counter()
+            frame = capture.capture_frame()
+            completions.append(time.perf_counter())
+            latency += completions[-1] - start
+            shape = list(getattr(frame, "shape", []))
+        cpu = time.process_time() - cpu
+        fps = delivered_fps(capture, completions)
+    except Exception as e:
+        return {"error": str(e)}
+    return {
+        "fps": fps,
+        "latency_ms": round(1000.0 * latency / frames, 2),
+        "cpu_ms": round(1000.0 * cpu / frames, 2),
+        "frames": frames,
+        "shape": shape,
+    }
+
+
+def select_best(results: List[Dict], min_height: int = 1080) -> Optional[Dict]:
+    """
+    Picks the best benchmarked mode.
+
+    Modes reaching `min_height` (text legibility) are preferred; among them the one
+    with the lowest read latency plus CPU time per frame wins. The latency already
+    includes the wait for a fresh frame, so the frame interval is not added again;
+    the frame rate only decides whether a mode delivered frames at all.
+    """
+    usable = [r for r in results if "error" not in r["benchmark"] and r["benchmark"].get("fps")]
+    if not usable:
+        return None
+    tall = [r for r in usable if r["mode"]["height"] >= min_height]
+    pool = tall or usable
+
+    def cost(r):
+        b = r["benchmark"]
+        return b["latency_ms"] + b["cpu_ms"]
+    return min(pool, key=cost)
+
+
+class CaptureProfiles:
+    """
+    Persists the best capture mode per device in a JSON file.
+    """
+    def __init__(self, path: str = PROFILES_PATH):
+        """
+        Args:
+            path (str): Profile file path (`VHB_CAPTURE_PROFILES`).
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self) -> Dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable capture profiles {self.path}: {e}")
+            return {}
+
+    def load(self, key: str) -> Optional[CaptureMode]:
+        """Returns the stored mode for a device key (None if unknown)."""
+        with self._lock:
+            entry = self._read().get(key)
+        return CaptureMode.from_dict(entry["mode"]) if entry else None
+
+    def save(self, key: str, mode: CaptureMode, results: Optional[List[Dict]] = None):
+        """Stores the best mode (and the benchmark results) for a device key."""
+        with self._lock:
+            data = self._read()
+            data[key] = {"mode": mode.to_dict(), "results": results or [],
+                         "updated": time.strftime("%Y-%m-%d %H:%M:%S")}
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'w') as f:
+                json.dump(data, f, indent=2)
+
+
+def negotiate(device_id: int, factory: Callable[[CaptureMode], object], frames: int = 20,
+              min_height: int = 1080, modes: Optional[List[CaptureMode]] = None,
+              profiles: Optional[CaptureProfiles] = None) -> Dict:
+    """
+    Probes (unless `modes` is given), benchmarks every mode and persists the best one.
+
+    Args:
+        device_id (int): Video device index.
+        factory (Callable[[CaptureMode], object]): Creates a capture for a mode
+            (must provide `capture_frame()`; `release()` is called afterwards if present).
+        frames (int): Timed frames per mode.
+        min_height (int): Preferred minimum frame height.
+        modes (Optional[List[CaptureMode]]): Modes to benchmark (probed if omitted).
+        profiles (Optional[CaptureProfiles]): Profile store (default file if omitted).
+
+    Returns:
+        Dict: {'device', 'results': [{'mode', 'benchmark'}], 'best': mode dict or None}.
+    """
+    modes = modes if modes is not None else probe_modes(device_id)
+    results = []
+    for mode in modes:
+        capture = factory(mode)
+        try:
+            results.append({"mode": mode.to_dict(), "benchmark": benchmark_mode(capture, frames)})
+        finally:
+            release = getattr(capture, "release", None)
+            if callable(release):
+                release()
+
+    key = device_key(device_id)
+    best = select_best(results, min_height)
+    if best is not None:
+        (profiles or CaptureProfiles()).save(key, CaptureMode.from_dict(best["mode"]), results)
+    return {"device": key, "results": results, "best": best["mode"] if best else None}
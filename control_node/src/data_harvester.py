@@ -9,8 +9,14 @@ import os
 import json
 import time
 import re
+import logging
 from typing import List, Dict, Optional
 
+try:
+    from .metrics import timed
+except ImportError:
+    from metrics import timed
+
 class DataHarvester:
     """
     Handles persistence and structuring of captured data.
@@ -29,6 +35,7 @@ class DataHarvester:
         if not os.path.exists(self.logs_dir):
             os.makedirs(self.logs_dir)
 
+    @timed("parse_listing")
     def parse_directory_listing(self, text: str) -> Dict:
         """
         Parses the text output of a 'dir' command (Windows CMD style) into a dictionary.
@@ -107,6 +114,7 @@ class DataHarvester:
             "raw_text": text
         }
 
+    @timed("save_scan")
     def save_scan(self, path: str, structure: Dict) -> str:
         """
         Saves the structured scan data to a JSON file.
@@ -132,6 +140,31 @@ class DataHarvester:
 
         return filepath
 
+    @timed("save_blob")
+    def save_blob(self, path: str, data: bytes) -> str:
+        """
+        Saves raw bytes transferred from the target (e.g. via the optical channel).
+
+        Args:
+            path (str): The original path on the target (used for naming).
+            data (bytes): The file content.
+
+        Returns:
+            str: The full filepath of the saved file.
+        """
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
+        safe_path = path.replace("/", "_").replace("\\", "_").replace(":", "").strip("_")
+        if not safe_path: safe_path = "root"
+
+        filename = f"optical_{safe_path}_{timestamp}.bin"
+        filepath = os.path.join(self.logs_dir, filename)
+
+        with open(filepath, 'wb') as f:
+            f.write(data)
+
+        return filepath
+
+    @timed("log_write")
     def log_ocr_stream(self, text: str):
         """
         Appends a block of OCR text to a daily log file.
@@ -152,4 +185,4 @@ class DataHarvester:
             with open(filepath, 'a') as f:
                 f.write(entry)
         except Exception as e:
-            print(f"Failed to write to OCR log: {e}")
+            logging.error(f"Failed to write to OCR log: {e}")
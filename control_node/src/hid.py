@@ -3,14 +3,26 @@ HID Injection Module.
 
 This module manages the low-level injection of keystrokes into the
 USB Gadget HID interface (typically /dev/hidg0). It supports
-different keyboard layouts (US, German ISO) and handles modifier keys.
+different keyboard layouts and handles modifier keys.
+
+Layouts are data files in `control_node/layouts/` (one JSON file per layout code,
+plus `_common.json` with the named keys and modifiers). They are compiled once into
+lookup tables, so typing and reverse lookups are plain dictionary/list accesses.
 """
 
 import os
+import json
 import time
 import random
+import logging
 import struct
-from typing import Dict, Tuple, List
+import functools
+from typing import Callable, Dict, Tuple, List, Optional
+
+try:
+    from .metrics import METRICS, RATE_BUCKETS, span
+except ImportError:
+    from metrics import METRICS, RATE_BUCKETS, span
 
 # HID Scancodes (Usage ID)
 # Reference: USB HID Usage Tables
@@ -49,219 +61,233 @@ MOD_RSHIFT = 0x20
 MOD_RALT = 0x40 # AltGr
 MOD_RGUI = 0x80
 
+# Modifier for each level of a layout file's key entries
+LEVEL_MODIFIERS = (MOD_NONE, MOD_LSHIFT, MOD_RALT, MOD_RALT | MOD_LSHIFT)
+
+LAYOUTS_DIR = os.environ.get("VHB_LAYOUTS_DIR",
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "layouts"))
+COMMON_FILE = "_common.json"
+
+Stroke = Tuple[int, int]
+
+def _load_json(path: str) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+@functools.lru_cache(maxsize=None)
+def _common_tables(directory: str) -> Dict:
+    """Named keys, modifiers and text characters shared by all layouts."""
+    data = _load_json(os.path.join(directory, COMMON_FILE))
+    named = {name: int(code, 16) for name, code in data["named_keys"].items()}
+    for alias, name in data.get("aliases", {}).items():
+        named[alias] = named[name]
+    return {
+        "named_keys": named,
+        "modifiers": {name: int(mask, 16) for name, mask in data["modifiers"].items()},
+        "text": {char: named[name] for char, name in data["text"].items()},
+    }
+
+def _level(modifiers: int) -> Optional[int]:
+    """Layout level (index into LEVEL_MODIFIERS) for a modifier mask, None if it is a shortcut."""
+    if modifiers & ~(MOD_LSHIFT | MOD_RSHIFT | MOD_RALT):
+        return None
+    return (1 if modifiers & (MOD_LSHIFT | MOD_RSHIFT) else 0) + (2 if modifiers & MOD_RALT else 0)
+
+@functools.lru_cache(maxsize=None)
+def compile_layout(path: str) -> Dict:
+    """
+    Compiles a layout file into lookup tables (cached per file).
+
+    Returns:
+        Dict: 'code', 'name', 'mapping' (char -> (modifier, scancode) for characters
+            produced by one key), 'strokes' (char -> tuple of (modifier, scancode),
+            including dead-key compositions), 'reverse' (flat list indexed by
+            level * 256 + scancode -> char) and 'dead_keys' (char -> stroke).
+    """
+    data = _load_json(path)
+    common = _common_tables(os.path.dirname(path))
+
+    mapping: Dict[str, Stroke] = {}
+    reverse: List[Optional[str]] = [None] * (len(LEVEL_MODIFIERS) * 256)
+    for key, chars in data["keys"].items():
+        code = int(key, 16)
+        for level, char in enumerate(chars):
+            if char is None:
+                continue
+            reverse[level * 256 + code] = char
+            mapping.setdefault(char, (LEVEL_MODIFIERS[level], code))
+    for char, code in common["text"].items():
+        mapping.setdefault(char, (MOD_NONE, code))
+        reverse[code] = reverse[code] or char
+
+    strokes: Dict[str, Tuple[Stroke, ...]] = {char: (stroke,) for char, stroke in mapping.items()}
+    dead_keys: Dict[str, Stroke] = {}
+    for dead, spec in data.get("dead_keys", {}).items():
+        stroke = (LEVEL_MODIFIERS[spec["level"]], int(spec["key"], 16))
+        dead_keys[dead] = stroke
+        reverse[spec["level"] * 256 + stroke[1]] = dead
+        for base, composed in spec["compose"].items():
+            if composed not in strokes and base in mapping:
+                strokes[composed] = (stroke, mapping[base])
+
+    return {"code": data["code"], "name": data.get("name", data["code"]), "mapping": mapping,
+            "strokes": strokes, "reverse": reverse, "dead_keys": dead_keys}
+
 class Layout:
-    """Base class for Keyboard Layouts."""
-    def __init__(self):
-        """Initializes an empty layout mapping."""
-        self.mapping: Dict[str, Tuple[int, int]] = {}
+    """
+    Keyboard layout compiled from a data file in `LAYOUTS_DIR`.
+
+    A layout file lists, per USB usage ID, the characters of each level (plain,
+    Shift, AltGr, Shift+AltGr) plus the dead keys and what they compose with.
+    Named keys and modifiers come from `_common.json` and are the same everywhere.
+    """
+    CODE = ""
+
+    def __init__(self, code: Optional[str] = None, directory: Optional[str] = None):
+        """
+        Args:
+            code (Optional[str]): Layout code, i.e. the file name without '.json'
+                (defaults to the class's CODE).
+            directory (Optional[str]): Layout directory (defaults to LAYOUTS_DIR).
+        """
+        directory = os.path.abspath(directory or LAYOUTS_DIR)
+        tables = compile_layout(os.path.join(directory, f"{(code or self.CODE).lower()}.json"))
+        self.code: str = tables["code"]
+        self.name: str = tables["name"]
+        self.mapping: Dict[str, Stroke] = tables["mapping"]
+        self.strokes: Dict[str, Tuple[Stroke, ...]] = tables["strokes"]
+        self.dead_keys: Dict[str, Stroke] = tables["dead_keys"]
+        self._reverse: List[Optional[str]] = tables["reverse"]
+        common = _common_tables(directory)
+        self.named_keys: Dict[str, int] = common["named_keys"]
+        self.modifiers: Dict[str, int] = common["modifiers"]
 
     def get_scancode(self, char: str) -> Tuple[int, int]:
-        """Returns (modifier, scancode) for a given character."""
+        """Returns (modifier, scancode) for a character typed with a single key ((0, 0) if none)."""
         return self.mapping.get(char, (MOD_NONE, 0x00))
 
+    def get_strokes(self, char: str) -> Optional[Tuple[Stroke, ...]]:
+        """Returns the keystrokes producing a character (two for dead-key compositions), or None."""
+        return self.strokes.get(char)
+
+    def get_char(self, modifiers: int, key_code: int) -> Optional[str]:
+        """Returns the character a keystroke produces (None for shortcuts and unmapped keys)."""
+        level = _level(modifiers)
+        if level is None or not 0 <= key_code < 256:
+            return None
+        return self._reverse[level * 256 + key_code]
+
+    def unmapped(self, text: str) -> List[str]:
+        """Returns the distinct characters of `text` this layout cannot type, in order."""
+        return list(dict.fromkeys(char for char in text if char not in self.strokes))
+
+    def key_code(self, key_name: str) -> int:
+        """Usage ID for a named key ('F13', 'PGUP', 'KP_5', ...) or a single character, 0 if unknown."""
+        code = self.named_keys.get(key_name.upper(), 0)
+        if code == 0 and len(key_name) == 1:
+            code = self.get_scancode(key_name.lower())[1] or self.get_scancode(key_name)[1]
+        return code
+
 class USLayout(Layout):
+    """US QWERTY Keyboard Layout (layouts/us.json)."""
+    CODE = "US"
+
+    def __init__(self, directory: Optional[str] = None):
+        super().__init__(directory=directory)
+
+class GermanISO(Layout):
+    """German ISO (QWERTZ) Keyboard Layout (layouts/de.json)."""
+    CODE = "DE"
+
+    def __init__(self, directory: Optional[str] = None):
+        super().__init__(directory=directory)
+
+def available_layouts(directory: Optional[str] = None) -> Dict[str, Callable[[], Layout]]:
+    """
+    Layout factories for every layout file in a directory, keyed by layout code.
+
+    US and DE keep their dedicated classes; any other file is loaded as a plain Layout,
+    so adding a layout only needs a new data file.
     """
-    US QWERTY Keyboard Layout Mapping.
+    directory = directory or LAYOUTS_DIR
+    factories: Dict[str, Callable[[], Layout]] = {}
+    if os.path.isdir(directory):
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(".json") and not filename.startswith("_"):
+                code = filename[:-len(".json")].upper()
+                factories[code] = functools.partial(Layout, code, directory)
+    for cls in (USLayout, GermanISO):
+        if cls.CODE in factories:
+            factories[cls.CODE] = functools.partial(cls, directory)
+    return factories
+
+# Layout codes as used by layout detection and the target configuration
+LAYOUTS = available_layouts()
+
+# Unicode fallback: characters the layout cannot type are entered through an
+# OS input method. Each encoder returns the HID reports for one character
+# (None if the method cannot produce it).
+Report = Tuple[int, int]
+
+def _tap(modifiers: int, key_code: int, held: int = MOD_NONE) -> List[Report]:
+    """Press and release of one key while `held` modifiers stay down."""
+    return [(modifiers | held, key_code), (held, 0)]
+
+def windows_alt_reports(char: str, layout: Layout) -> Optional[List[Report]]:
     """
-    def __init__(self):
-        """Initializes the US QWERTY mapping."""
-        super().__init__()
-        # Basic lowercase (a-z)
-        self.mapping['a'] = (MOD_NONE, 0x04)
-        self.mapping['b'] = (MOD_NONE, 0x05)
-        self.mapping['c'] = (MOD_NONE, 0x06)
-        self.mapping['d'] = (MOD_NONE, 0x07)
-        self.mapping['e'] = (MOD_NONE, 0x08)
-        self.mapping['f'] = (MOD_NONE, 0x09)
-        self.mapping['g'] = (MOD_NONE, 0x0A)
-        self.mapping['h'] = (MOD_NONE, 0x0B)
-        self.mapping['i'] = (MOD_NONE, 0x0C)
-        self.mapping['j'] = (MOD_NONE, 0x0D)
-        self.mapping['k'] = (MOD_NONE, 0x0E)
-        self.mapping['l'] = (MOD_NONE, 0x0F)
-        self.mapping['m'] = (MOD_NONE, 0x10)
-        self.mapping['n'] = (MOD_NONE, 0x11)
-        self.mapping['o'] = (MOD_NONE, 0x12)
-        self.mapping['p'] = (MOD_NONE, 0x13)
-        self.mapping['q'] = (MOD_NONE, 0x14)
-        self.mapping['r'] = (MOD_NONE, 0x15)
-        self.mapping['s'] = (MOD_NONE, 0x16)
-        self.mapping['t'] = (MOD_NONE, 0x17)
-        self.mapping['u'] = (MOD_NONE, 0x18)
-        self.mapping['v'] = (MOD_NONE, 0x19)
-        self.mapping['w'] = (MOD_NONE, 0x1A)
-        self.mapping['x'] = (MOD_NONE, 0x1B)
-        self.mapping['y'] = (MOD_NONE, 0x1C)
-        self.mapping['z'] = (MOD_NONE, 0x1D)
-
-        # Numbers
-        self.mapping['1'] = (MOD_NONE, 0x1E)
-        self.mapping['2'] = (MOD_NONE, 0x1F)
-        self.mapping['3'] = (MOD_NONE, 0x20)
-        self.mapping['4'] = (MOD_NONE, 0x21)
-        self.mapping['5'] = (MOD_NONE, 0x22)
-        self.mapping['6'] = (MOD_NONE, 0x23)
-        self.mapping['7'] = (MOD_NONE, 0x24)
-        self.mapping['8'] = (MOD_NONE, 0x25)
-        self.mapping['9'] = (MOD_NONE, 0x26)
-        self.mapping['0'] = (MOD_NONE, 0x27)
-
-        # Uppercase (Shift)
-        for char, (mod, code) in list(self.mapping.items()):
-            if char.isalpha():
-                self.mapping[char.upper()] = (MOD_LSHIFT, code)
-
-        # Special Characters US
-        self.mapping['!'] = (MOD_LSHIFT, 0x1E)
-        self.mapping['@'] = (MOD_LSHIFT, 0x1F)
-        self.mapping['#'] = (MOD_LSHIFT, 0x20)
-        self.mapping['$'] = (MOD_LSHIFT, 0x21)
-        self.mapping['%'] = (MOD_LSHIFT, 0x22)
-        self.mapping['^'] = (MOD_LSHIFT, 0x23)
-        self.mapping['&'] = (MOD_LSHIFT, 0x24)
-        self.mapping['*'] = (MOD_LSHIFT, 0x25)
-        self.mapping['('] = (MOD_LSHIFT, 0x26)
-        self.mapping[')'] = (MOD_LSHIFT, 0x27)
-
-        self.mapping['-'] = (MOD_NONE, 0x2D)
-        self.mapping['_'] = (MOD_LSHIFT, 0x2D)
-        self.mapping['='] = (MOD_NONE, 0x2E)
-        self.mapping['+'] = (MOD_LSHIFT, 0x2E)
-        self.mapping['['] = (MOD_NONE, 0x2F)
-        self.mapping['{'] = (MOD_LSHIFT, 0x2F)
-        self.mapping[']'] = (MOD_NONE, 0x30)
-        self.mapping['}'] = (MOD_LSHIFT, 0x30)
-        self.mapping['\\'] = (MOD_NONE, 0x31)
-        self.mapping['|'] = (MOD_LSHIFT, 0x31)
-        self.mapping[';'] = (MOD_NONE, 0x33)
-        self.mapping[':'] = (MOD_LSHIFT, 0x33)
-        self.mapping["'"] = (MOD_NONE, 0x34)
-        self.mapping['"'] = (MOD_LSHIFT, 0x34)
-        self.mapping['`'] = (MOD_NONE, 0x35)
-        self.mapping['~'] = (MOD_LSHIFT, 0x35)
-        self.mapping[','] = (MOD_NONE, 0x36)
-        self.mapping['<'] = (MOD_LSHIFT, 0x36)
-        self.mapping['.'] = (MOD_NONE, 0x37)
-        self.mapping['>'] = (MOD_LSHIFT, 0x37)
-        self.mapping['/'] = (MOD_NONE, 0x38)
-        self.mapping['?'] = (MOD_LSHIFT, 0x38)
-
-        # Other symbols
-        self.mapping[' '] = (MOD_NONE, SCANCODE_SPACE)
-        self.mapping['\n'] = (MOD_NONE, SCANCODE_ENTER)
-        self.mapping['\t'] = (MOD_NONE, SCANCODE_TAB)
+    Windows Alt code: hold Left Alt, type the decimal code on the numpad, release Alt.
 
-class GermanISO(Layout):
+    Alt+0nnn enters the character with ANSI code nnn (cp1252); codes without the
+    leading zero use the OEM code page (cp437), which covers box drawing and a few
+    Greek/math symbols. Needs NumLock on.
+    """
+    for prefix, codepage in (("0", "cp1252"), ("", "cp437")):
+        try:
+            value = char.encode(codepage)
+        except UnicodeEncodeError:
+            continue
+        if len(value) != 1 or value[0] < 0x20:
+            continue
+        reports = [(MOD_LALT, 0)]
+        for digit in prefix + str(value[0]):
+            reports += _tap(MOD_NONE, layout.named_keys[f"KP_{digit}"], held=MOD_LALT)
+        return reports + [(MOD_NONE, 0)]
+    return None
+
+def windows_hex_reports(char: str, layout: Layout) -> Optional[List[Report]]:
     """
-    German ISO Keyboard Layout Mapping.
+    Windows hex numpad input: hold Alt, press numpad '+', type the code point in hex.
+
+    Covers the whole Basic Multilingual Plane but needs the registry value
+    HKCU\\Control Panel\\Input Method\\EnableHexNumpad = "1" (and a re-login).
     """
-    def __init__(self):
-        """Initializes the German ISO (QWERTZ) mapping."""
-        super().__init__()
-        # Basic lowercase (a-z)
-        # Note: In German layout, Z and Y are swapped compared to US QWERTY
-        # But scancodes are positional.
-        # QWERTY: q=0x14, w=0x1a, ...
-        # QWERTZ: q=0x14, w=0x1a, ... z (pos y)=0x1d, y (pos z)=0x1c
-
-        # We map characters to the USB Usage IDs.
-        # The OS maps Usage ID -> Character based on configured layout.
-        # If the target OS is set to German, pressing Usage ID 0x1D (Z position on US) produces 'y'.
-        # Wait, if target is German:
-        # Key labeled 'Z' is at 0x1C (Y position on US).
-        # Key labeled 'Y' is at 0x1D (Z position on US).
-
-        # Let's define based on "What key do I press on a German keyboard to get 'x'?"
-
-        # Lowercase
-        self.mapping['a'] = (MOD_NONE, 0x04)
-        self.mapping['b'] = (MOD_NONE, 0x05)
-        self.mapping['c'] = (MOD_NONE, 0x06)
-        self.mapping['d'] = (MOD_NONE, 0x07)
-        self.mapping['e'] = (MOD_NONE, 0x08)
-        self.mapping['f'] = (MOD_NONE, 0x09)
-        self.mapping['g'] = (MOD_NONE, 0x0A)
-        self.mapping['h'] = (MOD_NONE, 0x0B)
-        self.mapping['i'] = (MOD_NONE, 0x0C)
-        self.mapping['j'] = (MOD_NONE, 0x0D)
-        self.mapping['k'] = (MOD_NONE, 0x0E)
-        self.mapping['l'] = (MOD_NONE, 0x0F)
-        self.mapping['m'] = (MOD_NONE, 0x10)
-        self.mapping['n'] = (MOD_NONE, 0x11)
-        self.mapping['o'] = (MOD_NONE, 0x12)
-        self.mapping['p'] = (MOD_NONE, 0x13)
-        self.mapping['q'] = (MOD_NONE, 0x14)
-        self.mapping['r'] = (MOD_NONE, 0x15)
-        self.mapping['s'] = (MOD_NONE, 0x16)
-        self.mapping['t'] = (MOD_NONE, 0x17)
-        self.mapping['u'] = (MOD_NONE, 0x18)
-        self.mapping['v'] = (MOD_NONE, 0x19)
-        self.mapping['w'] = (MOD_NONE, 0x1A)
-        self.mapping['x'] = (MOD_NONE, 0x1B)
-        self.mapping['y'] = (MOD_NONE, 0x1D) # Pos Z on US
-        self.mapping['z'] = (MOD_NONE, 0x1C) # Pos Y on US
-
-        # Numbers
-        self.mapping['1'] = (MOD_NONE, 0x1E)
-        self.mapping['2'] = (MOD_NONE, 0x1F)
-        self.mapping['3'] = (MOD_NONE, 0x20)
-        self.mapping['4'] = (MOD_NONE, 0x21)
-        self.mapping['5'] = (MOD_NONE, 0x22)
-        self.mapping['6'] = (MOD_NONE, 0x23)
-        self.mapping['7'] = (MOD_NONE, 0x24)
-        self.mapping['8'] = (MOD_NONE, 0x25)
-        self.mapping['9'] = (MOD_NONE, 0x26)
-        self.mapping['0'] = (MOD_NONE, 0x27)
-
-        # Uppercase (Shift)
-        for char, (mod, code) in list(self.mapping.items()):
-            if char.isalpha():
-                self.mapping[char.upper()] = (MOD_LSHIFT, code)
-
-        # Special German Characters (Shifted Numbers)
-        self.mapping['!'] = (MOD_LSHIFT, 0x1E) # Shift+1
-        self.mapping['"'] = (MOD_LSHIFT, 0x1F) # Shift+2
-        self.mapping['§'] = (MOD_LSHIFT, 0x20) # Shift+3
-        self.mapping['$'] = (MOD_LSHIFT, 0x21) # Shift+4
-        self.mapping['%'] = (MOD_LSHIFT, 0x22) # Shift+5
-        self.mapping['&'] = (MOD_LSHIFT, 0x23) # Shift+6
-        self.mapping['/'] = (MOD_LSHIFT, 0x24) # Shift+7
-        self.mapping['('] = (MOD_LSHIFT, 0x25) # Shift+8
-        self.mapping[')'] = (MOD_LSHIFT, 0x26) # Shift+9
-        self.mapping['='] = (MOD_LSHIFT, 0x27) # Shift+0
-
-        # Other symbols
-        self.mapping[' '] = (MOD_NONE, SCANCODE_SPACE)
-        self.mapping['\n'] = (MOD_NONE, SCANCODE_ENTER)
-        self.mapping['\t'] = (MOD_NONE, SCANCODE_TAB)
-
-        self.mapping['ß'] = (MOD_NONE, 0x2D) # Key right of 0
-        self.mapping['?'] = (MOD_LSHIFT, 0x2D)
-
-        self.mapping['+'] = (MOD_NONE, 0x30) # Key right of P (ü/+] in DE, ] in US) wait..
-        # DE Layout:
-        # Row QWERTYUIOP Ü +
-        # Row ASDFGHJKL Ö Ä #
-        # Row YXCVBNM , . -
-        # Row <
-
-        # Let's approximate common CLI chars for DE layout
-        self.mapping['.'] = (MOD_NONE, 0x37)
-        self.mapping[':'] = (MOD_LSHIFT, 0x37)
-        self.mapping[','] = (MOD_NONE, 0x36)
-        self.mapping[';'] = (MOD_LSHIFT, 0x36)
-        self.mapping['-'] = (MOD_NONE, 0x38) # Slash key on US is -/_ on DE
-        self.mapping['_'] = (MOD_LSHIFT, 0x38)
-
-        # AltGr (Right Alt)
-        self.mapping['@'] = (MOD_RALT, 0x14) # AltGr+Q
-        self.mapping['\\'] = (MOD_RALT, 0x2D) # AltGr+ß (Key right of 0)
-        self.mapping['|'] = (MOD_RALT, 0x35) # AltGr + < (Key right of LShift)
-        self.mapping['{'] = (MOD_RALT, 0x24) # AltGr+7
-        self.mapping['}'] = (MOD_RALT, 0x27) # AltGr+0
-        self.mapping['['] = (MOD_RALT, 0x25) # AltGr+8
-        self.mapping[']'] = (MOD_RALT, 0x26) # AltGr+9
-        self.mapping['~'] = (MOD_RALT, 0x30) # AltGr + + (Key right of Ü)
+    if ord(char) > 0xFFFF:
+        return None
+    reports = [(MOD_LALT, 0)] + _tap(MOD_NONE, layout.named_keys["KP_PLUS"], held=MOD_LALT)
+    for digit in f"{ord(char):x}":
+        code = layout.named_keys[f"KP_{digit}"] if digit.isdigit() else layout.get_scancode(digit)[1]
+        if code == 0:
+            return None
+        reports += _tap(MOD_NONE, code, held=MOD_LALT)
+    return reports + [(MOD_NONE, 0)]
+
+def linux_unicode_reports(char: str, layout: Layout) -> Optional[List[Report]]:
+    """GTK/IBus Unicode entry: Ctrl+Shift+U, the code point in hex, Space."""
+    reports = _tap(MOD_LCTRL | MOD_LSHIFT, layout.get_scancode('u')[1])
+    for digit in f"{ord(char):x}":
+        modifiers, code = layout.get_scancode(digit)
+        if code == 0:
+            return None
+        reports += _tap(modifiers, code)
+    return reports + _tap(MOD_NONE, SCANCODE_SPACE)
+
+UNICODE_INPUT_METHODS: Dict[str, Optional[Callable[[str, Layout], Optional[List[Report]]]]] = {
+    "windows_alt": windows_alt_reports,
+    "windows_hex": windows_hex_reports,
+    "linux": linux_unicode_reports,
+    "none": None,
+}
+DEFAULT_UNICODE_INPUT = os.environ.get("VHB_UNICODE_INPUT", "windows_alt")
 
 class KeyInjector:
     """
@@ -270,20 +296,29 @@ class KeyInjector:
     This class manages the connection to the OS HID device file (e.g., /dev/hidg0),
     formats the USB reports, and handles the timing of key presses.
     """
-    def __init__(self, device_path="/dev/hidg0", layout: Layout = GermanISO()):
+    def __init__(self, device_path="/dev/hidg0", layout: Optional[Layout] = None,
+                 unicode_input: str = DEFAULT_UNICODE_INPUT):
         """
         Args:
             device_path (str): Path to the HID gadget character device.
-            layout (Layout): The keyboard layout object (USLayout or GermanISO).
+            layout (Optional[Layout]): The keyboard layout object (see LAYOUTS).
+                Defaults to GermanISO, loaded when the injector is created.
+            unicode_input (str): Input method for characters the layout cannot type
+                (see UNICODE_INPUT_METHODS; "none" disables the fallback).
         """
+        if unicode_input not in UNICODE_INPUT_METHODS:
+            raise ValueError(f"Unknown unicode input method '{unicode_input}'. "
+                             f"Supported: {', '.join(UNICODE_INPUT_METHODS)}")
         self.device_path = device_path
-        self.layout = layout
+        self.layout = layout or GermanISO()
+        self.unicode_input = unicode_input
+        self._listeners: List[Callable[[int, int], None]] = []
         self._check_device()
 
     def _check_device(self):
         """Checks if the HID device file exists; enables simulation mode if not."""
         if not os.path.exists(self.device_path):
-            print(f"Warning: HID device {self.device_path} not found. Running in simulation mode.")
+            logging.warning(f"HID device {self.device_path} not found. Running in simulation mode.")
             self.simulation_mode = True
         else:
             self.simulation_mode = False
@@ -301,6 +336,9 @@ class KeyInjector:
         """
         # We only use Key1 for simplicity (typing one char at a time)
         report = struct.pack('BBBBBBBB', modifiers, 0, key_code, 0, 0, 0, 0, 0)
+        METRICS.inc("vhb_hid_reports_total")
+        for listener in self._listeners:
+            listener(modifiers, key_code)
 
         if self.simulation_mode:
             # print(f"[SIM] Sending Report: Mod={modifiers:02x} Key={key_code:02x}")
@@ -311,85 +349,140 @@ class KeyInjector:
                     f.write(report)
                     f.flush()
             except IOError as e:
-                print(f"Error writing to HID device: {e}")
+                logging.error(f"Error writing to HID device: {e}")
+
+    def add_listener(self, callback: Callable[[int, int], None]):
+        """Registers a callback receiving (modifiers, key_code) of every report sent."""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[int, int], None]):
+        """Unregisters a report callback."""
+        if callback in self._listeners:
+            self._listeners.remove(callback)
 
     def release_all(self):
         """Sends an empty report to release all keys."""
         self._send_report(0, 0)
 
+    def compile_char(self, char: str) -> Optional[List[Report]]:
+        """
+        Compiles one character into HID reports (press/release pairs).
+
+        Characters of the layout are typed directly (a dead key followed by the base
+        key for composed characters such as 'ê' on DE); anything else goes through
+        the configured Unicode input method.
+
+        Returns:
+            Optional[List[Report]]: (modifiers, usage ID) reports, None if the
+                character cannot be entered.
+        """
+        strokes = self.layout.get_strokes(char)
+        if strokes is not None:
+            reports: List[Report] = []
+            for modifier, code in strokes:
+                reports += _tap(modifier, code)
+            return reports
+        encoder = UNICODE_INPUT_METHODS[self.unicode_input]
+        return encoder(char, self.layout) if encoder else None
+
+    def compile_text(self, text: str) -> List[List[Report]]:
+        """
+        Compiles a string into per-character report sequences.
+
+        Raises:
+            ValueError: If some characters can neither be typed with the layout nor
+                entered through the Unicode input method.
+        """
+        compiled, missing = [], []
+        for char in text:
+            reports = self.compile_char(char)
+            if reports is None:
+                missing.append(char)
+            compiled.append(reports)
+        if missing:
+            raise ValueError(f"No key mapping in layout {self.layout.code} "
+                             f"(unicode input: {self.unicode_input}) for: {''.join(dict.fromkeys(missing))!r}")
+        return compiled
+
+    def _send_reports(self, reports: List[Report]):
+        """Sends a compiled report sequence, holding each key down briefly."""
+        for modifiers, key_code in reports:
+            self._send_report(modifiers, key_code)
+            if key_code:
+                # Hold briefly (simulating physical press)
+                time.sleep(random.uniform(0.01, 0.03))
+
     def press_key(self, char: str):
         """
-        Presses and releases a single character key.
+        Presses and releases the key(s) producing a single character.
 
-        This method looks up the scancode for the character in the current layout,
-        sends the press report, waits a random small duration, and then sends the release report.
+        This method compiles the character into reports (see compile_char), sends each
+        press report, waits a random small duration, and sends the release report.
 
         Args:
             char (str): The character to type.
+
+        Raises:
+            ValueError: If the character cannot be entered.
         """
-        modifier, code = self.layout.get_scancode(char)
-        if code == 0:
-            print(f"Warning: No mapping for character '{char}'")
-            return
+        self._send_reports(self.compile_text(char)[0])
 
-        # Press
-        self._send_report(modifier, code)
+    def press_scancode(self, modifiers: int, key_code: int):
+        """
+        Presses and releases a raw key, independent of the configured layout.
 
-        # Hold briefly (simulating physical press)
+        Args:
+            modifiers (int): Modifier bitmask (MOD_* constants).
+            key_code (int): The USB HID usage ID of the key.
+        """
+        self._send_report(modifiers, key_code)
         time.sleep(random.uniform(0.01, 0.03))
-
-        # Release
         self.release_all()
 
     def press_sequence(self, modifiers_list: List[str], key_name: str):
         """
         Presses a special sequence like Ctrl+Alt+Del.
-        modifiers_list: ['CTRL', 'ALT', 'SHIFT', 'GUI']
-        key_name: 'DELETE', 'F1', 'ENTER', 'A', etc.
+        modifiers_list: ['CTRL', 'ALT', 'SHIFT', 'GUI', 'RALT', ...] (see layouts/_common.json)
+        key_name: 'DELETE', 'F1', 'PGUP', 'KP_5', 'ENTER', 'A', etc.
+
+        Raises:
+            ValueError: For unknown modifier or key names (nothing is sent).
         """
         mod_mask = 0
         for m in modifiers_list:
-            m = m.upper()
-            if m == 'CTRL': mod_mask |= MOD_LCTRL
-            if m == 'ALT': mod_mask |= MOD_LALT
-            if m == 'SHIFT': mod_mask |= MOD_LSHIFT
-            if m == 'GUI' or m == 'WIN': mod_mask |= MOD_LGUI
-            if m == 'RALT': mod_mask |= MOD_RALT
-
-        # Find key code (naive lookup)
-        key_code = 0
-        # Check explicit mappings first
-        if key_name == 'DELETE': key_code = 0x4C
-        elif key_name == 'ENTER': key_code = SCANCODE_ENTER
-        elif key_name == 'ESC': key_code = SCANCODE_ESCAPE
-        elif key_name == 'TAB': key_code = SCANCODE_TAB
-        elif key_name.startswith('F'):
-            try:
-                f_num = int(key_name[1:])
-                if 1 <= f_num <= 12:
-                    key_code = 0x39 + f_num
-            except ValueError:
-                pass
-
-        if key_code == 0 and len(key_name) == 1:
-             # Try to find character code
-             _, key_code = self.layout.get_scancode(key_name.lower())
+            mask = self.layout.modifiers.get(m.upper())
+            if mask is None:
+                raise ValueError(f"Unknown modifier '{m}'")
+            mod_mask |= mask
 
+        key_code = self.layout.key_code(key_name)
         if key_code == 0:
-             print(f"Warning: Unknown key name '{key_name}'")
-             return
+            raise ValueError(f"Unknown key name '{key_name}'")
 
         self._send_report(mod_mask, key_code)
         time.sleep(0.1)
         self.release_all()
 
-
     def type_text(self, text: str, delay_mean: float = 0.05, delay_std: float = 0.02):
-        """Types a string with humanized timing."""
-        for char in text:
-            self.press_key(char)
+        """
+        Types a string with humanized timing.
+
+        The whole string is compiled first (including Unicode fallback sequences for
+        characters outside the layout), so nothing is typed if any character cannot be
+        entered.
 
-            # Calculate delay
-            delay = random.gauss(delay_mean, delay_std)
-            if delay < 0.01: delay = 0.01
-            time.sleep(delay)
+        Raises:
+            ValueError: If some characters cannot be entered.
+        """
+        compiled = self.compile_text(text)
+        start = time.perf_counter()
+        with span("hid.type_text"):
+            for reports in compiled:
+                self._send_reports(reports)
+
+                # Calculate delay
+                delay = random.gauss(delay_mean, delay_std)
+                if delay < 0.01: delay = 0.01
+                time.sleep(delay)
+        if compiled:
+            METRICS.observe("vhb_keystrokes_per_second", len(compiled) / (time.perf_counter() - start), RATE_BUCKETS)
@@ -3,84 +3,204 @@ Automated Keyboard Layout Detection Module.
 
 This module detects the active keyboard layout of the target system
 by injecting specific test characters and observing the output via OCR.
+
+The fingerprint types one batch of layout-discriminating keys (by raw scancode,
+so the result does not depend on the layout currently configured in the
+injector), OCRs only the part of the screen that changed, scores the observed
+characters against a table of layouts and erases exactly what was typed.
 """
 
 import time
 import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from .hid import LAYOUTS, MOD_NONE, MOD_LSHIFT, SCANCODE_SPACE, SCANCODE_BACKSPACE
+except ImportError:
+    from hid import LAYOUTS, MOD_NONE, MOD_LSHIFT, SCANCODE_SPACE, SCANCODE_BACKSPACE
+
+# Probe keys (modifier, USB usage ID) and the character each layout produces.
+# Only keys that produce exactly one character everywhere are used: dead keys
+# (e.g. ^ on FR/DE/CH) would merge with the next keystroke, and AltGr combinations
+# act as Ctrl+Alt shortcuts on layouts without AltGr (US).
+PROBES: List[Tuple[int, int]] = [
+    (MOD_NONE, 0x1C),    # y/z
+    (MOD_NONE, 0x1D),    # z/y/w
+    (MOD_NONE, 0x04),    # a/q
+    (MOD_NONE, 0x10),    # m/,
+    (MOD_NONE, 0x33),    # ;/ö/m
+    (MOD_NONE, 0x34),    # '/ä/ù
+    (MOD_NONE, 0x2D),    # -/ß/)/'
+    (MOD_NONE, 0x32),    # \/#/*/$ (non-US hash key)
+    (MOD_LSHIFT, 0x1F),  # @/"/2
+    (MOD_LSHIFT, 0x20),  # #/£/§/3/*
+    (MOD_LSHIFT, 0x34),  # "/@/Ä/%/à
+]
+
+FINGERPRINTS: Dict[str, List[str]] = {
+    "US": ["y", "z", "a", "m", ";", "'", "-", "\\", "@", "#", '"'],
+    "UK": ["y", "z", "a", "m", ";", "'", "-", "#", '"', "£", "@"],
+    "DE": ["z", "y", "a", "m", "ö", "ä", "ß", "#", '"', "§", "Ä"],
+    "FR": ["y", "w", "q", ",", "m", "ù", ")", "*", "2", "3", "%"],
+    "CH": ["z", "y", "a", "m", "ö", "ä", "'", "$", '"', "*", "à"],
+}
+
+MIN_SCORE = 0.5     # Share of probes that must match the best layout
+MIN_MARGIN = 0.15   # Required lead over the runner-up
+CHANGE_THRESHOLD = 40
+REGION_PADDING = 6
+
+
+def _edit_distance(a: List[str], b: List[str]) -> int:
+    """Levenshtein distance between two token sequences."""
+    previous = list(range(len(b) + 1))
+    for i, x in enumerate(a, 1):
+        current = [i]
+        for j, y in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (x != y)))
+        previous = current
+    return previous[-1]
+
+
+def score_fingerprint(tokens: List[str]) -> Dict[str, float]:
+    """
+    Scores observed probe characters against every layout.
+
+    The score is 1 - edit distance / number of probes, so a character lost, added
+    or misread by OCR only costs that probe while the order of probes still counts.
+
+    Args:
+        tokens (List[str]): Characters read back, in typing order.
+
+    Returns:
+        Dict[str, float]: Layout code -> similarity (0..1).
+    """
+    return {code: round(max(0.0, 1.0 - _edit_distance(expected, tokens) / len(expected)), 3)
+            for code, expected in FINGERPRINTS.items()}
+
+
+def changed_region(before: np.ndarray, after: np.ndarray, padding: int = REGION_PADDING) -> Optional[List[int]]:
+    """
+    Bounding box [x, y, width, height] of the pixels that differ (None if nothing changed).
+    """
+    if before.shape != after.shape:
+        h, w = after.shape[:2]
+        return [0, 0, w, h]
+    diff = np.abs(before.astype(np.int16) - after.astype(np.int16))
+    if diff.ndim == 3:
+        diff = diff.max(axis=2)
+    ys, xs = np.nonzero(diff > CHANGE_THRESHOLD)
+    if len(ys) == 0:
+        return None
+    h, w = after.shape[:2]
+    x0, y0 = max(0, int(xs.min()) - padding), max(0, int(ys.min()) - padding)
+    x1, y1 = min(w, int(xs.max()) + 1 + padding), min(h, int(ys.max()) + 1 + padding)
+    return [x0, y0, x1 - x0, y1 - y0]
+
 
 class LayoutDetector:
     """
-    Automates the detection of the target system's keyboard layout (e.g., US vs DE).
+    Automates the detection of the target system's keyboard layout (US, UK, DE, FR, CH).
 
-    This works by injecting characters that have different positions on different layouts
-    (like 'z' and 'y') and observing what character actually appears on the screen via OCR.
+    This works by injecting keys that produce different characters on different layouts
+    (like 'z' and 'y') and observing what actually appears on the screen via OCR.
     """
-    def __init__(self, injector, capture_func):
+    def __init__(self, injector, capture_func, frame_source: Optional[Callable] = None,
+                 ocr: Optional[Callable] = None, settle: float = 0.3, key_delay: float = 0.03):
         """
         Args:
             injector (KeyInjector): The instance used to type keys.
             capture_func (Callable): A function that captures the screen text (OCR).
+            frame_source (Optional[Callable]): Returns the current frame. Together with
+                `ocr`, only the changed input-line region is read; without it the
+                whole screen is OCR'd through `capture_func`.
+            ocr (Optional[Callable]): OCRs an image crop and returns the text.
+            settle (float): Wait after typing before the screen is read, in seconds.
+            key_delay (float): Mean delay between probe keystrokes in seconds.
         """
         self.injector = injector
         self.capture_func = capture_func
+        self.frame_source = frame_source
+        self.ocr = ocr
+        self.settle = settle
+        self.key_delay = key_delay
+        self.last_result: Dict = {}
+
+    def _type_probes(self) -> int:
+        """Types the probe keys separated by spaces and returns the number of keystrokes."""
+        keystrokes = 0
+        for i, (modifiers, code) in enumerate(PROBES):
+            if i:
+                self.injector.press_scancode(MOD_NONE, SCANCODE_SPACE)
+                keystrokes += 1
+            self.injector.press_scancode(modifiers, code)
+            keystrokes += 1
+            time.sleep(self.key_delay)
+        return keystrokes
+
+    def _erase(self, keystrokes: int):
+        """Erases the typed probe (every probe key produces exactly one character)."""
+        for _ in range(keystrokes):
+            self.injector.press_scancode(MOD_NONE, SCANCODE_BACKSPACE)
+
+    def _read_probe(self, before: Optional[np.ndarray]) -> Optional[str]:
+        """OCRs the probe output (changed region only if frames are available)."""
+        if before is None:
+            return self.capture_func(mode="ocr_text")
+        after = self.frame_source()
+        region = changed_region(before, after)
+        self.last_result["region"] = region
+        if region is None:
+            return None
+        x, y, w, h = region
+        return self.ocr(after[y:y + h, x:x + w])
 
     def detect(self) -> str:
         """
-        Runs the layout detection heuristic.
-
-        Heuristic:
-        - Type 'z'.
-        - If 'z' appears: Likely US or UK (QWERTY).
-        - If 'y' appears: Likely German (QWERTZ) because the 'z' key is in the 'y' position on US hardware maps.
+        Runs the layout fingerprint in a single round trip.
 
         Returns:
-            str: The detected layout code ("US", "DE", or "UNKNOWN").
+            str: The detected layout code ("US", "UK", "DE", "FR", "CH"), or "UNKNOWN"
+                if the output was missing or ambiguous (details in `last_result`).
         """
         logging.info("Starting Keyboard Layout Detection...")
+        self.last_result = {}
+        before = self.frame_source() if self.frame_source and self.ocr else None
 
-        # We need to type characters that vary significantly between layouts.
-        # US vs DE:
-        # z <-> y
-
-        # Test 1: Check Y/Z (QWERTZ vs QWERTY)
-        # We send 'z'.
-        # On US: Output 'z'
-        # On DE: Output 'y' (because 'z' key is at 'y' position)
-
-        test_char = 'z'
-        self.injector.type_text(test_char, delay_mean=0.1)
-        time.sleep(1.0)
-
-        text = self.capture_func(mode="ocr_text")
-        logging.debug(f"Layout Detect 'z' -> Saw '{text}'")
+        keystrokes = self._type_probes()
+        try:
+            time.sleep(self.settle)
+            text = self._read_probe(before)
+        finally:
+            self._erase(keystrokes)
 
-        if 'y' in text.lower():
-            # We sent 'z' (pos Z), but got 'y'.
-            # This implies the target interprets that position as 'y'.
-            # That matches QWERTZ (DE).
-            logging.info("Detected Layout: DE (QWERTZ)")
-            return "DE"
-        elif 'z' in text.lower():
-            logging.info("Detected Layout: US/UK (QWERTY)")
-            return "US" # Could be UK too
+        if not text:
+            logging.info("Layout detection: probe produced no visible output")
+            self.last_result.update({"layout": "UNKNOWN", "tokens": [], "scores": {}})
+            return "UNKNOWN"
 
-        # Fallback or inconclusive
-        return "UNKNOWN"
+        tokens = text.split()
+        scores = score_fingerprint(tokens)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        (best, best_score), (_, runner_up) = ranked[0], ranked[1]
+        layout = best if best_score >= MIN_SCORE and best_score - runner_up >= MIN_MARGIN else "UNKNOWN"
+        self.last_result.update({"layout": layout, "tokens": tokens, "scores": scores})
+        logging.info(f"Layout detection: saw {tokens}, scores {scores} -> {layout}")
+        return layout
 
     def apply_layout(self, layout_code: str):
         """
         Applies the detected layout to the KeyInjector.
 
         Args:
-            layout_code (str): The code returned by detect() ("US", "DE").
+            layout_code (str): The code returned by detect().
         """
-        if layout_code == "DE":
-            from .hid import GermanISO
-            logging.info("Applying GermanISO Layout")
-            self.injector.layout = GermanISO()
-        elif layout_code == "US":
-             from .hid import USLayout
-             logging.info("Applying US Layout")
-             self.injector.layout = USLayout()
+        if layout_code in LAYOUTS:
+            logging.info(f"Applying {layout_code} Layout")
+            self.injector.layout = LAYOUTS[layout_code]()
+        elif layout_code in FINGERPRINTS:
+            logging.warning(f"Detected layout {layout_code} has no key mapping yet, keeping current.")
         else:
             logging.warning(f"Unknown layout code {layout_code}, keeping current.")
@@ -0,0 +1,68 @@
+"""
+Deferred Imports for Optional Heavy Dependencies.
+
+OpenCV and PyTesseract are only needed once the first frame is grabbed or read,
+but importing them eagerly made every server start pay for them before the MCP
+handshake. `optional_module` returns a shared stand-in that imports the real
+module on first attribute access. The stand-in is falsy when the module is not
+installed, so call sites check `if not cv2:` where they used to check
+`cv2 is None`.
+
+Tests replace the module where it is looked up (e.g. `patch.object(vision, "cv2", mock)`).
+"""
+
+import logging
+import importlib
+import threading
+from typing import Dict, Optional
+
+class OptionalModule:
+    """Module stand-in that performs the import on first use."""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._missing = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None and not self._missing:
+            with self._lock:
+                if self._module is None and not self._missing:
+                    try:
+                        self._module = importlib.import_module(self._name)
+                    except ImportError:
+                        self._missing = True
+                        logging.warning(f"{self._name} not found. Features that need it will fail if not mocked.")
+        return self._module
+
+    @property
+    def loaded(self) -> bool:
+        """True once the real module has been imported."""
+        return self._module is not None
+
+    def __bool__(self) -> bool:
+        return self._load() is not None
+
+    def __getattr__(self, attr: str):
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        module = self._load()
+        if module is None:
+            raise ImportError(f"{self._name} is not installed")
+        return getattr(module, attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "missing" if self._missing else "deferred"
+        return f"<optional module '{self._name}' ({state})>"
+
+_MODULES: Dict[str, OptionalModule] = {}
+_MODULES_LOCK = threading.Lock()
+
+def optional_module(name: str) -> OptionalModule:
+    """Returns the process-wide deferred handle for a module."""
+    with _MODULES_LOCK:
+        handle: Optional[OptionalModule] = _MODULES.get(name)
+        if handle is None:
+            handle = _MODULES[name] = OptionalModule(name)
+        return handle
@@ -0,0 +1,249 @@
+"""
+Macro Engine Module.
+
+Runs short, deterministic interaction scripts on a target inside the server, so
+a sequence like "type a command, wait for the prompt, read a value" costs one
+tool call instead of one LLM round trip per step.
+
+A macro is a list of steps. Each step is an object whose action key selects the
+operation; the other keys are options:
+
+    [
+      {"type": "ipconfig\\n"},
+      {"wait_for_text": "IPv4", "timeout": 10},
+      {"wait_stable": 0.5},
+      {"ocr_region": [0, 0, 1920, 1080], "save_as": "screen"},
+      {"assert": "Ethernet adapter", "in": "screen"},
+      {"extract": "IPv4 Address[ .]*: ([0-9.]+)", "from": "screen", "save_as": "ip"},
+      {"type": "ping -n 1 ${ip}\\n"}
+    ]
+
+Actions:
+- "type": text to type (`${name}` is replaced by saved variables); option "delay_ms".
+- "key": named key or character (see `hid.Layout.key_code`); option "modifiers".
+- "wait_for_text": waits until the text is on screen; options "timeout", "region".
+- "wait_stable": waits until the screen has not changed for this many seconds
+  (a blinking cursor does not count); option "timeout".
+- "ocr_region": OCRs [x, y, width, height] (or the full screen if null) and saves
+  the text as "save_as" (default "screen").
+- "assert": fails the macro unless the text (a regular expression with
+  "regex": true) is in variable "in" (default: the last OCR text, or a fresh OCR).
+- "extract": regular expression searched in "from"; its first group (or the
+  whole match) is saved as "save_as" (default "value").
+- "sleep": waits a fixed number of seconds.
+
+Any step may set "optional": true to continue after a failure.
+"""
+
+import re
+import time
+import string
+import logging
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+ACTIONS = ("type", "key", "wait_for_text", "wait_stable", "ocr_region", "assert", "extract", "sleep")
+OPTIONS = {"delay_ms", "modifiers", "timeout", "region", "save_as", "in", "from", "regex", "optional"}
+DEFAULT_TIMEOUT = 10.0
+POLL_INTERVAL = 0.25
+MAX_STEPS = 200
+
+
+class MacroError(Exception):
+    """A step failed (the message is reported in the trace)."""
+
+
+def _normalize(text: str) -> str:
+    """Lowercase text with whitespace runs collapsed (OCR line breaks and spacing vary)."""
+    return " ".join(text.lower().split())
+
+
+def validate_macro(steps: List[Dict]) -> List[str]:
+    """
+    Checks the structure of a macro before anything is sent to the target.
+
+    Returns:
+        List[str]: The action of each step.
+
+    Raises:
+        ValueError: On an empty or too long macro, unknown actions or options.
+    """
+    if not isinstance(steps, list) or not steps:
+        raise ValueError("A macro is a non-empty list of steps.")
+    if len(steps) > MAX_STEPS:
+        raise ValueError(f"Macro has {len(steps)} steps, at most {MAX_STEPS} are allowed.")
+    actions = []
+    for index, step in enumerate(steps):
+        if not isinstance(step, dict):
+            raise ValueError(f"Step {index}: expected an object, got {type(step).__name__}.")
+        found = [key for key in step if key in ACTIONS]
+        if len(found) != 1:
+            raise ValueError(f"Step {index}: needs exactly one action of {', '.join(ACTIONS)}.")
+        unknown = set(step) - OPTIONS - set(found)
+        if unknown:
+            raise ValueError(f"Step {index}: unknown option(s) {', '.join(sorted(unknown))}.")
+        actions.append(found[0])
+    return actions
+
+
+class MacroRunner:
+    """
+    Executes macros against one target's injector and capture pipeline.
+    """
+    def __init__(self, injector, frame_source: Callable[[], np.ndarray], pipeline,
+                 state_source: Optional[Callable[[], Dict]] = None, poll_interval: float = POLL_INTERVAL):
+        """
+        Args:
+            injector (KeyInjector): Sends the keystrokes.
+            frame_source (Callable): Returns the current frame.
+            pipeline (VisionPipeline): OCR pipeline (read_text).
+            state_source (Optional[Callable]): Returns the screen-state classification of
+                the current frame (see `screen_state.py`), used by "wait_stable".
+            poll_interval (float): Delay between screen polls in seconds.
+        """
+        self.injector = injector
+        self.frame_source = frame_source
+        self.pipeline = pipeline
+        self.state_source = state_source
+        self.poll_interval = poll_interval
+
+    def run(self, steps: List[Dict], timeout: float = 120.0) -> Dict:
+        """
+        Runs a macro and stops at the first failing (non-optional) step.
+
+        Args:
+            steps (List[Dict]): The macro (see module docstring).
+            timeout (float): Limit for the whole macro in seconds.
+
+        Returns:
+            Dict: {'ok', 'failed_step' (index or None), 'error', 'variables',
+                'trace' (per step: 'step', 'action', 'ok', 'ms', plus 'detail' or 'error'),
+                'elapsed_ms'}.
+        """
+        actions = validate_macro(steps)
+        variables: Dict[str, str] = {}
+        trace: List[Dict] = []
+        result = {"ok": True, "failed_step": None, "error": None}
+        start = time.monotonic()
+        deadline = start + timeout
+
+        for index, (action, step) in enumerate(zip(actions, steps)):
+            entry = {"step": index, "action": action, "ok": True}
+            step_start = time.monotonic()
+            try:
+                if time.monotonic() >= deadline:
+                    raise MacroError(f"Macro timeout of {timeout:g}s exceeded.")
+                detail = getattr(self, f"_do_{action}")(step, variables, deadline)
+                if detail is not None:
+                    entry["detail"] = detail
+            except (MacroError, ValueError, RuntimeError, re.error) as e:
+                entry.update({"ok": False, "error": str(e)})
+            entry["ms"] = round((time.monotonic() - step_start) * 1000, 1)
+            trace.append(entry)
+
+            if not entry["ok"]:
+                if step.get("optional"):
+                    continue
+                logging.info(f"Macro stopped at step {index} ({action}): {entry['error']}")
+                result.update({"ok": False, "failed_step": index, "error": entry["error"]})
+                break
+
+        result.update({"variables": variables, "trace": trace,
+                       "elapsed_ms": round((time.monotonic() - start) * 1000, 1)})
+        return result
+
+    # --- Helpers ---
+
+    def _ocr(self, region: Optional[List[int]] = None) -> str:
+        """OCRs the current frame (or a region of it)."""
+        return self.pipeline.read_text(self.frame_source(), region)
+
+    @staticmethod
+    def _timeout(step: Dict, deadline: float) -> float:
+        """Absolute end time of a waiting step (never past the macro deadline)."""
+        return min(deadline, time.monotonic() + float(step.get("timeout", DEFAULT_TIMEOUT)))
+
+    @staticmethod
+    def _matches(pattern: str, text: str, regex: bool) -> bool:
+        if regex:
+            return re.search(pattern, text, re.IGNORECASE | re.MULTILINE) is not None
+        return _normalize(pattern) in _normalize(text)
+
+    # --- Actions ---
+
+    def _do_type(self, step: Dict, variables: Dict, deadline: float):
+        text = string.Template(str(step["type"])).safe_substitute(variables)
+        delay = float(step.get("delay_ms", 20)) / 1000.0
+        self.injector.type_text(text, delay_mean=delay, delay_std=delay * 0.3)
+        return {"chars": len(text)}
+
+    def _do_key(self, step: Dict, variables: Dict, deadline: float):
+        self.injector.press_sequence(step.get("modifiers", []), str(step["key"]))
+        return None
+
+    def _do_sleep(self, step: Dict, variables: Dict, deadline: float):
+        time.sleep(max(0.0, min(float(step["sleep"]), deadline - time.monotonic())))
+        return None
+
+    def _do_wait_for_text(self, step: Dict, variables: Dict, deadline: float):
+        expected = string.Template(str(step["wait_for_text"])).safe_substitute(variables)
+        end = self._timeout(step, deadline)
+        polls = 0
+        while True:
+            text = self._ocr(step.get("region"))
+            polls += 1
+            if self._matches(expected, text, bool(step.get("regex"))):
+                variables["screen"] = text
+                return {"polls": polls}
+            if time.monotonic() + self.poll_interval > end:
+                raise MacroError(f"Text '{expected}' did not appear ({polls} OCR passes).")
+            time.sleep(self.poll_interval)
+
+    def _do_wait_stable(self, step: Dict, variables: Dict, deadline: float):
+        if self.state_source is None:
+            raise MacroError("No screen-state source for wait_stable.")
+        seconds = float(step["wait_stable"])
+        end = self._timeout(step, deadline)
+        polls = 0
+        while True:
+            state = self.state_source()
+            polls += 1
+            if state["stable_seconds"] >= seconds:
+                return {"state": state["state"], "stable_seconds": state["stable_seconds"], "polls": polls}
+            if time.monotonic() + self.poll_interval > end:
+                raise MacroError(f"Screen did not settle for {seconds:g}s (last state '{state['state']}').")
+            time.sleep(self.poll_interval)
+
+    def _do_ocr_region(self, step: Dict, variables: Dict, deadline: float):
+        region = step["ocr_region"]
+        if region is not None and (not isinstance(region, list) or len(region) != 4):
+            raise ValueError("ocr_region needs [x, y, width, height] or null.")
+        name = step.get("save_as", "screen")
+        variables[name] = self._ocr(region)
+        return {"save_as": name, "chars": len(variables[name])}
+
+    def _do_assert(self, step: Dict, variables: Dict, deadline: float):
+        expected = string.Template(str(step["assert"])).safe_substitute(variables)
+        source = step.get("in")
+        if source is not None and source not in variables:
+            raise MacroError(f"Unknown variable '{source}'.")
+        text = variables[source] if source else variables.get("screen")
+        if text is None:
+            text = variables["screen"] = self._ocr()
+        if not self._matches(expected, text, bool(step.get("regex"))):
+            raise MacroError(f"Assertion failed: '{expected}' not found.")
+        return None
+
+    def _do_extract(self, step: Dict, variables: Dict, deadline: float):
+        source = step.get("from", "screen")
+        if source == "screen" and source not in variables:
+            variables[source] = self._ocr()
+        if source not in variables:
+            raise MacroError(f"Unknown variable '{source}'.")
+        match = re.search(step["extract"], variables[source], re.IGNORECASE | re.MULTILINE)
+        if match is None:
+            raise MacroError(f"Pattern '{step['extract']}' not found in '{source}'.")
+        name = step.get("save_as", "value")
+        variables[name] = (match.group(1) if match.groups() else match.group(0)).strip()
+        return {"save_as": name, "value": variables[name]}
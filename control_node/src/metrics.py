@@ -0,0 +1,306 @@
+"""
+Metrics Module.
+
+Lightweight tracing spans and metrics for the bridge. A span times one stage
+(capture, preprocessing, OCR, encoding, log writing, VLM, whole tools, ...) and
+feeds the `vhb_stage_seconds` histogram with a `stage` label:
+
+    with span("ocr"):
+        text = pytesseract.image_to_string(image)
+
+    @timed("preprocess")
+    def preprocess_for_ocr(self, image): ...
+
+Besides stage latencies, components record histograms such as frame age at use,
+OCR characters per second and keystrokes per second, counters such as cache hits
+and misses, and gauges collected on demand (queue depths). Everything lives in
+the process-wide `METRICS` registry, which renders as JSON (resource
+`system://metrics`) or in the Prometheus text format (`serve_prometheus`, enabled
+with `VHB_METRICS_PORT`).
+
+Histograms keep fixed cumulative buckets (for Prometheus) plus the most recent
+observations for percentiles, so memory stays constant however long the
+server runs.
+
+Within `collect_trace()`, spans of the current thread are also appended to a
+per-call trace, and components can `attach()` intermediate data (the frame, the
+OCR input) to it; the slow-call capture (see `profiling.py`) stores both.
+"""
+
+import bisect
+import functools
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RATE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000)
+RECENT = 256  # Observations kept per histogram for percentiles
+
+HELP = {
+    "vhb_stage_seconds": "Duration of pipeline stages and tool calls.",
+    "vhb_frame_age_seconds": "Age of a captured frame when a tool starts processing it.",
+    "vhb_ocr_chars_per_second": "Recognized characters per second of OCR time.",
+    "vhb_keystrokes_per_second": "Characters typed per second (including delays).",
+    "vhb_cache_requests_total": "Cache lookups by cache and result (hit/miss).",
+    "vhb_hid_reports_total": "HID reports sent.",
+    "vhb_hid_queue_depth": "Queued HID command sequences per target.",
+    "vhb_capture_waiting_readers": "Readers waiting for a shared frame grab per target.",
+    "vhb_vlm_queued": "VLM requests waiting for or holding a backend slot.",
+    "vhb_vlm_in_flight": "VLM requests running against the backend.",
+    "vhb_vlm_cache_entries": "Cached VLM responses.",
+    "vhb_state_bytes": "Bytes held by the bounded server state (OCR logs, screen cache).",
+    "vhb_process_resident_bytes": "Resident memory of the server process.",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Histogram:
+    """Bucketed distribution with count, sum and a window of recent observations."""
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot: above the largest bucket
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=RECENT)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.recent.append(value)
+
+    def snapshot(self) -> Dict:
+        """Count, sum and mean/p50/p95/p99/max of the recent observations."""
+        with self._lock:
+            ordered = sorted(self.recent)
+            count, total = self.count, self.sum
+        pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else None
+        return {"count": count, "sum": round(total, 6),
+                "mean": round(total / count, 6) if count else None,
+                "p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": ordered[-1] if ordered else None}
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """(le, cumulative count) pairs in Prometheus order, ending with +Inf."""
+        with self._lock:
+            counts = list(self.counts)
+        result, running = [], 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], counts):
+            running += count
+            result.append((bound if isinstance(bound, str) else f"{bound:g}", running))
+        return result
+
+
+class MetricsRegistry:
+    """
+    Holds histograms, counters and gauge collectors by name and labels.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._collectors: List[Callable[[], List[Tuple[str, Dict, float]]]] = []
+
+    def histogram(self, name: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels) -> Histogram:
+        """Returns the histogram for name and labels (created on first use)."""
+        key = _labels(labels)
+        series = self._histograms.get(name)
+        histogram = series.get(key) if series else None
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, {}).setdefault(key, Histogram(buckets))
+        return histogram
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels):
+        """Records one observation."""
+        self.histogram(name, buckets, **labels).observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        """Increments a counter."""
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def add_collector(self, collector: Callable[[], List[Tuple[str, Dict, float]]]):
+        """Registers a function returning current gauge values as (name, labels, value)."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def _gauges(self) -> Dict[str, Dict[Labels, float]]:
+        gauges: Dict[str, Dict[Labels, float]] = {}
+        for collector in list(self._collectors):
+            try:
+                for name, labels, value in collector():
+                    gauges.setdefault(name, {})[_labels(labels)] = value
+            except Exception as e:
+                logging.debug(f"Metrics collector failed: {e}")
+        return gauges
+
+    def reset(self):
+        """Drops all observations and counters (collectors are kept)."""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def snapshot(self) -> Dict:
+        """
+        Returns all metrics as JSON-serializable data.
+
+        Returns:
+            Dict: {'histograms': {name: [{'labels', 'count', 'sum', 'mean', 'p50', 'p95',
+                'p99', 'max'}]}, 'counters': {name: [{'labels', 'value'}]},
+                'gauges': {name: [{'labels', 'value'}]}}.
+        """
+        with self._lock:
+            histograms = {name: dict(series) for name, series in self._histograms.items()}
+            counters = {name: dict(series) for name, series in self._counters.items()}
+        return {
+            "histograms": {name: [dict(h.snapshot(), labels=dict(key)) for key, h in series.items()]
+                           for name, series in histograms.items()},
+            "counters": {name: [{"labels": dict(key), "value": v} for key, v in series.items()]
+                         for name, series in counters.items()},
+            "gauges": {name: [{"labels": dict(key), "value": v} for key, v in series.items()]
+                       for name, series in self._gauges().items()},
+        }
+
+    def prometheus(self) -> str:
+        """Renders all metrics in the Prometheus text exposition format (0.0.4)."""
+        def fmt(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = labels + extra
+            if not pairs:
+                return ""
+            escaped = (v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+        def header(name: str, kind: str):
+            if name in HELP:
+                lines.append(f"# HELP {name} {HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            histograms = {name: dict(series) for name, series in self._histograms.items()}
+            counters = {name: dict(series) for name, series in self._counters.items()}
+        lines: List[str] = []
+        for name, series in sorted(histograms.items()):
+            header(name, "histogram")
+            for key, histogram in series.items():
+                for le, count in histogram.cumulative():
+                    lines.append(f"{name}_bucket{fmt(key, (('le', le),))} {count}")
+                snap = histogram.snapshot()
+                lines.append(f"{name}_sum{fmt(key)} {snap['sum']:g}")
+                lines.append(f"{name}_count{fmt(key)} {snap['count']}")
+        for name, series in sorted(counters.items()):
+            header(name, "counter")
+            lines.extend(f"{name}{fmt(key)} {value:g}" for key, value in series.items())
+        for name, series in sorted(self._gauges().items()):
+            header(name, "gauge")
+            lines.extend(f"{name}{fmt(key)} {value:g}" for key, value in series.items())
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+_trace: ContextVar[Optional[Dict]] = ContextVar("vhb_trace", default=None)
+
+
+def current_trace() -> Optional[Dict]:
+    """The trace being collected in this context (None outside `collect_trace`)."""
+    return _trace.get()
+
+
+@contextmanager
+def collect_trace() -> Iterator[Dict]:
+    """
+    Collects the spans and attachments of the enclosed block.
+
+    Yields:
+        Dict: {'start' (perf_counter), 'spans' ([{'stage', 'start_ms', 'ms'}]),
+            'artifacts' (name -> latest attached value)}.
+    """
+    trace = {"start": time.perf_counter(), "spans": [], "artifacts": {}}
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+def attach(name: str, value):
+    """Attaches data to the current trace (no-op when none is collected)."""
+    trace = _trace.get()
+    if trace is not None:
+        trace["artifacts"][name] = value
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Times the enclosed block as `stage` (recorded even if it raises)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        METRICS.observe("vhb_stage_seconds", elapsed, stage=stage)
+        trace = _trace.get()
+        if trace is not None:
+            trace["spans"].append({"stage": stage, "start_ms": round((start - trace["start"]) * 1000, 2),
+                                   "ms": round(elapsed * 1000, 2)})
+
+
+def timed(stage: str) -> Callable:
+    """Decorator recording every call of the function as a span."""
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def serve_prometheus(port: int, host: str = "127.0.0.1",
+                     registry: Optional[MetricsRegistry] = None) -> ThreadingHTTPServer:
+    """
+    Serves `GET /metrics` in the Prometheus text format on a background thread.
+
+    Args:
+        port (int): TCP port (0 picks a free one, see `server.server_address`).
+        host (str): Bind address; local only by default.
+        registry (Optional[MetricsRegistry]): Metrics to serve (default METRICS).
+
+    Returns:
+        ThreadingHTTPServer: The running server (`shutdown()` stops it).
+    """
+    source = registry or METRICS
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = source.prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logging.info(f"Prometheus metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
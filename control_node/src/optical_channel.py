@@ -0,0 +1,469 @@
+"""
+Optical Data Channel Module.
+
+This module implements a high-bandwidth read channel from the target system.
+Instead of OCRing text, a short PowerShell script (typed via the `KeyInjector`)
+renders the requested file as a grid of colored console cells. Every cell
+carries one nibble (16 console colors), and every screen ("frame") carries a
+header with sequence number, frame count, payload length and CRC32.
+
+The control node decodes the grids from the captured HDMI frames, checks the
+CRCs and asks the script to re-render missing frames by typing their sequence
+numbers into its input prompt.
+
+Frame layout (row-major cells, one nibble each, high nibble first):
+    [seq:2 bytes][count:2 bytes][length:2 bytes][crc32:4 bytes][payload...]
+
+The CRC32 (zlib polynomial) covers seq, count, length and payload.
+"""
+
+import time
+import zlib
+import logging
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+HEADER_BYTES = 10
+HEADER_NIBBLES = HEADER_BYTES * 2
+
+DEFAULT_COLS = 56
+DEFAULT_ROWS = 26
+
+# Approximate Windows console colors (RGB) in ANSI order
+# (black, red, green, yellow, blue, magenta, cyan, white, then bright variants).
+# Only used to synthesize frames; the decoder learns the real palette from
+# the calibration frames.
+CONSOLE_PALETTE_RGB = [
+    (12, 12, 12), (197, 15, 31), (19, 161, 14), (193, 156, 0),
+    (0, 55, 218), (136, 23, 152), (58, 150, 221), (204, 204, 204),
+    (118, 118, 118), (231, 72, 86), (22, 198, 12), (249, 241, 165),
+    (59, 120, 255), (180, 0, 158), (97, 214, 214), (242, 242, 242),
+]
+CONSOLE_PALETTE_BGR = [(b, g, r) for (r, g, b) in CONSOLE_PALETTE_RGB]
+
+
+def frame_capacity(cols: int, rows: int) -> int:
+    """Returns the number of payload bytes a single frame can carry."""
+    return max(0, (cols * rows - HEADER_NIBBLES) // 2)
+
+
+def calibration_grids(cols: int, rows: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the two calibration grids (pattern and inverse).
+
+    Every color appears in every row of pattern A, and pattern B replaces each
+    color index `k` with `15 - k`, so every cell changes between A and B.
+    """
+    r, c = np.indices((rows, cols))
+    grid_a = ((r + c) % 16).astype(np.uint8)
+    return grid_a, (15 - grid_a).astype(np.uint8)
+
+
+def _bytes_to_nibbles(data: bytes) -> np.ndarray:
+    """Splits bytes into a flat nibble array (high nibble first)."""
+    arr = np.frombuffer(data, dtype=np.uint8)
+    out = np.empty(arr.size * 2, dtype=np.uint8)
+    out[0::2] = arr >> 4
+    out[1::2] = arr & 0x0F
+    return out
+
+
+def _nibbles_to_bytes(nibbles: np.ndarray) -> bytes:
+    """Joins a flat nibble array (high nibble first) back into bytes."""
+    nibbles = nibbles.astype(np.uint8)
+    return ((nibbles[0::2] << 4) | nibbles[1::2]).astype(np.uint8).tobytes()
+
+
+def encode_frames(data: bytes, cols: int = DEFAULT_COLS, rows: int = DEFAULT_ROWS) -> List[np.ndarray]:
+    """
+    Encodes data into a list of nibble grids, exactly as the target script renders them.
+
+    Args:
+        data (bytes): The payload to transfer.
+        cols (int): Grid width in cells.
+        rows (int): Grid height in cells.
+
+    Returns:
+        List[np.ndarray]: One (rows, cols) uint8 grid per frame.
+    """
+    capacity = frame_capacity(cols, rows)
+    if capacity <= 0:
+        raise ValueError(f"Grid {cols}x{rows} is too small for the frame header.")
+
+    count = max(1, -(-len(data) // capacity))
+    grids = []
+    for seq in range(count):
+        payload = data[seq * capacity:(seq + 1) * capacity]
+        head = bytes([seq >> 8 & 0xFF, seq & 0xFF, count >> 8 & 0xFF, count & 0xFF,
+                      len(payload) >> 8 & 0xFF, len(payload) & 0xFF])
+        crc = zlib.crc32(head + payload)
+        nibbles = _bytes_to_nibbles(head + crc.to_bytes(4, "big") + payload)
+
+        grid = np.zeros(cols * rows, dtype=np.uint8)
+        grid[:nibbles.size] = nibbles
+        grids.append(grid.reshape(rows, cols))
+    return grids
+
+
+def render_grid(grid: np.ndarray, cell_size: Tuple[int, int] = (16, 16),
+                origin: Tuple[int, int] = (0, 0), frame_size: Optional[Tuple[int, int]] = None,
+                palette: Optional[List[Tuple[int, int, int]]] = None) -> np.ndarray:
+    """
+    Renders a nibble grid into a BGR frame, the way the console displays it.
+
+    Useful for simulations and tests without a capture card.
+
+    Args:
+        grid (np.ndarray): (rows, cols) array of color indices.
+        cell_size (Tuple[int, int]): (width, height) of one cell in pixels.
+        origin (Tuple[int, int]): (x, y) pixel position of the top-left cell.
+        frame_size (Optional[Tuple[int, int]]): (width, height) of the output frame.
+            Defaults to the grid size plus the origin offset.
+        palette (Optional[List]): BGR colors per index. Defaults to the console palette.
+
+    Returns:
+        np.ndarray: The rendered BGR frame (uint8).
+    """
+    palette_arr = np.array(palette or CONSOLE_PALETTE_BGR, dtype=np.uint8)
+    cw, ch = cell_size
+    ox, oy = origin
+    rows, cols = grid.shape
+    if frame_size is None:
+        frame_size = (ox + cols * cw, oy + rows * ch)
+
+    frame = np.zeros((frame_size[1], frame_size[0], 3), dtype=np.uint8)
+    frame[:] = palette_arr[0]
+    cells = palette_arr[grid].repeat(ch, axis=0).repeat(cw, axis=1)
+    frame[oy:oy + rows * ch, ox:ox + cols * cw] = cells
+    return frame
+
+
+def _ps_quote(path: str) -> str:
+    """Quotes a path for PowerShell, preferring double quotes (no apostrophe key needed)."""
+    if any(ch in path for ch in '$`"'):
+        return "'" + path.replace("'", "''") + "'"
+    return f'"{path}"'
+
+
+def build_target_script(path: str, cols: int = DEFAULT_COLS, rows: int = DEFAULT_ROWS,
+                        hold_ms: int = 150, calibration_ms: int = 1000) -> str:
+    """
+    Builds the PowerShell one-liner that renders a file as color grids on the target.
+
+    The script clears the console, shows calibration patterns A and B, renders
+    all data frames and then waits at an (invisible) `Read-Host` prompt. A line
+    of comma-separated sequence numbers re-renders those frames; an empty line ends
+    the transfer.
+
+    The script deliberately avoids characters that are dead keys or missing on
+    common layouts (backtick, caret, tilde, `*`, `|`, `<`, `>`).
+
+    Args:
+        path (str): File on the target to transfer.
+        cols (int): Grid width in cells (each cell is two console columns).
+        rows (int): Grid height in cells (console rows).
+        hold_ms (int): How long each data frame stays on screen.
+        calibration_ms (int): How long each calibration pattern stays on screen.
+
+    Returns:
+        str: The script (single line, without trailing newline).
+    """
+    capacity = frame_capacity(cols, rows)
+    if capacity <= 0:
+        raise ValueError(f"Grid {cols}x{rows} is too small for the frame header.")
+
+    parts = [
+        f"$e=[char]27;$L=[char]10;$C={cols};$R={rows};$T={cols * rows};$K={capacity};$H={int(hold_ms)}",
+        f"$b=[IO.File]::ReadAllBytes({_ps_quote(path)})",
+        "$N=[int][math]::Max(1,[math]::Ceiling($b.Length/$K))",
+        # CRC32 lookup table (zlib polynomial, decimal literals avoid int32 hex parsing)
+        "$t=for($n=0;$n -lt 256;$n++){$c=[long]$n;for($k=0;$k -lt 8;$k++){"
+        "if($c -band 1){$c=3988292384 -bxor ($c -shr 1)}else{$c=$c -shr 1}};$c}",
+        # S: draw a nibble grid at the top-left corner and hold it
+        "function S($g,$w){$i=0;$o=\"\";for($r=0;$r -lt $R;$r++){for($x=0;$x -lt $C;$x++){"
+        "$v=[int]$g[$i];$i++;if($v -lt 8){$q=40+$v}else{$q=92+$v};$o+=\"$e[$($q)m  \"};"
+        "$o+=\"$e[0m\"+$L};[Console]::SetCursorPosition(0,0);[Console]::Write($o);Start-Sleep -m $w}",
+        # F: build and draw frame number $s
+        "function F($s){$o=[math]::BigMul($s,$K);$l=[int][math]::Max(0,[math]::Min($K,$b.Length-$o));"
+        "$h=@((($s -shr 8) -band 255),($s -band 255),(($N -shr 8) -band 255),($N -band 255),"
+        "(($l -shr 8) -band 255),($l -band 255));if($l -gt 0){$p=@($b[$o..($o+$l-1)])}else{$p=@()};"
+        "$c=4294967295;foreach($x in ($h+$p)){$c=$t[($c -bxor $x) -band 255] -bxor ($c -shr 8)};"
+        "$c=$c -bxor 4294967295;$y=$h+@((($c -shr 24) -band 255),(($c -shr 16) -band 255),"
+        "(($c -shr 8) -band 255),($c -band 255))+$p;$g=foreach($x in $y){$x -shr 4;$x -band 15};S $g $H}",
+        # Calibration patterns A and B (B = 15 - A)
+        "$a=for($i=0;$i -lt $T;$i++){([math]::Floor($i/$C)+$i%$C)%16};$z=foreach($x in $a){15-$x}",
+        f"Clear-Host;S $a {int(calibration_ms)};S $z {int(calibration_ms)}",
+        "for($s=0;$s -lt $N;$s++){F $s}",
+        "while(1){$q=Read-Host;if(-not $q){break};foreach($s in $q.Split(\",\")){F ([int]$s)}}",
+        "[Console]::Write(\"$e[0m\");Clear-Host",
+    ]
+    return ";".join(parts)
+
+
+class OpticalDecoder:
+    """
+    Decodes color-cell frames from captured screen images.
+
+    The decoder must be calibrated first with a consecutive pair of captured
+    frames showing calibration patterns A and B. Calibration yields the grid
+    position (from the pixels that changed between A and B) and the actual
+    color of each palette entry as seen by the capture card.
+    """
+    def __init__(self, cols: int = DEFAULT_COLS, rows: int = DEFAULT_ROWS, diff_threshold: int = 48):
+        """
+        Args:
+            cols (int): Grid width in cells.
+            rows (int): Grid height in cells.
+            diff_threshold (int): Minimum per-channel change to count a pixel as changed.
+        """
+        self.cols = cols
+        self.rows = rows
+        self.diff_threshold = diff_threshold
+        self.region: Optional[Tuple[int, int, int, int]] = None
+        self.palette: Optional[np.ndarray] = None
+
+    @property
+    def calibrated(self) -> bool:
+        """True once grid region and palette are known."""
+        return self.region is not None and self.palette is not None
+
+    def _sample_cells(self, frame: np.ndarray, region: Tuple[int, int, int, int]) -> np.ndarray:
+        """
+        Samples the color of every cell (mean of 9 points around the cell center).
+
+        Returns:
+            np.ndarray: (rows, cols, 3) float array.
+        """
+        if frame.ndim == 2:
+            frame = frame[:, :, None].repeat(3, axis=2)
+        x, y, w, h = region
+        cw = w / self.cols
+        ch = h / self.rows
+        xs = x + (np.arange(self.cols) + 0.5) * cw
+        ys = y + (np.arange(self.rows) + 0.5) * ch
+
+        acc = np.zeros((self.rows, self.cols, 3), dtype=np.float32)
+        for dy in (-ch / 4, 0.0, ch / 4):
+            yi = np.clip(np.round(ys + dy).astype(int), 0, frame.shape[0] - 1)
+            for dx in (-cw / 4, 0.0, cw / 4):
+                xi = np.clip(np.round(xs + dx).astype(int), 0, frame.shape[1] - 1)
+                acc += frame[np.ix_(yi, xi)][:, :, :3]
+        return acc / 9.0
+
+    def _classify(self, samples: np.ndarray, palette: np.ndarray) -> np.ndarray:
+        """Maps sampled cell colors to the nearest palette index."""
+        dist = ((samples[:, :, None, :] - palette[None, None, :, :]) ** 2).sum(axis=3)
+        return dist.argmin(axis=2).astype(np.uint8)
+
+    def calibrate(self, frame_a: np.ndarray, frame_b: np.ndarray) -> bool:
+        """
+        Tries to calibrate from two consecutive frames.
+
+        Succeeds only if `frame_a` shows pattern A and `frame_b` shows pattern B:
+        cells of equal index in A must have a distinct common color, and every
+        cell of B must classify as the inverse index.
+
+        Args:
+            frame_a (np.ndarray): Candidate frame showing pattern A.
+            frame_b (np.ndarray): Candidate frame showing pattern B.
+
+        Returns:
+            bool: True if calibration succeeded.
+        """
+        if frame_a is None or frame_b is None or getattr(frame_a, 'shape', None) != getattr(frame_b, 'shape', None):
+            return False
+
+        a = frame_a.astype(np.int16)
+        b = frame_b.astype(np.int16)
+        diff = np.abs(a - b)
+        if diff.ndim == 3:
+            diff = diff.max(axis=2)
+        mask = diff > self.diff_threshold
+        if mask.mean() < 0.01:
+            return False
+
+        # Bounding box from projections (robust against a few noisy pixels)
+        row_frac = mask.mean(axis=1)
+        col_frac = mask.mean(axis=0)
+        rows_on = np.where(row_frac > 0.5 * row_frac.max())[0]
+        cols_on = np.where(col_frac > 0.5 * col_frac.max())[0]
+        y0, y1 = int(rows_on[0]), int(rows_on[-1]) + 1
+        x0, x1 = int(cols_on[0]), int(cols_on[-1]) + 1
+        if (x1 - x0) < self.cols or (y1 - y0) < self.rows:
+            return False
+        region = (x0, y0, x1 - x0, y1 - y0)
+
+        grid_a, grid_b = calibration_grids(self.cols, self.rows)
+        samples_a = self._sample_cells(frame_a, region)
+        palette = np.zeros((16, 3), dtype=np.float32)
+        for k in range(16):
+            sel = samples_a[grid_a == k]
+            if sel.size == 0:
+                return False
+            palette[k] = sel.mean(axis=0)
+
+        # Pattern A and B are symmetric; index 0 (black) must be darker than 15 (bright white)
+        if palette[0].sum() >= palette[15].sum():
+            return False
+
+        # Palette entries must be distinguishable
+        pair = ((palette[:, None, :] - palette[None, :, :]) ** 2).sum(axis=2)
+        np.fill_diagonal(pair, np.inf)
+        if pair.min() < 10.0 ** 2:
+            return False
+
+        samples_b = self._sample_cells(frame_b, region)
+        if (self._classify(samples_b, palette) == grid_b).mean() < 0.95:
+            return False
+
+        self.region = region
+        self.palette = palette
+        logging.info(f"Optical channel calibrated: region={region}")
+        return True
+
+    def decode(self, frame: np.ndarray) -> Optional[Tuple[int, int, bytes]]:
+        """
+        Decodes a single captured frame.
+
+        Args:
+            frame (np.ndarray): The captured BGR frame.
+
+        Returns:
+            Optional[Tuple[int, int, bytes]]: (seq, count, payload) if the CRC matches,
+            otherwise None (torn frame, calibration screen, noise).
+        """
+        if not self.calibrated:
+            raise RuntimeError("Optical decoder is not calibrated.")
+
+        nibbles = self._classify(self._sample_cells(frame, self.region), self.palette).ravel()
+        header = _nibbles_to_bytes(nibbles[:HEADER_NIBBLES])
+        seq = int.from_bytes(header[0:2], "big")
+        count = int.from_bytes(header[2:4], "big")
+        length = int.from_bytes(header[4:6], "big")
+        crc = int.from_bytes(header[6:10], "big")
+
+        if count == 0 or seq >= count or length > frame_capacity(self.cols, self.rows):
+            return None
+
+        payload = _nibbles_to_bytes(nibbles[HEADER_NIBBLES:HEADER_NIBBLES + 2 * length])
+        if zlib.crc32(header[:6] + payload) != crc:
+            return None
+        return seq, count, payload
+
+
+class OpticalReceiver:
+    """
+    Orchestrates an optical file transfer from the target system.
+
+    Types the render script via the `KeyInjector`, calibrates on the first
+    frames, collects CRC-valid frames from the capture stream and requests
+    retransmission of missing sequence numbers.
+    """
+    def __init__(self, injector, capture, cols: int = DEFAULT_COLS, rows: int = DEFAULT_ROWS,
+                 hold_ms: int = 150, calibration_ms: int = 1000):
+        """
+        Args:
+            injector (KeyInjector): Used to type the script and retransmission requests.
+            capture (ScreenCapture): Source of frames.
+            cols (int): Grid width in cells.
+            rows (int): Grid height in cells.
+            hold_ms (int): Display time per data frame on the target.
+            calibration_ms (int): Display time per calibration pattern on the target.
+        """
+        self.injector = injector
+        self.capture = capture
+        self.cols = cols
+        self.rows = rows
+        self.hold_ms = hold_ms
+        self.calibration_ms = calibration_ms
+        self.decoder = OpticalDecoder(cols, rows)
+
+    def _calibrate(self, deadline: float):
+        """Polls frames until two consecutive frames show patterns A and B."""
+        recent: List[np.ndarray] = []
+        while time.time() < deadline:
+            frame = self.capture.capture_frame()
+            # Compare against the last few frames to tolerate a torn redraw in between
+            for prev in reversed(recent):
+                if self.decoder.calibrate(prev, frame):
+                    return
+            recent = (recent + [frame])[-3:]
+        raise RuntimeError("Optical channel calibration timed out.")
+
+    def receive(self, path: str, timeout: float = 300.0, idle_timeout: Optional[float] = None,
+                max_rounds: int = 5) -> Tuple[bytes, Dict]:
+        """
+        Transfers a file from the target.
+
+        Args:
+            path (str): File path on the target.
+            timeout (float): Overall time limit in seconds.
+            idle_timeout (float): Seconds without a new frame before missing frames are requested.
+                Defaults to 4 frame hold times (at least 2 s).
+            max_rounds (int): Maximum number of retransmission requests.
+
+        Returns:
+            Tuple[bytes, Dict]: The file content and transfer statistics.
+
+        Raises:
+            RuntimeError: On calibration timeout, no decodable frames or too many retransmissions.
+        """
+        if idle_timeout is None:
+            idle_timeout = max(2.0, 4 * self.hold_ms / 1000.0)
+
+        start = time.time()
+        deadline = start + timeout
+        script = build_target_script(path, self.cols, self.rows, self.hold_ms, self.calibration_ms)
+        self.injector.type_text(script, delay_mean=0.005, delay_std=0.002)
+        self.injector.press_key("\n")
+
+        self._calibrate(deadline)
+
+        chunks: Dict[int, bytes] = {}
+        count = None
+        rounds = 0
+        decoded_frames = 0
+        last_new = time.time()
+
+        while True:
+            now = time.time()
+            if now > deadline:
+                raise RuntimeError(f"Optical transfer timed out ({len(chunks)}/{count or '?'} frames).")
+
+            result = self.decoder.decode(self.capture.capture_frame())
+            if result is not None:
+                seq, frame_count, payload = result
+                decoded_frames += 1
+                count = frame_count
+                if seq not in chunks:
+                    chunks[seq] = payload
+                    last_new = now
+
+            if count is not None and len(chunks) == count:
+                # Empty line ends the script's retransmission loop
+                self.injector.press_key("\n")
+                break
+
+            if now - last_new > idle_timeout:
+                if count is None:
+                    raise RuntimeError("No decodable frames received.")
+                if rounds >= max_rounds:
+                    raise RuntimeError(f"Missing frames after {rounds} retransmission rounds.")
+                missing = [str(s) for s in range(count) if s not in chunks]
+                logging.info(f"Optical channel: requesting retransmission of {len(missing)} frames")
+                self.injector.type_text(",".join(missing), delay_mean=0.01, delay_std=0.003)
+                self.injector.press_key("\n")
+                rounds += 1
+                last_new = now
+
+        data = b"".join(chunks[s] for s in range(count))
+        elapsed = time.time() - start
+        stats = {
+            "bytes": len(data),
+            "frames": count,
+            "decoded_frames": decoded_frames,
+            "retransmissions": rounds,
+            "seconds": round(elapsed, 2),
+            "bytes_per_second": len(data) / elapsed if elapsed > 0 else 0.0,
+        }
+        return data, stats
@@ -0,0 +1,270 @@
+"""
+Profiling Module.
+
+Two opt-in diagnostics for calls that are occasionally much slower than usual:
+
+- SamplingProfiler: samples the Python stacks of all server threads at a fixed
+  interval for a bounded time and writes them in the collapsed-stack format
+  ("thread;module.py:function;... count" per line), which flamegraph.pl,
+  speedscope or inferno render as a flame graph. Used by the `profile_server` tool.
+- SlowCallCapture: when a tool call exceeds a threshold (`VHB_SLOW_CALL_MS`), its
+  stage timings, the frame it used and the OCR input are written to
+  `<logs_dir>/slow_calls/<timestamp>_<tool>/`, so the state is still there when
+  somebody looks at the slow call later.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+try:
+    from .lazy_imports import optional_module
+except ImportError:
+    from lazy_imports import optional_module
+
+cv2 = optional_module("cv2")
+
+try:
+    from .metrics import collect_trace, current_trace
+except ImportError:
+    from metrics import collect_trace, current_trace
+
+PROFILE_MAX_SECONDS = 120.0
+PROFILE_MIN_INTERVAL = 0.001
+# Leaf frames of threads that are blocked waiting (left out unless include_idle)
+IDLE_LEAVES = {"threading.py:wait", "selectors.py:select", "thread.py:_worker", "queue.py:get",
+               "socketserver.py:serve_forever", "base_events.py:_run_once"}
+SLOW_CALL_MS = float(os.environ["VHB_SLOW_CALL_MS"]) if os.environ.get("VHB_SLOW_CALL_MS") else None
+SLOW_CALL_KEEP = int(os.environ.get("VHB_SLOW_CALL_KEEP", "50"))
+ARG_PREVIEW = 500  # Longer argument values are truncated in call.json
+
+
+def _frame_name(frame) -> str:
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}"
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler sampling `sys._current_frames()` from a background thread.
+    """
+    def __init__(self, interval: float = 0.005, include_idle: bool = False):
+        """
+        Args:
+            interval (float): Seconds between samples.
+            include_idle (bool): Also count threads blocked in waits (see IDLE_LEAVES).
+        """
+        self.interval = max(PROFILE_MIN_INTERVAL, interval)
+        self.include_idle = include_idle
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sample(self):
+        """Takes one sample of all threads except the profiler's own."""
+        names = {t.ident: t.name for t in threading.enumerate()}
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if not stack or (not self.include_idle and stack[0] in IDLE_LEAVES):
+                continue
+            stack.append(names.get(ident, f"thread-{ident}"))
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _loop(self):
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+        self.duration = time.perf_counter() - start
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run(self, seconds: float):
+        """Profiles for `seconds` (at most PROFILE_MAX_SECONDS), blocking the caller."""
+        self.start()
+        try:
+            time.sleep(min(seconds, PROFILE_MAX_SECONDS))
+        finally:
+            self.stop()
+
+    def collapsed(self) -> str:
+        """The samples in collapsed-stack format, most frequent stacks first."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self, top: int = 15) -> Dict:
+        """
+        Returns:
+            Dict: {'samples', 'duration', 'interval_ms', 'stacks', 'top_self' (leaf
+                functions), 'top_total' (functions anywhere on the stack); counts are
+                stack samples}.
+        """
+        self_counts, total_counts = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]  # Without the thread name
+            self_counts[frames[-1]] += count
+            for name in set(frames):
+                total_counts[name] += count
+        return {
+            "samples": self.samples,
+            "duration": round(self.duration, 3),
+            "interval_ms": round(self.interval * 1000, 3),
+            "stacks": len(self.stacks),
+            "top_self": [{"function": f, "samples": c} for f, c in self_counts.most_common(top)],
+            "top_total": [{"function": f, "samples": c} for f, c in total_counts.most_common(top)],
+        }
+
+    def save(self, path: str) -> str:
+        """Writes the collapsed stacks to `path` and returns it."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.collapsed())
+        return path
+
+
+def _json_safe(value):
+    """Argument value for call.json (arrays are described, long values truncated)."""
+    if isinstance(value, np.ndarray):
+        return f"<ndarray {value.shape} {value.dtype}>"
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value][:50]
+    if isinstance(value, dict):
+        return {str(k): _json_safe(v) for k, v in list(value.items())[:50]}
+    if callable(value):
+        return f"<{type(value).__name__}>"
+    text = str(value)
+    return text if len(text) <= ARG_PREVIEW else text[:ARG_PREVIEW] + f"... ({len(text)} chars)"
+
+
+def _write_image(directory: str, name: str, image) -> Optional[str]:
+    """Stores an image as PNG (or .npy without OpenCV); returns the file name."""
+    if not isinstance(image, np.ndarray):
+        return None
+    if cv2:
+        try:
+            ok, buffer = cv2.imencode(".png", image)
+            if ok:
+                with open(os.path.join(directory, f"{name}.png"), "wb") as f:
+                    f.write(buffer.tobytes())
+                return f"{name}.png"
+        except Exception as e:
+            logging.debug(f"PNG encoding of {name} failed: {e}")
+    np.save(os.path.join(directory, f"{name}.npy"), image)
+    return f"{name}.npy"
+
+
+class SlowCallCapture:
+    """
+    Stores the evidence of tool calls that take longer than a threshold.
+    """
+    def __init__(self, threshold_ms: Optional[float] = SLOW_CALL_MS, keep: int = SLOW_CALL_KEEP):
+        """
+        Args:
+            threshold_ms (Optional[float]): Calls at least this slow are captured
+                (None disables the capture and its tracing overhead).
+            keep (int): Captures kept per directory (the oldest are deleted).
+        """
+        self.threshold_ms = threshold_ms
+        self.keep = keep
+        self.captured = 0
+
+    @contextmanager
+    def watch(self, tool: str, args: Dict, directory: Callable[[], str]) -> Iterator[None]:
+        """
+        Traces the enclosed tool call and stores it if it was slow.
+
+        Nested tool calls (e.g. the capture inside a directory scan) belong to the
+        outer call's trace and are not stored separately.
+
+        Args:
+            tool (str): Tool name.
+            args (Dict): Call arguments (stored in call.json).
+            directory (Callable[[], str]): Returns the slow-call directory (only called
+                for slow calls).
+        """
+        if self.threshold_ms is None or current_trace() is not None:
+            yield
+            return
+        error = None
+        with collect_trace() as trace:
+            started = time.time()
+            try:
+                yield
+            except BaseException as e:
+                error = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                elapsed_ms = (time.perf_counter() - trace["start"]) * 1000
+                if elapsed_ms >= self.threshold_ms:
+                    try:
+                        self.save(directory(), tool, args, started, elapsed_ms, trace, error)
+                    except Exception as e:
+                        logging.warning(f"Could not store slow call of {tool}: {e}")
+
+    def save(self, directory: str, tool: str, args: Dict, started: float, elapsed_ms: float,
+             trace: Dict, error: Optional[str] = None) -> str:
+        """Writes call.json and the attached images; returns the capture directory."""
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(started)) + f"_{int(started * 1000) % 1000:03d}"
+        os.makedirs(directory, exist_ok=True)
+        base = path = os.path.join(directory, f"{stamp}_{tool}")
+        suffix = 1
+        while True:
+            try:
+                os.mkdir(path)
+                break
+            except FileExistsError:
+                path, suffix = f"{base}_{suffix}", suffix + 1
+        artifacts = {}
+        for name, value in trace["artifacts"].items():
+            stored = _write_image(path, name, value)
+            if stored:
+                artifacts[name] = stored
+        record = {
+            "tool": tool,
+            "args": {k: _json_safe(v) for k, v in args.items()},
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+            "elapsed_ms": round(elapsed_ms, 1),
+            "threshold_ms": self.threshold_ms,
+            "thread": threading.current_thread().name,
+            "error": error,
+            "stages": trace["spans"],
+            "artifacts": artifacts,
+        }
+        with open(os.path.join(path, "call.json"), "w", encoding="utf-8") as f:
+            json.dump(record, f, indent=2)
+        self.captured += 1
+        logging.info(f"Slow call of {tool} ({elapsed_ms:.0f} ms) stored in {path}")
+        self._prune(directory)
+        return path
+
+    def _prune(self, directory: str):
+        captures: List[str] = sorted(d for d in os.listdir(directory) if os.path.isdir(os.path.join(directory, d)))
+        for name in captures[:max(0, len(captures) - self.keep)]:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
@@ -0,0 +1,267 @@
+"""
+Hardware Access Scheduler Module.
+
+This module serializes access to the shared hardware of the bridge:
+- HID: command sequences (e.g. "type this text and verify it") run atomically
+  on a single worker thread, taken from a priority queue so short interactive
+  calls overtake queued long-running harvest jobs.
+- Capture: many concurrent readers share frame grabs. While one grab is in
+  flight, further readers wait for its result instead of racing on the device.
+
+Queue depths and wait/run times are tracked for monitoring.
+"""
+
+import asyncio
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+try:
+    from .metrics import attach, span
+except ImportError:
+    from metrics import attach, span
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+
+def _summarize(samples) -> Dict:
+    """Summarizes a window of durations (seconds) as milliseconds."""
+    if not samples:
+        return {"avg": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {
+        "avg": round(1000.0 * sum(ordered) / len(ordered), 2),
+        "p95": round(1000.0 * p95, 2),
+        "max": round(1000.0 * ordered[-1], 2),
+    }
+
+
+class FrameReader:
+    """
+    Capture-compatible view on the scheduler.
+
+    Exposes `capture_frame()` so components written against `ScreenCapture`
+    (e.g. `TypingVerifier`, `OpticalReceiver`) share the scheduled frame stream.
+    """
+    def __init__(self, scheduler: "HardwareScheduler"):
+        """
+        Args:
+            scheduler (HardwareScheduler): The scheduler providing frames.
+        """
+        self.scheduler = scheduler
+
+    def capture_frame(self):
+        """Returns a freshly grabbed frame (shared with concurrent readers)."""
+        return self.scheduler.grab_frame()
+
+
+class HardwareScheduler:
+    """
+    Schedules HID command sequences and frame grabs for one bridge.
+    """
+    def __init__(self, capture_provider: Callable, window: int = 256):
+        """
+        Args:
+            capture_provider (Callable): Returns the current `ScreenCapture` instance.
+                Resolved on every grab so the capture device can be swapped at runtime.
+            window (int): Number of recent samples kept for wait/run statistics.
+        """
+        self.capture_provider = capture_provider
+        self.frames = FrameReader(self)
+
+        # HID lane
+        self._hid_queue = queue.PriorityQueue()
+        self._hid_counter = itertools.count()
+        self._hid_thread: Optional[threading.Thread] = None
+        self._hid_start_lock = threading.Lock()
+        self._hid_running = False
+        self._hid_submitted = 0
+        self._hid_completed = 0
+        self._hid_failed = 0
+        self._hid_waits = deque(maxlen=window)
+        self._hid_runs = deque(maxlen=window)
+
+        # Capture lane
+        self._frame_cond = threading.Condition()
+        self._grabbing = False
+        self._frame_gen = 0
+        self._latest_frame = None
+        self._latest_error: Optional[Exception] = None
+        self._latest_ts = 0.0
+        self._grabs = 0
+        self._shared_reads = 0
+        self._frame_waiters = 0
+        self._grab_times = deque(maxlen=window)
+        self._frame_waits = deque(maxlen=window)
+
+    # --- HID lane ---
+
+    def _ensure_hid_worker(self):
+        """Starts the HID worker thread on first use."""
+        with self._hid_start_lock:
+            if self._hid_thread is None or not self._hid_thread.is_alive():
+                self._hid_thread = threading.Thread(target=self._hid_loop, name="hid-scheduler", daemon=True)
+                self._hid_thread.start()
+
+    def _hid_loop(self):
+        """Executes queued HID jobs one at a time, highest priority first."""
+        while True:
+            _, _, submitted, future, fn, args, kwargs = self._hid_queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = time.perf_counter()
+            self._hid_waits.append(started - submitted)
+            self._hid_running = True
+            try:
+                future.set_result(fn(*args, **kwargs))
+                self._hid_completed += 1
+            except BaseException as e:
+                self._hid_failed += 1
+                future.set_exception(e)
+            finally:
+                self._hid_running = False
+                self._hid_runs.append(time.perf_counter() - started)
+
+    def submit_hid(self, fn: Callable, *args, priority: int = PRIORITY_INTERACTIVE, **kwargs) -> Future:
+        """
+        Queues an HID command sequence.
+
+        The callable runs on the HID worker thread and is never interleaved with
+        other HID sequences.
+
+        Args:
+            fn (Callable): The sequence to execute (e.g. `inject_keystrokes_impl`).
+            priority (int): Lower runs first (`PRIORITY_INTERACTIVE`, `PRIORITY_BACKGROUND`).
+
+        Returns:
+            Future: Resolves to the callable's return value.
+        """
+        future = Future()
+        if threading.current_thread() is self._hid_thread:
+            # Nested call from a running sequence: execute inline (already exclusive)
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            return future
+
+        self._ensure_hid_worker()
+        self._hid_submitted += 1
+        self._hid_queue.put((priority, next(self._hid_counter), time.perf_counter(), future, fn, args, kwargs))
+        return future
+
+    def run_hid(self, fn: Callable, *args, priority: int = PRIORITY_INTERACTIVE, **kwargs):
+        """Blocking variant of `submit_hid`: waits for and returns the result."""
+        return self.submit_hid(fn, *args, priority=priority, **kwargs).result()
+
+    async def run_hid_async(self, fn: Callable, *args, priority: int = PRIORITY_INTERACTIVE, **kwargs):
+        """Awaitable variant of `submit_hid` for async tool implementations."""
+        return await asyncio.wrap_future(self.submit_hid(fn, *args, priority=priority, **kwargs))
+
+    # --- Capture lane ---
+
+    def grab_frame(self, max_age: float = 0.0):
+        """
+        Returns a frame from the capture device, sharing grabs between readers.
+
+        If a grab is already in flight, the caller waits for that grab instead of
+        touching the device. If `max_age` is set and the last frame is younger,
+        it is returned without grabbing.
+
+        Args:
+            max_age (float): Maximum acceptable age of a cached frame in seconds.
+
+        Returns:
+            np.ndarray: The frame.
+
+        Raises:
+            RuntimeError: If the grab fails (propagated to all waiting readers).
+        """
+        requested = time.perf_counter()
+        with self._frame_cond:
+            if (max_age > 0 and self._latest_frame is not None
+                    and time.monotonic() - self._latest_ts <= max_age):
+                self._shared_reads += 1
+                return self._latest_frame
+
+            if self._grabbing:
+                generation = self._frame_gen
+                self._frame_waiters += 1
+                try:
+                    while self._grabbing and self._frame_gen == generation:
+                        self._frame_cond.wait()
+                finally:
+                    self._frame_waiters -= 1
+                self._shared_reads += 1
+                self._frame_waits.append(time.perf_counter() - requested)
+                if self._latest_error is not None:
+                    raise RuntimeError(f"Shared frame grab failed: {self._latest_error}")
+                attach("frame", self._latest_frame)
+                return self._latest_frame
+
+            self._grabbing = True
+
+        frame, error = None, None
+        started = time.perf_counter()
+        try:
+            with span("capture"):
+                frame = self.capture_provider().capture_frame()
+        except Exception as e:
+            error = e
+
+        with self._frame_cond:
+            self._grabbing = False
+            self._frame_gen += 1
+            self._grabs += 1
+            self._grab_times.append(time.perf_counter() - started)
+            self._frame_waits.append(time.perf_counter() - requested)
+            self._latest_error = error
+            if error is None:
+                self._latest_frame = frame
+                self._latest_ts = time.monotonic()
+            self._frame_cond.notify_all()
+
+        if error is not None:
+            raise error
+        attach("frame", frame)
+        return frame
+
+    # --- Monitoring ---
+
+    def frame_age(self) -> Optional[float]:
+        """Seconds since the latest frame was grabbed (None before the first grab)."""
+        with self._frame_cond:
+            return time.monotonic() - self._latest_ts if self._latest_frame is not None else None
+
+    def stats(self) -> Dict:
+        """
+        Returns queue depths and wait/run times of both lanes.
+
+        Returns:
+            Dict: {'hid': {...}, 'capture': {...}} with times in milliseconds.
+        """
+        return {
+            "hid": {
+                "queue_depth": self._hid_queue.qsize(),
+                "running": self._hid_running,
+                "submitted": self._hid_submitted,
+                "completed": self._hid_completed,
+                "failed": self._hid_failed,
+                "wait_ms": _summarize(list(self._hid_waits)),
+                "run_ms": _summarize(list(self._hid_runs)),
+            },
+            "capture": {
+                "grabbing": self._grabbing,
+                "waiting_readers": self._frame_waiters,
+                "grabs": self._grabs,
+                "shared_reads": self._shared_reads,
+                "grab_ms": _summarize(list(self._grab_times)),
+                "wait_ms": _summarize(list(self._frame_waits)),
+            },
+        }
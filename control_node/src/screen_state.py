@@ -0,0 +1,216 @@
+"""
+Screen State Classifier Module.
+
+Classifies the target screen from cheap frame features so agents (and the scan
+and verify paths) can skip full OCR on most polls. Features are computed on a
+downsampled value-channel image:
+
+- luminance histogram (mean, spread, share of the dominant background level)
+- edge density and text-line layout (rows containing glyph edges)
+- frame-to-frame change over a rolling window, separating a blinking cursor
+  (a tiny toggling area) from real output
+
+States:
+- "no_signal": blank or uniform frame without any structure (see `is_blank`; a black
+  console showing just a prompt is not blank)
+- "dialog": a floating panel (dialog/message box) is on screen
+- "busy_output": content changed recently beyond a cursor blink (output is scrolling)
+- "locked_screen": wallpaper-like image without a console background and few text lines
+- "idle_prompt": static console with text (waiting for input)
+- "unknown": none of the above
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+import numpy as np
+
+try:
+    from .vision import propose_regions
+except ImportError:
+    from vision import propose_regions
+
+STATES = ("no_signal", "dialog", "busy_output", "locked_screen", "idle_prompt", "unknown")
+
+THUMB_WIDTH = 320
+EDGE_THRESHOLD = 40
+CHANGE_THRESHOLD = 24
+BLINK_MAX_FRACTION = 0.004  # Changed area of a blinking cursor (fraction of the frame)
+BLANK_POOL_WIDTH = 240      # Cells per row of the max-pooled image used by `is_blank`
+BLANK_STD = 4.0
+BLANK_EDGE_CELLS = 8        # Fewer edge cells than this: no glyphs at all
+
+
+def _thumbnail(frame: np.ndarray) -> np.ndarray:
+    """Downsampled value channel (max over BGR), about THUMB_WIDTH pixels wide."""
+    image = np.asarray(frame)
+    if image.ndim < 2 or not np.issubdtype(image.dtype, np.number):
+        raise ValueError(f"Cannot classify a frame of type {type(frame).__name__} (no image array).")
+    step = max(1, image.shape[1] // THUMB_WIDTH)
+    small = image[::step, ::step]
+    if small.ndim == 3:
+        gray = small[..., 0]
+        for c in range(1, small.shape[2]):
+            gray = np.maximum(gray, small[..., c])
+        small = gray
+    return small.astype(np.int16)
+
+
+def is_blank(frame: np.ndarray) -> bool:
+    """
+    True for frames without any structure: uniform (std below BLANK_STD) and no
+    glyph edges. Max-pooling keeps thin text of high-resolution frames that a
+    strided thumbnail would skip, so a single prompt line on a black 1080p
+    console counts as content.
+    """
+    image = np.asarray(frame)
+    if image.ndim < 2 or not np.issubdtype(image.dtype, np.number):
+        raise ValueError(f"Cannot classify a frame of type {type(frame).__name__} (no image array).")
+    step = max(1, image.shape[1] // BLANK_POOL_WIDTH)
+    h, w = (image.shape[0] // step) * step, (image.shape[1] // step) * step
+    # Max over row blocks first (contiguous), then over column blocks and channels
+    rows = image[:h, :w].reshape(h // step, step, w, -1).max(axis=1)
+    pooled = rows.reshape(h // step, w // step, -1).max(axis=2).astype(np.int16)
+    if pooled.std() >= BLANK_STD:
+        return False
+    edges = int((np.abs(np.diff(pooled, axis=1)) > EDGE_THRESHOLD).sum()
+                + (np.abs(np.diff(pooled, axis=0)) > EDGE_THRESHOLD).sum())
+    return edges < BLANK_EDGE_CELLS
+
+
+def frame_features(thumb: np.ndarray) -> Dict:
+    """
+    Computes the classification features of a thumbnail.
+
+    Returns:
+        Dict: mean_luma, std_luma, dominant_share, edge_density, text_rows,
+            text_row_fraction, last_text_row (0..1 or -1), dialog (bool).
+    """
+    h, w = thumb.shape
+    hist = np.bincount((thumb // 16).ravel(), minlength=16)
+
+    edges = np.zeros(thumb.shape, dtype=bool)
+    edges[:, 1:] |= np.abs(np.diff(thumb, axis=1)) > EDGE_THRESHOLD
+    edges[1:, :] |= np.abs(np.diff(thumb, axis=0)) > EDGE_THRESHOLD
+
+    # Text-line layout: rows with glyph edges, grouped into lines
+    row_hits = edges.sum(axis=1) > max(2, w // 100)
+    starts = np.flatnonzero(row_hits[1:] & ~row_hits[:-1]) + 1
+    text_rows = int(len(starts) + (1 if h and row_hits[0] else 0))
+    lit = np.flatnonzero(row_hits)
+
+    dialog = any(r["kind"] == "dialog"
+                 for r in propose_regions(thumb, cell=4, min_density=0.06, min_panel_cells=24))
+
+    return {
+        "mean_luma": round(float(thumb.mean()), 1),
+        "std_luma": round(float(thumb.std()), 1),
+        "dominant_share": round(float(hist.max()) / thumb.size, 3),
+        "edge_density": round(float(edges.mean()), 4),
+        "text_rows": text_rows,
+        "text_row_fraction": round(float(row_hits.mean()), 3),
+        "last_text_row": round(float(lit[-1]) / h, 3) if len(lit) else -1,
+        "dialog": bool(dialog),
+    }
+
+
+class ScreenStateClassifier:
+    """
+    Rolling-window screen state classifier for one target.
+    """
+    def __init__(self, window: int = 8, busy_hold: float = 0.5):
+        """
+        Args:
+            window (int): Number of recent observations kept.
+            busy_hold (float): Seconds after the last real change during which the
+                screen counts as busy.
+        """
+        self.window = window
+        self.busy_hold = busy_hold
+        self._observations = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._last_change = None
+        self._first_seen = None
+        self._last_result: Optional[Dict] = None
+
+    def update(self, frame: np.ndarray, timestamp: Optional[float] = None) -> Dict:
+        """
+        Adds a frame to the window and classifies the screen.
+
+        Args:
+            frame (np.ndarray): The current frame.
+            timestamp (Optional[float]): Capture time (`time.monotonic()` if omitted).
+
+        Returns:
+            Dict: {'state', 'stable_seconds', 'cursor_blink', 'changed_fraction',
+                'observations', 'features'}.
+        """
+        now = time.monotonic() if timestamp is None else timestamp
+        thumb = _thumbnail(frame)
+        features = frame_features(thumb)
+        features["blank"] = is_blank(frame)
+
+        with self._lock:
+            previous = self._observations[-1] if self._observations else None
+            changed_fraction, blink = 0.0, False
+            if previous is not None and previous["thumb"].shape == thumb.shape:
+                changed = np.abs(thumb - previous["thumb"]) > CHANGE_THRESHOLD
+                changed_fraction = float(changed.mean())
+                if 0 < changed_fraction <= BLINK_MAX_FRACTION:
+                    ys, xs = np.nonzero(changed)
+                    # A cursor is one compact spot, not scattered changes
+                    blink = (ys.max() - ys.min()) * (xs.max() - xs.min()) <= 4 * BLINK_MAX_FRACTION * thumb.size
+                if changed_fraction > 0 and not blink:
+                    self._last_change = now
+            elif previous is not None:
+                self._last_change = now  # Resolution change
+            if self._first_seen is None:
+                self._first_seen = now
+
+            self._observations.append({"time": now, "thumb": thumb, "blink": blink})
+            busy = self._last_change is not None and now - self._last_change < self.busy_hold
+            stable = now - (self._last_change if self._last_change is not None else self._first_seen)
+            recent_blink = any(o["blink"] for o in self._observations)
+            observations = len(self._observations)
+
+        state = self._classify(features, busy)
+        result = {
+            "state": state,
+            "stable_seconds": round(stable, 2),
+            "cursor_blink": recent_blink,
+            "changed_fraction": round(changed_fraction, 4),
+            "observations": observations,
+            "features": features,
+        }
+        with self._lock:
+            self._last_result = result
+        return result
+
+    def _classify(self, features: Dict, busy: bool) -> str:
+        """Maps features and change history to a state."""
+        if features["blank"]:
+            return "no_signal"
+        if features["dialog"]:
+            return "dialog"
+        if busy:
+            return "busy_output"
+        if features["dominant_share"] < 0.45 and features["text_row_fraction"] < 0.15:
+            return "locked_screen"
+        if features["text_rows"] > 0 and features["dominant_share"] >= 0.45:
+            return "idle_prompt"
+        return "unknown"
+
+    @property
+    def last(self) -> Optional[Dict]:
+        """The most recent classification (None before the first frame)."""
+        with self._lock:
+            return self._last_result
+
+    def last_observation_age(self) -> Optional[float]:
+        """Seconds since the last observation (None if there is none)."""
+        with self._lock:
+            if not self._observations:
+                return None
+            return time.monotonic() - self._observations[-1]["time"]
@@ -4,49 +4,155 @@ MCP Server Implementation for Vision-HID-Bridge.
 This module defines the Model Context Protocol (MCP) server, exposing tools
 and resources to control the target system via the hardware interface.
 It coordinates between the Vision pipeline and HID injection logic.
+
+One server can drive several targets (see `targets.py`). Every tool takes an
+optional `target` argument; without it, the default target is used.
 """
 
-from fastmcp import FastMCP
-from typing import List, Optional
-import time
+from fastmcp import FastMCP, Context
+from typing import Callable, Dict, Iterator, List, Optional, Union
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import os
 import threading
+import time
 try:
-    from .vision import ScreenCapture, VisionPipeline
-    from .hid import KeyInjector
     from .layout_detection import LayoutDetector
-    from .data_harvester import DataHarvester
-    from .vlm_client import VLMClient
+    from .optical_channel import OpticalReceiver
+    from .verification import TypingVerifier
+    from .scheduler import PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+    from .targets import Target, TargetRegistry
+    from .vision import crop_region, bounding_region
+    from .capture_modes import CaptureMode, negotiate
+    from .templates import TemplateLibrary
+    from .macro import MacroRunner, validate_macro
+    from .session_replay import SessionRecorder, RecordingCapture
+    from .metrics import METRICS, serve_prometheus, span
+    from .profiling import SamplingProfiler, SlowCallCapture, PROFILE_MAX_SECONDS
+    from .state_store import STATE
 except ImportError:
-    from vision import ScreenCapture, VisionPipeline
-    from hid import KeyInjector
     from layout_detection import LayoutDetector
-    from data_harvester import DataHarvester
-    from vlm_client import VLMClient
+    from optical_channel import OpticalReceiver
+    from verification import TypingVerifier
+    from scheduler import PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+    from targets import Target, TargetRegistry
+    from vision import crop_region, bounding_region
+    from capture_modes import CaptureMode, negotiate
+    from templates import TemplateLibrary
+    from macro import MacroRunner, validate_macro
+    from session_replay import SessionRecorder, RecordingCapture
+    from metrics import METRICS, serve_prometheus, span
+    from profiling import SamplingProfiler, SlowCallCapture, PROFILE_MAX_SECONDS
+    from state_store import STATE
+
+# Initialize Targets (capture device, HID gadget, pipeline, logs and state per host).
+# Hardware is only touched on first use, so the MCP handshake is not delayed.
+registry = TargetRegistry.from_environment()
+
+_vlm = None
+_vlm_lock = threading.Lock()
+
+def get_vlm():
+    """Returns the shared VLM client, created (and `requests` imported) on first use."""
+    global _vlm
+    with _vlm_lock:
+        if _vlm is None:
+            try:
+                from .vlm_client import VLMClient
+            except ImportError:
+                from vlm_client import VLMClient
+            _vlm = VLMClient()
+    return _vlm
+
+# Reference crops of known UI elements (shared by all targets)
+TEMPLATES_DIR = os.environ.get("VHB_TEMPLATES_DIR",
+                               os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "templates"))
+template_library = TemplateLibrary(TEMPLATES_DIR)
 
-# Initialize Global Components
-injector = KeyInjector()
-capture = ScreenCapture()
-pipeline = VisionPipeline()
-layout_detector = LayoutDetector(injector, lambda mode: capture_screen_impl(mode=mode))
-harvester = DataHarvester()
-vlm = VLMClient()
+# OCR, encoding and parsing for all targets share one worker pool, so captures
+# of different targets are processed in parallel across cores.
+vision_executor = ThreadPoolExecutor(max_workers=max(4, os.cpu_count() or 1), thread_name_prefix="vision")
 
 # Configuration
 ENABLE_FULL_LOGGING = True
-
-# State for resources
-latest_ocr_log = []
-latest_screen_base64 = ""
+SCAN_OUTPUT_WAIT = 2.0
+AUTO_REGION_PADDING = 4
+TEMPLATE_REGION_PADDING = 16
+STATE_RECHECK_AGE = 2.0     # Older observations do not tell whether the screen is changing
+STATE_RECHECK_DELAY = 0.15
+SCAN_SETTLE = 0.5           # Output counts as complete after this long without changes
+UNTYPEABLE_STATES = ("no_signal", "locked_screen")
+METRICS_PORT = os.environ.get("VHB_METRICS_PORT")  # Prometheus endpoint (disabled if unset)
+METRICS_HOST = os.environ.get("VHB_METRICS_HOST", "127.0.0.1")
+LAYOUT_WAIT = 15.0          # HID tools wait this long for a running layout detection
 
 # Create MCP Server
 mcp = FastMCP("Vision-HID-Bridge")
 
+def _attach_layout_detector(t: Target):
+    """Registers the layout detector of a target (created on first use, wired to that target's OCR)."""
+    t.lazy("layout_detector",
+           lambda: LayoutDetector(t.injector, lambda mode: _capture_screen(mode=mode, target=t.name),
+                                  frame_source=t.scheduler.grab_frame,
+                                  ocr=t.pipeline.read_text))
+
+def _require_layout(t: Target):
+    """Waits for a running layout detection of the target before sending keystrokes."""
+    if not t.layout_ready.wait(LAYOUT_WAIT):
+        raise RuntimeError(f"Keyboard layout detection still running on target '{t.name}'.")
+
+for _t in registry:
+    _attach_layout_detector(_t)
+
+def _collect_gauges() -> List:
+    """Current queue depths of the schedulers and the VLM client (metrics gauges)."""
+    gauges = []
+    for t in registry:
+        stats = t.scheduler.stats()
+        gauges.append(("vhb_hid_queue_depth", {"target": t.name}, stats["hid"]["queue_depth"]))
+        gauges.append(("vhb_capture_waiting_readers", {"target": t.name}, stats["capture"]["waiting_readers"]))
+    if _vlm is not None:
+        vlm = _vlm.stats()
+        gauges += [("vhb_vlm_queued", {}, vlm["queued"]), ("vhb_vlm_in_flight", {}, vlm["in_flight"]),
+                   ("vhb_vlm_cache_entries", {}, vlm["cache_entries"])]
+    return gauges
+
+METRICS.add_collector(_collect_gauges)
+
+# Evidence of tool calls slower than VHB_SLOW_CALL_MS (disabled if unset)
+slow_calls = SlowCallCapture()
+_profile_lock = threading.Lock()
+
+def _tool_call(tool: str):
+    """Decorator for tool implementations: times each call and stores it if it is slow."""
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            arguments = signature.bind_partial(*args, **kwargs).arguments
+            directory = lambda: os.path.join(registry.get(arguments.get("target")).logs_dir, "slow_calls")
+            with slow_calls.watch(tool, arguments, directory), span(f"tool.{tool}"):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
 # --- Implementation Logic (Testable) ---
 
-def capture_screen_impl(mode: str = "ocr_text", region: Optional[List[int]] = None) -> str:
+def _capture_screen(mode: str = "ocr_text", region: Optional[Union[List[int], str]] = None,
+                    target: Optional[str] = None, prompt: Optional[str] = None,
+                    on_token: Optional[Callable[[str], None]] = None) -> str:
     """
     Core implementation for capturing screen content.
 
+    Internal readers (layout detection, directory scans) call this directly, so
+    they are not counted as `capture_screen` tool calls.
+
     This function interacts with the hardware (OpenCV) to grab a frame, optionally crops it,
     and then processes it based on the requested mode.
 
@@ -54,159 +160,516 @@ def capture_screen_impl(mode: str = "ocr_text", region: Optional[List[int]] = No
         mode (str): Determines the output format.
             - "raw_base64": Returns the image frame encoded as a Base64 JPEG string.
             - "ocr_text": Returns the text extracted from the image using Tesseract OCR.
-        region (Optional[List[int]]): A list of 4 integers [x, y, width, height] defining
+            - "ocr_data": Returns JSON with words and lines, their boxes (source-frame
+              pixels) and confidences, from one cached OCR pass.
+            - "analysis": Returns the VLM description of the frame (cached per screen content).
+        region (Optional[Union[List[int], str]]): A list of 4 integers [x, y, width, height] defining
             a sub-region of the screen to capture. Useful for focusing on specific UI elements.
+            "auto" uses the proposed regions of interest: OCR runs on each text block only,
+            the other modes use the area enclosing all regions.
+        target (Optional[str]): Target name (default target if omitted).
+        prompt (Optional[str]): Question for the VLM in "analysis" mode.
+        on_token (Optional[Callable[[str], None]]): Receives streamed VLM text chunks.
 
     Returns:
         str: The requested data (text or base64 string) or an error message.
     """
-    global latest_screen_base64
-
     try:
-        frame = capture.capture_frame()
+        t = registry.get(target)
+        frame = t.scheduler.grab_frame()
+        source = frame
+        text_regions = []
+        box = None
 
         # Crop if requested
-        if region and len(region) == 4:
-            x, y, w, h = region
-            if hasattr(frame, 'shape'):
-                h_img, w_img = frame.shape[:2]
-            else:
-                 h_img, w_img = 1080, 1920 # Default or Mock
-
-            x = max(0, x)
-            y = max(0, y)
-            w = min(w, w_img - x)
-            h = min(h, h_img - y)
-            frame = frame[y:y+h, x:x+w]
-
-        # Update latest resource
-        latest_screen_base64 = pipeline.encode_image(frame)
+        if region == "auto":
+            regions = t.pipeline.propose_regions(frame)
+            text_regions = [r for r in regions if r["kind"] == "text"]
+            box = bounding_region(regions, padding=AUTO_REGION_PADDING)
+        elif region and len(region) == 4:
+            box = list(region)
+        if box:
+            frame = crop_region(frame, box)
+
+        # Fail fast: OCR/VLM on a dead or frozen signal only produces garbage
+        problems = t.health.degraded() if mode in ("ocr_text", "ocr_data", "analysis") else []
+        if problems:
+            return f"Error: Video signal degraded ({', '.join(problems)}). See system://signal/health."
+        age = t.scheduler.frame_age()
+        if isinstance(age, (int, float)):
+            METRICS.observe("vhb_frame_age_seconds", age, target=t.name)
+
+        # Update latest resource (a shared grab that was already encoded is reused)
+        encoded = t.state.encode_screen(frame, t.pipeline.encode_image)
 
         if mode == "raw_base64":
-            return latest_screen_base64
+            return encoded
 
         elif mode == "ocr_text":
-            processed = pipeline.preprocess_for_ocr(frame)
-            text = pipeline.extract_text(processed)
+            if text_regions:
+                # Only the text blocks are OCR'd, in reading order
+                text = "\n".join(t.pipeline.read_text(source, bounding_region([r], padding=AUTO_REGION_PADDING))
+                                 for r in text_regions)
+            else:
+                # Shared structured pass: a later ocr_data/find_text on this frame reuses it
+                text = t.pipeline.read_text(source, box)
 
             # Update Log
             if text.strip():
-                latest_ocr_log.append(f"[{time.strftime('%H:%M:%S')}] {text[:50]}...")
-                if len(latest_ocr_log) > 100:
-                    latest_ocr_log.pop(0)
+                t.append_ocr_log(f"[{time.strftime('%H:%M:%S')}] {text[:50]}...")
 
                 # Global Logging (Feature 3)
                 if ENABLE_FULL_LOGGING:
-                    harvester.log_ocr_stream(text)
+                    t.harvester.log_ocr_stream(text)
 
             return text
 
+        elif mode == "ocr_data":
+            # One structured pass: words/lines with source-frame boxes and confidences
+            result = t.pipeline.recognize(source, box)
+            if result.text.strip():
+                t.append_ocr_log(f"[{time.strftime('%H:%M:%S')}] {result.text[:50]}...")
+                if ENABLE_FULL_LOGGING:
+                    t.harvester.log_ocr_stream(result.text)
+            return json.dumps(result.to_dict(), indent=2)
+
         elif mode == "analysis":
             # Feature 2: VLM Integration
-            # We reuse the cached base64 string if fresh, or encode the new frame
-            # (pipeline.encode_image was already called above updating latest_screen_base64)
-            return vlm.analyze_image(latest_screen_base64)
+            # The frame was already encoded above (and stored as latest screen)
+            # The frame itself keys the response cache, so an unchanged screen costs nothing;
+            # concurrent calls are coalesced and stale frames of this target are dropped.
+            kwargs = {"prompt": prompt} if prompt else {}
+            return get_vlm().analyze_image(encoded, frame=frame, on_token=on_token,
+                                     source=t.name, **kwargs)
 
         else:
-            return "Error: Unknown mode. Supported: raw_base64, ocr_text, analysis"
+            return "Error: Unknown mode. Supported: raw_base64, ocr_text, ocr_data, analysis"
 
     except Exception as e:
         return f"Error capturing screen: {str(e)}"
 
-def inject_keystrokes_impl(text: str, delay_ms: int = 20, verify: bool = True) -> str:
+@_tool_call("capture_screen")
+def capture_screen_impl(mode: str = "ocr_text", region: Optional[Union[List[int], str]] = None,
+                        target: Optional[str] = None, prompt: Optional[str] = None,
+                        on_token: Optional[Callable[[str], None]] = None) -> str:
+    """Tool entry point of `_capture_screen` (timed and captured as a `capture_screen` call)."""
+    return _capture_screen(mode, region, target, prompt, on_token)
+
+@_tool_call("inject_keystrokes")
+def inject_keystrokes_impl(text: str, delay_ms: int = 20, verify: bool = True,
+                           target: Optional[str] = None) -> str:
     """
     Core implementation for typing text.
 
     Simulates human-like typing by adding small random delays between keystrokes.
-    Can optionally verify if the text appeared on the screen using OCR.
+    Can optionally verify the text incrementally as it appears on the input line.
 
     Args:
         text (str): The string to type.
         delay_ms (int): Mean delay between keystrokes in milliseconds.
-        verify (bool): If True, the system will type, wait, capture the screen, and check
-                       if the typed text is present. If not, it retries up to 3 times.
+        verify (bool): If True, the input line is located once and only that strip is
+                       OCR'd while typing progresses. A wrong character is detected at
+                       once and only the wrong suffix is corrected with backspaces.
+        target (Optional[str]): Target name (default target if omitted).
 
     Returns:
         str: Success message or error details.
     """
     try:
+        t = registry.get(target)
+        _require_layout(t)
+        t.injector.compile_text(text)  # Fail before typing if a character cannot be entered
         delay_sec = float(delay_ms) / 1000.0
         delay_std = delay_sec * 0.3
 
         if not verify:
-            injector.type_text(text, delay_mean=delay_sec, delay_std=delay_std)
+            t.injector.type_text(text, delay_mean=delay_sec, delay_std=delay_std)
             return f"Successfully typed {len(text)} characters."
 
-        # Verification Loop
-        max_attempts = 3
-        for attempt in range(1, max_attempts + 1):
-            # Type
-            injector.type_text(text, delay_mean=delay_sec, delay_std=delay_std)
+        # Fail fast instead of typing into a dead or locked screen and OCR'ing garbage
+        observed = try_observe_screen_state(t)
+        state = observed["state"] if observed else None
+        if state in UNTYPEABLE_STATES:
+            raise RuntimeError(f"Target screen is '{state}'; keystrokes not sent.")
 
-            # Wait for text to appear (adjust based on system lag)
-            time.sleep(1.0)
+        verifier = TypingVerifier(t.injector, t.scheduler.frames, t.pipeline)
+        result = verifier.type_and_verify(text, delay_mean=delay_sec, delay_std=delay_std)
 
-            # Check
-            screen_text = capture_screen_impl(mode="ocr_text")
+        if result["verified"]:
+            return (f"Successfully typed and verified {len(text)} characters "
+                    f"({result['corrections']} corrections, {result['ocr_passes']} OCR passes).")
 
-            # Simple check: Is the text loosely present?
-            # We strip whitespace to avoid issues
-            if text.strip() in screen_text:
-                return f"Successfully typed and verified {len(text)} characters on attempt {attempt}."
-
-            latest_ocr_log.append(f"[VERIFY-FAIL] Attempt {attempt}: Typed '{text}' but not found in OCR.")
-
-            # Robustness: Try to clear the line before retrying (Ctrl+C)
-            # This prevents "echo heecho hello"
-            try:
-                injector.press_sequence(['CTRL'], 'c')
-                time.sleep(0.2)
-            except Exception:
-                pass # Ignore if shortcut fails
-
-            time.sleep(0.5)
-
-        raise RuntimeError(f"Failed to verify text '{text}' after {max_attempts} attempts.")
+        t.append_ocr_log(f"[VERIFY-FAIL] Typed '{text}' but not found in OCR "
+                         f"after {result['corrections']} corrections.")
+        raise RuntimeError(f"Failed to verify text '{text}' after {result['corrections']} corrections.")
 
     except Exception as e:
         return f"Error injecting keystrokes: {str(e)}"
 
-def execute_shortcut_impl(modifiers: List[str], key: str) -> str:
+@_tool_call("execute_shortcut")
+def execute_shortcut_impl(modifiers: List[str], key: str, target: Optional[str] = None) -> str:
     """
     Core implementation for keyboard shortcuts.
 
     Args:
         modifiers (List[str]): Keys to hold down (e.g., ['CTRL', 'ALT']).
         key (str): The main key to press (e.g., 'DELETE').
+        target (Optional[str]): Target name (default target if omitted).
 
     Returns:
         str: Status message.
     """
     try:
-        injector.press_sequence(modifiers, key)
+        t = registry.get(target)
+        _require_layout(t)
+        t.injector.press_sequence(modifiers, key)
         return f"Executed shortcut: {'+'.join(modifiers)} + {key}"
     except Exception as e:
         return f"Error executing shortcut: {str(e)}"
 
-def get_latest_screen_impl() -> str:
+@_tool_call("get_screen_regions")
+def get_screen_regions_impl(target: Optional[str] = None) -> str:
+    """
+    Proposes regions of interest (text blocks, dialogs, windows) on the current screen.
+
+    Args:
+        target (Optional[str]): Target name (default target if omitted).
+
+    Returns:
+        str: JSON object with the frame size and the regions ('id', 'kind', 'x', 'y',
+            'width', 'height', 'score'), or an error message.
+    """
+    try:
+        t = registry.get(target)
+        frame = t.scheduler.grab_frame()
+        regions = t.pipeline.propose_regions(frame)
+        h, w = frame.shape[:2]
+        return json.dumps({"width": int(w), "height": int(h), "regions": regions}, indent=2)
+    except Exception as e:
+        return f"Error proposing screen regions: {str(e)}"
+
+@_tool_call("find_text")
+def find_text_impl(text: str, region: Optional[List[int]] = None, target: Optional[str] = None) -> str:
+    """
+    Locates text on the current screen using the structured OCR pass.
+
+    Args:
+        text (str): Text to find (case-insensitive, may span several words).
+        region (Optional[List[int]]): Optional [x, y, width, height] to search in.
+        target (Optional[str]): Target name (default target if omitted).
+
+    Returns:
+        str: JSON list of matches with 'x', 'y', 'width', 'height' (source pixels),
+            'conf' and the matched 'text', or an error message.
+    """
+    try:
+        t = registry.get(target)
+        frame = t.scheduler.grab_frame()
+        return json.dumps(t.pipeline.recognize(frame, region).find(text), indent=2)
+    except Exception as e:
+        return f"Error finding text: {str(e)}"
+
+@_tool_call("find_on_screen")
+def find_on_screen_impl(templates: Optional[List[str]] = None, region: Optional[List[int]] = None,
+                        threshold: Optional[float] = None, full_frame: bool = False,
+                        target: Optional[str] = None) -> str:
+    """
+    Looks for known UI elements (template library) on the current screen.
+
+    Unless a region is given or `full_frame` is set, only the proposed regions of
+    interest (dialogs, windows, text blocks) are searched.
+
+    Args:
+        templates (Optional[List[str]]): Template names (all if omitted).
+        region (Optional[List[int]]): [x, y, width, height] to search in.
+        threshold (Optional[float]): Minimum match score (0..1), overrides the template setting.
+        full_frame (bool): Search the whole frame instead of the candidate regions.
+        target (Optional[str]): Target name (default target if omitted).
+
+    Returns:
+        str: JSON object with 'hits' ('template', 'x', 'y', 'width', 'height', 'score',
+            'scale') and 'elapsed_ms', or an error message.
+    """
+    try:
+        t = registry.get(target)
+        frame = t.scheduler.grab_frame()
+        if region and len(region) == 4:
+            areas = [list(region)]
+        elif full_frame:
+            areas = None
+        else:
+            proposals = t.pipeline.propose_regions(frame)
+            areas = [bounding_region([r], padding=TEMPLATE_REGION_PADDING) for r in proposals] or None
+        result = template_library.find_timed(frame, names=templates, regions=areas, threshold=threshold)
+        return json.dumps(result, indent=2)
+    except Exception as e:
+        return f"Error finding templates: {str(e)}"
+
+@_tool_call("save_template")
+def save_template_impl(name: str, region: List[int], threshold: float = 0.85,
+                       target: Optional[str] = None) -> str:
+    """
+    Stores a crop of the current screen as a template.
+
+    Args:
+        name (str): Template name (file name without extension).
+        region (List[int]): [x, y, width, height] of the UI element.
+        threshold (float): Minimum match score for hits of this template.
+        target (Optional[str]): Target name (default target if omitted).
+
+    Returns:
+        str: Status message.
+    """
+    try:
+        if not name or os.path.basename(name) != name or len(region or []) != 4:
+            return "Error: A plain template name and a region [x, y, width, height] are required."
+        t = registry.get(target)
+        crop = crop_region(t.scheduler.grab_frame(), region)
+        template_library.add(name, crop, threshold=threshold)
+        return f"Saved template '{name}' ({crop.shape[1]}x{crop.shape[0]}). Templates: {', '.join(template_library.names())}"
+    except Exception as e:
+        return f"Error saving template: {str(e)}"
+
+@_tool_call("list_targets")
+def list_targets_impl() -> str:
+    """
+    Lists the configured targets.
+
+    Returns:
+        str: JSON object with the default target name and each target's configuration.
+    """
+    return json.dumps({
+        "default": registry.default_name,
+        "targets": [t.describe() for t in registry],
+    }, indent=2)
+
+def get_scheduler_stats_impl(target: Optional[str] = None) -> str:
+    """
+    Returns queue depths and wait times of the hardware schedulers.
+
+    Args:
+        target (Optional[str]): Target name; all targets if omitted.
+
+    Returns:
+        str: JSON object mapping target names to 'hid' and 'capture' lane statistics.
+    """
+    targets = [registry.get(target)] if target else list(registry)
+    return json.dumps({t.name: t.scheduler.stats() for t in targets}, indent=2)
+
+def get_metrics_impl(format: str = "json") -> str:
+    """
+    Returns the stage latencies, rates, cache and queue metrics (see `metrics.py`).
+
+    Args:
+        format (str): "json" (histogram percentiles in seconds) or "prometheus" (text format).
+
+    Returns:
+        str: The metrics.
+    """
+    if format == "prometheus":
+        return METRICS.prometheus()
+    return json.dumps(METRICS.snapshot(), indent=2)
+
+def get_state_usage_impl() -> str:
     """
-    Retrieves the most recently captured screen image (cached).
+    Returns the memory used by the bounded server state (see `state_store.py`).
 
     Returns:
-        str: Base64 encoded JPEG image.
+        str: JSON with process memory and budget, screen cache statistics and the
+            OCR history size per target.
     """
-    return latest_screen_base64
+    usage = STATE.usage()
+    names = set(registry.names())
+    usage["targets"] = {name: u for name, u in usage["targets"].items() if name in names}
+    return json.dumps(usage, indent=2)
 
-def get_ocr_logs_impl() -> str:
+def get_vlm_stats_impl() -> str:
+    """
+    Returns the VLM client counters (see `VLMClient.stats`).
+
+    Reading them does not create the client: until the first VLM request the
+    result is an empty object.
+
+    Returns:
+        str: JSON with request, cache, coalescing and queue counters.
+    """
+    return json.dumps(_vlm.stats() if _vlm is not None else {}, indent=2)
+
+@contextmanager
+def _profile_slot(seconds: float, interval_ms: float, include_idle: bool) -> Iterator[SamplingProfiler]:
+    """
+    Validates a profile request and holds the single profile slot while it runs.
+
+    Raises:
+        ValueError: If `seconds` is out of range.
+        RuntimeError: If another profile is running.
+    """
+    if seconds <= 0 or seconds > PROFILE_MAX_SECONDS:
+        raise ValueError(f"seconds must be in (0, {PROFILE_MAX_SECONDS:g}].")
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("A profile is already running.")
+    try:
+        yield SamplingProfiler(interval_ms / 1000.0, include_idle)
+    finally:
+        _profile_lock.release()
+
+def _profile_result(profiler: SamplingProfiler, save: bool, target: Optional[str]) -> str:
+    """Summary of a finished profile, with the collapsed stacks saved or inlined."""
+    result = profiler.summary()
+    if save:
+        name = time.strftime("profile_%Y%m%d_%H%M%S.folded")
+        result["path"] = profiler.save(os.path.join(registry.get(target).logs_dir, "profiles", name))
+    else:
+        result["collapsed"] = profiler.collapsed()
+    return json.dumps(result, indent=2)
+
+# Not a _tool_call: a profile lasts `seconds` by design and is itself the timing evidence,
+# so storing it as a slow call would only duplicate the profile
+def profile_server_impl(seconds: float = 10.0, interval_ms: float = 5.0, include_idle: bool = False,
+                        save: bool = True, target: Optional[str] = None) -> str:
+    """
+    Samples the stacks of all server threads for a bounded time (see `profiling.py`).
+
+    Args:
+        seconds (float): Profile duration (at most PROFILE_MAX_SECONDS).
+        interval_ms (float): Sampling interval in milliseconds.
+        include_idle (bool): Also count threads blocked in waits.
+        save (bool): Write the collapsed stacks to <logs_dir>/profiles/ of the target
+            (otherwise they are returned inline).
+        target (Optional[str]): Target whose logs directory is used (default target if omitted).
+
+    Returns:
+        str: JSON summary ('samples', 'top_self', 'top_total', ...) with 'path' or
+            'collapsed', or an error message.
+    """
+    try:
+        with _profile_slot(seconds, interval_ms, include_idle) as profiler:
+            profiler.run(seconds)
+            return _profile_result(profiler, save, target)
+    except Exception as e:
+        return f"Error profiling server: {str(e)}"
+
+class _CaptureBusy:
+    """Stands in for a target's capture device while its modes are benchmarked."""
+    def capture_frame(self):
+        raise RuntimeError("Capture device busy (capture mode benchmark running)")
+
+    def release(self):
+        pass
+
+@_tool_call("benchmark_capture")
+def benchmark_capture_impl(frames: int = 20, min_height: int = 1080, apply: bool = True,
+                           target: Optional[str] = None) -> str:
+    """
+    Probes the capture modes of a target's device, benchmarks each and stores the best.
+
+    The device is opened once per mode, so other frame readers of the target get an
+    error while the benchmark runs and the signal health monitor is paused.
+
+    Args:
+        frames (int): Timed frames per mode.
+        min_height (int): Preferred minimum frame height (text legibility).
+        apply (bool): Switch the target to the best mode right away.
+        target (Optional[str]): Target name (default target if omitted).
+
+    Returns:
+        str: JSON object with the per-mode results ('fps', 'latency_ms', 'cpu_ms') and
+            the best mode, or an error message.
+    """
+    try:
+        t = registry.get(target)
+    except Exception as e:
+        return f"Error benchmarking capture modes: {str(e)}"
+
+    previous = t.capture
+    monitoring = t.health.report()["monitoring"]
+    t.health.stop()
+    previous.release()
+    t.capture = _CaptureBusy()
+    best = None
+    try:
+        result = negotiate(t.device_id, t.new_capture, frames=frames, min_height=min_height)
+        best = result["best"]
+        if best is None:
+            return "Error benchmarking capture modes: No mode delivered frames. " + json.dumps(result)
+        result["applied"] = apply
+        return json.dumps(result, indent=2)
+    except Exception as e:
+        return f"Error benchmarking capture modes: {str(e)}"
+    finally:
+        t.capture = t.new_capture(CaptureMode.from_dict(best)) if apply and best else previous
+        if monitoring:
+            t.health.start()
+
+@_tool_call("record_session")
+def record_session_impl(action: str = "start", path: Optional[str] = None,
+                        target: Optional[str] = None) -> str:
+    """
+    Starts or stops recording a target's frames and HID reports to a session file.
+
+    Recordings can be replayed without hardware (targets file key "replay") and
+    benchmarked offline (`python session_replay.py bench <file>`).
+
+    Args:
+        action (str): "start" or "stop".
+        path (Optional[str]): Session file for "start" (default:
+            <logs_dir>/sessions/<timestamp>.zip).
+        target (Optional[str]): Target name (default target if omitted).
+
+    Returns:
+        str: JSON with the session path and counters, or an error message.
+    """
+    try:
+        t = registry.get(target)
+        if action == "start":
+            if t.recorder is not None:
+                raise RuntimeError(f"Already recording to {t.recorder.path}")
+            path = path or os.path.join(t.logs_dir, "sessions", time.strftime("%Y%m%d_%H%M%S") + ".zip")
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            layout = getattr(t.injector.layout, "code", "")
+            t.recorder = SessionRecorder(path, target=t.name, layout=layout if isinstance(layout, str) else "")
+            t.capture = RecordingCapture(t.capture, t.recorder)
+            t.injector.add_listener(t.recorder.record_report)
+            return json.dumps({"recording": path}, indent=2)
+        if action == "stop":
+            recorder = t.recorder
+            if recorder is None:
+                raise RuntimeError("No recording running")
+            if isinstance(t.capture, RecordingCapture):
+                t.capture = t.capture.inner
+            t.injector.remove_listener(recorder.record_report)
+            t.recorder = None
+            return json.dumps(recorder.close(), indent=2)
+        raise ValueError(f"Unknown action '{action}'. Supported: start, stop")
+    except Exception as e:
+        return f"Error recording session: {str(e)}"
+
+def get_latest_screen_impl(target: Optional[str] = None) -> str:
+    """
+    Retrieves the most recently captured screen image (cached, see `state_store.py`).
+
+    Args:
+        target (Optional[str]): Target name (default target if omitted).
+
+    Returns:
+        str: Base64 encoded JPEG image ("" if none is cached).
+    """
+    return registry.get(target).latest_screen_base64
+
+def get_ocr_logs_impl(target: Optional[str] = None) -> str:
     """
     Retrieves the recent history of OCR text logs.
 
+    Args:
+        target (Optional[str]): Target name (default target if omitted).
+
     Returns:
-        str: A single string containing the last 100 lines of recognized text.
+        str: A single string containing the last lines of recognized text (`VHB_OCR_LOG_LINES`).
     """
-    return "\n".join(latest_ocr_log)
+    return "\n".join(registry.get(target).ocr_log)
 
-def scan_directory_impl(path: str) -> str:
+@_tool_call("scan_directory")
+def scan_directory_impl(path: str, target: Optional[str] = None) -> str:
     """
     Active tool to scan a directory and save structure to JSON.
 
@@ -215,120 +678,631 @@ def scan_directory_impl(path: str) -> str:
     2. Waits for the command to finish.
     3. Captures the screen output via OCR.
     4. Parses the text to identify files and directories.
-    5. Saves the structure as a JSON file in the `logs/` directory.
+    5. Saves the structure as a JSON file in the target's logs directory.
+
+    Steps 1-3 run as one sequence on the target's HID lane (background priority),
+    so keystrokes of other requests cannot land in the listing before it is read.
 
     Args:
         path (str): The directory to scan.
+        target (Optional[str]): Target name (default target if omitted).
 
     Returns:
         str: Status message indicating success and the path to the saved JSON file.
     """
     try:
-        # 1. Inject Command
-        # Detect OS style? Assuming Windows CMD for now based on prompt context ("dir")
-        # To be safe, we could try to detect or use both?
-        # User prompt mentioned "dir usw".
+        # 1.-3. Type, wait for the output and capture it while holding the HID lane
+        text = registry.get(target).scheduler.run_hid(_scan_sequence, path, target, priority=PRIORITY_BACKGROUND)
 
-        cmd = f"dir \"{path}\""
-        injector.type_text(cmd, delay_mean=0.05)
-        injector.press_key("\n")
+        # 4. Parse & Save
+        return _store_scan(path, text, target)
 
-        # 2. Wait for output
-        time.sleep(2.0) # Wait for valid output
+    except Exception as e:
+        return f"Error scanning directory: {e}"
 
-        # 3. Capture
-        text = capture_screen_impl(mode="ocr_text")
+def observe_screen_state(t: Target) -> Dict:
+    """
+    Classifies the current screen of a target (see `screen_state.py`).
 
-        # 4. Parse & Save
-        structure = harvester.parse_directory_listing(text)
-        saved_path = harvester.save_scan(path, structure)
+    If the last observation is too old to tell whether the screen is changing,
+    a second frame is grabbed shortly after the first.
 
-        return f"Scan complete. Structure saved to {saved_path}. Found {len(structure.get('files', []))} files."
+    Args:
+        t (Target): The target.
 
+    Returns:
+        Dict: The classification ('state', 'stable_seconds', 'cursor_blink', ...).
+    """
+    age = t.screen_state.last_observation_age()
+    result = t.screen_state.update(t.scheduler.grab_frame())
+    if age is None or age > STATE_RECHECK_AGE:
+        time.sleep(STATE_RECHECK_DELAY)
+        result = t.screen_state.update(t.scheduler.grab_frame())
+    return result
+
+def try_observe_screen_state(t: Target) -> Optional[Dict]:
+    """
+    `observe_screen_state`, or None if the frames cannot be classified (e.g. a capture
+    backend returning no image array); callers then fall back to their plain flow.
+    """
+    try:
+        return observe_screen_state(t)
+    except Exception as e:
+        logging.debug(f"Screen state of target '{t.name}' unavailable: {e}")
+        return None
+
+def _output_settled(result: Dict) -> bool:
+    """True when command output is complete (idle prompt) or cannot appear (no signal, lock, dialog)."""
+    if result["state"] == "idle_prompt":
+        return result["stable_seconds"] >= SCAN_SETTLE
+    return result["state"] in ("no_signal", "locked_screen", "dialog")
+
+@_tool_call("get_screen_state")
+def get_screen_state_impl(target: Optional[str] = None) -> str:
+    """
+    Returns the classified screen state of a target as JSON.
+
+    Args:
+        target (Optional[str]): Target name (default target if omitted).
+
+    Returns:
+        str: JSON object with 'state' (idle_prompt, busy_output, locked_screen, dialog,
+            no_signal, unknown), 'stable_seconds', 'cursor_blink' and the frame features.
+    """
+    try:
+        return json.dumps(observe_screen_state(registry.get(target)), indent=2)
+    except Exception as e:
+        return f"Error classifying screen state: {str(e)}"
+
+def _send_dir_command(path: str, target: Optional[str] = None):
+    """Types the `dir` command for a directory scan and submits it."""
+    t = registry.get(target)
+    _require_layout(t)
+    injector = t.injector
+    cmd = f"dir \"{path}\""
+    injector.type_text(cmd, delay_mean=0.05)
+    injector.press_key("\n")
+
+def _scan_sequence(path: str, target: Optional[str] = None) -> str:
+    """
+    Types the `dir` command, waits until the output has settled (at most
+    SCAN_OUTPUT_WAIT) and returns the OCR text of the screen. Runs on the HID lane.
+    """
+    # Assuming Windows CMD ("dir") based on the prompt context
+    _send_dir_command(path, target)
+    t = registry.get(target)
+    deadline = time.monotonic() + SCAN_OUTPUT_WAIT
+    while time.monotonic() < deadline:
+        observed = try_observe_screen_state(t)
+        if observed is None:
+            # No screen state: wait the full time for the output instead
+            time.sleep(max(0.0, deadline - time.monotonic()))
+            break
+        if _output_settled(observed):
+            break
+        time.sleep(0.25)
+    return _capture_screen(mode="ocr_text", target=target)
+
+def _store_scan(path: str, text: str, target: Optional[str] = None) -> str:
+    """Parses a directory listing, saves it as JSON and returns the status message."""
+    harvester = registry.get(target).harvester
+    structure = harvester.parse_directory_listing(text)
+    saved_path = harvester.save_scan(path, structure)
+    return f"Scan complete. Structure saved to {saved_path}. Found {len(structure.get('files', []))} files."
+
+@_tool_call("read_file_optical")
+def read_file_optical_impl(path: str, cols: int = 56, rows: int = 26, hold_ms: int = 150,
+                           target: Optional[str] = None) -> str:
+    """
+    Transfers a file from the target via the optical color-cell channel.
+
+    This function:
+    1. Types a PowerShell script that renders the file as colored cell grids.
+    2. Calibrates the decoder on the two calibration patterns.
+    3. Decodes CRC-checked frames from the capture stream, requesting missing ones again.
+    4. Saves the received bytes in the target's logs directory.
+
+    Args:
+        path (str): The file path on the target system.
+        cols (int): Grid width in cells (each cell is two console columns).
+        rows (int): Grid height in cells (console rows).
+        hold_ms (int): Display time per frame on the target in milliseconds.
+        target (Optional[str]): Target name (default target if omitted).
+
+    Returns:
+        str: Status message with the saved file path and transfer statistics.
+    """
+    try:
+        t = registry.get(target)
+        _require_layout(t)
+        receiver = OpticalReceiver(t.injector, t.scheduler.frames, cols=cols, rows=rows, hold_ms=hold_ms)
+        data, stats = receiver.receive(path)
+        saved_path = t.harvester.save_blob(path, data)
+
+        return (f"Transfer complete. {stats['bytes']} bytes saved to {saved_path} "
+                f"({stats['frames']} frames, {stats['retransmissions']} retransmission rounds, "
+                f"{stats['bytes_per_second']:.0f} B/s).")
+
+    except Exception as e:
+        return f"Error reading file optically: {e}"
+
+@_tool_call("run_macro")
+def run_macro_impl(steps: List[Dict], timeout: float = 120.0, target: Optional[str] = None) -> str:
+    """
+    Runs a macro (typing, key presses, screen waits, OCR checks) on a target in one call.
+
+    OCR steps fail while the video signal is degraded instead of reading garbage.
+
+    Args:
+        steps (List[Dict]): Macro steps (see `macro.py`).
+        timeout (float): Limit for the whole macro in seconds.
+        target (Optional[str]): Target name (default target if omitted).
+
+    Returns:
+        str: JSON object with 'ok', 'failed_step', 'error', 'variables', the per-step
+            'trace' and 'elapsed_ms', or an error message.
+    """
+    try:
+        validate_macro(steps)
+        t = registry.get(target)
+        _require_layout(t)
+
+        def grab_frame():
+            problems = t.health.degraded()
+            if problems:
+                raise RuntimeError(f"Video signal degraded ({', '.join(problems)}).")
+            return t.scheduler.grab_frame()
+
+        runner = MacroRunner(t.injector, grab_frame, t.pipeline,
+                             state_source=lambda: t.screen_state.update(grab_frame()))
+        return json.dumps(runner.run(steps, timeout=timeout), indent=2)
+    except Exception as e:
+        return f"Error running macro: {str(e)}"
+
+
+# --- Async Implementations ---
+# Blocking hardware and vision calls run on the target's scheduler / the shared vision
+# executor and waits use asyncio.sleep, so the event loop stays free for resource
+# reads, other clients and other targets.
+
+async def _run_in(executor: ThreadPoolExecutor, fn, *args, **kwargs):
+    """Runs a blocking function on the given executor and awaits the result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+async def _run_hid(target: Optional[str], priority: int, fn, *args, **kwargs):
+    """
+    Runs an HID sequence on the scheduler of the given target.
+
+    While the target's layout detection is still running, the request waits here
+    (without occupying the HID lane) for at most LAYOUT_WAIT seconds.
+    """
+    t = registry.get(target)
+    deadline = time.monotonic() + LAYOUT_WAIT
+    while not t.layout_ready.is_set():
+        if time.monotonic() >= deadline:
+            raise RuntimeError(f"Keyboard layout detection still running on target '{t.name}'.")
+        await asyncio.sleep(0.05)
+    return await t.scheduler.run_hid_async(fn, *args, priority=priority, **kwargs)
+
+def _progress_reporter(ctx: Optional[Context]) -> Optional[Callable[[str], None]]:
+    """
+    Returns a thread-safe callback forwarding streamed VLM chunks to the MCP caller
+    as progress notifications (None without a request context).
+    """
+    if ctx is None:
+        return None
+    loop = asyncio.get_running_loop()
+    received = [0]
+
+    def on_token(chunk: str):
+        received[0] += 1
+        asyncio.run_coroutine_threadsafe(ctx.report_progress(received[0], None, chunk), loop)
+    return on_token
+
+async def capture_screen_async(mode: str = "ocr_text", region: Optional[Union[List[int], str]] = None,
+                               target: Optional[str] = None, prompt: Optional[str] = None,
+                               ctx: Optional[Context] = None) -> str:
+    """
+    Async variant of `capture_screen_impl` (runs on the vision executor).
+
+    In "analysis" mode, VLM tokens are streamed to the caller through `ctx` while
+    the model is generating.
+    """
+    on_token = _progress_reporter(ctx) if mode == "analysis" else None
+    return await _run_in(vision_executor, capture_screen_impl, mode, region, target, prompt, on_token)
+
+async def inject_keystrokes_async(text: str, delay_ms: int = 20, verify: bool = True,
+                                  target: Optional[str] = None) -> str:
+    """
+    Async variant of `inject_keystrokes_impl`.
+
+    Runs as one sequence on the target's HID lane, so the whole (verified) text
+    is typed without interleaving keystrokes of other requests.
+    """
+    try:
+        return await _run_hid(target, PRIORITY_INTERACTIVE, inject_keystrokes_impl, text, delay_ms, verify, target)
+    except Exception as e:
+        return f"Error injecting keystrokes: {str(e)}"
+
+async def execute_shortcut_async(modifiers: List[str], key: str, target: Optional[str] = None) -> str:
+    """Async variant of `execute_shortcut_impl` (interactive priority on the HID lane)."""
+    try:
+        return await _run_hid(target, PRIORITY_INTERACTIVE, execute_shortcut_impl, modifiers, key, target)
+    except Exception as e:
+        return f"Error executing shortcut: {str(e)}"
+
+async def scan_directory_async(path: str, target: Optional[str] = None) -> str:
+    """
+    Async variant of `scan_directory_impl`.
+
+    Typing, the output wait and the capture run as one sequence on the HID lane with
+    background priority (no other keystrokes can interleave before the listing is
+    read); parsing and saving run on the vision executor.
+    """
+    try:
+        text = await _run_hid(target, PRIORITY_BACKGROUND, _scan_sequence, path, target)
+        return await _run_in(vision_executor, _store_scan, path, text, target)
     except Exception as e:
         return f"Error scanning directory: {e}"
 
+async def read_file_optical_async(path: str, cols: int = 56, rows: int = 26, hold_ms: int = 150,
+                                  target: Optional[str] = None) -> str:
+    """Async variant of `read_file_optical_impl` (holds the HID lane for the transfer, background priority)."""
+    try:
+        return await _run_hid(target, PRIORITY_BACKGROUND, read_file_optical_impl, path, cols, rows, hold_ms, target)
+    except Exception as e:
+        return f"Error reading file optically: {e}"
+
+async def profile_server_async(seconds: float = 10.0, interval_ms: float = 5.0, include_idle: bool = False,
+                               save: bool = True, target: Optional[str] = None) -> str:
+    """Async variant of `profile_server_impl` (the event loop keeps serving while sampling)."""
+    try:
+        with _profile_slot(seconds, interval_ms, include_idle) as profiler:
+            profiler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profiler.stop()
+            return await _run_in(vision_executor, _profile_result, profiler, save, target)
+    except Exception as e:
+        return f"Error profiling server: {str(e)}"
+
+async def run_macro_async(steps: List[Dict], timeout: float = 120.0, target: Optional[str] = None) -> str:
+    """Async variant of `run_macro_impl` (holds the HID lane for the whole macro, interactive priority)."""
+    try:
+        return await _run_hid(target, PRIORITY_INTERACTIVE, run_macro_impl, steps, timeout, target)
+    except Exception as e:
+        return f"Error running macro: {str(e)}"
+
 
 # --- MCP Tool Definitions ---
 
 @mcp.tool()
-def capture_screen(mode: str = "ocr_text", region: Optional[List[int]] = None) -> str:
+async def capture_screen(mode: str = "ocr_text", region: Optional[Union[List[int], str]] = None,
+                         target: Optional[str] = None, prompt: Optional[str] = None,
+                         ctx: Optional[Context] = None) -> str:
     """
     Captures the current screen content from the target system.
 
     Args:
-        mode: Return mode. "raw_base64" for image data, "ocr_text" for extracted text.
-        region: Optional [x, y, width, height] to crop.
+        mode: Return mode. "raw_base64" for image data, "ocr_text" for extracted text,
+              "ocr_data" for words/lines with bounding boxes and confidences (JSON),
+              "analysis" for a VLM description (streamed as progress notifications).
+        region: Optional [x, y, width, height] to crop, or "auto" to process only the
+                regions of interest (see get_screen_regions).
+        target: Target host name (see list_targets). Uses the default target if omitted.
+        prompt: Optional question for the VLM in "analysis" mode.
     """
-    return capture_screen_impl(mode, region)
+    return await capture_screen_async(mode, region, target, prompt, ctx)
 
 @mcp.tool()
-def inject_keystrokes(text: str, delay_ms: int = 20, verify: bool = True) -> str:
+async def inject_keystrokes(text: str, delay_ms: int = 20, verify: bool = True,
+                            target: Optional[str] = None) -> str:
     """
     Types text into the target system with optional visual verification.
 
     Args:
         text: The string to type.
         delay_ms: Average delay between keystrokes in milliseconds.
-        verify: If True, attempts to verify the text appeared on screen (retries 3 times).
+        verify: If True, verifies the text on the input line while typing and corrects
+                mistyped characters with backspaces.
+        target: Target host name (see list_targets). Uses the default target if omitted.
     """
-    return inject_keystrokes_impl(text, delay_ms, verify)
+    return await inject_keystrokes_async(text, delay_ms, verify, target)
 
 @mcp.tool()
-def execute_shortcut(modifiers: List[str], key: str) -> str:
+async def execute_shortcut(modifiers: List[str], key: str, target: Optional[str] = None) -> str:
     """
     Executes a keyboard shortcut (e.g., Ctrl+Alt+Del).
 
     Args:
         modifiers: List of modifiers ['CTRL', 'ALT', 'SHIFT', 'GUI', 'RALT'].
         key: The key to press (e.g., 'DELETE', 'ENTER', 'T').
+        target: Target host name (see list_targets). Uses the default target if omitted.
     """
-    return execute_shortcut_impl(modifiers, key)
+    return await execute_shortcut_async(modifiers, key, target)
 
 @mcp.tool()
-def scan_directory(path: str) -> str:
+async def scan_directory(path: str, target: Optional[str] = None) -> str:
     """
     Scans a directory on the target system using OCR and saves the structure as JSON.
     Currently assumes Windows CMD ('dir' command).
 
     Args:
         path: The directory path to scan (e.g., "C:\\Users").
+        target: Target host name (see list_targets). Uses the default target if omitted.
     """
-    return scan_directory_impl(path)
+    return await scan_directory_async(path, target)
+
+@mcp.tool()
+async def read_file_optical(path: str, cols: int = 56, rows: int = 26, hold_ms: int = 150,
+                            target: Optional[str] = None) -> str:
+    """
+    Reads a file from the target system through a high-bandwidth optical channel.
+    The target renders the file as colored console cells (PowerShell), which are
+    decoded from the HDMI stream. Much faster and more reliable than OCR for data.
+
+    Args:
+        path: The file path on the target (e.g., "C:\\Windows\\win.ini").
+        cols: Grid width in cells; 2*cols must be smaller than the console width.
+        rows: Grid height in cells; must be smaller than the console height.
+        hold_ms: Display time per frame in milliseconds.
+        target: Target host name (see list_targets). Uses the default target if omitted.
+    """
+    return await read_file_optical_async(path, cols, rows, hold_ms, target)
+
+@mcp.tool()
+async def get_screen_regions(target: Optional[str] = None) -> str:
+    """
+    Finds text blocks, dialog boxes and windows on the current screen.
+    Use the returned boxes as `region` for capture_screen.
+
+    Args:
+        target: Target host name (see list_targets). Uses the default target if omitted.
+    """
+    return await _run_in(vision_executor, get_screen_regions_impl, target)
+
+@mcp.tool()
+async def find_text(text: str, region: Optional[List[int]] = None, target: Optional[str] = None) -> str:
+    """
+    Finds where text appears on screen (bounding boxes and OCR confidence).
+
+    Args:
+        text: Text to find (case-insensitive, may span several words).
+        region: Optional [x, y, width, height] to search in.
+        target: Target host name (see list_targets). Uses the default target if omitted.
+    """
+    return await _run_in(vision_executor, find_text_impl, text, region, target)
+
+@mcp.tool()
+async def find_on_screen(templates: Optional[List[str]] = None, region: Optional[List[int]] = None,
+                         threshold: Optional[float] = None, full_frame: bool = False,
+                         target: Optional[str] = None) -> str:
+    """
+    Checks whether known UI elements (dialogs, UAC prompts, login screens, error boxes)
+    are on screen, using the template library. Much faster than OCR or VLM analysis.
+
+    Args:
+        templates: Template names to look for (all if omitted).
+        region: Optional [x, y, width, height] to search in.
+        threshold: Optional minimum match score (0..1).
+        full_frame: Search the whole screen instead of the detected regions of interest.
+        target: Target host name (see list_targets). Uses the default target if omitted.
+    """
+    return await _run_in(vision_executor, find_on_screen_impl, templates, region, threshold, full_frame, target)
+
+@mcp.tool()
+async def save_template(name: str, region: List[int], threshold: float = 0.85,
+                        target: Optional[str] = None) -> str:
+    """
+    Saves a screen crop as a template for find_on_screen.
+
+    Args:
+        name: Template name (e.g. "uac_prompt").
+        region: [x, y, width, height] of the UI element on the current screen.
+        threshold: Minimum match score for this template.
+        target: Target host name (see list_targets). Uses the default target if omitted.
+    """
+    return await _run_in(vision_executor, save_template_impl, name, region, threshold, target)
+
+@mcp.tool()
+async def get_screen_state(target: Optional[str] = None) -> str:
+    """
+    Cheaply classifies the screen without OCR: idle_prompt, busy_output, locked_screen,
+    dialog, no_signal or unknown. Poll this instead of capture_screen while waiting
+    for a command to finish.
+
+    Args:
+        target: Target host name (see list_targets). Uses the default target if omitted.
+    """
+    return await _run_in(vision_executor, get_screen_state_impl, target)
+
+@mcp.tool()
+async def list_targets() -> str:
+    """
+    Lists the target hosts managed by this bridge (name, capture device, HID gadget, layout).
+    """
+    return list_targets_impl()
+
+@mcp.tool()
+async def benchmark_capture(frames: int = 20, min_height: int = 1080, apply: bool = True,
+                            target: Optional[str] = None) -> str:
+    """
+    Finds the fastest capture mode (pixel format, resolution, frame rate) of the capture
+    card and stores it for future sessions. Takes a few seconds per mode; run it once
+    per capture card or when frames arrive slowly.
+
+    Args:
+        frames: Frames to time per mode.
+        min_height: Preferred minimum resolution height.
+        apply: Switch to the best mode immediately.
+        target: Target host name (see list_targets). Uses the default target if omitted.
+    """
+    return await _run_in(vision_executor, benchmark_capture_impl, frames, min_height, apply, target)
+
+@mcp.tool()
+async def run_macro(steps: List[Dict], timeout: float = 120.0, target: Optional[str] = None) -> str:
+    """
+    Runs a deterministic sequence of steps on the target at hardware speed, without a
+    model round trip per step. Returns a JSON trace (per step: ok, ms, detail/error)
+    and the extracted variables. Stops at the first failed step.
+
+    Each step is an object with one action key:
+        {"type": "dir\\n"}                          types text (${var} inserts a variable)
+        {"key": "ENTER", "modifiers": ["CTRL"]}    presses a named key
+        {"wait_for_text": "C:\\>", "timeout": 10}  waits until the text is on screen
+        {"wait_stable": 0.5}                       waits until the screen stops changing
+        {"ocr_region": [x, y, w, h], "save_as": "v"}  OCRs a region (null = full screen)
+        {"assert": "text", "in": "v"}              fails unless the text is present
+        {"extract": "regex (group)", "from": "v", "save_as": "w"}  saves a regex match
+        {"sleep": 1.0}                             waits
+    Any step may add "optional": true; "regex": true makes wait_for_text/assert use a regex.
+
+    Args:
+        steps: The macro steps.
+        timeout: Limit for the whole macro in seconds.
+        target: Target host name (see list_targets). Uses the default target if omitted.
+    """
+    return await run_macro_async(steps, timeout, target)
+
+@mcp.tool()
+async def record_session(action: str = "start", path: Optional[str] = None, target: Optional[str] = None) -> str:
+    """
+    Records the target's screen frames and keystrokes to a session file ("start"/"stop"),
+    for offline replay and pipeline benchmarks without hardware.
+
+    Args:
+        action: "start" or "stop".
+        path: Session file for "start" (default: <logs_dir>/sessions/<timestamp>.zip).
+        target: Target host name (see list_targets). Uses the default target if omitted.
+    """
+    return await _run_in(vision_executor, record_session_impl, action, path, target)
+
+@mcp.tool()
+async def profile_server(seconds: float = 10.0, interval_ms: float = 5.0, include_idle: bool = False,
+                         save: bool = True, target: Optional[str] = None) -> str:
+    """
+    Runs a sampling profile of the bridge server while other calls continue, e.g. to
+    find out why tool calls are slow. Returns the hottest functions; the full
+    collapsed stacks (flame graph input) are saved to the logs directory.
+
+    Args:
+        seconds: Profile duration (max 120).
+        interval_ms: Sampling interval in milliseconds.
+        include_idle: Also count threads that are waiting.
+        save: Save the collapsed stacks to <logs_dir>/profiles/ instead of returning them.
+        target: Target whose logs directory is used. Uses the default target if omitted.
+    """
+    return await profile_server_async(seconds, interval_ms, include_idle, save, target)
 
 @mcp.resource("system://screen/latest")
-def get_latest_screen() -> str:
-    """Returns the most recently captured screen as base64."""
+async def get_latest_screen() -> str:
+    """Returns the most recently captured screen of the default target as base64."""
     return get_latest_screen_impl()
 
 @mcp.resource("system://logs/ocr")
-def get_ocr_logs() -> str:
-    """Returns the last 100 lines of OCR logs."""
+async def get_ocr_logs() -> str:
+    """Returns the retained OCR log entries of the default target (VHB_OCR_LOG_LINES)."""
     return get_ocr_logs_impl()
 
-def detect_layout_at_startup():
-    """
-    Attempts to detect the layout at server startup.
-    This is best-effort. If the screen is not interactive (e.g. lock screen),
-    it might fail or produce odd results.
-    """
+@mcp.resource("system://targets/{target}/screen/latest")
+async def get_target_latest_screen(target: str) -> str:
+    """Returns the most recently captured screen of a target as base64."""
+    return get_latest_screen_impl(target)
+
+@mcp.resource("system://targets/{target}/logs/ocr")
+async def get_target_ocr_logs(target: str) -> str:
+    """Returns the retained OCR log entries of a target (VHB_OCR_LOG_LINES)."""
+    return get_ocr_logs_impl(target)
+
+@mcp.resource("system://screen/state")
+async def get_screen_state_resource() -> str:
+    """Returns the classified screen state of the default target as JSON."""
+    return await _run_in(vision_executor, get_screen_state_impl)
+
+@mcp.resource("system://targets/{target}/screen/state")
+async def get_target_screen_state(target: str) -> str:
+    """Returns the classified screen state of a target as JSON."""
+    return await _run_in(vision_executor, get_screen_state_impl, target)
+
+@mcp.resource("system://signal/health")
+async def get_signal_health() -> str:
+    """Returns capture signal statistics, active degradations and recent events of all targets as JSON."""
+    return json.dumps({t.name: t.health.report() for t in registry}, indent=2)
+
+@mcp.resource("system://targets/{target}/signal/health")
+async def get_target_signal_health(target: str) -> str:
+    """Returns capture signal statistics, active degradations and recent events of a target as JSON."""
+    try:
+        return json.dumps(registry.get(target).health.report(), indent=2)
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+@mcp.resource("system://scheduler/stats")
+async def get_scheduler_stats() -> str:
+    """Returns HID queue depth, frame readers and wait times of all targets as JSON."""
+    return get_scheduler_stats_impl()
+
+@mcp.resource("system://metrics")
+async def get_metrics() -> str:
+    """Returns stage latency histograms, OCR/typing rates, cache hit counters and queue depths as JSON."""
+    return get_metrics_impl()
+
+@mcp.resource("system://state")
+async def get_state_usage() -> str:
+    """Returns process memory, memory budget, screen cache and OCR history usage as JSON."""
+    return get_state_usage_impl()
+
+@mcp.resource("system://vlm/stats")
+async def get_vlm_stats() -> str:
+    """Returns VLM cache hits, coalesced/superseded/rejected requests and queue depth as JSON."""
+    return get_vlm_stats_impl()
+
+def _detect_layout(t: Target):
+    """Detects and applies the keyboard layout of one target (best-effort)."""
     try:
-        # Give some time for system to settle or user to prep
-        # time.sleep(2)
-
-        # We should check if we can type.
-        # But for now, we just run the detection logic.
-        print("Running startup layout detection...")
-        layout_code = layout_detector.detect()
-        layout_detector.apply_layout(layout_code)
+        logging.info(f"Running startup layout detection for target '{t.name}'...")
+        layout_code = t.layout_detector.detect()
+        t.layout_detector.apply_layout(layout_code)
+        t.layout_status = {"state": "done", "layout": layout_code,
+                           "scores": t.layout_detector.last_result.get("scores", {})}
     except Exception as e:
-        print(f"Startup layout detection failed: {e}")
+        logging.warning(f"Startup layout detection failed for target '{t.name}': {e}")
+        t.layout_status = {"state": "failed", "error": str(e)}
+    finally:
+        t.layout_ready.set()
+
+def start_layout_detection() -> List[Future]:
+    """
+    Starts the layout detection of every target in the background.
+
+    This is best-effort. If the screen is not interactive (e.g. lock screen), it might
+    fail or produce odd results; the configured layout is kept then. The probe types
+    on the target, so it is queued on the target's HID lane as a background job and
+    never interleaves with other keystrokes. Only HID tools of a target wait for its
+    detection; capture tools and resources answer at once.
+
+    Returns:
+        List[Future]: One future per target, resolved when its detection has finished.
+    """
+    futures = []
+    for t in registry:
+        t.layout_ready.clear()
+        t.layout_status = {"state": "detecting"}
+        futures.append(t.scheduler.submit_hid(_detect_layout, t, priority=PRIORITY_BACKGROUND))
+    return futures
 
 def run():
     """
     Main entry point for the MCP Server.
 
-    Performs startup routines (layout detection) and starts the FastMCP server.
+    Starts the background routines (layout detection, signal health monitors) and
+    serves immediately.
     """
-    detect_layout_at_startup()
+    start_layout_detection()
+    for t in registry:
+        t.health.start()
+    if METRICS_PORT:
+        serve_prometheus(int(METRICS_PORT), METRICS_HOST)
     mcp.run()
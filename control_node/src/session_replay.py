@@ -0,0 +1,431 @@
+"""
+Session Record and Replay Module.
+
+Records what a target's pipeline saw (timestamped frames) and what it sent (HID
+reports) into a single session file. A recording can later stand in for the
+capture card and the HID gadget, so OCR, change detection and parsing can be
+benchmarked and regression-tested on real screens without hardware.
+
+Session file (ZIP, deflate):
+- `session.json`: metadata (format version, target, layout, start time).
+- `events.jsonl`: one event per line, in order:
+  {"t": 1.25, "kind": "frame", "index": 3, "shape": [1080, 1920, 3], "dtype": "uint8",
+   "reports": 12, "encoding": "key" | "delta" | "same", "file": "frames/000003.bin"}
+  {"t": 1.31, "kind": "hid", "report": [2, 4]}
+  `reports` is the number of HID reports sent before the frame was captured.
+- `frames/NNNNNN.bin`: raw pixels of key frames, or XOR deltas against the
+  previous frame. Console screens change little between frames, so deltas are
+  mostly zeros and compress to a few kilobytes. Unchanged frames store nothing.
+
+Replay (`ReplaySession`) provides a capture object and a KeyInjector. Frames play
+back at the original pace times `speed`, or one recorded frame per capture call
+with `speed=0` (fully deterministic). A frame recorded after the n-th HID report
+is only shown once the replay injector has sent n reports, so typed text and its
+echo stay in order however fast the replay runs.
+
+Command line:
+    python session_replay.py bench session.zip [--baseline expected.json] [--write-baseline expected.json]
+runs the OCR pipeline over every distinct frame and reports timings; with a
+baseline it exits with status 1 if any frame's text differs.
+"""
+
+import os
+import json
+import time
+import queue
+import logging
+import zipfile
+import argparse
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+try:
+    from .vision import ScreenCapture
+    from .hid import KeyInjector, Layout, LAYOUTS
+except ImportError:
+    from vision import ScreenCapture
+    from hid import KeyInjector, Layout, LAYOUTS
+
+FORMAT_VERSION = 1
+KEYFRAME_INTERVAL = 50
+MAX_PENDING_FRAMES = 64
+
+
+class SessionRecorder:
+    """
+    Writes frames and HID reports of one target into a session file.
+
+    Frames are encoded and compressed on a background thread; if it falls behind by
+    more than `max_pending` frames, further frames are dropped (and counted) rather
+    than slowing down the capture path.
+    """
+    def __init__(self, path: str, target: str = "", layout: str = "",
+                 keyframe_interval: int = KEYFRAME_INTERVAL, max_pending: int = MAX_PENDING_FRAMES):
+        """
+        Args:
+            path (str): Session file to create (ZIP).
+            target (str): Target name (metadata).
+            layout (str): Keyboard layout code of the target (metadata, used on replay).
+            keyframe_interval (int): Every n-th stored frame is a full frame.
+            max_pending (int): Frames waiting for compression before frames are dropped.
+        """
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self._zip = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6)
+        self._meta = {"version": FORMAT_VERSION, "target": target, "layout": layout,
+                      "started": time.time()}
+        self._events: List[Dict] = []
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._reports = 0
+        self._frames = 0
+        self._dropped = 0
+        self._closed = False
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_pending)
+        self._worker = threading.Thread(target=self._encode_loop, name="session-recorder", daemon=True)
+        self._worker.start()
+
+    def _now(self) -> float:
+        return round(time.monotonic() - self._start, 4)
+
+    def record_frame(self, frame: np.ndarray):
+        """Adds a captured frame (copied; the caller may reuse its buffer)."""
+        if self._closed:
+            return
+        with self._lock:
+            event = {"t": self._now(), "kind": "frame", "index": self._frames,
+                     "shape": list(frame.shape), "dtype": str(frame.dtype), "reports": self._reports}
+            try:
+                self._queue.put_nowait((event, np.array(frame, copy=True)))
+            except queue.Full:
+                self._dropped += 1
+                return
+            self._frames += 1
+            self._events.append(event)
+
+    def record_report(self, modifiers: int, key_code: int):
+        """Adds a sent HID report (KeyInjector listener signature)."""
+        if self._closed:
+            return
+        with self._lock:
+            self._events.append({"t": self._now(), "kind": "hid", "report": [modifiers, key_code]})
+            self._reports += 1
+
+    def _encode_loop(self):
+        """Compresses queued frames in order (XOR delta against the previous frame)."""
+        previous: Optional[np.ndarray] = None
+        since_key = 0
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            event, frame = item
+            if (previous is None or previous.shape != frame.shape or previous.dtype != frame.dtype
+                    or since_key >= self.keyframe_interval):
+                event["encoding"], payload, since_key = "key", frame, 0
+            else:
+                payload = np.bitwise_xor(frame, previous)
+                event["encoding"] = "delta" if payload.any() else "same"
+            if event["encoding"] != "same":
+                event["file"] = f"frames/{event['index']:06d}.bin"
+                self._zip.writestr(event["file"], np.ascontiguousarray(payload).tobytes())
+                since_key += 1
+            previous = frame
+
+    def stats(self) -> Dict:
+        """Counters of the recording so far."""
+        with self._lock:
+            return {"path": self.path, "frames": self._frames, "reports": self._reports,
+                    "dropped_frames": self._dropped, "duration": self._now()}
+
+    def close(self) -> Dict:
+        """Finishes the session file and returns the final counters (including file size)."""
+        if self._closed:
+            return self.stats()
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+        stats = self.stats()
+        with self._lock:
+            self._meta.update({"duration": stats["duration"], "frames": stats["frames"],
+                               "reports": stats["reports"], "dropped_frames": stats["dropped_frames"]})
+            self._zip.writestr("session.json", json.dumps(self._meta, indent=2))
+            self._zip.writestr("events.jsonl", "".join(json.dumps(e) + "\n" for e in self._events))
+        self._zip.close()
+        stats["distinct_frames"] = sum(1 for e in self._events if e.get("encoding") != "same" and e["kind"] == "frame")
+        stats["bytes"] = os.path.getsize(self.path)
+        return stats
+
+
+class RecordingCapture:
+    """
+    Wraps a capture object and records every frame it returns.
+
+    Other attributes (release, measured_fps, active_mode, ...) are passed through.
+    """
+    def __init__(self, capture, recorder: SessionRecorder):
+        self.inner = capture
+        self.recorder = recorder
+
+    def capture_frame(self) -> np.ndarray:
+        frame = self.inner.capture_frame()
+        self.recorder.record_frame(frame)
+        return frame
+
+    def __getattr__(self, name: str):
+        return getattr(self.__dict__["inner"], name)
+
+
+class SessionReader:
+    """
+    Reads a session file and decodes its frames.
+    """
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): Session file written by SessionRecorder.
+        """
+        self.path = path
+        self._zip = zipfile.ZipFile(path, "r")
+        self.meta: Dict = json.loads(self._zip.read("session.json"))
+        if self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported session format version {self.meta.get('version')} in {path}")
+        events = [json.loads(line) for line in self._zip.read("events.jsonl").decode().splitlines() if line]
+        self.frames: List[Dict] = [e for e in events if e["kind"] == "frame"]
+        self.reports: List[Tuple[int, int]] = [tuple(e["report"]) for e in events if e["kind"] == "hid"]
+        self._cache: Optional[Tuple[int, np.ndarray]] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def _payload(self, event: Dict) -> np.ndarray:
+        data = self._zip.read(event["file"])
+        return np.frombuffer(data, dtype=np.dtype(event["dtype"])).reshape(event["shape"])
+
+    def frame(self, index: int) -> np.ndarray:
+        """
+        Decodes frame `index` (sequential access only applies one delta).
+
+        Returns:
+            np.ndarray: The frame (read-only; copy before modifying).
+        """
+        with self._lock:
+            if self._cache is not None and self._cache[0] == index:
+                return self._cache[1]
+            base, current = self._cache if self._cache is not None and self._cache[0] < index else (-1, None)
+            # Restart from the last key frame after the cached one (the first frame is one)
+            key = index
+            while key > base and self.frames[key]["encoding"] != "key":
+                key -= 1
+            if key > base:
+                base, current = key, self._payload(self.frames[key])
+            for i in range(base + 1, index + 1):
+                if self.frames[i]["encoding"] == "delta":
+                    current = np.bitwise_xor(current, self._payload(self.frames[i]))
+            current.setflags(write=False)
+            self._cache = (index, current)
+            return current
+
+    def distinct_frames(self) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yields (index, frame) for every frame that differs from its predecessor."""
+        for index, event in enumerate(self.frames):
+            if event["encoding"] != "same":
+                yield index, self.frame(index)
+
+    def close(self):
+        self._zip.close()
+
+
+class ReplaySession:
+    """
+    Plays a recorded session back through a capture object and a KeyInjector.
+    """
+    def __init__(self, path: Union[str, SessionReader], speed: float = 1.0, sync_hid: bool = True,
+                 layout: Optional[Layout] = None, unicode_input: Optional[str] = None):
+        """
+        Args:
+            path (Union[str, SessionReader]): Session file (or an open reader).
+            speed (float): Playback speed relative to the recording (2.0 = twice as fast);
+                0 returns the next recorded frame on every capture call.
+            sync_hid (bool): Hold back frames recorded after HID reports the replay
+                injector has not sent yet.
+            layout (Optional[Layout]): Layout of the replay injector (default: the
+                recorded target's layout).
+            unicode_input (Optional[str]): Unicode input method of the replay injector.
+        """
+        self.reader = path if isinstance(path, SessionReader) else SessionReader(path)
+        self.speed = speed
+        self.sync_hid = sync_hid
+        self._lock = threading.Lock()
+        self._start: Optional[float] = None
+        self._position = -1
+        self.reports_sent = 0
+        code = self.reader.meta.get("layout")
+        layout = layout or (LAYOUTS[code]() if code in LAYOUTS else None)
+        self.capture = ReplayCapture(self)
+        options = {"layout": layout, "unicode_input": unicode_input}
+        self.injector = ReplayInjector(self, **{k: v for k, v in options.items() if v is not None})
+
+    def _eligible(self, index: int) -> bool:
+        return not self.sync_hid or self.reader.frames[index]["reports"] <= self.reports_sent
+
+    def next_index(self) -> int:
+        """Index of the frame the capture shows now (advances the replay)."""
+        with self._lock:
+            last = len(self.reader) - 1
+            if last < 0:
+                raise RuntimeError(f"Session {self.reader.path} contains no frames")
+            if self.speed <= 0:
+                candidate = min(self._position + 1, last)
+                if self._position < 0 or self._eligible(candidate):
+                    self._position = candidate
+                return self._position
+            now = time.monotonic()
+            if self._start is None:
+                self._start = now
+            clock = (now - self._start) * self.speed
+            position = max(self._position, 0)
+            while (position < last and self.reader.frames[position + 1]["t"] - self.reader.frames[0]["t"] <= clock
+                   and self._eligible(position + 1)):
+                position += 1
+            self._position = position
+            return position
+
+    def finished(self) -> bool:
+        """True once the last recorded frame has been shown."""
+        return self._position >= len(self.reader) - 1
+
+    def report_sent(self, report: Tuple[int, int]):
+        with self._lock:
+            self.reports_sent += 1
+
+
+class ReplayCapture(ScreenCapture):
+    """
+    Capture backend returning the frames of a recorded session.
+    """
+    def __init__(self, session: ReplaySession):
+        super().__init__(device_id=-1)
+        self.session = session
+        self._last_read: Optional[float] = None
+
+    def _open_camera(self):
+        pass
+
+    def capture_frame(self) -> np.ndarray:
+        """Returns the current replay frame (the last one repeats after the end)."""
+        frame = self.session.reader.frame(self.session.next_index())
+        now = time.perf_counter()
+        if self._last_read is not None:
+            self.read_intervals.append(now - self._last_read)
+        self._last_read = now
+        return frame
+
+    def measured_fps(self) -> Optional[float]:
+        """Frame rate of the recording (scaled by the replay speed)."""
+        frames = self.session.reader.frames
+        if len(frames) < 2 or frames[-1]["t"] <= frames[0]["t"]:
+            return None
+        fps = (len(frames) - 1) / (frames[-1]["t"] - frames[0]["t"])
+        return round(fps * self.session.speed, 1) if self.session.speed > 0 else None
+
+    def release(self):
+        pass
+
+
+class ReplayInjector(KeyInjector):
+    """
+    KeyInjector that feeds the replay instead of a HID gadget.
+
+    Sent reports advance the replay (see `ReplaySession.sync_hid`) and are compared
+    with the recorded ones: `diverged_at` is the index of the first report that differs.
+    """
+    def __init__(self, session: ReplaySession, **kwargs):
+        self.session = session
+        self.sent: List[Tuple[int, int]] = []
+        self.diverged_at: Optional[int] = None
+        super().__init__(device_path="replay", **kwargs)
+
+    def _check_device(self):
+        self.simulation_mode = True
+
+    def _send_report(self, modifiers: int, key_code: int):
+        report = (modifiers, key_code)
+        recorded = self.session.reader.reports
+        index = len(self.sent)
+        if self.diverged_at is None and (index >= len(recorded) or tuple(recorded[index]) != report):
+            self.diverged_at = index
+            logging.info(f"Replay: report {index} {report} differs from the recording")
+        self.sent.append(report)
+        self.session.report_sent(report)
+        super()._send_report(modifiers, key_code)
+
+
+def benchmark_session(reader: SessionReader, pipeline=None) -> Dict:
+    """
+    Reads every distinct frame of a session the way the tools do (`VisionPipeline.read_text`).
+
+    Args:
+        reader (SessionReader): The session.
+        pipeline (VisionPipeline): OCR pipeline (a new VisionPipeline if omitted).
+
+    Returns:
+        Dict: {'frames', 'distinct_frames', 'ocr_ms' (mean/p50/p95/max), 'texts'
+            (frame index -> text)}.
+    """
+    if pipeline is None:
+        try:
+            from .vision import VisionPipeline
+        except ImportError:
+            from vision import VisionPipeline
+        pipeline = VisionPipeline()
+    timings, texts = [], {}
+    for index, frame in reader.distinct_frames():
+        start = time.perf_counter()
+        texts[str(index)] = pipeline.read_text(frame)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    pick = lambda q: round(timings[min(len(timings) - 1, int(q * len(timings)))], 1) if timings else None
+    return {
+        "frames": len(reader),
+        "distinct_frames": len(texts),
+        "ocr_ms": {"mean": round(sum(timings) / len(timings), 1) if timings else None,
+                   "p50": pick(0.5), "p95": pick(0.95), "max": pick(1.0)},
+        "texts": texts,
+    }
+
+
+def compare_texts(expected: Dict[str, str], actual: Dict[str, str]) -> List[str]:
+    """Frame indices whose OCR text differs from a baseline (including missing frames)."""
+    return sorted((k for k in set(expected) | set(actual) if expected.get(k) != actual.get(k)), key=int)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the OCR pipeline on a recorded session.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="OCR every distinct frame and report timings")
+    bench.add_argument("session")
+    bench.add_argument("--baseline", help="JSON file with expected texts; differences fail the run")
+    bench.add_argument("--write-baseline", help="Store the recognized texts as a new baseline")
+    args = parser.parse_args(argv)
+
+    reader = SessionReader(args.session)
+    result = benchmark_session(reader)
+    texts = result.pop("texts")
+    status = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            result["changed_frames"] = compare_texts(json.load(f), texts)
+        status = 1 if result["changed_frames"] else 0
+    if args.write_baseline:
+        with open(args.write_baseline, "w", encoding="utf-8") as f:
+            json.dump(texts, f, indent=2, ensure_ascii=False)
+    print(json.dumps(result, indent=2))
+    return status
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,287 @@
+"""
+Signal Health Monitor Module.
+
+Watches the frame stream of one target and tells apart conditions that otherwise
+only show up as OCR garbage: no HDMI signal, a black or uniform screen, a frozen
+image, a resolution change, a low frame rate, slow frame delivery and chroma
+smearing from 4:2:0 subsampled signals.
+
+A background thread samples frames through the target's scheduler (sharing grabs
+with other readers). Per-frame statistics are computed vectorized on strided
+samples. Conditions are tracked as a set; each transition raises an event (kept
+in a bounded history, logged, and passed to registered listeners).
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+try:
+    from .screen_state import is_blank
+except ImportError:
+    from screen_state import is_blank
+
+# Conditions that make OCR/VLM results meaningless. "frozen" is only reported:
+# an uncompressed capture of a static screen can legitimately be bit-identical.
+CRITICAL_CONDITIONS = ("no_signal", "black_screen", "uniform_frame")
+
+BLACK_LUMA = 8.0
+UNIFORM_STD = 3.0
+FROZEN_SECONDS = 10.0
+MIN_FPS = 10.0
+MAX_DECODE_MS = 250.0
+MIN_CHROMA_SHARPNESS = 0.35
+SAMPLE_STEP = 4
+CHROMA_PATCH = 256
+
+
+def _luma(image: np.ndarray) -> np.ndarray:
+    """BT.601 luma of a BGR (or grayscale) image as float32."""
+    if image.ndim == 2:
+        return image.astype(np.float32)
+    b, g, r = (image[..., i].astype(np.float32) for i in range(3))
+    return 0.114 * b + 0.587 * g + 0.299 * r
+
+
+def chroma_sharpness(frame: np.ndarray, patch: int = CHROMA_PATCH) -> Optional[float]:
+    """
+    Estimates whether chroma has full horizontal resolution.
+
+    With 4:2:0/4:2:2 subsampling, pixel pairs (2k, 2k+1) share their chroma, so
+    chroma steps inside a pair are much weaker than steps between pairs. The ratio
+    of both step energies is ~1 for full chroma and approaches 0 when smeared.
+    Measured on the most colorful full-resolution patch.
+
+    Returns:
+        Optional[float]: The ratio, or None if the frame has too little color detail.
+    """
+    if frame.ndim != 3 or frame.shape[1] < 4:
+        return None
+    h, w = frame.shape[:2]
+    # Pick the patch with the most color (coarse search on a strided view)
+    step = max(1, patch // 2)
+    best, best_score = (0, 0), -1.0
+    for y in range(0, max(1, h - patch + 1), step):
+        for x in range(0, max(1, w - patch + 1), step):
+            view = frame[y:y + patch:8, x:x + patch:8].astype(np.int16)
+            score = float(np.abs(view[..., 2] - view[..., 1]).mean() + np.abs(view[..., 0] - view[..., 1]).mean())
+            if score > best_score:
+                best, best_score = (y, x), score
+    y, x = best
+    region = frame[y:y + patch, x:x + patch].astype(np.float32)
+    luma = _luma(region)
+    cr = region[..., 2] - luma
+    cb = region[..., 0] - luma
+    width = (region.shape[1] // 2) * 2
+    if width < 4:
+        return None
+
+    inner = np.abs(cr[:, 1:width:2] - cr[:, 0:width:2]) + np.abs(cb[:, 1:width:2] - cb[:, 0:width:2])
+    outer = np.abs(cr[:, 2:width:2] - cr[:, 1:width - 1:2]) + np.abs(cb[:, 2:width:2] - cb[:, 1:width - 1:2])
+    outer_energy = float(outer.sum())
+    if outer_energy < 50.0 * region.shape[0]:
+        return None  # Not enough color edges to judge
+    return round(float(inner.sum()) / outer_energy, 3)
+
+
+class SignalHealthMonitor:
+    """
+    Frame-stream health monitor for one target.
+    """
+    def __init__(self, name: str, frame_source: Callable, fps_source: Optional[Callable] = None,
+                 interval: float = 0.5, history: int = 100):
+        """
+        Args:
+            name (str): Target name (used in events).
+            frame_source (Callable): Returns a frame; raises if no frame can be grabbed
+                (e.g. `scheduler.grab_frame`).
+            fps_source (Optional[Callable]): Returns the measured capture frame rate or None.
+            interval (float): Sampling interval of the monitor thread in seconds.
+            history (int): Number of retained events.
+        """
+        self.name = name
+        self.frame_source = frame_source
+        self.fps_source = fps_source
+        self.interval = interval
+
+        self._lock = threading.Lock()
+        self._events = deque(maxlen=history)
+        self._listeners: List[Callable[[Dict], None]] = []
+        self._conditions = set()
+        self._stats: Dict = {}
+        self._last_sample = None
+        self._last_shape = None
+        self._unchanged_since = None
+        self._decode_ms = deque(maxlen=20)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    # --- Events ---
+
+    def add_listener(self, listener: Callable[[Dict], None]):
+        """Registers a callback receiving every event dict."""
+        self._listeners.append(listener)
+
+    def _emit(self, kind: str, message: str, now: float):
+        event = {"time": round(now, 3), "target": self.name, "kind": kind, "message": message}
+        self._events.append(event)
+        if kind == "recovered":
+            logging.info(f"[{self.name}] Signal {message}")
+        else:
+            logging.warning(f"[{self.name}] Signal degraded ({kind}): {message}")
+        for listener in list(self._listeners):
+            try:
+                listener(event)
+            except Exception as e:
+                logging.debug(f"Signal health listener failed: {e}")
+
+    def _set_conditions(self, active: Dict[str, str], now: float):
+        """Updates the active condition set and emits transition events."""
+        with self._lock:
+            previous = set(self._conditions)
+            self._conditions = set(active)
+        for kind in sorted(set(active) - previous):
+            self._emit(kind, active[kind], now)
+        for kind in sorted(previous - set(active)):
+            self._emit("recovered", f"{kind} cleared", now)
+
+    # --- Statistics ---
+
+    def observe(self, frame: Optional[np.ndarray], decode_ms: Optional[float] = None,
+                timestamp: Optional[float] = None, error: Optional[str] = None) -> Dict:
+        """
+        Computes the statistics of one frame (or a failed grab) and updates conditions.
+
+        Args:
+            frame (Optional[np.ndarray]): The frame, None if the grab failed.
+            decode_ms (Optional[float]): Time the grab took in milliseconds.
+            timestamp (Optional[float]): Observation time (`time.time()` if omitted).
+            error (Optional[str]): Grab error message (no signal).
+
+        Returns:
+            Dict: The current statistics.
+        """
+        now = time.time() if timestamp is None else timestamp
+        active: Dict[str, str] = {}
+
+        if frame is None:
+            active["no_signal"] = error or "No frame from capture device"
+            stats = {"signal": False, "error": error}
+            with self._lock:
+                self._last_sample = None
+                self._unchanged_since = None
+        else:
+            sample = np.asarray(frame)[::SAMPLE_STEP, ::SAMPLE_STEP]
+            luma = _luma(sample)
+            mean_luma = float(luma.mean())
+            std_luma = float(luma.std())
+            h, w = frame.shape[:2]
+
+            with self._lock:
+                if self._last_shape is not None and self._last_shape != (h, w):
+                    active["resolution_change"] = f"{self._last_shape[1]}x{self._last_shape[0]} -> {w}x{h}"
+                self._last_shape = (h, w)
+
+                # Bit-identical samples: a live capture always carries some noise or cursor blink
+                if not (self._last_sample is not None and self._last_sample.shape == sample.shape
+                        and np.array_equal(self._last_sample, sample)):
+                    self._unchanged_since = now
+                    self._last_sample = sample.copy()
+                frozen_seconds = now - self._unchanged_since
+                if decode_ms is not None:
+                    self._decode_ms.append(decode_ms)
+                decode_avg = sum(self._decode_ms) / len(self._decode_ms) if self._decode_ms else None
+
+            fps = self.fps_source() if self.fps_source else None
+            sharpness = chroma_sharpness(frame)
+
+            # Dark or low-contrast frames are only degraded without any glyphs: a black
+            # console showing a prompt has a near-black mean and a tiny spread too
+            if (mean_luma < BLACK_LUMA or std_luma < UNIFORM_STD) and is_blank(frame):
+                if mean_luma < BLACK_LUMA:
+                    active["black_screen"] = f"Mean luminance {mean_luma:.1f}"
+                else:
+                    active["uniform_frame"] = f"Uniform frame (luminance {mean_luma:.1f} +/- {std_luma:.1f})"
+            if frozen_seconds >= FROZEN_SECONDS:
+                active["frozen"] = f"Identical frames for {frozen_seconds:.1f} s"
+            if fps is not None and fps < MIN_FPS:
+                active["low_fps"] = f"{fps:.1f} fps"
+            if decode_avg is not None and decode_avg > MAX_DECODE_MS:
+                active["slow_decode"] = f"{decode_avg:.0f} ms per frame"
+            if sharpness is not None and sharpness < MIN_CHROMA_SHARPNESS:
+                active["chroma_smear"] = f"Chroma sharpness {sharpness:.2f} (subsampled signal?)"
+
+            stats = {
+                "signal": True,
+                "width": int(w),
+                "height": int(h),
+                "mean_luma": round(mean_luma, 1),
+                "std_luma": round(std_luma, 1),
+                "frozen_seconds": round(frozen_seconds, 1),
+                "fps": fps,
+                "decode_ms": round(decode_avg, 1) if decode_avg is not None else None,
+                "chroma_sharpness": sharpness,
+            }
+
+        # A resolution change is a one-off event, not a lasting condition
+        if "resolution_change" in active:
+            self._emit("resolution_change", active.pop("resolution_change"), now)
+        self._set_conditions(active, now)
+
+        stats["time"] = round(now, 3)
+        with self._lock:
+            self._stats = stats
+        return stats
+
+    def sample(self) -> Dict:
+        """Grabs one frame from the frame source and observes it."""
+        started = time.perf_counter()
+        try:
+            frame = self.frame_source()
+        except Exception as e:
+            return self.observe(None, error=str(e))
+        return self.observe(frame, decode_ms=1000.0 * (time.perf_counter() - started))
+
+    # --- Thread ---
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Starts the monitor thread (no-op if running)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=f"signal-health-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the monitor thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2 * self.interval + 1)
+            self._thread = None
+
+    # --- Reporting ---
+
+    def degraded(self) -> List[str]:
+        """Active conditions that make OCR/VLM pointless (subset of CRITICAL_CONDITIONS)."""
+        with self._lock:
+            return sorted(c for c in self._conditions if c in CRITICAL_CONDITIONS)
+
+    def report(self) -> Dict:
+        """Returns the latest statistics, active conditions and recent events."""
+        with self._lock:
+            return {
+                "target": self.name,
+                "monitoring": self._thread is not None and self._thread.is_alive(),
+                "conditions": sorted(self._conditions),
+                "stats": dict(self._stats),
+                "events": list(self._events),
+            }
@@ -0,0 +1,371 @@
+"""
+State Store Module.
+
+Bounded resource state of the bridge, so the server can run for weeks on a small
+control node without growing memory. Every piece of state has an explicit
+retention policy:
+
+- RingLog: the OCR history of a target, a `deque` of the last N entries
+  (`VHB_OCR_LOG_LINES`).
+- LRUCache: encoded screens (`latest_screen_base64` of every target) share one
+  byte budget (`VHB_SCREEN_CACHE_MB`); the least recently used entries are evicted,
+  and entries can expire after `VHB_SCREEN_CACHE_TTL` seconds.
+- StateStore: owns the rings and the screen cache of all targets, reports their
+  usage next to the process memory and, above `VHB_MEMORY_BUDGET_MB`, drops all
+  cached screens but the most recently used one.
+
+Targets get their state from the process-wide `STATE` store:
+
+    state = STATE.open("rack-a")
+    state.ocr_log.append("[12:00:01] C:\\>...")
+    jpeg = state.encode_screen(frame, pipeline.encode_image)  # Reused for the same frame
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+import weakref
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    from .metrics import METRICS
+except ImportError:
+    from metrics import METRICS
+
+MB = 1024 * 1024
+OCR_LOG_LINES = int(os.environ.get("VHB_OCR_LOG_LINES", "100"))
+SCREEN_CACHE_MB = float(os.environ.get("VHB_SCREEN_CACHE_MB", "16"))
+SCREEN_CACHE_TTL = float(os.environ["VHB_SCREEN_CACHE_TTL"]) if os.environ.get("VHB_SCREEN_CACHE_TTL") else None
+MEMORY_BUDGET_MB = float(os.environ["VHB_MEMORY_BUDGET_MB"]) if os.environ.get("VHB_MEMORY_BUDGET_MB") else None
+BUDGET_CHECK_INTERVAL = 5.0  # Seconds between memory budget checks on screen updates
+
+
+def sizeof(value) -> int:
+    """Approximate payload size of a cached value in bytes."""
+    if value is None:
+        return 0
+    nbytes = getattr(value, "nbytes", None)  # NumPy arrays, memoryviews
+    if isinstance(nbytes, int):
+        return nbytes
+    if isinstance(value, (str, bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(sizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def process_memory() -> Optional[int]:
+    """Resident set size of this process in bytes (None where it cannot be read)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # Peak, KiB (bytes on macOS)
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        return None
+
+
+class RingLog:
+    """
+    Thread-safe ring of the most recent text entries (O(1) append and eviction).
+    """
+    def __init__(self, maxlen: int = OCR_LOG_LINES):
+        self._entries: deque = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    @property
+    def maxlen(self) -> int:
+        return self._entries.maxlen
+
+    def append(self, entry: str):
+        with self._lock:
+            if len(self._entries) == self._entries.maxlen:
+                self.dropped += 1
+            self._entries.append(entry)
+
+    def replace(self, entries: Iterable[str]):
+        """Replaces the contents (only the last `maxlen` entries are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._entries.extend(entries)
+
+    def lines(self) -> List[str]:
+        """Snapshot of the entries, oldest first."""
+        with self._lock:
+            return list(self._entries)
+
+    def nbytes(self) -> int:
+        with self._lock:
+            return sum(len(e) for e in self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.lines())
+
+
+class LRUCache:
+    """
+    Byte-budgeted LRU cache with optional expiry.
+
+    A value larger than the whole budget is not stored.
+    """
+    def __init__(self, name: str, max_bytes: int, max_entries: Optional[int] = None,
+                 ttl: Optional[float] = None):
+        """
+        Args:
+            name (str): Cache name (label of `vhb_cache_requests_total`).
+            max_bytes (int): Total size of the stored values (see `sizeof`).
+            max_entries (Optional[int]): Additional limit on the number of entries.
+            ttl (Optional[float]): Seconds after which an entry expires (None: never).
+        """
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[object, int, float]]" = OrderedDict()  # value, size, stored
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _drop(self, key: Hashable):
+        _, size, _ = self._entries.pop(key)
+        self.nbytes -= size
+
+    def _live(self, key: Hashable) -> Optional[Tuple[object, int, float]]:
+        """The entry of `key` unless it expired (caller holds the lock)."""
+        entry = self._entries.get(key)
+        if entry is not None and self.ttl is not None and time.monotonic() - entry[2] > self.ttl:
+            self._drop(key)
+            self.evictions += 1
+            return None
+        return entry
+
+    def get(self, key: Hashable, default=None):
+        """Returns the value and marks it as recently used."""
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+        METRICS.inc("vhb_cache_requests_total", cache=self.name, result="miss" if entry is None else "hit")
+        return default if entry is None else entry[0]
+
+    def peek(self, key: Hashable, default=None):
+        """Returns the value without counting a lookup or changing the order."""
+        with self._lock:
+            entry = self._live(key)
+        return default if entry is None else entry[0]
+
+    def put(self, key: Hashable, value, size: Optional[int] = None) -> bool:
+        """
+        Stores a value, evicting the least recently used entries to stay within budget.
+
+        Returns:
+            bool: False if the value alone exceeds the budget (it is not stored).
+        """
+        size = sizeof(value) if size is None else size
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if size > self.max_bytes:
+                return False
+            self._entries[key] = (value, size, time.monotonic())
+            self.nbytes += size
+            while self._entries and (self.nbytes > self.max_bytes or
+                                     (self.max_entries is not None and len(self._entries) > self.max_entries)):
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return True
+
+    def pop(self, key: Hashable, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            value = self._entries[key][0]
+            self._drop(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def trim(self, entries: int) -> int:
+        """
+        Evicts the least recently used entries until at most `entries` remain.
+
+        Returns:
+            int: Number of evicted entries.
+        """
+        with self._lock:
+            evicted = max(0, len(self._entries) - entries)
+            for _ in range(evicted):
+                self._drop(next(iter(self._entries)))
+            self.evictions += evicted
+        return evicted
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.nbytes, "max_bytes": self.max_bytes,
+                    "max_entries": self.max_entries, "ttl": self.ttl, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions}
+
+
+class TargetState:
+    """
+    Resource state of one target: OCR history and latest encoded screen.
+    """
+    def __init__(self, store: "StateStore", name: str):
+        self.name = name
+        self.ocr_log = RingLog(store.ocr_log_lines)
+        self._store = store
+        self._screens = store.screens
+        self._screen_frame = None  # Weak reference to the frame of the cached encoding
+
+    def latest_screen(self) -> str:
+        """The latest encoded screen ("" if none was captured or it was evicted)."""
+        return self._screens.peek(self, "")
+
+    def set_latest_screen(self, encoded: str):
+        self._screen_frame = None
+        if encoded:
+            self._screens.put(self, encoded)
+            self._store.enforce(force=False)
+        else:
+            self._screens.pop(self)
+
+    def encode_screen(self, frame, encode: Callable[[object], str]) -> str:
+        """
+        Stores the encoding of `frame` as latest screen; a frame that was already
+        encoded (the same object, e.g. a shared grab) is not encoded again.
+        """
+        cached = self._screen_frame() if self._screen_frame is not None else None
+        if cached is frame:
+            encoded = self._screens.get(self)
+            if encoded is not None:
+                return encoded
+        else:
+            METRICS.inc("vhb_cache_requests_total", cache=self._screens.name, result="miss")
+        encoded = encode(frame)
+        self.set_latest_screen(encoded)
+        try:
+            self._screen_frame = weakref.ref(frame)
+        except TypeError:
+            self._screen_frame = None
+        return encoded
+
+    def usage(self) -> Dict:
+        return {"ocr_log_lines": len(self.ocr_log), "ocr_log_bytes": self.ocr_log.nbytes(),
+                "ocr_log_dropped": self.ocr_log.dropped, "screen_bytes": sizeof(self.latest_screen())}
+
+
+class StateStore:
+    """
+    Owns the bounded state of all targets and reports memory usage against budgets.
+    """
+    def __init__(self, ocr_log_lines: int = OCR_LOG_LINES, screen_cache_bytes: int = int(SCREEN_CACHE_MB * MB),
+                 screen_ttl: Optional[float] = SCREEN_CACHE_TTL,
+                 memory_budget_bytes: Optional[int] = int(MEMORY_BUDGET_MB * MB) if MEMORY_BUDGET_MB else None):
+        """
+        Args:
+            ocr_log_lines (int): OCR history entries kept per target.
+            screen_cache_bytes (int): Budget of the encoded screens of all targets.
+            screen_ttl (Optional[float]): Seconds after which a cached screen expires.
+            memory_budget_bytes (Optional[int]): Process memory above which `enforce()`
+                trims the screen cache (None: report only).
+        """
+        self.ocr_log_lines = ocr_log_lines
+        self.memory_budget_bytes = memory_budget_bytes
+        self.screens = LRUCache("screen", screen_cache_bytes, ttl=screen_ttl)
+        self._targets: "weakref.WeakSet[TargetState]" = weakref.WeakSet()
+        self._over_budget = False
+        self._checked = 0.0
+
+    def open(self, name: str) -> TargetState:
+        """Creates the state of a target."""
+        state = TargetState(self, name)
+        self._targets.add(state)
+        return state
+
+    def enforce(self, force: bool = True) -> bool:
+        """
+        Trims the screen cache to one entry while the process exceeds its memory budget.
+
+        The most recently used screen survives. A check triggered by a capture
+        therefore keeps the screen just stored, and only other targets lose theirs.
+
+        Args:
+            force (bool): Check now; otherwise at most every BUDGET_CHECK_INTERVAL seconds.
+
+        Returns:
+            bool: True if the process is over budget.
+        """
+        if self.memory_budget_bytes is None:
+            return False
+        now = time.monotonic()
+        if not force and now - self._checked < BUDGET_CHECK_INTERVAL:
+            return self._over_budget
+        self._checked = now
+        rss = process_memory()
+        over = bool(rss and rss > self.memory_budget_bytes)
+        if over:
+            self.screens.trim(1)
+            if not self._over_budget:
+                logging.warning(f"Process memory {rss / MB:.0f} MB exceeds the budget of "
+                                f"{self.memory_budget_bytes / MB:.0f} MB; screen cache trimmed to the latest screen.")
+        self._over_budget = over
+        return over
+
+    def usage(self) -> Dict:
+        """
+        Returns:
+            Dict: {'process_rss_bytes', 'memory_budget_bytes', 'over_budget', 'screen_cache'
+                (LRU stats), 'ocr_log_lines' (limit per target), 'targets' {name: usage},
+                'state_bytes' (OCR logs plus screen cache)}.
+        """
+        over = self.enforce()
+        targets = {s.name: s.usage() for s in list(self._targets)}
+        screens = self.screens.stats()
+        return {
+            "process_rss_bytes": process_memory(),
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "over_budget": over,
+            "screen_cache": screens,
+            "ocr_log_lines": self.ocr_log_lines,
+            "targets": targets,
+            "state_bytes": screens["bytes"] + sum(t["ocr_log_bytes"] for t in targets.values()),
+        }
+
+    def gauges(self) -> List[Tuple[str, Dict, float]]:
+        """Usage as metrics gauges (see `MetricsRegistry.add_collector`)."""
+        gauges = [("vhb_state_bytes", {"component": "screen_cache"}, self.screens.nbytes)]
+        gauges += [("vhb_state_bytes", {"component": "ocr_log", "target": s.name}, s.ocr_log.nbytes())
+                   for s in list(self._targets)]
+        rss = process_memory()
+        if rss is not None:
+            gauges.append(("vhb_process_resident_bytes", {}, rss))
+        return gauges
+
+
+STATE = StateStore()
+METRICS.add_collector(STATE.gauges)
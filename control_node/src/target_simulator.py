@@ -0,0 +1,515 @@
+"""
+Synthetic Target Simulator Module.
+
+A local stand-in for the whole interface unit: a CMD-like console that reads HID
+reports from a FIFO (the KeyInjector writes to it exactly as to /dev/hidg0) and
+renders its screen into NumPy frames for a capture backend. With it, typing,
+verification, scans and macros run end to end without a Raspberry Pi, capture
+card or target machine, e.g. for throughput and latency tests.
+
+What is emulated:
+- keyboard: reports are decoded through the configured layout's reverse table,
+  including dead keys and Windows Alt+numpad codes (see `hid.py`)
+- console: prompt, line editing (Backspace, Esc, Ctrl+C), line wrapping,
+  scrolling, a blinking cursor
+- commands: `dir`, `cd`, `echo`, `type`, `cls`, `ver`, `whoami` on a small
+  in-memory file system; anything else prints CMD's "not recognized" error
+- timing: keystroke echo latency, command latency (keys typed meanwhile are
+  applied afterwards, like CMD's type-ahead) and the frame rate of the capture
+
+Glyphs are rendered once per character with a TrueType font (PIL, if installed)
+or OpenCV's Hershey font, and rows are cached, so a frame costs little more than
+stacking cached row images.
+"""
+
+import os
+import math
+import time
+import select
+import shutil
+import logging
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = None
+
+try:
+    from .lazy_imports import optional_module
+except ImportError:
+    from lazy_imports import optional_module
+
+cv2 = optional_module("cv2")
+
+try:
+    from .vision import ScreenCapture
+    from .hid import (LAYOUTS, MOD_LALT, MOD_LCTRL, MOD_RCTRL, SCANCODE_ENTER, SCANCODE_BACKSPACE,
+                      SCANCODE_ESCAPE, SCANCODE_TAB)
+except ImportError:
+    from vision import ScreenCapture
+    from hid import (LAYOUTS, MOD_LALT, MOD_LCTRL, MOD_RCTRL, SCANCODE_ENTER, SCANCODE_BACKSPACE,
+                     SCANCODE_ESCAPE, SCANCODE_TAB)
+
+FONT_CANDIDATES = [
+    os.environ.get("VHB_SIM_FONT", ""),
+    "/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf",
+    "/usr/share/fonts/TTF/DejaVuSansMono.ttf",
+    "/Library/Fonts/Courier New.ttf",
+    "C:\\Windows\\Fonts\\consola.ttf",
+]
+FOREGROUND = (192, 192, 192)  # CMD's default light gray on black
+CURSOR_BLINK = 0.53           # Windows caret blink interval in seconds
+ROW_CACHE = 512
+KP_ENTER = 0x58
+KP_PLUS = 0x57
+KEYPAD_DIGITS = {0x62: "0", **{0x59 + i: str(i + 1) for i in range(9)}}
+
+BANNER = ["Microsoft Windows [Version 10.0.19045.0]", "(c) Microsoft Corporation. All rights reserved.", ""]
+DEFAULT_FILES = {
+    "C:\\Users\\sim\\notes.txt": "hello from the simulator",
+    "C:\\Users\\sim\\config with spaces.json": "{\"debug\": false}",
+    "C:\\Users\\sim\\Documents\\report.csv": "id,value\n1,42",
+    "C:\\Windows\\win.ini": "; for 16-bit app support",
+}
+
+
+class GlyphAtlas:
+    """Renders and caches character cells (white-on-black intensity masks)."""
+    def __init__(self, font_size: int = 16, font_path: Optional[str] = None):
+        self.font = None
+        if Image is not None:
+            for path in [font_path or ""] + FONT_CANDIDATES:
+                if path and os.path.exists(path):
+                    self.font = ImageFont.truetype(path, font_size)
+                    break
+        if self.font is not None:
+            ascent, descent = self.font.getmetrics()
+            self.cell_w = int(math.ceil(self.font.getlength("M")))
+            self.cell_h = ascent + descent + 2
+        elif cv2 and hasattr(cv2, "putText"):
+            self.scale = font_size / 22.0
+            (w, h), base = cv2.getTextSize("M", cv2.FONT_HERSHEY_SIMPLEX, self.scale, 1)
+            self.cell_w, self.cell_h = w + 2, h + base + 4
+        else:
+            raise RuntimeError("Target simulator needs Pillow or OpenCV to render text.")
+        self._glyphs: Dict[str, np.ndarray] = {" ": np.zeros((self.cell_h, self.cell_w), dtype=np.uint8)}
+
+    def glyph(self, char: str) -> np.ndarray:
+        cached = self._glyphs.get(char)
+        if cached is not None:
+            return cached
+        if self.font is not None:
+            image = Image.new("L", (self.cell_w, self.cell_h), 0)
+            ImageDraw.Draw(image).text((0, 1), char, fill=255, font=self.font)
+            cell = np.asarray(image, dtype=np.uint8)
+        else:
+            cell = np.zeros((self.cell_h, self.cell_w), dtype=np.uint8)
+            text = char if char.isascii() else "?"
+            cv2.putText(cell, text, (1, self.cell_h - 5), cv2.FONT_HERSHEY_SIMPLEX, self.scale, 255, 1, cv2.LINE_AA)
+        self._glyphs[char] = cell
+        return cell
+
+
+class VirtualFileSystem:
+    """Case-insensitive in-memory Windows paths for the simulated commands."""
+    def __init__(self, files: Dict[str, str]):
+        self.dirs: Dict[str, Dict] = {}
+        self._mkdir("C:\\")
+        for path, content in files.items():
+            self.add_file(path, content)
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return path.rstrip("\\").lower() or "c:"
+
+    def _mkdir(self, path: str) -> Dict:
+        key = self._key(path)
+        if key not in self.dirs:
+            self.dirs[key] = {"name": path.rstrip("\\") or "C:", "dirs": {}, "files": {}}
+            if "\\" in key:
+                parent, _, name = path.rstrip("\\").rpartition("\\")
+                self._mkdir(parent)["dirs"][name.lower()] = name
+        return self.dirs[key]
+
+    def add_file(self, path: str, content: str):
+        parent, _, name = path.rpartition("\\")
+        self._mkdir(parent)["files"][name.lower()] = (name, content)
+
+    def resolve(self, cwd: str, path: str) -> str:
+        """Absolute path for `path` relative to `cwd` (handles '..' and drive paths)."""
+        path = path.strip().strip('"')
+        parts = [] if len(path) > 1 and path[1] == ":" else cwd.rstrip("\\").split("\\")
+        for part in path.replace("/", "\\").split("\\"):
+            if part in ("", "."):
+                continue
+            if part == ".." and len(parts) > 1:
+                parts.pop()
+            elif part != "..":
+                parts.append(part.upper() if part.endswith(":") else part)
+        resolved = "\\".join(parts)
+        entry = self.dirs.get(self._key(resolved))
+        return (entry["name"] if entry else resolved) + ("\\" if len(parts) == 1 else "")
+
+    def directory(self, path: str) -> Optional[Dict]:
+        return self.dirs.get(self._key(path))
+
+    def file(self, path: str) -> Optional[Tuple[str, str]]:
+        parent, _, name = path.rpartition("\\")
+        entry = self.directory(parent)
+        return entry["files"].get(name.lower()) if entry else None
+
+
+class TerminalSimulator:
+    """
+    Simulated CMD console fed by HID reports and rendered into frames.
+    """
+    def __init__(self, width: int = 1280, height: int = 720, fps: float = 30.0, layout: str = "US",
+                 key_latency: float = 0.01, command_latency: float = 0.05, font_size: int = 16,
+                 font_path: Optional[str] = None, files: Optional[Dict[str, str]] = None,
+                 cwd: str = "C:\\Users\\sim", blink: float = CURSOR_BLINK):
+        """
+        Args:
+            width (int): Frame width in pixels.
+            height (int): Frame height in pixels.
+            fps (float): Frame rate of the simulated capture.
+            layout (str): Keyboard layout the simulated target uses to decode keystrokes.
+            key_latency (float): Delay until a keystroke is echoed, in seconds.
+            command_latency (float): Time a command takes before its output appears.
+            font_size (int): Font size in pixels.
+            font_path (Optional[str]): TrueType font (monospace); see FONT_CANDIDATES.
+            files (Optional[Dict[str, str]]): File path -> content for the simulated
+                file system (DEFAULT_FILES if omitted).
+            cwd (str): Initial working directory.
+            blink (float): Cursor blink interval in seconds (0: steady cursor, so frames
+                only change with the screen content).
+        """
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unknown layout '{layout}'. Supported: {', '.join(LAYOUTS)}")
+        self.width, self.height, self.fps = width, height, fps
+        self.layout = LAYOUTS[layout]()
+        self.key_latency, self.command_latency = key_latency, command_latency
+        self.blink = blink
+        self.atlas = GlyphAtlas(font_size, font_path)
+        self.cols = max(20, width // self.atlas.cell_w)
+        self.rows = max(5, height // self.atlas.cell_h)
+        self.fs = VirtualFileSystem(DEFAULT_FILES if files is None else files)
+        self.cwd = self.fs.resolve("C:\\", cwd)
+
+        # Reverse of the layout's dead-key compositions: (dead stroke, base stroke) -> char
+        self._compose = {strokes: char for char, strokes in self.layout.strokes.items() if len(strokes) == 2}
+        self._dead_strokes = set(self.layout.dead_keys.values())
+
+        self._lock = threading.Lock()
+        self.history: Deque[str] = deque(BANNER, maxlen=2000)
+        self.input = ""
+        self._keys: Deque[Tuple[float, int, int]] = deque()  # (due, modifiers, key code)
+        self._busy_until = 0.0
+        self._pending_output: Optional[List[str]] = None
+        self._dead: Optional[Tuple[int, int]] = None
+        self._alt_digits = ""
+        self._alt_hex = False
+        self._held: Tuple[int, ...] = ()
+        self._rows: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._frame_key = None
+        self._frame: Optional[np.ndarray] = None
+        self.keystrokes = 0
+        self.commands = 0
+
+        self.hid_path: Optional[str] = None
+        self._tmpdir: Optional[str] = None
+        self._fd: Optional[int] = None
+        self._keepalive: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+    # --- HID input ---
+
+    def start(self, hid_path: Optional[str] = None) -> str:
+        """
+        Creates the HID FIFO and starts reading reports from it.
+
+        Args:
+            hid_path (Optional[str]): FIFO path (a new temporary one if omitted).
+
+        Returns:
+            str: The FIFO path to use as the KeyInjector's device path.
+        """
+        if not hasattr(os, "mkfifo"):
+            raise RuntimeError("The target simulator needs named pipes (Linux/macOS).")
+        if hid_path is None:
+            self._tmpdir = tempfile.mkdtemp(prefix="vhb-sim-")
+            hid_path = os.path.join(self._tmpdir, "hidg0")
+        if not os.path.exists(hid_path):
+            os.mkfifo(hid_path)
+        self.hid_path = hid_path
+        self._fd = os.open(hid_path, os.O_RDONLY | os.O_NONBLOCK)
+        # Our own writer keeps the FIFO open, so writers closing it do not signal EOF
+        self._keepalive = os.open(hid_path, os.O_WRONLY)
+        self._running = True
+        self._thread = threading.Thread(target=self._read_loop, name="target-simulator", daemon=True)
+        self._thread.start()
+        logging.info(f"Target simulator reading HID reports from {hid_path} ({self.cols}x{self.rows} cells)")
+        return hid_path
+
+    def stop(self):
+        """Stops reading and removes a temporary FIFO."""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        for fd in (self._fd, self._keepalive):
+            if fd is not None:
+                os.close(fd)
+        self._fd = self._keepalive = None
+        if self._tmpdir:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+            self._tmpdir = None
+
+    def _read_loop(self):
+        pending = b""
+        while self._running:
+            ready, _, _ = select.select([self._fd], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                pending += os.read(self._fd, 4096)
+            except BlockingIOError:
+                continue
+            while len(pending) >= 8:
+                self.feed_report(pending[:8])
+                pending = pending[8:]
+
+    def feed_report(self, report: bytes, timestamp: Optional[float] = None):
+        """Processes one 8-byte boot keyboard report (modifiers, reserved, 6 key codes)."""
+        now = time.monotonic() if timestamp is None else timestamp
+        modifiers, keys = report[0], tuple(k for k in report[2:8] if k)
+        with self._lock:
+            pressed = [k for k in keys if k not in self._held]
+            self._held = keys
+            if not keys:
+                # Releases matter for Alt codes (the character appears when Alt goes up)
+                self._keys.append((now + self.key_latency, modifiers, 0))
+            for code in pressed:
+                self._keys.append((now + self.key_latency, modifiers, code))
+
+    # --- Console state ---
+
+    def _prompt(self) -> str:
+        return f"{self.cwd}>"
+
+    def _apply_events(self, now: float):
+        """Applies due keystrokes and command output (caller holds the lock)."""
+        while True:
+            if self._pending_output is not None and now >= self._busy_until:
+                self.history.extend(self._pending_output)
+                self._pending_output = None
+            if self._pending_output is not None or not self._keys or self._keys[0][0] > now:
+                return
+            due, modifiers, code = self._keys.popleft()
+            self._key(modifiers, code, max(due, self._busy_until))
+
+    def _key(self, modifiers: int, code: int, now: float):
+        alt = modifiers & MOD_LALT and not modifiers & (MOD_LCTRL | MOD_RCTRL)
+        if self._alt_digits and not modifiers & MOD_LALT:
+            self._finish_alt_code()
+        if code == 0:
+            return
+        self.keystrokes += 1
+        if alt:
+            if code == KP_PLUS:
+                self._alt_hex = True
+                return
+            digit = KEYPAD_DIGITS.get(code) or (self.layout.get_char(0, code) if self._alt_hex else None)
+            if digit and digit in "0123456789abcdef":
+                self._alt_digits += digit
+            return
+        if code in (SCANCODE_ENTER, KP_ENTER):
+            self._submit(now)
+        elif code == SCANCODE_BACKSPACE:
+            self.input = self.input[:-1]
+        elif code == SCANCODE_ESCAPE:
+            self.input = ""
+        elif code == SCANCODE_TAB:
+            pass
+        elif modifiers & (MOD_LCTRL | MOD_RCTRL):
+            if self.layout.get_char(0, code) == "c":
+                self.history.append(self._prompt() + self.input + "^C")
+                self.input = ""
+        elif (modifiers, code) in self._dead_strokes and self._dead is None:
+            self._dead = (modifiers, code)
+        else:
+            char = self.layout.get_char(modifiers, code)
+            if self._dead is not None:
+                composed = self._compose.get((self._dead, (modifiers, code)))
+                dead_char = self.layout.get_char(*self._dead) or ""
+                self._dead = None
+                if composed:
+                    self.input += composed
+                    return
+                self.input += dead_char
+            if char:
+                self.input += char
+
+    def _finish_alt_code(self):
+        digits, hex_mode = self._alt_digits, self._alt_hex
+        self._alt_digits, self._alt_hex = "", False
+        try:
+            if hex_mode:
+                self.input += chr(int(digits, 16))
+            else:
+                value = int(digits)
+                codepage = "cp1252" if digits.startswith("0") else "cp437"
+                self.input += bytes([value % 256]).decode(codepage, errors="replace")
+        except ValueError:
+            pass
+
+    def _submit(self, now: float):
+        line = self.input
+        self.history.append(self._prompt() + line)
+        self.input = ""
+        output = self._run(line.strip())
+        self.commands += 1
+        if line.strip():
+            output.append("")
+        self._pending_output = output
+        self._busy_until = now + self.command_latency
+
+    def _run(self, command: str) -> List[str]:
+        """Executes a command and returns its output lines."""
+        if not command:
+            return []
+        name, _, arg = command.partition(" ")
+        name = name.lower()
+        if name.startswith("echo"):
+            text = command[4:]
+            return [text[1:] if text[:1] in (" ", ".") else text] if text else ["ECHO is on."]
+        if name == "cls":
+            self.history.clear()
+            return []
+        if name == "ver":
+            return ["", BANNER[0]]
+        if name == "whoami":
+            return ["sim\\user"]
+        if name == "cd":
+            if not arg.strip():
+                return [self.cwd]
+            path = self.fs.resolve(self.cwd, arg)
+            if self.fs.directory(path) is None:
+                return ["The system cannot find the path specified."]
+            self.cwd = path
+            return []
+        if name == "dir":
+            return self._dir(self.fs.resolve(self.cwd, arg) if arg.strip() else self.cwd)
+        if name == "type":
+            entry = self.fs.file(self.fs.resolve(self.cwd, arg))
+            return entry[1].splitlines() if entry else ["The system cannot find the file specified."]
+        return [f"'{name}' is not recognized as an internal or external command,",
+                "operable program or batch file."]
+
+    def _dir(self, path: str) -> List[str]:
+        entry = self.fs.directory(path)
+        lines = [" Volume in drive C has no label.", " Volume Serial Number is 1A2B-3C4D", ""]
+        if entry is None:
+            return lines + ["File Not Found"]
+        stamp = "01/15/2024  09:30 AM"
+        is_root = "\\" not in entry["name"]
+        lines += [" Directory of " + entry["name"] + ("\\" if is_root else ""), ""]
+        names = ([] if is_root else [".", ".."]) + sorted(entry["dirs"].values(), key=str.lower)
+        lines += [f"{stamp}    <DIR>          {name}" for name in names]
+        files = sorted(entry["files"].values(), key=lambda f: f[0].lower())
+        lines += [f"{stamp}    {len(content):>14} {name}" for name, content in files]
+        total = sum(len(content) for _, content in files)
+        lines += [f"{len(files):>16} File(s) {total:>14} bytes",
+                  f"{len(names):>16} Dir(s)  10737418240 bytes free"]
+        return lines
+
+    # --- Rendering ---
+
+    def _wrap(self, line: str) -> List[str]:
+        return [line[i:i + self.cols] for i in range(0, len(line), self.cols)] or [""]
+
+    def screen_lines(self, now: Optional[float] = None) -> List[str]:
+        """The text currently on screen (rows of at most `cols` characters)."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._apply_events(now)
+            physical = []
+            for line in list(self.history)[-self.rows:]:
+                physical.extend(self._wrap(line))
+            if self._pending_output is None:
+                physical.extend(self._wrap(self._prompt() + self.input))
+        return physical[-self.rows:]
+
+    def _row(self, text: str) -> np.ndarray:
+        strip = self._rows.get(text)
+        if strip is None:
+            cells = [self.atlas.glyph(c) for c in text.ljust(self.cols)[:self.cols]]
+            strip = np.hstack(cells)
+            self._rows[text] = strip
+            if len(self._rows) > ROW_CACHE:
+                self._rows.popitem(last=False)
+        else:
+            self._rows.move_to_end(text)
+        return strip
+
+    def render(self, now: Optional[float] = None) -> np.ndarray:
+        """Renders the current screen as a BGR frame."""
+        now = time.monotonic() if now is None else now
+        lines = self.screen_lines(now)
+        busy = self._pending_output is not None
+        cursor_on = not busy and (self.blink <= 0 or int(now / self.blink) % 2 == 0)
+        key = (tuple(lines), cursor_on)
+        if key != self._frame_key:
+            cell_h, cell_w = self.atlas.cell_h, self.atlas.cell_w
+            mask = np.zeros((self.height, self.width), dtype=np.uint8)
+            for i, line in enumerate(lines):
+                strip = self._row(line)
+                mask[i * cell_h:(i + 1) * cell_h, :strip.shape[1]] = strip[:, :self.width]
+            if cursor_on and lines:
+                row, col = len(lines) - 1, len(lines[-1])
+                if col >= self.cols:
+                    row, col = row + 1, 0
+                y = (row + 1) * cell_h - 3
+                if y + 2 <= self.height:
+                    mask[y:y + 2, col * cell_w:(col + 1) * cell_w] = 255
+            frame = np.empty((self.height, self.width, 3), dtype=np.uint8)
+            for c, value in enumerate(FOREGROUND):
+                frame[..., c] = (mask.astype(np.uint16) * value // 255).astype(np.uint8)
+            self._frame_key, self._frame = key, frame
+        return self._frame.copy()
+
+    def stats(self) -> Dict:
+        return {"keystrokes": self.keystrokes, "commands": self.commands, "cols": self.cols, "rows": self.rows,
+                "fps": self.fps, "font": "truetype" if self.atlas.font is not None else "hershey"}
+
+
+class SimulatedCapture(ScreenCapture):
+    """
+    Capture backend delivering the simulator's screen at its frame rate.
+
+    Like a capture card, a grab returns the next frame, so reads are spaced by 1/fps.
+    """
+    def __init__(self, simulator: TerminalSimulator):
+        super().__init__(device_id=-1)
+        self.simulator = simulator
+
+    def _open_camera(self):
+        pass
+
+    def capture_frame(self) -> np.ndarray:
+        period = 1.0 / self.simulator.fps
+        now = time.monotonic()
+        wait = (math.floor(now / period) + 1) * period - now
+        time.sleep(wait)
+        return self.simulator.render()
+
+    def measured_fps(self) -> Optional[float]:
+        return float(self.simulator.fps)
+
+    def release(self):
+        pass
@@ -0,0 +1,306 @@
+"""
+Target Registry Module.
+
+A single control node can drive several air-gapped hosts. Each host ("target")
+has its own capture device, HID gadget, keyboard layout, vision pipeline,
+log directory, hardware scheduler and resource state. The registry is
+configured from a JSON file:
+
+    {
+      "default": "rack-a",
+      "targets": [
+        {"name": "rack-a", "device_id": 0, "hid_path": "/dev/hidg0", "layout": "DE", "logs_dir": "logs/rack-a"},
+        {"name": "rack-b", "device_id": 2, "hid_path": "/dev/hidg1", "layout": "US", "logs_dir": "logs/rack-b",
+         "capture_mode": {"fourcc": "MJPG", "width": 1920, "height": 1080, "fps": 30}, "capture_backend": "v4l2",
+         "unicode_input": "linux"},
+        {"name": "lab", "layout": "US", "replay": {"path": "sessions/login.zip", "speed": 4.0}},
+        {"name": "sim", "layout": "DE", "simulator": {"width": 1280, "height": 720, "fps": 30}}
+      ]
+    }
+
+The path is read from the `VHB_TARGETS_CONFIG` environment variable. Without a
+configuration, a single target named "default" (device 0, /dev/hidg0) is used.
+"""
+
+import os
+import json
+import threading
+from typing import Callable, Dict, Iterator, List, Optional
+try:
+    from .vision import ScreenCapture, VisionPipeline
+    from .hid import KeyInjector, LAYOUTS, UNICODE_INPUT_METHODS, DEFAULT_UNICODE_INPUT
+    from .data_harvester import DataHarvester
+    from .scheduler import HardwareScheduler
+    from .screen_state import ScreenStateClassifier
+    from .signal_health import SignalHealthMonitor
+    from .capture_modes import CaptureMode
+    from .v4l2_capture import V4L2Capture
+    from .session_replay import ReplaySession
+    from .target_simulator import TerminalSimulator, SimulatedCapture
+    from .state_store import STATE, StateStore
+except ImportError:
+    from vision import ScreenCapture, VisionPipeline
+    from hid import KeyInjector, LAYOUTS, UNICODE_INPUT_METHODS, DEFAULT_UNICODE_INPUT
+    from data_harvester import DataHarvester
+    from scheduler import HardwareScheduler
+    from screen_state import ScreenStateClassifier
+    from signal_health import SignalHealthMonitor
+    from capture_modes import CaptureMode
+    from v4l2_capture import V4L2Capture
+    from session_replay import ReplaySession
+    from target_simulator import TerminalSimulator, SimulatedCapture
+    from state_store import STATE, StateStore
+
+DEFAULT_TARGET = "default"
+CAPTURE_BACKENDS = {"opencv": ScreenCapture, "v4l2": V4L2Capture}
+DEFAULT_CAPTURE_BACKEND = os.environ.get("VHB_CAPTURE_BACKEND", "opencv")
+
+
+class Target:
+    """
+    Hardware, pipeline and resource state of one target host.
+    """
+    def __init__(self, name: str, device_id: int = 0, hid_path: str = "/dev/hidg0",
+                 layout: str = "DE", logs_dir: str = "logs", capture_mode: Optional[CaptureMode] = None,
+                 capture_backend: str = DEFAULT_CAPTURE_BACKEND, unicode_input: str = DEFAULT_UNICODE_INPUT,
+                 replay: Optional[Dict] = None, simulator: Optional[Dict] = None,
+                 state: Optional[StateStore] = None):
+        """
+        Args:
+            name (str): Unique target name used in tool calls.
+            device_id (int): Video device index of the capture card.
+            hid_path (str): Path to the HID gadget character device.
+            layout (str): Initial keyboard layout code (see `hid.LAYOUTS`).
+            logs_dir (str): Directory for scans and OCR logs of this target.
+            capture_mode (Optional[CaptureMode]): Explicit capture mode; the stored
+                benchmark result (or the driver default) if omitted.
+            capture_backend (str): "opencv" (cv2.VideoCapture) or "v4l2" (direct mmap
+                streaming, Linux only; see `v4l2_capture.py`).
+            unicode_input (str): How characters missing from the layout are entered
+                ("windows_alt", "windows_hex", "linux" or "none"; see `hid.UNICODE_INPUT_METHODS`).
+            replay (Optional[Dict]): {'path', 'speed', 'sync_hid'}: play a recorded session
+                instead of using the capture card and HID gadget (see `session_replay.py`).
+            simulator (Optional[Dict]): Keyword arguments of `TerminalSimulator`: run against
+                a simulated console instead of the hardware (see `target_simulator.py`).
+            state (Optional[StateStore]): Store holding the OCR history and latest screen
+                (default: the process-wide `STATE`, see `state_store.py`).
+        """
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unknown layout '{layout}' for target '{name}'. Supported: {', '.join(LAYOUTS)}")
+        if capture_backend not in CAPTURE_BACKENDS:
+            raise ValueError(f"Unknown capture backend '{capture_backend}' for target '{name}'. "
+                             f"Supported: {', '.join(CAPTURE_BACKENDS)}")
+        if unicode_input not in UNICODE_INPUT_METHODS:
+            raise ValueError(f"Unknown unicode input method '{unicode_input}' for target '{name}'. "
+                             f"Supported: {', '.join(UNICODE_INPUT_METHODS)}")
+
+        self.name = name
+        self.device_id = device_id
+        self.hid_path = hid_path
+        self.logs_dir = logs_dir
+        self.capture_backend = capture_backend
+        self.unicode_input = unicode_input
+
+        # Components touching hardware or the file system are created on first use
+        # (see __getattr__), so constructing the registry is instant.
+        self._factory_lock = threading.Lock()
+        self._factories: Dict[str, Callable] = {
+            "injector": lambda: KeyInjector(device_path=hid_path, layout=LAYOUTS[layout](),
+                                            unicode_input=unicode_input),
+            "pipeline": VisionPipeline,
+            "harvester": lambda: DataHarvester(logs_dir),
+        }
+        self.replay = None
+        if replay:
+            self.replay = ReplaySession(replay["path"], speed=float(replay.get("speed", 1.0)),
+                                        sync_hid=bool(replay.get("sync_hid", True)), layout=LAYOUTS[layout](),
+                                        unicode_input=unicode_input)
+            self._factories["injector"] = lambda: self.replay.injector
+        self.simulator = None
+        if simulator is not None:
+            self.simulator = TerminalSimulator(**dict({"layout": layout}, **simulator))
+            # The real KeyInjector writes to the simulator's FIFO like to the gadget
+            self.hid_path = hid_path = self.simulator.start()
+        if self.replay:
+            self.capture = self.replay.capture
+        elif self.simulator:
+            self.capture = SimulatedCapture(self.simulator)
+        else:
+            self.capture = self.new_capture(capture_mode)
+        self.recorder = None  # SessionRecorder while a recording is running
+        self.scheduler = HardwareScheduler(lambda: self.capture)
+        self.screen_state = ScreenStateClassifier()
+        self.health = SignalHealthMonitor(name, self.scheduler.grab_frame, fps_source=self._measured_fps)
+
+        # Keyboard layout detection (runs in the background; HID tools wait for it)
+        self.layout_ready = threading.Event()
+        self.layout_ready.set()
+        self.layout_status: Dict = {"state": "not_run"}
+
+        # Resource state (bounded, thread-safe; tools run on several threads)
+        self.state = (state or STATE).open(name)
+
+    def __getattr__(self, name: str):
+        """Creates a lazily constructed component on first access."""
+        factories = self.__dict__.get("_factories", {})
+        if name not in factories:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        with self.__dict__["_factory_lock"]:
+            if name not in self.__dict__:
+                self.__dict__[name] = factories[name]()
+        return self.__dict__[name]
+
+    def lazy(self, name: str, factory: Callable):
+        """Registers a component that is created by `factory` on first access."""
+        self._factories[name] = factory
+
+    @classmethod
+    def from_dict(cls, config: Dict) -> "Target":
+        """Creates a target from one entry of the configuration file."""
+        return cls(
+            name=config["name"],
+            device_id=int(config.get("device_id", 0)),
+            hid_path=config.get("hid_path", "/dev/hidg0"),
+            layout=config.get("layout", "DE"),
+            logs_dir=config.get("logs_dir", os.path.join("logs", config["name"])),
+            capture_mode=CaptureMode.from_dict(config["capture_mode"]) if config.get("capture_mode") else None,
+            capture_backend=config.get("capture_backend", DEFAULT_CAPTURE_BACKEND),
+            unicode_input=config.get("unicode_input", DEFAULT_UNICODE_INPUT),
+            replay=config.get("replay"),
+            simulator=config.get("simulator"),
+        )
+
+    def new_capture(self, mode: Optional[CaptureMode] = None) -> ScreenCapture:
+        """Creates a capture object for this target's device with the configured backend."""
+        return CAPTURE_BACKENDS[self.capture_backend](self.device_id, mode=mode)
+
+    def _measured_fps(self) -> Optional[float]:
+        """Frame rate measured by the capture device (None if unknown)."""
+        fps = getattr(self.capture, "measured_fps", None)
+        value = fps() if callable(fps) else None
+        return value if isinstance(value, (int, float)) else None
+
+    @property
+    def ocr_log(self) -> List[str]:
+        """Snapshot of the OCR history (the last `VHB_OCR_LOG_LINES` entries)."""
+        return self.state.ocr_log.lines()
+
+    @ocr_log.setter
+    def ocr_log(self, entries: List[str]):
+        self.state.ocr_log.replace(entries)
+
+    @property
+    def latest_screen_base64(self) -> str:
+        """The latest encoded screen ("" if none is cached, see `state_store.py`)."""
+        return self.state.latest_screen()
+
+    @latest_screen_base64.setter
+    def latest_screen_base64(self, encoded: str):
+        self.state.set_latest_screen(encoded)
+
+    def append_ocr_log(self, entry: str):
+        """Appends an entry to the OCR history (thread-safe, the oldest entry drops out)."""
+        self.state.ocr_log.append(entry)
+
+    def describe(self) -> Dict:
+        """Returns the static configuration of this target."""
+        mode = getattr(self.capture, "active_mode", None) or getattr(self.capture, "mode", None)
+        return {
+            "name": self.name,
+            "device_id": self.device_id,
+            "hid_path": self.hid_path,
+            "layout": getattr(self.injector.layout, "code", type(self.injector.layout).__name__),
+            "layout_detection": dict(self.layout_status),
+            "logs_dir": self.logs_dir,
+            "capture_mode": mode.to_dict() if isinstance(mode, CaptureMode) else None,
+            "capture_backend": self.capture_backend,
+            "unicode_input": self.unicode_input,
+            "replay": self.replay.reader.path if self.replay else None,
+            "recording": self.recorder.path if self.recorder else None,
+            "simulator": self.simulator.stats() if self.simulator else None,
+            "hid_simulation": bool(getattr(self.injector, "simulation_mode", False)),
+        }
+
+
+class TargetRegistry:
+    """
+    Holds all configured targets and resolves target names from tool calls.
+    """
+    def __init__(self, targets: Optional[List[Target]] = None, default: Optional[str] = None):
+        """
+        Args:
+            targets (Optional[List[Target]]): Initial targets.
+            default (Optional[str]): Name of the target used when a call names none.
+                Defaults to the first target.
+        """
+        self._targets: Dict[str, Target] = {}
+        self.default_name = default
+        for target in targets or []:
+            self.add(target)
+
+    def add(self, target: Target, default: bool = False):
+        """Registers a target (optionally as the default)."""
+        if target.name in self._targets:
+            raise ValueError(f"Duplicate target name '{target.name}'")
+        self._targets[target.name] = target
+        if default or self.default_name is None:
+            self.default_name = target.name
+
+    def get(self, name: Optional[str] = None) -> Target:
+        """
+        Resolves a target by name.
+
+        Args:
+            name (Optional[str]): Target name; empty/None selects the default target.
+
+        Returns:
+            Target: The target.
+
+        Raises:
+            ValueError: If the name is unknown.
+        """
+        key = name or self.default_name
+        if key not in self._targets:
+            raise ValueError(f"Unknown target '{name}'. Available: {', '.join(self._targets) or 'none'}")
+        return self._targets[key]
+
+    def names(self) -> List[str]:
+        """Returns all target names in configuration order."""
+        return list(self._targets)
+
+    def __iter__(self) -> Iterator[Target]:
+        return iter(self._targets.values())
+
+    def __len__(self) -> int:
+        return len(self._targets)
+
+    @classmethod
+    def from_config(cls, path: str) -> "TargetRegistry":
+        """
+        Loads targets from a JSON configuration file.
+
+        Args:
+            path (str): Path to the configuration file.
+
+        Returns:
+            TargetRegistry: The populated registry.
+        """
+        with open(path, 'r') as f:
+            config = json.load(f)
+
+        entries = config.get("targets", [])
+        if not entries:
+            raise ValueError(f"No targets defined in {path}")
+        registry = cls([Target.from_dict(entry) for entry in entries], default=config.get("default"))
+        registry.get()  # Validate the default name
+        return registry
+
+    @classmethod
+    def from_environment(cls) -> "TargetRegistry":
+        """
+        Loads the registry from `VHB_TARGETS_CONFIG`, or creates the single default target.
+        """
+        path = os.environ.get("VHB_TARGETS_CONFIG", "")
+        if path:
+            return cls.from_config(path)
+        return cls([Target(DEFAULT_TARGET)])
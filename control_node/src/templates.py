@@ -0,0 +1,253 @@
+"""
+Template Matching Module.
+
+Recognizes known UI elements (dialogs, UAC prompts, login screens, error boxes)
+without OCR or a VLM round trip. Reference crops are stored as PNG files in a
+template directory; on load, each is converted to grayscale and a multi-scale
+pyramid is precomputed. Frames are matched with `cv2.matchTemplate`
+(normalized cross-correlation) coarse-to-fine: a half-resolution search inside
+the candidate regions, then a refinement at full resolution around each hit.
+
+Optional per-template settings live in `templates.json` in the same directory:
+
+    {"uac_prompt": {"threshold": 0.9, "scales": [1.0]}}
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    from .lazy_imports import optional_module
+except ImportError:
+    from lazy_imports import optional_module
+
+cv2 = optional_module("cv2")
+
+DEFAULT_SCALES = (0.75, 0.9, 1.0, 1.1, 1.25)
+DEFAULT_THRESHOLD = 0.85
+COARSE_FACTOR = 0.5
+METADATA_FILE = "templates.json"
+
+
+def _to_gray(image: np.ndarray) -> np.ndarray:
+    """Converts a BGR image to 8-bit grayscale (no-op for grayscale input)."""
+    if image.ndim == 3:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image
+
+
+def _resize(image: np.ndarray, factor: float) -> np.ndarray:
+    """Scales an image by a factor (area interpolation when shrinking)."""
+    if factor == 1.0:
+        return image
+    h, w = image.shape[:2]
+    size = (max(1, int(round(w * factor))), max(1, int(round(h * factor))))
+    interpolation = cv2.INTER_AREA if factor < 1.0 else cv2.INTER_LINEAR
+    return cv2.resize(image, size, interpolation=interpolation)
+
+
+class Template:
+    """
+    A reference crop with its precomputed scale pyramid.
+    """
+    def __init__(self, name: str, image: np.ndarray, threshold: float = DEFAULT_THRESHOLD,
+                 scales: Sequence[float] = DEFAULT_SCALES):
+        """
+        Args:
+            name (str): Template name (file stem).
+            image (np.ndarray): Reference crop (BGR or grayscale).
+            threshold (float): Minimum normalized correlation for a hit (0..1).
+            scales (Sequence[float]): Scale factors the element may appear at on screen.
+        """
+        self.name = name
+        self.threshold = threshold
+        self.gray = _to_gray(image)
+        h, w = self.gray.shape[:2]
+        self.height, self.width = h, w
+
+        # Precomputed pyramid: full-resolution and coarse (half-resolution) variants per scale
+        self.levels = []
+        for scale in scales:
+            full = _resize(self.gray, scale)
+            coarse = _resize(self.gray, scale * COARSE_FACTOR)
+            if min(coarse.shape[:2]) < 4:
+                continue
+            self.levels.append((scale, full, coarse))
+
+
+class TemplateLibrary:
+    """
+    Loads templates from a directory and finds them in frames.
+    """
+    def __init__(self, directory: str):
+        """
+        Args:
+            directory (str): Template directory (PNG files plus optional templates.json).
+                Loaded lazily on first use.
+        """
+        self.directory = directory
+        self._templates: Dict[str, Template] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _metadata(self) -> Dict:
+        path = os.path.join(self.directory, METADATA_FILE)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def load(self):
+        """(Re)loads all templates from the directory and precomputes their pyramids."""
+        if not cv2:
+            raise RuntimeError("OpenCV not installed.")
+        templates = {}
+        if os.path.isdir(self.directory):
+            metadata = self._metadata()
+            for filename in sorted(os.listdir(self.directory)):
+                name, ext = os.path.splitext(filename)
+                if ext.lower() != ".png":
+                    continue
+                image = cv2.imread(os.path.join(self.directory, filename), cv2.IMREAD_GRAYSCALE)
+                if image is None:
+                    logging.warning(f"Could not read template {filename}")
+                    continue
+                options = metadata.get(name, {})
+                templates[name] = Template(name, image,
+                                           threshold=options.get("threshold", DEFAULT_THRESHOLD),
+                                           scales=options.get("scales", DEFAULT_SCALES))
+        with self._lock:
+            self._templates = templates
+            self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def names(self) -> List[str]:
+        """Returns the names of all templates."""
+        self._ensure_loaded()
+        return sorted(self._templates)
+
+    def add(self, name: str, image: np.ndarray, threshold: float = DEFAULT_THRESHOLD,
+            save: bool = True) -> Template:
+        """
+        Adds a template (e.g. a crop of the current screen).
+
+        Args:
+            name (str): Template name.
+            image (np.ndarray): Reference crop.
+            threshold (float): Minimum correlation for a hit.
+            save (bool): Also write `<name>.png` (and its threshold) to the directory.
+
+        Returns:
+            Template: The new template.
+        """
+        self._ensure_loaded()
+        template = Template(name, image, threshold=threshold)
+        if save:
+            os.makedirs(self.directory, exist_ok=True)
+            cv2.imwrite(os.path.join(self.directory, f"{name}.png"), template.gray)
+            if threshold != DEFAULT_THRESHOLD:
+                metadata = self._metadata()
+                metadata.setdefault(name, {})["threshold"] = threshold
+                with open(os.path.join(self.directory, METADATA_FILE), 'w') as f:
+                    json.dump(metadata, f, indent=2)
+        with self._lock:
+            self._templates[name] = template
+        return template
+
+    def find(self, frame: np.ndarray, names: Optional[List[str]] = None,
+             regions: Optional[List[List[int]]] = None, threshold: Optional[float] = None,
+             max_hits: int = 5) -> List[Dict]:
+        """
+        Finds templates in a frame.
+
+        Args:
+            frame (np.ndarray): BGR or grayscale frame.
+            names (Optional[List[str]]): Templates to look for (all if omitted).
+            regions (Optional[List[List[int]]]): Candidate areas [x, y, width, height] to
+                search; the full frame if omitted.
+            threshold (Optional[float]): Overrides the per-template threshold.
+            max_hits (int): Maximum hits per template.
+
+        Returns:
+            List[Dict]: Hits sorted by score, each with 'template', 'x', 'y', 'width',
+                'height' (frame pixels), 'score' and 'scale'.
+
+        Raises:
+            ValueError: If a requested template does not exist.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            library = dict(self._templates)
+        selected = names or sorted(library)
+        unknown = [n for n in selected if n not in library]
+        if unknown:
+            raise ValueError(f"Unknown template(s): {', '.join(unknown)}. Available: {', '.join(sorted(library)) or 'none'}")
+
+        gray = _to_gray(frame)
+        fh, fw = gray.shape[:2]
+        areas = regions or [[0, 0, fw, fh]]
+        coarse_frame = _resize(gray, COARSE_FACTOR)
+
+        hits = []
+        for name in selected:
+            template = library[name]
+            limit = template.threshold if threshold is None else threshold
+            candidates = []
+            for x, y, w, h in areas:
+                x0, y0 = max(0, int(x)), max(0, int(y))
+                x1, y1 = min(fw, int(x + w)), min(fh, int(y + h))
+                cx0, cy0 = int(x0 * COARSE_FACTOR), int(y0 * COARSE_FACTOR)
+                cx1, cy1 = int(np.ceil(x1 * COARSE_FACTOR)), int(np.ceil(y1 * COARSE_FACTOR))
+                area = coarse_frame[cy0:cy1, cx0:cx1]
+                for scale, full, coarse in template.levels:
+                    th, tw = coarse.shape[:2]
+                    if area.shape[0] < th or area.shape[1] < tw:
+                        continue
+                    scores = cv2.matchTemplate(area, coarse, cv2.TM_CCOEFF_NORMED)
+                    # Coarse pass is tolerant; the full-resolution pass decides
+                    for py, px in zip(*np.nonzero(scores >= limit - 0.15)):
+                        candidates.append((float(scores[py, px]), scale, full,
+                                           int((cx0 + px) / COARSE_FACTOR), int((cy0 + py) / COARSE_FACTOR)))
+
+            # Refine the best coarse candidates at full resolution
+            candidates.sort(key=lambda c: c[0], reverse=True)
+            found = []
+            for _, scale, full, x, y in candidates[:max(20, 4 * max_hits)]:
+                th, tw = full.shape[:2]
+                if any(abs(x - f["x"]) < tw // 2 and abs(y - f["y"]) < th // 2 for f in found):
+                    continue
+                pad = int(round(2 / COARSE_FACTOR))
+                rx0, ry0 = max(0, x - pad), max(0, y - pad)
+                window = gray[ry0:min(fh, y + th + pad), rx0:min(fw, x + tw + pad)]
+                if window.shape[0] < th or window.shape[1] < tw:
+                    continue
+                scores = cv2.matchTemplate(window, full, cv2.TM_CCOEFF_NORMED)
+                _, score, _, loc = cv2.minMaxLoc(scores)
+                if score < limit:
+                    continue
+                hit = {"template": name, "x": rx0 + loc[0], "y": ry0 + loc[1], "width": tw, "height": th,
+                       "score": round(float(score), 3), "scale": scale}
+                if any(abs(hit["x"] - f["x"]) < tw // 2 and abs(hit["y"] - f["y"]) < th // 2 for f in found):
+                    continue
+                found.append(hit)
+                if len(found) >= max_hits:
+                    break
+            hits.extend(found)
+
+        hits.sort(key=lambda h: h["score"], reverse=True)
+        return hits
+
+    def find_timed(self, frame: np.ndarray, **kwargs) -> Dict:
+        """`find` plus the elapsed time, as returned by the `find_on_screen` tool."""
+        started = time.perf_counter()
+        hits = self.find(frame, **kwargs)
+        return {"hits": hits, "elapsed_ms": round(1000.0 * (time.perf_counter() - started), 2)}
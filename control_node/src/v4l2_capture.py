@@ -0,0 +1,422 @@
+"""
+V4L2 Capture Backend Module.
+
+An alternative to `cv2.VideoCapture` that talks to the Video4Linux2 API directly
+(Linux only). Kernel buffers are mmap'd once; frames are dequeued with `select`
+plus non-blocking VIDIOC_DQBUF. All buffers that are ready are drained and only
+the newest one is kept, so a grab never returns a stale frame and never waits
+for more than the next frame. Each frame carries the driver's timestamp and
+sequence number, from which frame age, frame rate and dropped frames are known
+exactly.
+
+`V4L2Capture.capture_raw()` returns a zero-copy NumPy view of the dequeued
+buffer (valid until the next grab); `capture_frame()` converts it to a BGR frame
+like `ScreenCapture`. Device access goes through a small `KernelDevice` object,
+so the backend can be exercised with a file-backed fake device.
+"""
+
+import ctypes
+import errno
+import logging
+import mmap
+import os
+import select
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+try:
+    from .lazy_imports import optional_module
+except ImportError:
+    from lazy_imports import optional_module
+
+cv2 = optional_module("cv2")
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Not available on Windows
+
+try:
+    from .vision import ScreenCapture
+    from .capture_modes import CaptureMode, CaptureProfiles, fourcc_code, fourcc_name, mode_accepted
+except ImportError:
+    from vision import ScreenCapture
+    from capture_modes import CaptureMode, CaptureProfiles, fourcc_code, fourcc_name, mode_accepted
+
+# --- videodev2.h ---
+
+V4L2_BUF_TYPE_VIDEO_CAPTURE = 1
+V4L2_MEMORY_MMAP = 1
+V4L2_FIELD_ANY = 0
+V4L2_CAP_VIDEO_CAPTURE = 0x00000001
+V4L2_CAP_STREAMING = 0x04000000
+V4L2_CAP_DEVICE_CAPS = 0x80000000
+V4L2_CAP_TIMEPERFRAME = 0x1000
+V4L2_BUF_FLAG_ERROR = 0x0040
+V4L2_BUF_FLAG_TIMESTAMP_MASK = 0xE000
+V4L2_BUF_FLAG_TIMESTAMP_MONOTONIC = 0x2000
+
+
+class v4l2_capability(ctypes.Structure):
+    _fields_ = [("driver", ctypes.c_char * 16), ("card", ctypes.c_char * 32), ("bus_info", ctypes.c_char * 32),
+                ("version", ctypes.c_uint32), ("capabilities", ctypes.c_uint32),
+                ("device_caps", ctypes.c_uint32), ("reserved", ctypes.c_uint32 * 3)]
+
+
+class v4l2_pix_format(ctypes.Structure):
+    _fields_ = [("width", ctypes.c_uint32), ("height", ctypes.c_uint32), ("pixelformat", ctypes.c_uint32),
+                ("field", ctypes.c_uint32), ("bytesperline", ctypes.c_uint32), ("sizeimage", ctypes.c_uint32),
+                ("colorspace", ctypes.c_uint32), ("priv", ctypes.c_uint32), ("flags", ctypes.c_uint32),
+                ("ycbcr_enc", ctypes.c_uint32), ("quantization", ctypes.c_uint32), ("xfer_func", ctypes.c_uint32)]
+
+
+class _v4l2_format_union(ctypes.Union):
+    # The kernel union contains pointers (v4l2_window), hence pointer alignment
+    _fields_ = [("pix", v4l2_pix_format), ("raw_data", ctypes.c_uint8 * 200), ("_align", ctypes.c_void_p)]
+
+
+class v4l2_format(ctypes.Structure):
+    _fields_ = [("type", ctypes.c_uint32), ("fmt", _v4l2_format_union)]
+
+
+class v4l2_fract(ctypes.Structure):
+    _fields_ = [("numerator", ctypes.c_uint32), ("denominator", ctypes.c_uint32)]
+
+
+class v4l2_captureparm(ctypes.Structure):
+    _fields_ = [("capability", ctypes.c_uint32), ("capturemode", ctypes.c_uint32), ("timeperframe", v4l2_fract),
+                ("extendedmode", ctypes.c_uint32), ("readbuffers", ctypes.c_uint32), ("reserved", ctypes.c_uint32 * 4)]
+
+
+class _v4l2_streamparm_union(ctypes.Union):
+    _fields_ = [("capture", v4l2_captureparm), ("raw_data", ctypes.c_uint8 * 200)]
+
+
+class v4l2_streamparm(ctypes.Structure):
+    _fields_ = [("type", ctypes.c_uint32), ("parm", _v4l2_streamparm_union)]
+
+
+class v4l2_requestbuffers(ctypes.Structure):
+    _fields_ = [("count", ctypes.c_uint32), ("type", ctypes.c_uint32), ("memory", ctypes.c_uint32),
+                ("capabilities", ctypes.c_uint32), ("reserved", ctypes.c_uint32)]
+
+
+class timeval(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_usec", ctypes.c_long)]
+
+
+class v4l2_timecode(ctypes.Structure):
+    _fields_ = [("type", ctypes.c_uint32), ("flags", ctypes.c_uint32), ("frames", ctypes.c_uint8),
+                ("seconds", ctypes.c_uint8), ("minutes", ctypes.c_uint8), ("hours", ctypes.c_uint8),
+                ("userbits", ctypes.c_uint8 * 4)]
+
+
+class _v4l2_buffer_m(ctypes.Union):
+    _fields_ = [("offset", ctypes.c_uint32), ("userptr", ctypes.c_ulong), ("planes", ctypes.c_void_p),
+                ("fd", ctypes.c_int32)]
+
+
+class v4l2_buffer(ctypes.Structure):
+    _fields_ = [("index", ctypes.c_uint32), ("type", ctypes.c_uint32), ("bytesused", ctypes.c_uint32),
+                ("flags", ctypes.c_uint32), ("field", ctypes.c_uint32), ("timestamp", timeval),
+                ("timecode", v4l2_timecode), ("sequence", ctypes.c_uint32), ("memory", ctypes.c_uint32),
+                ("m", _v4l2_buffer_m), ("length", ctypes.c_uint32), ("reserved2", ctypes.c_uint32),
+                ("request_fd", ctypes.c_int32)]
+
+
+def _ioc(direction: int, nr: int, struct) -> int:
+    """Builds an ioctl request number (asm-generic/ioctl.h, type 'V')."""
+    return (direction << 30) | (ctypes.sizeof(struct) << 16) | (ord('V') << 8) | nr
+
+
+_IOW, _IOR, _IOWR = 1, 2, 3
+VIDIOC_QUERYCAP = _ioc(_IOR, 0, v4l2_capability)
+VIDIOC_G_FMT = _ioc(_IOWR, 4, v4l2_format)
+VIDIOC_S_FMT = _ioc(_IOWR, 5, v4l2_format)
+VIDIOC_REQBUFS = _ioc(_IOWR, 8, v4l2_requestbuffers)
+VIDIOC_QUERYBUF = _ioc(_IOWR, 9, v4l2_buffer)
+VIDIOC_QBUF = _ioc(_IOWR, 15, v4l2_buffer)
+VIDIOC_DQBUF = _ioc(_IOWR, 17, v4l2_buffer)
+VIDIOC_STREAMON = _ioc(_IOW, 18, ctypes.c_int)
+VIDIOC_STREAMOFF = _ioc(_IOW, 19, ctypes.c_int)
+VIDIOC_G_PARM = _ioc(_IOWR, 21, v4l2_streamparm)
+VIDIOC_S_PARM = _ioc(_IOWR, 22, v4l2_streamparm)
+
+
+class KernelDevice:
+    """
+    System-call layer of the backend (replaced by a fake device in tests).
+    """
+    def open(self, path: str) -> int:
+        return os.open(path, os.O_RDWR | os.O_NONBLOCK)
+
+    def ioctl(self, fd: int, request: int, arg):
+        if fcntl is None:
+            raise OSError(errno.ENOSYS, "V4L2 capture requires Linux")
+        fcntl.ioctl(fd, request, arg, True)
+
+    def mmap(self, fd: int, length: int, offset: int) -> mmap.mmap:
+        return mmap.mmap(fd, length, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE, offset=offset)
+
+    def wait(self, fd: int, timeout: float) -> bool:
+        readable, _, _ = select.select([fd], [], [], timeout)
+        return bool(readable)
+
+    def close(self, fd: int):
+        os.close(fd)
+
+
+class V4L2Capture(ScreenCapture):
+    """
+    Capture card access through V4L2 mmap streaming I/O (same interface as `ScreenCapture`).
+    """
+    def __init__(self, device_id: int = 0, mode: Optional[CaptureMode] = None,
+                 profiles: Optional[CaptureProfiles] = None, buffers: int = 4, timeout: float = 2.0,
+                 device: Optional[KernelDevice] = None):
+        """
+        Args:
+            device_id (int): The video device index (e.g., 0 for /dev/video0).
+            mode (Optional[CaptureMode]): Explicit capture mode (see `ScreenCapture`).
+            profiles (Optional[CaptureProfiles]): Profile store for the stored mode.
+            buffers (int): Number of kernel buffers to request.
+            timeout (float): Maximum wait for a frame in seconds.
+            device (Optional[KernelDevice]): System-call layer (the real kernel if omitted).
+        """
+        super().__init__(device_id, mode=mode, profiles=profiles)
+        self.path = f"/dev/video{device_id}"
+        self.buffer_count = buffers
+        self.timeout = timeout
+        self.device = device or KernelDevice()
+        self.fd: Optional[int] = None
+        self.bytesperline = 0
+        self.dropped = 0
+        self.last_timestamp: Optional[float] = None
+        self.last_sequence: Optional[int] = None
+        self._maps = []
+        self._held: Optional[v4l2_buffer] = None
+
+    # --- Setup ---
+
+    def _ioctl(self, request: int, arg, name: str):
+        try:
+            self.device.ioctl(self.fd, request, arg)
+        except OSError as e:
+            raise RuntimeError(f"{name} failed on {self.path}: {e.strerror or e}") from e
+
+    def _open_camera(self):
+        """Opens the device, configures the mode, maps the buffers and starts streaming."""
+        if self.fd is not None:
+            return
+        try:
+            self.fd = self.device.open(self.path)
+        except OSError as e:
+            raise RuntimeError(f"Could not open video device {self.path}: {e.strerror or e}") from e
+        try:
+            self._configure()
+            self._start_streaming()
+        except Exception:
+            self.release()
+            raise
+
+    def _configure(self):
+        cap = v4l2_capability()
+        self._ioctl(VIDIOC_QUERYCAP, cap, "VIDIOC_QUERYCAP")
+        caps = cap.device_caps if cap.capabilities & V4L2_CAP_DEVICE_CAPS else cap.capabilities
+        if not (caps & V4L2_CAP_VIDEO_CAPTURE and caps & V4L2_CAP_STREAMING):
+            raise RuntimeError(f"{self.path} ({cap.card.decode(errors='replace')}) does not support streaming capture")
+
+        mode = self._requested_mode() or CaptureMode()
+        fmt = v4l2_format(type=V4L2_BUF_TYPE_VIDEO_CAPTURE)
+        self._ioctl(VIDIOC_G_FMT, fmt, "VIDIOC_G_FMT")
+        fmt.fmt.pix.width, fmt.fmt.pix.height = mode.width, mode.height
+        fmt.fmt.pix.field = V4L2_FIELD_ANY
+        if mode.fourcc:
+            fmt.fmt.pix.pixelformat = fourcc_code(mode.fourcc)
+        self._ioctl(VIDIOC_S_FMT, fmt, "VIDIOC_S_FMT")
+        pix = fmt.fmt.pix
+        self.bytesperline = pix.bytesperline
+
+        parm = v4l2_streamparm(type=V4L2_BUF_TYPE_VIDEO_CAPTURE)
+        fps = None
+        try:
+            self.device.ioctl(self.fd, VIDIOC_G_PARM, parm)
+            if mode.fps and parm.parm.capture.capability & V4L2_CAP_TIMEPERFRAME:
+                parm.parm.capture.timeperframe.numerator = 1000
+                parm.parm.capture.timeperframe.denominator = int(round(mode.fps * 1000))
+                self.device.ioctl(self.fd, VIDIOC_S_PARM, parm)
+            frac = parm.parm.capture.timeperframe
+            fps = frac.denominator / frac.numerator if frac.numerator else None
+        except OSError as e:
+            logging.debug(f"Frame rate not configurable on {self.path}: {e}")
+
+        self.active_mode = CaptureMode(fourcc_name(pix.pixelformat), pix.width, pix.height, fps)
+        if self.mode is not None and not mode_accepted(self.mode, self.active_mode):
+            logging.warning(f"Video device {self.device_id}: requested {self.mode}, driver configured {self.active_mode}")
+
+    def _start_streaming(self):
+        req = v4l2_requestbuffers(count=self.buffer_count, type=V4L2_BUF_TYPE_VIDEO_CAPTURE, memory=V4L2_MEMORY_MMAP)
+        self._ioctl(VIDIOC_REQBUFS, req, "VIDIOC_REQBUFS")
+        if req.count < 2:
+            raise RuntimeError(f"{self.path} granted only {req.count} buffer(s)")
+        for index in range(req.count):
+            buf = v4l2_buffer(index=index, type=V4L2_BUF_TYPE_VIDEO_CAPTURE, memory=V4L2_MEMORY_MMAP)
+            self._ioctl(VIDIOC_QUERYBUF, buf, "VIDIOC_QUERYBUF")
+            self._maps.append(self.device.mmap(self.fd, buf.length, buf.m.offset))
+            self._ioctl(VIDIOC_QBUF, buf, "VIDIOC_QBUF")
+        self._ioctl(VIDIOC_STREAMON, ctypes.c_int(V4L2_BUF_TYPE_VIDEO_CAPTURE), "VIDIOC_STREAMON")
+
+    # --- Frames ---
+
+    def _queue(self, buf: v4l2_buffer):
+        self._ioctl(VIDIOC_QBUF, buf, "VIDIOC_QBUF")
+
+    def _dequeue_latest(self) -> v4l2_buffer:
+        """Waits for a frame, drains all ready buffers and keeps the newest."""
+        deadline = time.monotonic() + self.timeout
+        latest = None
+        while latest is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self.device.wait(self.fd, remaining):
+                raise RuntimeError(f"Failed to grab frame (no frame from {self.path} within {self.timeout} s)")
+            while True:
+                buf = v4l2_buffer(type=V4L2_BUF_TYPE_VIDEO_CAPTURE, memory=V4L2_MEMORY_MMAP)
+                try:
+                    self.device.ioctl(self.fd, VIDIOC_DQBUF, buf)
+                except OSError as e:
+                    if e.errno == errno.EAGAIN:
+                        break
+                    raise RuntimeError(f"VIDIOC_DQBUF failed on {self.path}: {e.strerror or e}") from e
+                if buf.flags & V4L2_BUF_FLAG_ERROR:
+                    self._queue(buf)  # Corrupted transfer, wait for the next frame
+                    continue
+                if latest is not None:
+                    self._queue(latest)
+                latest = buf
+        return latest
+
+    def capture_raw(self) -> Dict:
+        """
+        Grabs the newest frame without copying it.
+
+        The returned view points into the mmap'd kernel buffer and stays valid until
+        the next `capture_raw`/`capture_frame` call or `release`, which hand the buffer
+        back to the driver.
+
+        Returns:
+            Dict: 'data' (uint8 view of the payload), 'mode' (CaptureMode), 'bytesperline',
+                'timestamp' (driver timestamp in seconds), 'age' (seconds since the driver
+                timestamp, None if the clock is not monotonic), 'sequence' and 'dropped' (frames skipped since opening).
+
+        Raises:
+            RuntimeError: If no frame arrives in time or the device fails.
+        """
+        self._open_camera()
+        if self._held is not None:
+            held, self._held = self._held, None
+            self._queue(held)
+
+        buf = self._dequeue_latest()
+        self._held = buf
+        timestamp = buf.timestamp.tv_sec + buf.timestamp.tv_usec / 1e6
+        monotonic = buf.flags & V4L2_BUF_FLAG_TIMESTAMP_MASK == V4L2_BUF_FLAG_TIMESTAMP_MONOTONIC
+        age = time.monotonic() - timestamp if monotonic else None
+
+        # Driver timestamps give the exact frame spacing, even across dropped frames
+        if self.last_timestamp is not None and buf.sequence > self.last_sequence:
+            self.read_intervals.append((timestamp - self.last_timestamp) / (buf.sequence - self.last_sequence))
+        # Frames never handed to a caller (drained as stale here or dropped by the driver)
+        if self.last_sequence is not None and buf.sequence > self.last_sequence + 1:
+            self.dropped += buf.sequence - self.last_sequence - 1
+        self.last_timestamp, self.last_sequence = timestamp, buf.sequence
+
+        data = np.frombuffer(self._maps[buf.index], dtype=np.uint8, count=buf.bytesused)
+        return {"data": data, "mode": self.active_mode, "bytesperline": self.bytesperline,
+                "timestamp": timestamp, "age": age, "sequence": int(buf.sequence), "dropped": self.dropped}
+
+    def capture_frame(self) -> np.ndarray:
+        """
+        Captures the newest frame as a BGR image.
+
+        Returns:
+            np.ndarray: The captured image frame (owns its memory).
+
+        Raises:
+            RuntimeError: If capturing fails or the pixel format is not supported.
+        """
+        raw = self.capture_raw()
+        return to_bgr(raw["data"], raw["mode"], raw["bytesperline"])
+
+    def release(self):
+        """Stops streaming, unmaps the buffers and closes the device."""
+        if self.fd is None:
+            return
+        self._held = None
+        try:
+            self.device.ioctl(self.fd, VIDIOC_STREAMOFF, ctypes.c_int(V4L2_BUF_TYPE_VIDEO_CAPTURE))
+        except OSError:
+            pass
+        for mapped in self._maps:
+            try:
+                mapped.close()
+            except BufferError:
+                pass  # A caller still holds a view from capture_raw; unmapped once it is freed
+        self._maps = []
+        try:
+            self.device.ioctl(self.fd, VIDIOC_REQBUFS, v4l2_requestbuffers(
+                count=0, type=V4L2_BUF_TYPE_VIDEO_CAPTURE, memory=V4L2_MEMORY_MMAP))
+        except OSError:
+            pass
+        self.device.close(self.fd)
+        self.fd = None
+
+
+def _rows(data: np.ndarray, height: int, bytesperline: int, row_bytes: int) -> np.ndarray:
+    """Views a padded frame buffer as height x row_bytes (no copy)."""
+    stride = bytesperline or row_bytes
+    return data[:height * stride].reshape(height, stride)[:, :row_bytes]
+
+
+def to_bgr(data: np.ndarray, mode: CaptureMode, bytesperline: int = 0) -> np.ndarray:
+    """
+    Converts a raw V4L2 payload to a BGR image.
+
+    Args:
+        data (np.ndarray): uint8 payload.
+        mode (CaptureMode): Format and size of the payload.
+        bytesperline (int): Row stride (0 for packed rows).
+
+    Returns:
+        np.ndarray: A new HxWx3 BGR image.
+
+    Raises:
+        RuntimeError: If the format is not supported.
+    """
+    w, h, fourcc = mode.width, mode.height, mode.fourcc
+    if fourcc in ("MJPG", "JPEG"):
+        if not cv2:
+            raise RuntimeError("OpenCV not installed.")
+        frame = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        if frame is None:
+            raise RuntimeError("Failed to grab frame (corrupt JPEG payload)")
+        return frame
+    if fourcc == "BGR3":
+        return _rows(data, h, bytesperline, w * 3).reshape(h, w, 3).copy()
+    if fourcc == "RGB3":
+        return _rows(data, h, bytesperline, w * 3).reshape(h, w, 3)[..., ::-1].copy()
+    if fourcc == "GREY":
+        gray = _rows(data, h, bytesperline, w)
+        return np.repeat(gray[..., None], 3, axis=2)
+    if fourcc in ("YUYV", "UYVY"):
+        if not cv2:
+            raise RuntimeError("OpenCV not installed.")
+        packed = np.ascontiguousarray(_rows(data, h, bytesperline, w * 2)).reshape(h, w, 2)
+        code = cv2.COLOR_YUV2BGR_YUYV if fourcc == "YUYV" else cv2.COLOR_YUV2BGR_UYVY
+        return cv2.cvtColor(packed, code)
+    if fourcc == "NV12":
+        if not cv2:
+            raise RuntimeError("OpenCV not installed.")
+        planes = np.ascontiguousarray(_rows(data, h * 3 // 2, bytesperline, w))
+        return cv2.cvtColor(planes, cv2.COLOR_YUV2BGR_NV12)
+    raise RuntimeError(f"Unsupported pixel format {fourcc}")
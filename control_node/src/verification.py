@@ -0,0 +1,251 @@
+"""
+Typing Verification Module.
+
+This module verifies injected keystrokes incrementally. Instead of OCRing the
+whole screen after typing everything, it locates the input line once (from the
+rows that changed while the first characters were typed), OCRs only that strip
+while typing progresses and corrects divergences with backspaces.
+"""
+
+import re
+import time
+import difflib
+import logging
+from typing import Dict, Optional, Tuple
+import numpy as np
+
+
+def find_changed_band(before: np.ndarray, after: np.ndarray, threshold: int = 32) -> Optional[Tuple[int, int]]:
+    """
+    Finds the horizontal band of rows that changed between two frames.
+
+    If several separate bands changed (e.g. the typed line and a clock), the
+    band with the most changed pixels wins.
+
+    Args:
+        before (np.ndarray): Earlier frame.
+        after (np.ndarray): Later frame.
+        threshold (int): Minimum per-pixel change.
+
+    Returns:
+        Optional[Tuple[int, int]]: (y_start, y_end) of the band, or None if nothing changed.
+    """
+    if not isinstance(before, np.ndarray) or not isinstance(after, np.ndarray) or before.shape != after.shape:
+        return None
+
+    diff = np.abs(after.astype(np.int16) - before.astype(np.int16))
+    if diff.ndim == 3:
+        diff = diff.max(axis=2)
+    per_row = (diff > threshold).sum(axis=1)
+    changed = np.where(per_row > 0)[0]
+    if changed.size == 0:
+        return None
+
+    # Split into contiguous bands (allowing small gaps between glyph rows)
+    splits = np.where(np.diff(changed) > 3)[0] + 1
+    bands = np.split(changed, splits)
+    best = max(bands, key=lambda band: per_row[band].sum())
+    return int(best[0]), int(best[-1]) + 1
+
+
+def _normalize(text: str) -> str:
+    """Joins wrapped lines and collapses whitespace runs (OCR spacing is unreliable)."""
+    return re.sub(r'\s+', ' ', text.replace('\n', '')).rstrip()
+
+
+def _collapse(text: str) -> Tuple[str, list]:
+    """
+    Collapses whitespace like `_normalize` and keeps an index map.
+
+    Returns:
+        Tuple[str, list]: The normalized text and, per character, its index in `text`.
+    """
+    out, index = [], []
+    for i, ch in enumerate(text):
+        if ch.isspace():
+            if out and out[-1] == ' ':
+                continue
+            ch = ' '
+        out.append(ch)
+        index.append(i)
+    while out and out[-1] == ' ':
+        out.pop()
+        index.pop()
+    return ''.join(out), index
+
+
+class TypingVerifier:
+    """
+    Types text and verifies it incrementally on the input line.
+
+    Workflow:
+    1. Capture a reference frame and type the first chunk.
+    2. Locate the input line from the rows that changed.
+    3. After each chunk, OCR only that strip and align it against the expected text.
+    4. On divergence, erase only the wrong suffix with backspaces and retype it.
+
+    If no change is visible after the first chunk (no strip can be located), it
+    falls back to a single full-screen OCR check after typing everything.
+    """
+    def __init__(self, injector, capture, pipeline, chunk_size: int = 8, settle: float = 0.15,
+                 max_corrections: int = 3):
+        """
+        Args:
+            injector (KeyInjector): Used to type text and backspaces.
+            capture (ScreenCapture): Source of frames.
+            pipeline (VisionPipeline): OCR pipeline.
+            chunk_size (int): Number of characters typed between checks.
+            settle (float): Seconds to wait after typing before capturing.
+            max_corrections (int): Maximum number of backspace corrections.
+        """
+        self.injector = injector
+        self.capture = capture
+        self.pipeline = pipeline
+        self.chunk_size = max(1, chunk_size)
+        self.settle = settle
+        self.max_corrections = max_corrections
+
+    def _ocr(self, frame: np.ndarray, band: Optional[Tuple[int, int]] = None) -> str:
+        """OCRs the given band of the frame (or the full frame) through the shared OCR pass."""
+        region = [0, band[0], frame.shape[1], band[1] - band[0]] if band is not None else None
+        return self.pipeline.read_text(frame, region)
+
+    def _grow_band(self, band: Tuple[int, int], base: np.ndarray, frame: np.ndarray) -> Tuple[int, int]:
+        """Extends the strip if the typed text wrapped onto further rows."""
+        changed = find_changed_band(base, frame)
+        if changed is None:
+            return band
+        pad = max(4, (band[1] - band[0]) // 4)
+        start = max(0, min(band[0], changed[0] - pad))
+        end = min(frame.shape[0], max(band[1], changed[1] + pad))
+        return start, end
+
+    @staticmethod
+    def _divergence(screen: str, expected: str) -> Tuple[int, int]:
+        """
+        Aligns the OCR'd input line with the expected text.
+
+        Returns:
+            Tuple[int, int]: (index of the first wrong/missing character in `expected`,
+            number of our characters visible on screen after that index).
+        """
+        if screen.endswith(expected):
+            return len(expected), 0
+
+        window = screen[-(len(expected) + 16):]
+        matcher = difflib.SequenceMatcher(None, window, expected, autojunk=False)
+        a_start = None
+        first_wrong = len(expected)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                if a_start is None:
+                    a_start = i1 - j1
+                continue
+            if tag == 'delete' and j1 == 0:
+                # Prompt characters before our text
+                continue
+            first_wrong = j1
+            break
+
+        if a_start is None:
+            # Nothing of our text is recognizable: assume it all landed wrong
+            return 0, min(len(expected), len(window))
+        on_screen = len(window) - max(0, a_start)
+        return first_wrong, max(0, on_screen - first_wrong)
+
+    def _type(self, text: str, delay_mean: float, delay_std: float):
+        """Types text with humanized timing."""
+        self.injector.type_text(text, delay_mean=delay_mean, delay_std=delay_std)
+
+    def type_and_verify(self, text: str, delay_mean: float = 0.02, delay_std: float = 0.006) -> Dict:
+        """
+        Types `text` and verifies it as it appears.
+
+        Newlines are typed unverified; they end the current input line, so the
+        strip is located again for the next line.
+
+        Args:
+            text (str): Text to type.
+            delay_mean (float): Mean delay between keystrokes in seconds.
+            delay_std (float): Standard deviation of the delay.
+
+        Returns:
+            Dict: {'verified': bool, 'corrections': int, 'ocr_passes': int,
+                   'full_ocr_passes': int, 'mode': 'incremental' | 'full_screen'}
+        """
+        stats = {"verified": True, "corrections": 0, "ocr_passes": 0, "full_ocr_passes": 0,
+                 "mode": "incremental"}
+        lines = text.split('\n')
+        for index, line in enumerate(lines):
+            if line and not self._verify_line(line, delay_mean, delay_std, stats):
+                stats["verified"] = False
+                return stats
+            if index < len(lines) - 1:
+                self._type('\n', delay_mean, delay_std)
+        return stats
+
+    def _verify_line(self, line: str, delay_mean: float, delay_std: float, stats: Dict) -> bool:
+        """Types and verifies one input line (no newlines)."""
+        base = self.capture.capture_frame()
+        band = None
+        pos = 0
+        lag_checks = 0
+
+        while pos < len(line):
+            chunk = line[pos:pos + self.chunk_size]
+            self._type(chunk, delay_mean, delay_std)
+            expected = line[:pos + len(chunk)]
+            time.sleep(self.settle)
+            frame = self.capture.capture_frame()
+
+            if band is None:
+                band = find_changed_band(base, frame)
+                if band is None:
+                    return self._verify_full_screen(line, pos + len(chunk), delay_mean, delay_std, stats)
+                pad = max(4, (band[1] - band[0]) // 2)
+                band = (max(0, band[0] - pad), min(frame.shape[0], band[1] + pad))
+            else:
+                band = self._grow_band(band, base, frame)
+
+            norm_expected, index = _collapse(expected)
+            while True:
+                screen = _normalize(self._ocr(frame, band))
+                stats["ocr_passes"] += 1
+                first_wrong, visible_after = self._divergence(screen, norm_expected)
+                first_wrong = index[first_wrong] if first_wrong < len(index) else len(expected)
+                lagging = first_wrong < len(expected) and visible_after == 0
+                if not lagging or lag_checks >= 2:
+                    break
+                # Characters are missing at the end: the target may still be echoing
+                lag_checks += 1
+                time.sleep(self.settle)
+                frame = self.capture.capture_frame()
+
+            if first_wrong >= len(expected):
+                pos = len(expected)
+                lag_checks = 0
+                continue
+
+            if stats["corrections"] >= self.max_corrections:
+                logging.warning(f"Verification failed at character {first_wrong} of '{line}'")
+                return False
+
+            stats["corrections"] += 1
+            if visible_after:
+                logging.info(f"Divergence at character {first_wrong}: erasing {visible_after} characters")
+                self._type('\b' * visible_after, delay_mean, delay_std)
+            pos = first_wrong
+            lag_checks = 0
+
+        return True
+
+    def _verify_full_screen(self, line: str, typed: int, delay_mean: float, delay_std: float, stats: Dict) -> bool:
+        """Fallback: type the rest and check the full screen once."""
+        stats["mode"] = "full_screen"
+        if typed < len(line):
+            self._type(line[typed:], delay_mean, delay_std)
+        time.sleep(1.0)
+        screen = self._ocr(self.capture.capture_frame())
+        stats["ocr_passes"] += 1
+        stats["full_ocr_passes"] += 1
+        return line.strip() in screen
@@ -3,22 +3,32 @@ Vision Module for Screen Capture and Processing.
 
 This module handles the interaction with the USB HDMI capture card and
 provides image processing pipelines for OCR and visual analysis.
+
+It also contains a classical region-of-interest (ROI) stage that proposes text
+blocks, dialog boxes and windows, so OCR and the VLM only process relevant crops.
 """
 
 import time
 import base64
 import logging
-from typing import Tuple, Optional, Union
+import threading
+import weakref
+from collections import deque
+from typing import Dict, List, Tuple, Optional, Union
 import numpy as np
 
-# Try importing dependencies, handle failure gracefully for non-production envs
 try:
-    import cv2
-    import pytesseract
+    from .lazy_imports import optional_module
+    from .capture_modes import CaptureMode, CaptureProfiles, apply_mode, read_mode, mode_accepted, device_key
+    from .metrics import METRICS, RATE_BUCKETS, attach, span, timed
 except ImportError:
-    cv2 = None
-    pytesseract = None
-    logging.warning("OpenCV or PyTesseract not found. Vision module will fail if not mocked.")
+    from lazy_imports import optional_module
+    from capture_modes import CaptureMode, CaptureProfiles, apply_mode, read_mode, mode_accepted, device_key
+    from metrics import METRICS, RATE_BUCKETS, attach, span, timed
+
+# Imported on first use, so starting the server does not load OpenCV or Tesseract
+cv2 = optional_module("cv2")
+pytesseract = optional_module("pytesseract")
 
 class ScreenCapture:
     """
@@ -28,20 +38,35 @@ class ScreenCapture:
     and retrieving the latest frame. It includes logic to flush the internal
     buffer to ensure the captured frame represents the current screen state.
     """
-    def __init__(self, device_id: int = 0):
+    def __init__(self, device_id: int = 0, mode: Optional[CaptureMode] = None,
+                 profiles: Optional[CaptureProfiles] = None):
         """
         Args:
             device_id (int): The video device index (e.g., 0 for /dev/video0).
+            mode (Optional[CaptureMode]): Explicit capture mode (FOURCC, resolution, FPS).
+                If omitted, the best mode stored for the device by `benchmark_capture`
+                is used, falling back to the driver's default format at 1920x1080.
+            profiles (Optional[CaptureProfiles]): Profile store for the stored mode.
         """
         self.device_id = device_id
+        self.mode = mode
+        self.profiles = profiles
+        self.active_mode: Optional[CaptureMode] = None
         self.cap = None
+        self.read_intervals = deque(maxlen=32)
+
+    def _requested_mode(self) -> Optional[CaptureMode]:
+        """The explicit mode, else the mode stored for this device (None: driver default)."""
+        if self.mode is not None:
+            return self.mode
+        return (self.profiles or CaptureProfiles()).load(device_key(self.device_id))
 
     def _open_camera(self):
         """Initializes the VideoCapture object if not already open."""
         if self.cap is not None and self.cap.isOpened():
             return
 
-        if cv2 is None:
+        if not cv2:
             raise RuntimeError("OpenCV not installed.")
 
         self.cap = cv2.VideoCapture(self.device_id)
@@ -49,9 +74,11 @@ class ScreenCapture:
             raise RuntimeError(f"Could not open video device {self.device_id}")
 
         # Configure for low latency and high resolution
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1920)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 1080)
-        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        mode = self._requested_mode()
+        apply_mode(self.cap, mode or CaptureMode())
+        self.active_mode = read_mode(self.cap)
+        if mode is not None and not mode_accepted(mode, self.active_mode):
+            logging.warning(f"Video device {self.device_id}: requested {mode}, driver configured {self.active_mode}")
 
     def capture_frame(self) -> np.ndarray:
         """
@@ -73,18 +100,25 @@ class ScreenCapture:
         ret, frame = False, None
 
         # Try up to 3 times to get a valid frame
+        last_read = None
         for _ in range(3):
             val = self.cap.read()
             # print(f"DEBUG: cap.read() returned {val}")
             if val is not None and isinstance(val, tuple) and len(val) >= 2:
                  if val[0]:
                     ret, frame = val[0], val[1]
+                    # Once the buffer is drained, consecutive reads wait for the next
+                    # frame: their spacing measures the delivered frame rate.
+                    now = time.perf_counter()
+                    if last_read is not None:
+                        self.read_intervals.append(now - last_read)
+                    last_read = now
             # Don't break immediately in a real scenario you might want to drain buffer
             # but for mock/sim we just want the last valid one.
 
         if not ret or frame is None:
              # Just return a dummy frame if everything fails in simulation
-             if cv2 is not None and hasattr(cv2, 'VideoCapture'):
+             if cv2 and hasattr(cv2, 'VideoCapture'):
                   # Try to detect if we are mocked
                   if isinstance(self.cap, (type(None), object)): # very loose check
                        # In test environment we might want to fail hard, but in demo we want to proceed
@@ -94,20 +128,382 @@ class ScreenCapture:
 
         return frame
 
+    def measured_fps(self) -> Optional[float]:
+        """Frame rate measured from recent buffer reads (None until measured)."""
+        intervals = sorted(self.read_intervals)
+        if not intervals:
+            return None
+        median = intervals[len(intervals) // 2]
+        return round(1.0 / median, 1) if median > 0 else None
+
     def release(self):
         """Releases the video device resource."""
         if self.cap:
             self.cap.release()
             self.cap = None
 
+
+def _label_components(mask: np.ndarray) -> np.ndarray:
+    """
+    Labels 4-connected components of a boolean grid.
+
+    Runs min-label propagation until stable. The grid is the coarse cell grid of
+    the ROI stage (a few thousand cells), so this is cheap without SciPy.
+
+    Returns:
+        np.ndarray: int32 labels, -1 for background.
+    """
+    big = np.iinfo(np.int32).max
+    labels = np.where(mask, np.arange(mask.size, dtype=np.int32).reshape(mask.shape), big)
+    while True:
+        prev = labels
+        shifted = labels.copy()
+        np.minimum(shifted[1:, :], labels[:-1, :], out=shifted[1:, :])
+        np.minimum(shifted[:-1, :], labels[1:, :], out=shifted[:-1, :])
+        np.minimum(shifted[:, 1:], labels[:, :-1], out=shifted[:, 1:])
+        np.minimum(shifted[:, :-1], labels[:, 1:], out=shifted[:, :-1])
+        labels = np.where(mask, shifted, big)
+        if np.array_equal(labels, prev):
+            break
+    return np.where(mask, labels, -1)
+
+
+def _dilate(mask: np.ndarray, dx: int, dy: int) -> np.ndarray:
+    """Binary dilation of a cell grid with a (2*dy+1) x (2*dx+1) rectangle."""
+    out = mask.copy()
+    for i in range(1, dx + 1):
+        out[:, i:] |= mask[:, :-i]
+        out[:, :-i] |= mask[:, i:]
+    grown = out.copy()
+    for i in range(1, dy + 1):
+        grown[i:, :] |= out[:-i, :]
+        grown[:-i, :] |= out[i:, :]
+    return grown
+
+
+def propose_regions(frame: np.ndarray, cell: int = 8, edge_threshold: float = 40.0,
+                    min_density: float = 0.04, gap_cells: int = 2, min_panel_cells: int = 48,
+                    max_regions: int = 24) -> List[Dict]:
+    """
+    Proposes regions of interest in a frame (classical CV, numpy only).
+
+    Pipeline:
+    1. Edge map from horizontal/vertical intensity steps.
+    2. Edge density per cell (cell x cell pixels).
+    3. Morphological closing on the cell grid merges glyphs into lines and lines
+       into text blocks; connected components give the block contours.
+    4. Cells with a uniform fill that differs from the dominant background form
+       panels: "dialog" if they float inside the frame, "window" if they touch its border.
+
+    Args:
+        frame (np.ndarray): BGR or grayscale image.
+        cell (int): Cell size in pixels.
+        edge_threshold (float): Minimum intensity step counted as an edge.
+        min_density (float): Minimum fraction of edge pixels for a text cell.
+        gap_cells (int): Horizontal gap (cells) bridged between words.
+        min_panel_cells (int): Minimum area (cells) of a dialog/window.
+        max_regions (int): Maximum number of returned regions (largest first).
+
+    Returns:
+        List[Dict]: Regions in reading order, each with 'id', 'kind' ('text', 'dialog',
+            'window'), 'x', 'y', 'width', 'height' (source pixels) and 'score'.
+    """
+    image = np.asarray(frame)
+    h, w = image.shape[:2]
+    rows, cols = h // cell, w // cell
+    if rows < 1 or cols < 1:
+        return []
+    image = image[:rows * cell, :cols * cell]
+
+    # Value channel (max over BGR): cheap and keeps colored text visible
+    if image.ndim == 3:
+        gray = image[..., 0]
+        for c in range(1, image.shape[2]):
+            gray = np.maximum(gray, image[..., c])
+    else:
+        gray = image
+    gray = gray.astype(np.int16)
+
+    # 1. + 2. Edge density per cell, per orientation
+    def cell_density(edges):
+        return edges.reshape(rows, cell, cols, cell).mean(axis=(1, 3))
+
+    vertical = np.zeros(gray.shape, dtype=bool)
+    horizontal = np.zeros(gray.shape, dtype=bool)
+    vertical[:, 1:] = np.abs(np.diff(gray, axis=1)) > edge_threshold
+    horizontal[1:, :] = np.abs(np.diff(gray, axis=0)) > edge_threshold
+    density_v = cell_density(vertical)
+    density_h = cell_density(horizontal)
+    density = density_v + density_h
+    brightness = gray.reshape(rows, cell, cols, cell).mean(axis=(1, 3))
+
+    regions = []
+
+    # 3. Text blocks: glyphs have edges in both orientations (straight window and
+    # dialog borders only in one). Closing (dilate) merges them, components give blocks.
+    text_cells = (density_v >= min_density / 2) & (density_h >= min_density / 2)
+    closed = _dilate(text_cells, gap_cells, 1)
+    labels = _label_components(closed)
+    for label in np.unique(labels[labels >= 0]):
+        ys, xs = np.nonzero((labels == label) & text_cells)
+        if len(ys) < 2:
+            continue  # Isolated cell: border corner or noise
+        regions.append({
+            "kind": "text",
+            "cells": (ys.min(), xs.min(), ys.max() + 1, xs.max() + 1),
+            "score": round(float(density[ys, xs].mean()), 3),
+        })
+
+    # 4. Panels: uniform fills different from the background
+    levels = (brightness // 16).astype(np.int32)
+    background = np.bincount(levels.ravel()).argmax()
+    fill = (levels != background) & (density < min_density)
+    panel_mask = _dilate(fill, 1, 1) & (levels != background)
+    labels = _label_components(panel_mask)
+    for label in np.unique(labels[labels >= 0]):
+        ys, xs = np.nonzero(labels == label)
+        if len(ys) < min_panel_cells:
+            continue
+        y0, x0, y1, x1 = ys.min(), xs.min(), ys.max() + 1, xs.max() + 1
+        touches_border = y0 == 0 or x0 == 0 or y1 == rows or x1 == cols
+        regions.append({
+            "kind": "window" if touches_border else "dialog",
+            "cells": (y0, x0, y1, x1),
+            "score": round(len(ys) / float((y1 - y0) * (x1 - x0)), 3),
+        })
+
+    # Largest first for the cut, reading order for the result
+    regions.sort(key=lambda r: (r["cells"][2] - r["cells"][0]) * (r["cells"][3] - r["cells"][1]), reverse=True)
+    regions = regions[:max_regions]
+    regions.sort(key=lambda r: (r["cells"][0], r["cells"][1]))
+
+    result = []
+    for i, r in enumerate(regions):
+        y0, x0, y1, x1 = r["cells"]
+        result.append({
+            "id": i,
+            "kind": r["kind"],
+            "x": int(x0 * cell),
+            "y": int(y0 * cell),
+            "width": int((x1 - x0) * cell),
+            "height": int((y1 - y0) * cell),
+            "score": r["score"],
+        })
+    return result
+
+
+def crop_region(frame: np.ndarray, region: Union[List[int], Dict]) -> np.ndarray:
+    """
+    Crops a frame to [x, y, width, height] (or a region dict), clamped to the frame.
+    """
+    if isinstance(region, dict):
+        x, y, w, h = region["x"], region["y"], region["width"], region["height"]
+    else:
+        x, y, w, h = region
+    if hasattr(frame, 'shape'):
+        h_img, w_img = frame.shape[:2]
+    else:
+        h_img, w_img = 1080, 1920  # Default or Mock
+
+    x = max(0, x)
+    y = max(0, y)
+    w = min(w, w_img - x)
+    h = min(h, h_img - y)
+    return frame[y:y+h, x:x+w]
+
+
+def bounding_region(regions: List[Dict], padding: int = 0) -> Optional[List[int]]:
+    """Returns [x, y, width, height] enclosing all regions (None if there are none)."""
+    if not regions:
+        return None
+    x0 = min(r["x"] for r in regions) - padding
+    y0 = min(r["y"] for r in regions) - padding
+    x1 = max(r["x"] + r["width"] for r in regions) + padding
+    y1 = max(r["y"] + r["height"] for r in regions) + padding
+    return [max(0, x0), max(0, y0), x1 - max(0, x0), y1 - max(0, y0)]
+
+
+OCR_UPSCALE = 2  # Upscale factor of `preprocess_for_ocr`
+
+
+class OCRResult:
+    """
+    Structured OCR output of one frame (or region): words and lines with bounding
+    boxes in source-frame pixel coordinates and Tesseract confidences (0-100).
+    """
+    def __init__(self, words: List[Dict], lines: List[Dict]):
+        """
+        Args:
+            words (List[Dict]): {'text', 'x', 'y', 'width', 'height', 'conf', 'line'} per word.
+            lines (List[Dict]): {'text', 'x', 'y', 'width', 'height', 'conf'} per line.
+        """
+        self.words = words
+        self.lines = lines
+
+    @classmethod
+    def from_tesseract(cls, data: Dict, scale: float = 1.0, offset: Tuple[int, int] = (0, 0)) -> "OCRResult":
+        """
+        Builds the result from `pytesseract.image_to_data(..., output_type=DICT)`.
+
+        Args:
+            data (Dict): Tesseract output (parallel lists per key).
+            scale (float): Factor mapping OCR image pixels to source pixels (e.g. 0.5 after 2x upscale).
+            offset (Tuple[int, int]): (x, y) of the OCR'd region in the source frame.
+        """
+        ox, oy = offset
+        words, line_index = [], {}
+        for i, text in enumerate(data.get("text", [])):
+            text = (text or "").strip()
+            conf = float(data["conf"][i])
+            if not text or conf < 0:
+                continue
+            key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            line = line_index.setdefault(key, len(line_index))
+            words.append({
+                "text": text,
+                "x": int(round(data["left"][i] * scale)) + ox,
+                "y": int(round(data["top"][i] * scale)) + oy,
+                "width": int(round(data["width"][i] * scale)),
+                "height": int(round(data["height"][i] * scale)),
+                "conf": round(conf, 1),
+                "line": line,
+            })
+        return cls(words, cls._build_lines(words, len(line_index)))
+
+    @staticmethod
+    def _build_lines(words: List[Dict], count: int) -> List[Dict]:
+        """Line entries (joined text, enclosing box, mean confidence) of words with line indices 0..count-1."""
+        lines = []
+        for line in range(count):
+            members = [w for w in words if w["line"] == line]
+            x0 = min(w["x"] for w in members)
+            y0 = min(w["y"] for w in members)
+            x1 = max(w["x"] + w["width"] for w in members)
+            y1 = max(w["y"] + w["height"] for w in members)
+            lines.append({
+                "text": " ".join(w["text"] for w in members),
+                "x": x0, "y": y0, "width": x1 - x0, "height": y1 - y0,
+                "conf": round(sum(w["conf"] for w in members) / len(members), 1),
+            })
+        return lines
+
+    def within(self, region: List[int]) -> "OCRResult":
+        """
+        The words whose center lies inside `region` ([x, y, width, height], source
+        pixels), regrouped into lines; answers region queries from a full-frame pass.
+        """
+        x, y, w, h = (int(v) for v in region)
+        inside = [dict(word) for word in self.words
+                  if x <= word["x"] + word["width"] / 2 < x + w and y <= word["y"] + word["height"] / 2 < y + h]
+        renumber: Dict[int, int] = {}
+        for word in inside:
+            word["line"] = renumber.setdefault(word["line"], len(renumber))
+        return OCRResult(inside, self._build_lines(inside, len(renumber)))
+
+    @property
+    def text(self) -> str:
+        """Plain text, one line per recognized line."""
+        return "\n".join(line["text"] for line in self.lines)
+
+    @property
+    def mean_confidence(self) -> float:
+        """Mean word confidence (0.0 if nothing was recognized)."""
+        if not self.words:
+            return 0.0
+        return round(sum(w["conf"] for w in self.words) / len(self.words), 1)
+
+    def find(self, needle: str, case_sensitive: bool = False) -> List[Dict]:
+        """
+        Locates text on screen.
+
+        Args:
+            needle (str): Text to search (may span several words of a line).
+            case_sensitive (bool): Match case.
+
+        Returns:
+            List[Dict]: Boxes {'text', 'x', 'y', 'width', 'height', 'conf', 'line'} covering
+                the matching words of each line containing the needle.
+        """
+        norm = (lambda v: v) if case_sensitive else (lambda v: v.lower())
+        target = norm(needle.strip())
+        if not target:
+            return []
+        matches = []
+        for index, line in enumerate(self.lines):
+            text = norm(line["text"])
+            start = text.find(target)
+            while start >= 0:
+                end = start + len(target)
+                # Words overlapping the match (character spans within the joined line)
+                members, pos = [], 0
+                for w in (w for w in self.words if w["line"] == index):
+                    if pos < end and pos + len(w["text"]) > start:
+                        members.append(w)
+                    pos += len(w["text"]) + 1
+                x0 = min(w["x"] for w in members)
+                y0 = min(w["y"] for w in members)
+                x1 = max(w["x"] + w["width"] for w in members)
+                y1 = max(w["y"] + w["height"] for w in members)
+                matches.append({
+                    "text": line["text"][start:end],
+                    "x": x0, "y": y0, "width": x1 - x0, "height": y1 - y0,
+                    "conf": min(w["conf"] for w in members),
+                    "line": index,
+                })
+                start = text.find(target, start + 1)
+        return matches
+
+    def to_dict(self) -> Dict:
+        """Serializable form (text, mean confidence, lines, words)."""
+        return {
+            "text": self.text,
+            "mean_confidence": self.mean_confidence,
+            "lines": self.lines,
+            "words": self.words,
+        }
+
+
 class VisionPipeline:
     """
     Encapsulates image processing logic for Optical Character Recognition (OCR).
     """
     def __init__(self):
         """Initializes the vision pipeline."""
-        pass
+        # ROI proposals of the most recent frame (frames are shared between readers)
+        self._region_lock = threading.Lock()
+        self._region_frame = None
+        self._regions: List[Dict] = []
 
+        # Structured OCR of the most recent frame, per region
+        self._ocr_lock = threading.Lock()
+        self._ocr_frame = None
+        self._ocr_results: Dict[Optional[Tuple[int, ...]], OCRResult] = {}
+
+    def propose_regions(self, frame: np.ndarray, **kwargs) -> List[Dict]:
+        """
+        Returns the ROI proposals of a frame (see `propose_regions`), cached per frame.
+
+        Repeated calls with the same frame object (e.g. a grab shared by several
+        readers) reuse the result.
+        """
+        with self._region_lock:
+            cached = self._region_frame() if self._region_frame is not None else None
+            if cached is frame and not kwargs:
+                METRICS.inc("vhb_cache_requests_total", cache="regions", result="hit")
+                return self._regions
+        METRICS.inc("vhb_cache_requests_total", cache="regions", result="miss")
+        with span("regions"):
+            regions = propose_regions(frame, **kwargs)
+        if not kwargs:
+            with self._region_lock:
+                try:
+                    self._region_frame = weakref.ref(frame)
+                    self._regions = regions
+                except TypeError:
+                    self._region_frame = None
+        return regions
+
+    @timed("preprocess")
     def preprocess_for_ocr(self, image: np.ndarray) -> np.ndarray:
         """
         Prepares an image for OCR by applying a sequence of filters.
@@ -124,7 +520,7 @@ class VisionPipeline:
         Returns:
             np.ndarray: The processed binary image ready for Tesseract.
         """
-        if cv2 is None: return image
+        if not cv2: return image
 
         try:
             # 1. Grayscale
@@ -135,7 +531,7 @@ class VisionPipeline:
             inverted = cv2.bitwise_not(gray)
 
             # 3. Upscale (2x) to help with small fonts
-            scaled = cv2.resize(inverted, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+            scaled = cv2.resize(inverted, None, fx=OCR_UPSCALE, fy=OCR_UPSCALE, interpolation=cv2.INTER_CUBIC)
 
             # 4. Binarization (Otsu)
             # Ensure we unpack correctly even if mock behaves oddly
@@ -145,6 +541,7 @@ class VisionPipeline:
             else:
                 thresh = val # Fallback/Error
 
+            attach("ocr_input", thresh)
             return thresh
         except Exception as e:
             # If opencv processing fails (e.g. during mock), return original
@@ -163,14 +560,99 @@ class VisionPipeline:
         Returns:
             str: The extracted text.
         """
-        if pytesseract is None:
+        if not pytesseract:
             return "Error: PyTesseract not installed."
 
         # psm 6 = Assume a single uniform block of text. Good for CLI output.
         config = r'--psm 6'
-        text = pytesseract.image_to_string(image, config=config)
+        start = time.perf_counter()
+        with span("ocr"):
+            text = pytesseract.image_to_string(image, config=config)
+        elapsed = time.perf_counter() - start
+        if isinstance(text, str) and elapsed > 0:
+            METRICS.observe("vhb_ocr_chars_per_second", len(text.strip()) / elapsed, RATE_BUCKETS)
         return text
 
+    def recognize(self, frame: np.ndarray, region: Optional[List[int]] = None) -> OCRResult:
+        """
+        Runs one structured OCR pass (`image_to_data`) on a frame or a region of it.
+
+        Boxes are mapped back to source-frame coordinates (undoing the preprocessing
+        upscale and the crop offset). Results are cached for the most recent frame
+        object, so verification, layout detection and region lookups can share a pass;
+        once the full frame was recognized, regions of it are answered from that
+        result without running Tesseract again.
+
+        Args:
+            frame (np.ndarray): The raw BGR frame.
+            region (Optional[List[int]]): [x, y, width, height] to OCR instead of the full frame.
+
+        Returns:
+            OCRResult: Words and lines with boxes and confidences.
+
+        Raises:
+            RuntimeError: If PyTesseract is not installed.
+        """
+        if not pytesseract:
+            raise RuntimeError("PyTesseract not installed.")
+
+        key = tuple(int(v) for v in region) if region else None
+        with self._ocr_lock:
+            cached = self._ocr_frame() if self._ocr_frame is not None else None
+            if cached is frame and key in self._ocr_results:
+                METRICS.inc("vhb_cache_requests_total", cache="ocr", result="hit")
+                return self._ocr_results[key]
+            if cached is frame and None in self._ocr_results:
+                METRICS.inc("vhb_cache_requests_total", cache="ocr", result="hit")
+                result = self._ocr_results[key] = self._ocr_results[None].within(key)
+                return result
+        METRICS.inc("vhb_cache_requests_total", cache="ocr", result="miss")
+
+        image, offset = frame, (0, 0)
+        if region:
+            image = crop_region(frame, list(region))
+            offset = (max(0, int(region[0])), max(0, int(region[1])))
+        processed = self.preprocess_for_ocr(image)
+        # Map boxes of the (upscaled) OCR image back to source pixels
+        try:
+            scale = image.shape[0] / float(processed.shape[0])
+        except (AttributeError, TypeError, IndexError, ZeroDivisionError):
+            scale = 1.0 / OCR_UPSCALE
+        with span("ocr_data"):
+            data = pytesseract.image_to_data(processed, config=r'--psm 6', output_type=pytesseract.Output.DICT)
+        result = OCRResult.from_tesseract(data, scale=scale, offset=offset)
+
+        with self._ocr_lock:
+            cached = self._ocr_frame() if self._ocr_frame is not None else None
+            if cached is not frame:
+                self._ocr_results = {}
+                try:
+                    self._ocr_frame = weakref.ref(frame)
+                except TypeError:
+                    self._ocr_frame = None
+            if self._ocr_frame is not None:
+                self._ocr_results[key] = result
+        return result
+
+    def read_text(self, frame: np.ndarray, region: Optional[List[int]] = None) -> str:
+        """
+        Plain text of a frame or region from the shared structured pass (see `recognize`).
+
+        This is how tools, verification, macros and layout detection read the screen,
+        so Tesseract runs at most once per frame and region.
+
+        Args:
+            frame (np.ndarray): The raw BGR frame.
+            region (Optional[List[int]]): [x, y, width, height] to read instead of the full frame.
+
+        Returns:
+            str: One line per recognized line ("Error: ..." if PyTesseract is missing).
+        """
+        if not pytesseract:
+            return "Error: PyTesseract not installed."
+        return self.recognize(frame, region).text
+
+    @timed("encode")
     def encode_image(self, image: np.ndarray) -> str:
         """
         Encodes a numpy image array to a Base64 string (JPEG format).
@@ -182,6 +664,6 @@ class VisionPipeline:
         Returns:
             str: Base64 encoded JPEG string.
         """
-        if cv2 is None: return ""
+        if not cv2: return ""
         _, buffer = cv2.imencode('.jpg', image)
         return base64.b64encode(buffer).decode('utf-8')
@@ -4,47 +4,130 @@ VLM Client Module.
 This module provides a client interface to communicate with an Ollama-compatible
 Vision Language Model (VLM) API. It handles configuration via environment variables
 and formats requests for visual analysis.
+
+Requests go through a keep-alive session (connection pool), responses are streamed
+(`stream: true`) so tokens can be forwarded to the caller while the model is still
+generating, and finished answers are cached by (model, prompt, perceptual frame hash).
+Asking about an unchanged screen again is answered from the cache.
+
+Identical in-flight requests are coalesced, the number of concurrent backend requests
+is capped, and requests for stale frames still waiting for a slot are dropped in
+favour of the newest frame.
 """
 
 import os
 import requests
 import json
+import hashlib
 import logging
-from typing import Optional
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+import numpy as np
+from requests.adapters import HTTPAdapter
+
+try:
+    from .metrics import METRICS, span
+except ImportError:
+    from metrics import METRICS, span
+
+
+def frame_hash(frame: np.ndarray, hash_size: int = 16, margin: float = 2.0) -> str:
+    """
+    Computes a perceptual difference hash (dHash) of a frame.
+
+    The frame is reduced to a (hash_size x hash_size+1) grid of block means and each
+    bit encodes whether a block is brighter than its right neighbour by more than
+    `margin`. Sensor noise and compression artifacts leave the hash unchanged (flat
+    console background does not flip bits), while changed screen content (new text,
+    a dialog) does.
+
+    Args:
+        frame (np.ndarray): BGR or grayscale image.
+        hash_size (int): Grid size; the hash has hash_size^2 bits.
+        margin (float): Minimum brightness step (gray levels) that sets a bit.
+
+    Returns:
+        str: Hex digest of the hash.
+    """
+    gray = np.asarray(frame, dtype=np.float32)
+    if gray.ndim == 3:
+        gray = gray.mean(axis=2)
+    h, w = gray.shape[:2]
+
+    # Block means over an even grid (numpy only, no resize dependency)
+    row_edges = np.linspace(0, h, hash_size + 1).astype(int)
+    col_edges = np.linspace(0, w, hash_size + 2).astype(int)
+    row_sums = np.add.reduceat(gray, row_edges[:-1], axis=0)
+    blocks = np.add.reduceat(row_sums, col_edges[:-1], axis=1)
+    counts = np.outer(np.maximum(np.diff(row_edges), 1), np.maximum(np.diff(col_edges), 1))
+    blocks = blocks / counts
+
+    bits = (blocks[:, 1:] - blocks[:, :-1] > margin).flatten()
+    return np.packbits(bits).tobytes().hex()
+
 
 class VLMClient:
     """
     Client for interacting with Ollama VLM API.
     """
-    def __init__(self):
+    def __init__(self, base_url: Optional[str] = None, model: Optional[str] = None,
+                 api_key: Optional[str] = None, cache_size: int = 64, hash_size: int = 16,
+                 timeout: float = 30.0, pool_size: int = 4, max_in_flight: Optional[int] = None,
+                 max_queued: int = 8):
         """
-        Initializes the VLM Client by reading environment variables.
+        Initializes the VLM Client. Unset arguments are read from environment variables.
 
         Environment Variables:
             OLLAMA_BASE_URL (str): The base URL of the Ollama API (default: http://localhost:11434).
             OLLAMA_MODEL (str): The model name to use (default: llava).
             OLLAMA_API_KEY (str): Optional API Key if the endpoint is protected.
-        """
-        self.base_url = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434").rstrip("/")
-        self.model = os.environ.get("OLLAMA_MODEL", "llava")
-        self.api_key = os.environ.get("OLLAMA_API_KEY", "")
+            OLLAMA_MAX_IN_FLIGHT (int): Concurrent requests sent to the backend (default: 1).
 
-    def analyze_image(self, base64_image: str, prompt: str = "Describe what you see on this screen.") -> str:
+        Args:
+            cache_size (int): Number of cached responses (0 disables the cache).
+            hash_size (int): Grid size of the perceptual frame hash.
+            timeout (float): Connect timeout and maximum gap between streamed chunks (seconds).
+            pool_size (int): Number of keep-alive connections kept in the pool.
+            max_in_flight (Optional[int]): Concurrent backend requests; further requests wait.
+            max_queued (int): Distinct requests allowed to wait; beyond that calls are rejected.
         """
-        Sends an image to the VLM for analysis.
+        self.base_url = (base_url or os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")).rstrip("/")
+        self.model = model or os.environ.get("OLLAMA_MODEL", "llava")
+        self.api_key = api_key if api_key is not None else os.environ.get("OLLAMA_API_KEY", "")
+        self.cache_size = cache_size
+        self.hash_size = hash_size
+        self.timeout = timeout
+        if max_in_flight is None:
+            max_in_flight = int(os.environ.get("OLLAMA_MAX_IN_FLIGHT", "1"))
 
-        Args:
-            base64_image (str): The base64 encoded image string (without data URI prefix).
-            prompt (str): The text prompt for the model.
+        # Keep-alive connection pool, shared by all calls
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
-        Returns:
-            str: The model's response text.
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queued = max_queued
 
-        Raises:
-            RuntimeError: If the API call fails or configuration is missing.
-        """
-        url = f"{self.base_url}/api/generate"
+        self._cache: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._inflight: Dict[tuple, "_VLMRequest"] = {}
+        self._latest: Dict[tuple, "_VLMRequest"] = {}
+        self._running = 0
+        self._queued = 0
+        self._requests = 0
+        self._cache_hits = 0
+        self._coalesced = 0
+        self._superseded = 0
+        self._rejected = 0
+        self._errors = 0
 
+    def _headers(self) -> Dict[str, str]:
+        """Builds the request headers."""
         headers = {
             "Content-Type": "application/json"
         }
@@ -54,25 +137,232 @@ class VLMClient:
         # Ollama native doesn't use auth, but proxies might.
         if self.api_key:
             headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def cache_key(self, base64_image: str, prompt: str, frame: Optional[np.ndarray] = None) -> tuple:
+        """
+        Builds the cache key for a request.
+
+        With the source frame, the perceptual hash is used (unchanged screens hit the
+        cache even if the JPEG bytes differ). Otherwise the encoded image is hashed exactly.
+        """
+        if frame is not None and hasattr(frame, "shape"):
+            image_key = "p:" + frame_hash(frame, self.hash_size)
+        else:
+            image_key = "s:" + hashlib.sha1(base64_image.encode()).hexdigest()
+        return (self.model, prompt, image_key)
+
+    def _cache_lookup(self, key: tuple) -> Optional[str]:
+        """Returns a cached response (caller holds the lock)."""
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self._cache_hits += 1
+            return self._cache[key]
+        return None
 
+    def _cache_put(self, key: tuple, response: str):
+        if self.cache_size <= 0:
+            return
+        with self._lock:
+            self._cache[key] = response
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def clear_cache(self):
+        """Drops all cached responses."""
+        with self._lock:
+            self._cache.clear()
+
+    def _generate(self, base64_image: str, prompt: str,
+                  on_token: Optional[Callable[[str], None]] = None) -> str:
+        """
+        Streams one generation from the API.
+
+        Raises:
+            requests.exceptions.RequestException: On connection or HTTP errors.
+            RuntimeError: If the API reports an error in the stream.
+        """
+        url = f"{self.base_url}/api/generate"
         payload = {
             "model": self.model,
             "prompt": prompt,
             "images": [base64_image],
-            "stream": False
+            "stream": True
         }
 
-        try:
-            # We use a short timeout because this is an interactive system,
-            # but VLMs can be slow. 30s is reasonable.
-            response = requests.post(url, json=payload, headers=headers, timeout=30)
+        parts = []
+        # The read timeout applies between chunks, so long generations are fine as
+        # long as tokens keep arriving. The body is read to the end (not abandoned
+        # after "done") so the connection returns to the pool instead of being closed.
+        with self.session.post(url, json=payload, headers=self._headers(),
+                               stream=True, timeout=(self.timeout, self.timeout)) as response:
             response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    raise RuntimeError(chunk["error"])
+                token = chunk.get("response", "")
+                if token:
+                    parts.append(token)
+                    if on_token:
+                        on_token(token)
+        return "".join(parts)
 
-            data = response.json()
-            return data.get("response", "")
+    def _dispatch(self, request: "_VLMRequest", token: str):
+        """Forwards a streamed chunk to every caller attached to the request."""
+        with self._lock:
+            listeners = list(request.listeners)
+        for listener in listeners:
+            try:
+                listener(token)
+            except Exception as e:
+                logging.debug(f"VLM token listener failed: {e}")
 
-        except requests.exceptions.RequestException as e:
+    def _wait_for_slot(self, request: "_VLMRequest") -> bool:
+        """
+        Blocks until a backend slot is free (returns True, slot taken) or the request
+        is superseded by a newer frame of the same source (returns False).
+        """
+        with self._cond:
+            while self._running >= self.max_in_flight and request.superseded_by is None:
+                self._cond.wait()
+            self._queued -= 1
+            if request.superseded_by is not None:
+                self._inflight.pop(request.key, None)
+                self._cond.notify_all()
+                return False
+            request.started = True
+            self._running += 1
+            return True
+
+    def _execute(self, request: "_VLMRequest", base64_image: str, prompt: str) -> str:
+        """Runs the generation of a request that holds a backend slot."""
+        try:
+            with span("vlm"):
+                result = self._generate(base64_image, prompt, lambda token: self._dispatch(request, token))
+            failed = False
+        except (requests.exceptions.RequestException, RuntimeError, ValueError) as e:
             error_msg = f"VLM API Error: {str(e)}"
             logging.error(error_msg)
             # Return error as string so it bubbles up to the MCP tool output
-            return f"Error: Failed to contact VLM. {error_msg}"
+            result = f"Error: Failed to contact VLM. {error_msg}"
+            failed = True
+
+        with self._cond:
+            self._running -= 1
+            if failed:
+                self._errors += 1
+            self._inflight.pop(request.key, None)
+            if self._latest.get(request.scope) is request:
+                del self._latest[request.scope]
+            self._cond.notify_all()
+        if not failed:
+            self._cache_put(request.key, result)
+        return result
+
+    def analyze_image(self, base64_image: str, prompt: str = "Describe what you see on this screen.",
+                      frame: Optional[np.ndarray] = None,
+                      on_token: Optional[Callable[[str], None]] = None,
+                      source: Optional[str] = None) -> str:
+        """
+        Sends an image to the VLM for analysis.
+
+        Concurrent calls for the same frame hash and prompt share one backend request.
+        At most `max_in_flight` requests run against the backend; further distinct
+        requests wait (up to `max_queued`, beyond that they are rejected). A waiting
+        request from `source` is dropped when a newer frame from the same source is
+        asked about with the same prompt; its callers receive the newer answer.
+
+        Args:
+            base64_image (str): The base64 encoded image string (without data URI prefix).
+            prompt (str): The text prompt for the model.
+            frame (Optional[np.ndarray]): The source frame; enables perceptual caching.
+            on_token (Optional[Callable[[str], None]]): Called with each streamed text chunk.
+                On a cache hit it is called once with the full response.
+            source (Optional[str]): Name of the frame stream (e.g. the target), used to
+                drop requests for superseded frames.
+
+        Returns:
+            str: The model's response text.
+        """
+        key = self.cache_key(base64_image, prompt, frame)
+        with self._cond:
+            cached = self._cache_lookup(key)
+            METRICS.inc("vhb_cache_requests_total", cache="vlm", result="miss" if cached is None else "hit")
+            if cached is None:
+                request = self._inflight.get(key)
+                if request is not None:
+                    # Identical request already queued or running: attach to it
+                    while request.superseded_by is not None:
+                        request = request.superseded_by
+                    self._coalesced += 1
+                    if on_token:
+                        request.listeners.append(on_token)
+                    leader = False
+                elif self._queued >= self.max_queued:
+                    self._rejected += 1
+                    return f"Error: VLM busy ({self._queued} requests queued). Retry later."
+                else:
+                    scope = (source, self.model, prompt) if source else None
+                    request = _VLMRequest(key, scope)
+                    if on_token:
+                        request.listeners.append(on_token)
+                    if scope:
+                        previous = self._latest.get(scope)
+                        if previous is not None and not previous.started and previous.superseded_by is None:
+                            # Stale frame still waiting: hand its callers to the new request
+                            previous.superseded_by = request
+                            request.listeners.extend(previous.listeners)
+                            self._superseded += 1
+                            self._cond.notify_all()  # Its leader leaves the slot queue now
+                        self._latest[scope] = request
+                    self._inflight[key] = request
+                    self._queued += 1
+                    self._requests += 1
+                    leader = True
+        if cached is not None:
+            if on_token:
+                on_token(cached)
+            return cached
+
+        if leader:
+            try:
+                if self._wait_for_slot(request):
+                    result = self._execute(request, base64_image, prompt)
+                else:
+                    result = request.superseded_by.future.result()
+            except BaseException as e:
+                request.future.set_exception(e)
+                raise
+            request.future.set_result(result)
+            return result
+        return request.future.result()
+
+    def stats(self) -> Dict:
+        """Returns request, cache, coalescing and queue counters."""
+        with self._lock:
+            return {
+                "requests": self._requests,
+                "cache_hits": self._cache_hits,
+                "cache_entries": len(self._cache),
+                "coalesced": self._coalesced,
+                "superseded": self._superseded,
+                "rejected": self._rejected,
+                "in_flight": self._running,
+                "queued": self._queued,
+                "errors": self._errors,
+            }
+
+
+class _VLMRequest:
+    """A backend request shared by all callers asking the same question about the same frame."""
+    def __init__(self, key: tuple, scope: Optional[tuple]):
+        self.key = key
+        self.scope = scope
+        self.future = Future()
+        self.listeners = []
+        self.started = False
+        self.superseded_by: Optional["_VLMRequest"] = None
@@ -0,0 +1,106 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import io
+import json
+import os
+import sys
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import benchmarks
+import vision
+from benchmarks import (BenchmarkSuite, SkipStage, check_results, directory_listing, run_stage, summarize,
+                        text_lines)
+from data_harvester import DataHarvester
+
+class TestBenchmarks(unittest.TestCase):
+    def test_summary_percentiles(self):
+        result = summarize([i / 1000 for i in range(1, 101)])
+        self.assertEqual((result["n"], result["p50_ms"], result["p95_ms"], result["p99_ms"], result["max_ms"]),
+                         (100, 50.0, 95.0, 99.0, 100.0))
+        self.assertEqual(summarize([0.002])["p99_ms"], 2.0)
+
+    def test_run_stage_outcomes(self):
+        result = run_stage(lambda: np.zeros(100000), iterations=5)
+        self.assertEqual(result["n"], 5)
+        self.assertGreater(result["peak_kb"], 700)  # NumPy buffers are traced
+
+        def skip():
+            raise SkipStage("tesseract not available")
+        self.assertEqual(run_stage(skip), {"skipped": "tesseract not available"})
+        self.assertIn("ZeroDivisionError", run_stage(lambda: 1 / 0)["error"])
+
+    def test_budgets_and_baseline(self):
+        results = {"a": {"p95_ms": 120.0}, "b": {"p95_ms": 10.0}, "c": {"skipped": "x"},
+                   "d": {"error": "RuntimeError: boom"}, "e": {"p95_ms": 1.5}}
+        baseline = {"a": {"p95_ms": 110.0}, "b": {"p95_ms": 5.0}, "e": {"p95_ms": 1.0}}
+        failures = check_results(results, {"a": 100, "c": 1}, baseline)
+        self.assertEqual(len(failures), 3)
+        self.assertIn("a: p95 120 ms exceeds the budget of 100 ms", failures)
+        self.assertTrue(any(f.startswith("b: p95 10 ms regressed from 5 ms") for f in failures))
+        self.assertIn("d: RuntimeError: boom", failures)  # 'e' is within the noise floor
+
+    def test_fixtures(self):
+        with tempfile.TemporaryDirectory() as logs:
+            listing = DataHarvester(logs).parse_directory_listing(directory_listing(100))
+        self.assertEqual((len(listing["directories"]), len(listing["files"])), (10, 90))
+        frame = np.zeros((40, 30, 3), dtype=np.uint8)
+        frame[5:9, 3:20] = 200
+        frame[20:30, 3:20] = 200
+        self.assertEqual(text_lines(frame), [[0, 3, 30, 8], [0, 18, 30, 14]])
+
+    def test_ocr_stages_use_structured_pass(self):
+        # The stages time recognize(), the path the tools read text through, without its cache
+        tesseract = MagicMock()
+        tesseract.image_to_data.return_value = {"text": []}
+        suite = BenchmarkSuite(width=320, height=200, iterations=2)
+        try:
+            with patch.object(benchmarks, "pytesseract", tesseract), patch.object(vision, "pytesseract", tesseract):
+                results = suite.run(["ocr.full_frame"])
+                lines = len(text_lines(suite.frame))
+                suite.stages()["ocr.lines"]()()
+        finally:
+            suite.close()
+        self.assertIn("p95_ms", results["ocr.full_frame"])
+        self.assertEqual(tesseract.image_to_data.call_count, benchmarks.WARMUP + 2 + 1 + lines)
+        tesseract.image_to_string.assert_not_called()
+
+    def test_reference_baseline(self):
+        with open(benchmarks.DEFAULT_BASELINE, encoding="utf-8") as f:
+            baseline = json.load(f)
+        suite = BenchmarkSuite()
+        try:
+            self.assertLessEqual(set(baseline), set(suite.stages()))
+        finally:
+            suite.close()
+        self.assertTrue(all("p95_ms" in r or "skipped" in r for r in baseline.values()))
+
+    def test_suite_and_cli(self):
+        suite = BenchmarkSuite(width=320, height=200, iterations=3)
+        try:
+            results = suite.run(["capture", "parse", "hid"])
+        finally:
+            suite.close()
+        self.assertEqual(set(results), {"capture.replay", "parse.dir_listing", "hid.compile_text"})
+        self.assertTrue(all("p95_ms" in r for r in results.values()), results)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            baseline = os.path.join(tmp, "baseline.json")
+            budgets = os.path.join(tmp, "budgets.json")
+            with open(budgets, "w") as f:
+                json.dump({"parse.dir_listing": 0.0001}, f)
+            with patch("sys.stdout", new=io.StringIO()):
+                self.assertEqual(benchmarks.main(["--stages", "hid", "--iterations", "2",
+                                                  "--write-baseline", baseline]), 0)
+            with patch("sys.stdout", new=io.StringIO()) as out:
+                status = benchmarks.main(["--stages", "parse,hid", "--iterations", "2", "--baseline", baseline,
+                                          "--budgets", budgets])
+            self.assertEqual(status, 1)
+            report = json.loads(out.getvalue())
+            self.assertEqual(len(report["failures"]), 1)
+            self.assertTrue(report["failures"][0].startswith("parse.dir_listing"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+import unittest
+from unittest.mock import patch
+from types import SimpleNamespace
+import sys
+import os
+import tempfile
+import time
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import capture_modes
+from capture_modes import (CaptureMode, CaptureProfiles, fourcc_code, fourcc_name, parse_v4l2_formats,
+                           probe_modes, benchmark_mode, select_best, negotiate)
+
+FAKE_CV2 = SimpleNamespace(CAP_PROP_FRAME_WIDTH=3, CAP_PROP_FRAME_HEIGHT=4, CAP_PROP_FPS=5,
+                           CAP_PROP_FOURCC=6, CAP_PROP_BUFFERSIZE=38)
+
+V4L2_OUTPUT = """ioctl: VIDIOC_ENUM_FMT
+	Type: Video Capture
+
+	[0]: 'MJPG' (Motion-JPEG, compressed)
+		Size: Discrete 1920x1080
+			Interval: Discrete 0.017s (60.000 fps)
+			Interval: Discrete 0.033s (30.000 fps)
+		Size: Discrete 1280x720
+			Interval: Discrete 0.017s (60.000 fps)
+	[1]: 'YUYV' (YUYV 4:2:2)
+		Size: Discrete 1920x1080
+			Interval: Discrete 0.200s (5.000 fps)
+"""
+
+
+class FakeDevice:
+    """VideoCapture stand-in: accepts MJPG/YUYV at 1080p and 720p only."""
+    SUPPORTED = {("MJPG", 1920, 1080), ("MJPG", 1280, 720), ("YUYV", 1920, 1080)}
+
+    def __init__(self):
+        self.props = {6: fourcc_code("YUYV"), 3: 640, 4: 480, 5: 30.0}
+        self.released = False
+
+    def isOpened(self):
+        return True
+
+    def set(self, prop, value):
+        self.props[prop] = value
+        return True
+
+    def get(self, prop):
+        fourcc = fourcc_name(self.props[6])
+        if (fourcc, self.props[3], self.props[4]) not in self.SUPPORTED:
+            return {3: 640, 4: 480}.get(prop, self.props[prop])
+        return self.props[prop]
+
+    def release(self):
+        self.released = True
+
+
+class SyntheticCapture:
+    """Synthetic stream with a per-frame delay and decode cost."""
+    def __init__(self, mode, delay, busy=0.0):
+        self.mode, self.delay, self.busy = mode, delay, busy
+        self.released = False
+
+    def capture_frame(self):
+        time.sleep(self.delay)
+        end = time.process_time() + self.busy
+        while time.process_time() < end:
+            pass
+        return np.zeros((self.mode.height, self.mode.width, 3), dtype=np.uint8)
+
+    def release(self):
+        self.released = True
+
+
+class TestCaptureModes(unittest.TestCase):
+    def test_fourcc_roundtrip(self):
+        self.assertEqual(fourcc_code("MJPG"), ord("M") | ord("J") << 8 | ord("P") << 16 | ord("G") << 24)
+        self.assertEqual(fourcc_name(fourcc_code("YUYV")), "YUYV")
+        self.assertIsNone(fourcc_name(0))
+
+    def test_parse_v4l2_formats(self):
+        modes = parse_v4l2_formats(V4L2_OUTPUT)
+        self.assertEqual([repr(m) for m in modes],
+                         ["MJPG 1920x1080@60", "MJPG 1920x1080@30", "MJPG 1280x720@60", "YUYV 1920x1080@5"])
+
+    def test_probe_keeps_accepted_modes(self):
+        devices = []
+
+        def open_capture():
+            devices.append(FakeDevice())
+            return devices[-1]
+
+        candidates = [CaptureMode("MJPG", 1920, 1080, 30), CaptureMode("NV12", 1920, 1080, 30),
+                      CaptureMode("YUYV", 1280, 720, 10)]
+        with patch.object(capture_modes, "cv2", FAKE_CV2):
+            supported = probe_modes(0, open_capture=open_capture, candidates=candidates)
+        self.assertEqual(supported, [CaptureMode("MJPG", 1920, 1080, 30)])
+        self.assertTrue(all(d.released for d in devices))
+
+    def test_benchmark_measures_stream(self):
+        result = benchmark_mode(SyntheticCapture(CaptureMode(width=64, height=48), 0.01), frames=5, warmup=1)
+        self.assertEqual(result["shape"], [48, 64, 3])
+        self.assertGreaterEqual(result["latency_ms"], 9.0)
+        self.assertLess(result["fps"], 110)
+
+        failing = SyntheticCapture(CaptureMode(), 0)
+        failing.capture_frame = lambda: (_ for _ in ()).throw(RuntimeError("Failed to grab frame"))
+        self.assertEqual(benchmark_mode(failing), {"error": "Failed to grab frame"})
+
+    def test_benchmark_separates_frame_rate_from_latency(self):
+        # capture_frame() drains the buffer with three reads; the frame rate comes from the read spacing
+        import vision
+        device = FakeDevice()
+        frame = np.zeros((48, 64, 3), dtype=np.uint8)
+
+        def read():
+            time.sleep(0.01)
+            return True, frame
+        device.read = read
+        fake_cv2 = SimpleNamespace(VideoCapture=lambda device_id: device, **vars(FAKE_CV2))
+        with patch.object(capture_modes, "cv2", fake_cv2), patch.object(vision, "cv2", fake_cv2):
+            capture = vision.ScreenCapture(0, mode=CaptureMode("MJPG", 1920, 1080, 60))
+            result = benchmark_mode(capture, frames=4, warmup=1)
+        self.assertGreaterEqual(result["latency_ms"], 27.0)
+        self.assertGreater(result["fps"], 50)
+        self.assertLessEqual(len(capture.read_intervals), 8)  # warm-up reads are discarded
+
+    def test_select_best_prefers_legible_fast_mode(self):
+        def entry(fourcc, height, fps, latency, cpu):
+            return {"mode": CaptureMode(fourcc, 1920 if height == 1080 else 1280, height, fps).to_dict(),
+                    "benchmark": {"fps": fps, "latency_ms": latency, "cpu_ms": cpu}}
+        results = [entry("YUYV", 1080, 5, 200, 1), entry("MJPG", 1080, 30, 33, 6),
+                   entry("MJPG", 720, 60, 16, 3), {"mode": CaptureMode().to_dict(), "benchmark": {"error": "x"}}]
+        self.assertEqual(select_best(results)["mode"]["fourcc"], "MJPG")
+        self.assertEqual(select_best(results)["mode"]["height"], 1080)
+        self.assertEqual(select_best(results, min_height=720)["mode"]["height"], 720)
+        self.assertIsNone(select_best(results[3:]))
+
+        # The frame interval is not charged on top of the latency that already contains it
+        results = [entry("MJPG", 1080, 60, 40, 2), entry("YUYV", 1080, 10, 30, 2)]
+        self.assertEqual(select_best(results)["mode"]["fourcc"], "YUYV")
+
+    def test_profiles_default_to_logs_directory(self):
+        if "VHB_CAPTURE_PROFILES" not in os.environ:
+            self.assertEqual(CaptureProfiles().path, os.path.join("logs", "capture_profiles.json"))
+
+    def test_negotiate_persists_best_mode(self):
+        delays = {"YUYV": 0.03, "MJPG": 0.005}
+        modes = [CaptureMode("YUYV", 320, 240, 5), CaptureMode("MJPG", 320, 240, 30)]
+        created = []
+
+        def factory(mode):
+            created.append(SyntheticCapture(mode, delays[mode.fourcc]))
+            return created[-1]
+
+        with tempfile.TemporaryDirectory() as directory:
+            profiles = CaptureProfiles(os.path.join(directory, "profiles.json"))
+            result = negotiate(7, factory, frames=4, min_height=240, modes=modes, profiles=profiles)
+            self.assertEqual(result["best"]["fourcc"], "MJPG")
+            self.assertEqual(len(result["results"]), 2)
+            self.assertTrue(all(c.released for c in created))
+            self.assertEqual(profiles.load(result["device"]), CaptureMode("MJPG", 320, 240, 30))
+            self.assertIsNone(profiles.load("video99"))
+
+    def test_screen_capture_applies_mode(self):
+        import vision
+        device = FakeDevice()
+        fake_cv2 = SimpleNamespace(VideoCapture=lambda device_id: device, **vars(FAKE_CV2))
+        with patch.object(capture_modes, "cv2", fake_cv2), patch.object(vision, "cv2", fake_cv2):
+            capture = vision.ScreenCapture(0, mode=CaptureMode("MJPG", 1920, 1080, 60))
+            capture._open_camera()
+        self.assertEqual(fourcc_name(device.props[6]), "MJPG")
+        self.assertEqual(device.props[5], 60.0)
+        self.assertEqual(capture.active_mode, CaptureMode("MJPG", 1920, 1080, 60))
+
+if __name__ == '__main__':
+    unittest.main()
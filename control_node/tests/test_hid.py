@@ -1,13 +1,17 @@
 import unittest
+import io
 from unittest.mock import MagicMock, patch, mock_open
 import time
 import sys
 import os
+import json
+import shutil
+import tempfile
 
 # Add src to path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
 
-from hid import KeyInjector, Layout, GermanISO, MOD_LSHIFT, MOD_NONE, MOD_RALT
+from hid import KeyInjector, Layout, GermanISO, USLayout, LAYOUTS_DIR, available_layouts, MOD_LSHIFT, MOD_NONE, MOD_RALT, MOD_LCTRL, MOD_LALT
 
 class TestHID(unittest.TestCase):
     def setUp(self):
@@ -60,5 +64,118 @@ class TestHID(unittest.TestCase):
             mock_send.assert_any_call(5, 0x4C)
             mock_send.assert_any_call(0, 0) # Release
 
+    def test_dead_key_composition(self):
+        layout = GermanISO()
+        self.assertEqual(layout.get_strokes('ê'), ((MOD_NONE, 0x35), (MOD_NONE, 0x08)))
+        self.assertEqual(layout.get_strokes('^'), ((MOD_NONE, 0x35), (MOD_NONE, 0x2C)))
+        self.assertEqual(layout.get_strokes('`'), ((MOD_LSHIFT, 0x2E), (MOD_NONE, 0x2C)))
+        self.assertEqual(layout.get_scancode('ê'), (MOD_NONE, 0x00))  # Not a single key
+
+        with patch.object(self.injector, '_send_report') as mock_send, patch('hid.time.sleep'):
+            self.injector.layout = layout
+            self.injector.press_key('ê')
+            self.assertEqual([c.args for c in mock_send.call_args_list],
+                             [(MOD_NONE, 0x35), (0, 0), (MOD_NONE, 0x08), (0, 0)])
+
+    def test_reverse_lookup(self):
+        layout = GermanISO()
+        self.assertEqual(layout.get_char(MOD_NONE, 0x1C), 'z')
+        self.assertEqual(layout.get_char(MOD_LSHIFT, 0x1D), 'Y')
+        self.assertEqual(layout.get_char(MOD_RALT, 0x14), '@')
+        self.assertEqual(layout.get_char(MOD_NONE, 0x35), '^')  # Dead key
+        self.assertIsNone(layout.get_char(MOD_LCTRL, 0x04))  # Shortcut, not text
+        us = USLayout()
+        for char in "Hello, World! ~/[]{}|":
+            self.assertEqual(us.get_char(*us.get_scancode(char)), char)
+
+    def test_named_keys(self):
+        layout = USLayout()
+        self.assertEqual(layout.key_code('F13'), 0x68)
+        self.assertEqual(layout.key_code('F24'), 0x73)
+        self.assertEqual(layout.key_code('PGUP'), layout.key_code('PAGEUP'))
+        self.assertEqual(layout.key_code('home'), 0x4A)
+        self.assertEqual(layout.key_code('KP_5'), 0x5D)
+        self.assertEqual(layout.key_code('x'), 0x1B)
+        self.assertEqual(layout.key_code('NOPE'), 0)
+
+        with patch.object(self.injector, '_send_report') as mock_send, patch('hid.time.sleep'):
+            self.injector.press_sequence(['GUI'], 'LEFT')
+            mock_send.assert_any_call(0x08, 0x50)
+            with self.assertRaises(ValueError):
+                self.injector.press_sequence(['HYPER'], 'A')
+            with self.assertRaises(ValueError):
+                self.injector.press_sequence([], 'NOPE')
+
+    def test_unmapped_characters_are_reported(self):
+        injector = KeyInjector(device_path="/tmp/fake_hidg0", layout=USLayout(), unicode_input="none")
+        with patch.object(injector, '_send_report') as mock_send:
+            with self.assertRaises(ValueError) as cm:
+                injector.type_text("café ü", delay_mean=0.0, delay_std=0.0)
+            mock_send.assert_not_called()  # Nothing typed
+        self.assertIn("éü", str(cm.exception))
+
+    def test_windows_alt_code_fallback(self):
+        self.injector.layout = USLayout()
+        reports = self.injector.compile_char('é')  # cp1252 0xE9 -> Alt+0233
+        self.assertEqual(reports, [(MOD_LALT, 0),
+                                   (MOD_LALT, 0x62), (MOD_LALT, 0), (MOD_LALT, 0x5A), (MOD_LALT, 0),
+                                   (MOD_LALT, 0x5B), (MOD_LALT, 0), (MOD_LALT, 0x5B), (MOD_LALT, 0),
+                                   (MOD_NONE, 0)])
+        box = self.injector.compile_char('═')  # Only in the OEM code page: Alt+205
+        self.assertEqual([code for _, code in box if code], [0x5A, 0x62, 0x5D])
+
+        with patch.object(self.injector, '_send_report') as mock_send, patch('hid.time.sleep'):
+            self.injector.type_text("aé", delay_mean=0.0, delay_std=0.0)
+            sent = [c.args for c in mock_send.call_args_list]
+        self.assertEqual(sent, [(MOD_NONE, 0x04), (0, 0)] + reports)
+
+        with self.assertRaises(ValueError):
+            self.injector.type_text("✓")  # Neither in the layout nor in any code page
+
+    def test_messages_stay_off_stdout(self):
+        # stdout is the MCP stdio channel, and injectors are created after the server started
+        with tempfile.TemporaryDirectory() as tmp, patch("sys.stdout", new=io.StringIO()) as out:
+            with self.assertLogs(level="WARNING") as logs:
+                injector = KeyInjector(device_path=tmp)
+                injector.simulation_mode = False
+                injector._send_report(MOD_NONE, 0x04)  # A directory cannot be written
+        self.assertEqual(out.getvalue(), "")
+        self.assertEqual([record.levelname for record in logs.records], ["ERROR"])
+
+        with patch("sys.stdout", new=io.StringIO()) as out, self.assertLogs(level="WARNING") as logs:
+            KeyInjector(device_path="/tmp/none_hidg0")
+        self.assertEqual(out.getvalue(), "")
+        self.assertIn("simulation mode", logs.output[0])
+
+    def test_hex_and_linux_fallbacks(self):
+        windows = KeyInjector(device_path="/tmp/fake_hidg0", unicode_input="windows_hex")
+        self.assertIsInstance(windows.layout, GermanISO)  # Default layout, loaded on construction
+        reports = windows.compile_char('✓')  # U+2713
+        self.assertEqual(reports[:3], [(MOD_LALT, 0), (MOD_LALT, 0x57), (MOD_LALT, 0)])
+        self.assertEqual([code for _, code in reports[3:] if code], [0x5A, 0x5F, 0x59, 0x5B])
+
+        linux = KeyInjector(device_path="/tmp/fake_hidg0", layout=GermanISO(), unicode_input="linux")
+        reports = linux.compile_char('✓')
+        self.assertEqual(reports[0], (MOD_LCTRL | MOD_LSHIFT, 0x18))
+        self.assertEqual([code for _, code in reports[2:] if code], [0x1F, 0x24, 0x1E, 0x20, 0x2C])
+        self.assertIsNotNone(linux.compile_char('ê'))  # Still typed through the dead key
+        self.assertEqual(linux.compile_char('ê')[0], (MOD_NONE, 0x35))
+
+        with self.assertRaises(ValueError):
+            KeyInjector(device_path="/tmp/fake_hidg0", unicode_input="morse")
+
+    def test_layout_from_new_data_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            shutil.copy(os.path.join(LAYOUTS_DIR, "_common.json"), tmp)
+            with open(os.path.join(tmp, "xx.json"), "w", encoding="utf-8") as f:
+                json.dump({"code": "XX", "keys": {"0x04": ["ą", "Ą"]},
+                           "dead_keys": {"~": {"key": "0x05", "level": 0, "compose": {"ą": "ã"}}}}, f)
+            layouts = available_layouts(tmp)
+            self.assertEqual(list(layouts), ["XX"])
+            layout = layouts["XX"]()
+            self.assertEqual(layout.get_scancode('Ą'), (MOD_LSHIFT, 0x04))
+            self.assertEqual(layout.get_strokes('ã'), ((MOD_NONE, 0x05), (MOD_NONE, 0x04)))
+            self.assertEqual(layout.get_scancode('\n'), (MOD_NONE, 0x28))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+from unittest.mock import MagicMock
+import sys
+import os
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from layout_detection import LayoutDetector, PROBES, FINGERPRINTS, score_fingerprint, changed_region
+from hid import MOD_NONE, SCANCODE_SPACE, SCANCODE_BACKSPACE, USLayout, GermanISO, LAYOUTS
+
+
+class FakeTarget:
+    """Simulated target: an input line that renders keystrokes through the target's layout."""
+    def __init__(self, layout, existing="C:\\> copy y z"):
+        self.table = {probe: char for probe, char in zip(PROBES, FINGERPRINTS[layout])}
+        self.table[(MOD_NONE, SCANCODE_SPACE)] = " "
+        self.line = existing
+        self.existing = existing
+        self.presses = []
+
+    # KeyInjector interface
+    def press_scancode(self, modifiers, code):
+        self.presses.append((modifiers, code))
+        if (modifiers, code) == (MOD_NONE, SCANCODE_BACKSPACE):
+            self.line = self.line[:-1]
+        else:
+            self.line += self.table[(modifiers, code)]
+
+    def frame(self):
+        # One 8x16 cell per character; changed cells differ in brightness
+        frame = np.zeros((32, 8 * 64, 3), dtype=np.uint8)
+        for i, char in enumerate(self.line[:64]):
+            frame[8:24, 8 * i:8 * i + 6] = 60 + (ord(char) * 37) % 190
+        return frame
+
+    def ocr(self, image):
+        # Reads back the characters whose cells are inside the crop
+        self.crop_width = image.shape[1]
+        return self.line[len(self.existing):]
+
+
+class TestLayoutDetection(unittest.TestCase):
+    def detector(self, target, ocr=None):
+        return LayoutDetector(target, MagicMock(), frame_source=target.frame, ocr=ocr or target.ocr,
+                              settle=0, key_delay=0)
+
+    def test_detects_each_layout(self):
+        for layout in FINGERPRINTS:
+            target = FakeTarget(layout)
+            self.assertEqual(self.detector(target).detect(), layout, layout)
+
+    def test_single_round_trip_and_exact_cleanup(self):
+        target = FakeTarget("DE")
+        detector = self.detector(target)
+        detector.detect()
+        typed = [p for p in target.presses if p != (MOD_NONE, SCANCODE_BACKSPACE)]
+        self.assertEqual(len(typed), 2 * len(PROBES) - 1)
+        self.assertEqual(target.line, target.existing)  # Exactly the probe was erased
+        detector.capture_func.assert_not_called()  # No full-screen OCR
+
+    def test_only_changed_region_is_read(self):
+        target = FakeTarget("US")
+        detector = self.detector(target)
+        detector.detect()
+        x, y, w, h = detector.last_result["region"]
+        self.assertGreaterEqual(x, 8 * len(target.existing) - 8)
+        self.assertLess(w, 8 * (2 * len(PROBES) + 2))
+
+    def test_tolerates_ocr_losses(self):
+        target = FakeTarget("UK")
+        # OCR drops the pound sign and misreads one character
+        lossy = lambda image: target.line[len(target.existing):].replace("£", "").replace("m", "rn")
+        self.assertEqual(self.detector(target, ocr=lossy).detect(), "UK")
+
+    def test_ambiguous_or_missing_output(self):
+        target = FakeTarget("US")
+        self.assertEqual(self.detector(target, ocr=lambda image: "x").detect(), "UNKNOWN")
+
+        silent = FakeTarget("US")
+        silent.press_scancode = lambda modifiers, code: silent.presses.append((modifiers, code))
+        detector = self.detector(silent)
+        self.assertEqual(detector.detect(), "UNKNOWN")
+        self.assertIsNone(detector.last_result["region"])
+
+    def test_scores_and_region_helpers(self):
+        self.assertEqual(score_fingerprint(FINGERPRINTS["FR"])["FR"], 1.0)
+        self.assertLess(score_fingerprint(FINGERPRINTS["FR"])["US"], 0.5)
+        frame = np.zeros((20, 20), dtype=np.uint8)
+        changed = frame.copy()
+        changed[5:7, 10:12] = 255
+        self.assertEqual(changed_region(frame, changed, padding=1), [9, 4, 4, 4])
+        self.assertIsNone(changed_region(frame, frame.copy()))
+
+    def test_apply_layout(self):
+        injector = MagicMock()
+        detector = LayoutDetector(injector, MagicMock())
+        detector.apply_layout("US")
+        self.assertIsInstance(injector.layout, USLayout)
+        detector.apply_layout("DE")
+        self.assertIsInstance(injector.layout, GermanISO)
+        detector.apply_layout("FR")  # Loaded from layouts/fr.json
+        self.assertEqual(injector.layout.code, "FR")
+        detector.apply_layout("XX")  # Unknown: keeps the current layout
+        self.assertEqual(injector.layout.code, "FR")
+
+    def test_fingerprints_match_layout_files(self):
+        for code, expected in FINGERPRINTS.items():
+            layout = LAYOUTS[code]()
+            self.assertEqual([layout.get_char(mod, key) for mod, key in PROBES], expected, code)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+from unittest.mock import MagicMock
+import sys
+import os
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from macro import MacroRunner, validate_macro
+
+class FakeScreen:
+    """OCR pipeline returning a scripted sequence of screens (the last one repeats)."""
+    def __init__(self, screens):
+        self.screens = list(screens)
+        self.crops = []
+
+    def read_text(self, frame, region=None):
+        if region:
+            self.crops.append((region[3], region[2]) + frame.shape[2:])
+        return self.screens.pop(0) if len(self.screens) > 1 else self.screens[0]
+
+class TestMacro(unittest.TestCase):
+    def setUp(self):
+        self.injector = MagicMock()
+        self.frame = np.zeros((100, 200, 3), dtype=np.uint8)
+
+    def runner(self, screens, states=None):
+        states = list(states or [])
+        state_source = (lambda: states.pop(0) if len(states) > 1 else states[0]) if states else None
+        return MacroRunner(self.injector, lambda: self.frame, FakeScreen(screens),
+                           state_source=state_source, poll_interval=0.001)
+
+    def test_full_sequence_with_variables(self):
+        runner = self.runner(["C:\\>", "C:\\>ipconfig", "IPv4 Address. . . : 10.0.0.7\nC:\\>"],
+                             states=[{"state": "busy_output", "stable_seconds": 0.0},
+                                     {"state": "idle_prompt", "stable_seconds": 0.6}])
+        result = runner.run([
+            {"type": "ipconfig"},
+            {"key": "ENTER"},
+            {"wait_for_text": "ipv4 address", "timeout": 1},
+            {"wait_stable": 0.5, "timeout": 1},
+            {"extract": "IPv4 Address[ .]*: ([0-9.]+)", "save_as": "ip"},
+            {"assert": "10\\.0\\.0\\.\\d+", "in": "ip", "regex": True},
+            {"type": "ping ${ip}", "delay_ms": 5},
+        ])
+        self.assertTrue(result["ok"], result)
+        self.assertEqual(result["variables"]["ip"], "10.0.0.7")
+        self.assertEqual([e["action"] for e in result["trace"]],
+                         ["type", "key", "wait_for_text", "wait_stable", "extract", "assert", "type"])
+        self.assertEqual(result["trace"][2]["detail"]["polls"], 3)
+        self.assertEqual(result["trace"][3]["detail"]["state"], "idle_prompt")
+        self.injector.press_sequence.assert_called_once_with([], "ENTER")
+        self.assertEqual(self.injector.type_text.call_args_list[-1].args, ("ping 10.0.0.7",))
+
+    def test_stops_at_failed_step(self):
+        runner = self.runner(["Access denied"])
+        result = runner.run([
+            {"ocr_region": [0, 0, 50, 20], "save_as": "title"},
+            {"assert": "Administrator", "in": "title"},
+            {"type": "never typed"},
+        ])
+        self.assertFalse(result["ok"])
+        self.assertEqual(result["failed_step"], 1)
+        self.assertIn("Assertion failed", result["error"])
+        self.assertEqual(len(result["trace"]), 2)
+        self.assertEqual(runner.pipeline.crops, [(20, 50, 3)])
+        self.injector.type_text.assert_not_called()
+
+    def test_optional_step_and_timeouts(self):
+        runner = self.runner(["C:\\>"])
+        result = runner.run([
+            {"wait_for_text": "Done", "timeout": 0.01, "optional": True},
+            {"wait_stable": 1.0},  # No screen-state source
+        ])
+        self.assertFalse(result["ok"])
+        self.assertFalse(result["trace"][0]["ok"])
+        self.assertIn("did not appear", result["trace"][0]["error"])
+        self.assertEqual(result["failed_step"], 1)
+
+    def test_hid_errors_are_reported(self):
+        self.injector.type_text.side_effect = ValueError("No key mapping for '✓'")
+        result = self.runner(["x"]).run([{"type": "✓"}])
+        self.assertEqual(result["error"], "No key mapping for '✓'")
+
+    def test_validation(self):
+        self.assertEqual(validate_macro([{"type": "a"}, {"sleep": 0}]), ["type", "sleep"])
+        for bad in ([], [{"typo": "a"}], [{"type": "a", "key": "B"}], [{"type": "a", "colour": 1}], ["type"]):
+            with self.assertRaises(ValueError):
+                validate_macro(bad)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+import os
+import sys
+import tempfile
+import json
+import urllib.request
+import urllib.error
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import metrics
+from metrics import Histogram, MetricsRegistry, METRICS, serve_prometheus, span, timed
+from data_harvester import DataHarvester
+from hid import KeyInjector, USLayout
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram(self):
+        histogram = Histogram(buckets=(0.01, 0.1, 1.0))
+        for value in (0.005, 0.01, 0.05, 0.5, 2.0):
+            histogram.observe(value)
+        self.assertEqual(histogram.cumulative(), [("0.01", 2), ("0.1", 3), ("1", 4), ("+Inf", 5)])
+        snap = histogram.snapshot()
+        self.assertEqual((snap["count"], snap["p50"], snap["max"]), (5, 0.05, 2.0))
+        self.assertAlmostEqual(snap["sum"], 2.565)
+        self.assertIsNone(Histogram().snapshot()["p95"])
+
+    def test_registry_snapshot_and_prometheus(self):
+        registry = MetricsRegistry()
+        registry.observe("vhb_stage_seconds", 0.02, stage="ocr")
+        registry.inc("vhb_cache_requests_total", cache="ocr", result="hit")
+        registry.inc("vhb_cache_requests_total", 2, cache="ocr", result="hit")
+        registry.add_collector(lambda: [("vhb_hid_queue_depth", {"target": 'rack "a"'}, 3)])
+        registry.add_collector(lambda: 1 / 0)  # A failing collector is skipped
+
+        snap = registry.snapshot()
+        self.assertEqual(snap["counters"]["vhb_cache_requests_total"],
+                         [{"labels": {"cache": "ocr", "result": "hit"}, "value": 3}])
+        self.assertEqual(snap["histograms"]["vhb_stage_seconds"][0]["labels"], {"stage": "ocr"})
+        json.dumps(snap)
+
+        text = registry.prometheus()
+        self.assertIn("# TYPE vhb_stage_seconds histogram", text)
+        self.assertIn('vhb_stage_seconds_bucket{stage="ocr",le="0.025"} 1', text)
+        self.assertIn('vhb_stage_seconds_count{stage="ocr"} 1', text)
+        self.assertIn('vhb_cache_requests_total{cache="ocr",result="hit"} 3', text)
+        self.assertIn('vhb_hid_queue_depth{target="rack \\"a\\""} 3', text)
+        registry.reset()
+        self.assertEqual(registry.snapshot()["histograms"], {})
+
+    def test_spans(self):
+        METRICS.reset()
+
+        @timed("unit.decorated")
+        def work(x):
+            return x * 2
+        self.assertEqual(work(2), 4)
+        with self.assertRaises(ValueError):
+            with span("unit.failing"):
+                raise ValueError("boom")
+        stages = {h["labels"]["stage"]: h["count"] for h in METRICS.snapshot()["histograms"]["vhb_stage_seconds"]}
+        self.assertEqual(stages, {"unit.decorated": 1, "unit.failing": 1})
+
+    def test_component_instrumentation(self):
+        METRICS.reset()
+        with tempfile.TemporaryDirectory() as logs:
+            DataHarvester(logs).parse_directory_listing("01/01/2023  12:00 PM    10 a.txt")
+        injector = KeyInjector(device_path="/tmp/none_hidg0", layout=USLayout())
+        injector.type_text("ab", delay_mean=0.0, delay_std=0.0)
+        snap = METRICS.snapshot()
+        stages = {h["labels"]["stage"] for h in snap["histograms"]["vhb_stage_seconds"]}
+        self.assertTrue({"parse_listing", "hid.type_text"} <= stages)
+        self.assertEqual(snap["counters"]["vhb_hid_reports_total"][0]["value"], 4)
+        self.assertEqual(snap["histograms"]["vhb_keystrokes_per_second"][0]["count"], 1)
+
+    def test_prometheus_endpoint(self):
+        registry = MetricsRegistry()
+        registry.inc("vhb_hid_reports_total", 7)
+        http = serve_prometheus(0, registry=registry)
+        try:
+            base = f"http://127.0.0.1:{http.server_address[1]}"
+            with urllib.request.urlopen(base + "/metrics", timeout=5) as response:
+                self.assertTrue(response.headers["Content-Type"].startswith("text/plain"))
+                self.assertIn("vhb_hid_reports_total 7", response.read().decode())
+            with self.assertRaises(urllib.error.HTTPError):
+                urllib.request.urlopen(base + "/other", timeout=5)
+        finally:
+            http.shutdown()
+            http.server_close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+from unittest.mock import MagicMock
+import sys
+import os
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from optical_channel import (OpticalDecoder, OpticalReceiver, encode_frames, calibration_grids,
+                             render_grid, build_target_script, frame_capacity)
+
+COLS, ROWS = 20, 8
+CELL = (12, 16)
+ORIGIN = (37, 21)
+FRAME_SIZE = (320, 200)
+
+def render(grid, noise=0):
+    frame = render_grid(grid, cell_size=CELL, origin=ORIGIN, frame_size=FRAME_SIZE)
+    if noise:
+        rng = np.random.default_rng(0)
+        frame = np.clip(frame.astype(int) + rng.integers(-noise, noise + 1, frame.shape), 0, 255).astype(np.uint8)
+    return frame
+
+class TestOpticalChannel(unittest.TestCase):
+    def setUp(self):
+        self.decoder = OpticalDecoder(COLS, ROWS)
+        grid_a, grid_b = calibration_grids(COLS, ROWS)
+        self.frame_a = render(grid_a, noise=6)
+        self.frame_b = render(grid_b, noise=6)
+
+    def test_calibration_finds_grid(self):
+        self.assertTrue(self.decoder.calibrate(self.frame_a, self.frame_b))
+        x, y, w, h = self.decoder.region
+        self.assertEqual((x, y), ORIGIN)
+        self.assertEqual((w, h), (COLS * CELL[0], ROWS * CELL[1]))
+
+    def test_calibration_rejects_wrong_pair(self):
+        blank = render(np.zeros((ROWS, COLS), dtype=np.uint8))
+        self.assertFalse(self.decoder.calibrate(blank, self.frame_a))
+        self.assertFalse(self.decoder.calibrate(self.frame_b, self.frame_a))
+
+    def test_roundtrip(self):
+        data = bytes(range(256)) * 2
+        grids = encode_frames(data, COLS, ROWS)
+        self.assertEqual(len(grids), -(-len(data) // frame_capacity(COLS, ROWS)))
+
+        self.assertTrue(self.decoder.calibrate(self.frame_a, self.frame_b))
+        received = {}
+        for grid in grids:
+            seq, count, payload = self.decoder.decode(render(grid, noise=6))
+            self.assertEqual(count, len(grids))
+            received[seq] = payload
+        self.assertEqual(b"".join(received[i] for i in range(len(grids))), data)
+
+    def test_corrupted_frame_rejected(self):
+        self.assertTrue(self.decoder.calibrate(self.frame_a, self.frame_b))
+        grid = encode_frames(b"hello world", COLS, ROWS)[0].copy()
+        grid[-1, 0] ^= 0x1  # flip a payload-free cell: still valid
+        self.assertIsNotNone(self.decoder.decode(render(grid)))
+        grid[1, 5] ^= 0x3   # flip a payload cell: CRC must fail
+        self.assertIsNone(self.decoder.decode(render(grid)))
+
+    def test_receiver_requests_retransmission(self):
+        data = os.urandom(300)
+        grids = encode_frames(data, COLS, ROWS)
+        grid_a, grid_b = calibration_grids(COLS, ROWS)
+        blank = render(np.zeros((ROWS, COLS), dtype=np.uint8))
+
+        # Frame 1 is lost in the first pass and only shows up after the retransmission request
+        stream = [blank, render(grid_a), render(grid_b)] + [render(g) for i, g in enumerate(grids) if i != 1]
+        injector = MagicMock()
+        capture = MagicMock()
+
+        def next_frame():
+            if stream:
+                return stream.pop(0)
+            if injector.type_text.call_count > 1:
+                return render(grids[1])
+            return render(grids[-1])
+        capture.capture_frame.side_effect = next_frame
+
+        receiver = OpticalReceiver(injector, capture, cols=COLS, rows=ROWS)
+        result, stats = receiver.receive("C:\\data.bin", timeout=10, idle_timeout=0.05)
+        self.assertEqual(result, data)
+        self.assertEqual(stats["retransmissions"], 1)
+        injector.type_text.assert_any_call("1", delay_mean=0.01, delay_std=0.003)
+
+    def test_target_script(self):
+        script = build_target_script("C:\\Users\\Admin\\notes.txt", COLS, ROWS, hold_ms=100)
+        self.assertIn('"C:\\Users\\Admin\\notes.txt"', script)
+        self.assertIn(f"$K={frame_capacity(COLS, ROWS)}", script)
+        for char in "`^~*|<>\n":
+            self.assertNotIn(char, script)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from profiling import SamplingProfiler, SlowCallCapture
+from metrics import attach, span
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_sampling_profiler(self):
+        stop, idle = threading.Event(), threading.Event()
+        workers = [threading.Thread(target=busy_loop, args=(stop,), name="busy"),
+                   threading.Thread(target=idle.wait, name="idle")]
+        for worker in workers:
+            worker.start()
+        try:
+            profiler = SamplingProfiler(interval=0.002)
+            profiler.run(0.2)
+            with_idle = SamplingProfiler(interval=0.002, include_idle=True)
+            for _ in range(3):
+                with_idle.sample()
+        finally:
+            stop.set()
+            idle.set()
+            for worker in workers:
+                worker.join()
+
+        summary = profiler.summary()
+        self.assertGreater(summary["samples"], 10)
+        self.assertIn("test_profiling.py:busy_loop", [f["function"] for f in summary["top_total"]])
+        lines = profiler.collapsed().splitlines()
+        self.assertTrue(all(line.rsplit(" ", 1)[1].isdigit() for line in lines))
+        self.assertTrue(any(line.startswith("busy;") for line in lines))
+        self.assertFalse(any(line.startswith("idle;") for line in lines))
+        self.assertTrue(any(stack.startswith("idle;") for stack in with_idle.stacks))
+
+        path = profiler.save(os.path.join(self.tmp.name, "profiles", "p.folded"))
+        with open(path) as f:
+            self.assertEqual(f.read(), profiler.collapsed())
+
+    def test_slow_call_capture(self):
+        capture = SlowCallCapture(threshold_ms=0, keep=2)
+        directory = lambda: self.tmp.name
+        frame = np.zeros((20, 30, 3), dtype=np.uint8)
+        with capture.watch("capture_screen", {"mode": "ocr_text", "image": frame}, directory):
+            with span("capture"):
+                attach("frame", frame)
+            with capture.watch("inner", {}, directory):  # Nested calls belong to the outer trace
+                with span("ocr"):
+                    attach("ocr_input", frame[:, :, 0])
+        with self.assertRaises(ValueError):
+            with capture.watch("scan_directory", {"path": "x" * 600}, directory):
+                raise ValueError("boom")
+
+        self.assertEqual(capture.captured, 2)
+        calls = sorted(os.listdir(self.tmp.name))
+        self.assertEqual(len(calls), 2)
+        with open(os.path.join(self.tmp.name, calls[0], "call.json")) as f:
+            record = json.load(f)
+        self.assertEqual(record["tool"], "capture_screen")
+        self.assertEqual([s["stage"] for s in record["stages"]], ["capture", "ocr"])
+        self.assertEqual(record["args"]["image"], "<ndarray (20, 30, 3) uint8>")
+        self.assertEqual(set(record["artifacts"]), {"frame", "ocr_input"})
+        for name in record["artifacts"].values():
+            self.assertTrue(os.path.exists(os.path.join(self.tmp.name, calls[0], name)))
+        with open(os.path.join(self.tmp.name, calls[1], "call.json")) as f:
+            record = json.load(f)
+        self.assertEqual(record["error"], "ValueError: boom")
+        self.assertTrue(record["args"]["path"].endswith("(600 chars)"))
+
+        for _ in range(2):
+            time.sleep(0.002)
+            with capture.watch("find_text", {}, directory):
+                pass
+        self.assertEqual(len(os.listdir(self.tmp.name)), 2)  # Pruned to `keep`
+
+    def test_disabled_and_fast_calls(self):
+        for capture in (SlowCallCapture(threshold_ms=None), SlowCallCapture(threshold_ms=10000)):
+            with capture.watch("capture_screen", {}, lambda: self.tmp.name):
+                pass
+            self.assertEqual(capture.captured, 0)
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+from unittest.mock import MagicMock
+import threading
+import sys
+import time
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from scheduler import HardwareScheduler, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.capture = MagicMock()
+        self.scheduler = HardwareScheduler(lambda: self.capture)
+
+    def test_hid_sequences_do_not_interleave(self):
+        events = []
+
+        def sequence(name):
+            for i in range(3):
+                events.append(name)
+                time.sleep(0.01)
+
+        futures = [self.scheduler.submit_hid(sequence, n) for n in "abc"]
+        for f in futures:
+            f.result(timeout=5)
+        self.assertEqual(events, list("aaabbbccc"))
+
+    def test_interactive_overtakes_background(self):
+        gate = threading.Event()
+        order = []
+        blocker = self.scheduler.submit_hid(gate.wait)
+        time.sleep(0.05)  # blocker is running, the rest queues up
+
+        jobs = [self.scheduler.submit_hid(order.append, "harvest", priority=PRIORITY_BACKGROUND),
+                self.scheduler.submit_hid(order.append, "type", priority=PRIORITY_INTERACTIVE)]
+        self.assertEqual(self.scheduler.stats()["hid"]["queue_depth"], 2)
+        gate.set()
+        for f in [blocker] + jobs:
+            f.result(timeout=5)
+        self.assertEqual(order, ["type", "harvest"])
+
+    def test_nested_hid_call_runs_inline(self):
+        result = self.scheduler.run_hid(lambda: self.scheduler.run_hid(lambda: 42))
+        self.assertEqual(result, 42)
+
+    def test_concurrent_readers_share_grab(self):
+        def slow_grab():
+            time.sleep(0.2)
+            return "frame"
+        self.capture.capture_frame.side_effect = slow_grab
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.scheduler.grab_frame())) for _ in range(5)]
+        for t in threads:
+            t.start()
+            time.sleep(0.01)
+        for t in threads:
+            t.join()
+
+        self.assertEqual(results, ["frame"] * 5)
+        self.assertEqual(self.capture.capture_frame.call_count, 1)
+        stats = self.scheduler.stats()["capture"]
+        self.assertEqual(stats["grabs"], 1)
+        self.assertEqual(stats["shared_reads"], 4)
+
+    def test_grab_error_propagates(self):
+        self.capture.capture_frame.side_effect = RuntimeError("no signal")
+        with self.assertRaises(RuntimeError):
+            self.scheduler.grab_frame()
+
+if __name__ == '__main__':
+    unittest.main()
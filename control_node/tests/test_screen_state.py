@@ -0,0 +1,59 @@
+import unittest
+import sys
+import os
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from screen_state import ScreenStateClassifier
+
+def draw_text(frame, x, y, width, lines, color=200):
+    """Draws glyph-like strokes as fake text lines."""
+    for line in range(lines):
+        top = y + line * 20
+        for cx in range(x, x + width, 10):
+            frame[top:top + 12, cx:cx + 2] = color
+            frame[top:top + 2, cx:cx + 7] = color
+
+class TestScreenState(unittest.TestCase):
+    def setUp(self):
+        self.console = np.zeros((480, 640, 3), dtype=np.uint8)
+        draw_text(self.console, 16, 16, 400, 4)
+        self.classifier = ScreenStateClassifier(busy_hold=0.5)
+
+    def test_idle_then_busy_then_idle(self):
+        self.assertEqual(self.classifier.update(self.console, 0.0)["state"], "idle_prompt")
+        output = self.console.copy()
+        draw_text(output, 16, 96, 500, 5)
+        self.assertEqual(self.classifier.update(output, 0.2)["state"], "busy_output")
+        result = self.classifier.update(output, 1.0)
+        self.assertEqual(result["state"], "idle_prompt")
+        self.assertEqual(result["stable_seconds"], 0.8)
+
+    def test_cursor_blink_is_not_output(self):
+        self.classifier.update(self.console, 0.0)
+        blink = self.console.copy()
+        blink[80:92, 16:24] = 200
+        result = self.classifier.update(blink, 1.0)
+        self.assertEqual(result["state"], "idle_prompt")
+        self.assertTrue(result["cursor_blink"])
+
+    def test_dialog(self):
+        dialog = self.console.copy()
+        dialog[200:400, 150:500] = 180
+        draw_text(dialog, 180, 240, 200, 2, color=0)
+        self.assertEqual(self.classifier.update(dialog, 0.0)["state"], "dialog")
+
+    def test_no_signal(self):
+        blue = np.zeros((480, 640, 3), dtype=np.uint8)
+        blue[:] = (200, 0, 0)
+        self.assertEqual(self.classifier.update(blue, 0.0)["state"], "no_signal")
+
+    def test_locked_screen(self):
+        yy, xx = np.mgrid[0:480, 0:640]
+        wallpaper = np.stack([(xx / 4) % 256, (yy / 3) % 256, ((xx + yy) / 6) % 256], -1).astype(np.uint8)
+        draw_text(wallpaper, 250, 200, 140, 1, color=255)  # clock
+        self.assertEqual(self.classifier.update(wallpaper, 0.0)["state"], "locked_screen")
+
+if __name__ == '__main__':
+    unittest.main()
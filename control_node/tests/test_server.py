@@ -1,53 +1,84 @@
 import unittest
 from unittest.mock import MagicMock, patch
+import asyncio
+import threading
+import json
 import sys
+import time
 import os
-
-# Mock cv2/pytesseract again for server imports
-sys.modules['cv2'] = MagicMock()
-sys.modules['pytesseract'] = MagicMock()
+import subprocess
+import tempfile
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
 
 import server
+from data_harvester import DataHarvester
+from screen_state import ScreenStateClassifier
+from signal_health import SignalHealthMonitor
 
 class TestServer(unittest.TestCase):
     def setUp(self):
-        # Reset globals
-        server.latest_ocr_log = []
-        server.latest_screen_base64 = ""
+        # Reset state of the default target; its scans and OCR logs go to a temporary directory
+        self.target = server.registry.get()
+        self.logs = tempfile.TemporaryDirectory()
+        self.addCleanup(self.logs.cleanup)
+        self.target.logs_dir = self.logs.name
+        self.target.harvester = DataHarvester(self.logs.name)
+        self.target.ocr_log = []
+        self.target.latest_screen_base64 = ""
 
         # Mock the helper objects
         self.mock_capture = MagicMock()
         self.mock_injector = MagicMock()
+        self.mock_injector.layout.code = "DE"
         self.mock_pipeline = MagicMock()
 
-        server.capture = self.mock_capture
-        server.injector = self.mock_injector
-        server.pipeline = self.mock_pipeline
+        self.target.capture = self.mock_capture
+        self.target.injector = self.mock_injector
+        self.target.pipeline = self.mock_pipeline
 
         # Setup returns
         import numpy as np
-        self.mock_capture.capture_frame.return_value = np.zeros((10,10,3))
+        # Console-like frame: a few lines of bright "text" on black
+        console = np.zeros((120, 160, 3))
+        console[8:40:10, 8:100:3] = 200
+        self.mock_capture.capture_frame.return_value = console
+        self.target.screen_state = ScreenStateClassifier()
+        self.target.health = SignalHealthMonitor(self.target.name, self.target.scheduler.grab_frame)
+        self.target.layout_ready.set()
         self.mock_pipeline.encode_image.return_value = "base64data"
-        self.mock_pipeline.extract_text.return_value = "C:\\Windows\\system32>"
+        self.mock_pipeline.read_text.return_value = "C:\\Windows\\system32>"
 
     def test_tool_capture_screen_ocr(self):
         # Call implementation directly to bypass FastMCP decorators
         result = server.capture_screen_impl(mode="ocr_text")
         self.assertEqual(result, "C:\\Windows\\system32>")
-        self.assertIn("C:\\Windows\\system32>", server.latest_ocr_log[0])
-        self.assertEqual(server.latest_screen_base64, "base64data")
+        self.assertIn("C:\\Windows\\system32>", self.target.ocr_log[0])
+        self.assertEqual(self.target.latest_screen_base64, "base64data")
 
     def test_tool_inject_keystrokes(self):
         # We need to make sure verify logic passes.
         # It waits for OCR to contain text.
-        self.mock_pipeline.extract_text.return_value = "echo hello"
+        self.mock_pipeline.read_text.return_value = "echo hello"
 
         res = server.inject_keystrokes_impl("echo hello", verify=True)
         self.assertIn("Successfully typed", res)
         self.mock_injector.type_text.assert_called()
 
+    def test_unclassifiable_frames_fall_back(self):
+        # Capture backends returning no image array skip the screen-state checks
+        self.mock_capture.capture_frame.return_value = "DUMMY_FRAME"
+        self.mock_pipeline.read_text.return_value = "echo hello"
+        self.assertIn("Successfully typed and verified", server.inject_keystrokes_impl("echo hello", verify=True))
+
+        self.target.harvester = MagicMock()
+        self.target.harvester.parse_directory_listing.return_value = {"files": [{"name": "a.txt"}]}
+        with patch.object(server, 'SCAN_OUTPUT_WAIT', 0.05):
+            start = time.monotonic()
+            res = server.scan_directory_impl("C:\\")
+        self.assertIn("Found 1 files", res)
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)  # Fixed wait instead of settling
+
     def test_tool_inject_keystrokes_no_verify(self):
         res = server.inject_keystrokes_impl("echo hello", verify=False)
         self.assertIn("Successfully typed", res)
@@ -58,12 +89,298 @@ class TestServer(unittest.TestCase):
         self.assertIn("Executed shortcut", res)
         self.mock_injector.press_sequence.assert_called_with(['CTRL', 'ALT'], 'DELETE')
 
+    def test_run_macro(self):
+        res = json.loads(server.run_macro_impl([
+            {"type": "cd \\"},
+            {"key": "ENTER"},
+            {"wait_for_text": "system32>", "timeout": 1},
+            {"extract": "([A-Z]):", "save_as": "drive"},
+        ]))
+        self.assertTrue(res["ok"], res)
+        self.assertEqual(res["variables"]["drive"], "C")
+        self.mock_injector.press_sequence.assert_called_with([], "ENTER")
+
+        self.assertIn("Error running macro", server.run_macro_impl([{"click": [1, 2]}]))
+        self.mock_capture.capture_frame.side_effect = RuntimeError("Failed to grab frame")
+        self.target.health.sample()  # Signal lost: OCR steps fail fast
+        res = json.loads(server.run_macro_impl([{"wait_for_text": "C:"}]))
+        self.assertIn("Video signal degraded", res["error"])
+
+    def test_record_session(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "s.zip")
+            self.assertEqual(json.loads(server.record_session_impl("start", path))["recording"], path)
+            self.assertIn("Already recording", server.record_session_impl("start"))
+            self.target.scheduler.grab_frame()
+            stats = json.loads(server.record_session_impl("stop"))
+            self.assertIs(self.target.capture, self.mock_capture)
+            self.assertEqual(stats["frames"], 1)
+            self.assertTrue(os.path.exists(path))
+            self.assertIn("No recording running", server.record_session_impl("stop"))
+
     def test_resources(self):
-        server.latest_screen_base64 = "test_img"
+        self.target.latest_screen_base64 = "test_img"
         self.assertEqual(server.get_latest_screen_impl(), "test_img")
 
-        server.latest_ocr_log = ["log1", "log2"]
+        self.target.ocr_log = ["log1", "log2"]
         self.assertIn("log1\nlog2", server.get_ocr_logs_impl())
 
+    def test_async_scan_directory(self):
+        self.mock_pipeline.read_text.return_value = "01/01/2023  12:00 PM                10 file1.txt"
+        self.target.harvester = MagicMock()
+        self.target.harvester.parse_directory_listing.return_value = {"files": [{"name": "file1.txt"}]}
+        self.target.harvester.save_scan.return_value = "logs/scan.json"
+
+        with patch.object(server, 'SCAN_OUTPUT_WAIT', 0):
+            res = asyncio.run(server.scan_directory_async("C:\\"))
+        self.assertIn("Found 1 files", res)
+        self.mock_injector.type_text.assert_called()
+
+    def test_scan_holds_hid_lane(self):
+        # Typing, waiting and capturing run as one HID sequence, also on the sync path
+        threads = []
+        self.mock_injector.type_text.side_effect = lambda *a, **kw: threads.append(threading.current_thread().name)
+        self.mock_pipeline.read_text.side_effect = lambda *a: threads.append(threading.current_thread().name) or ""
+        self.target.harvester = MagicMock()
+        self.target.harvester.parse_directory_listing.return_value = {"files": []}
+        with patch.object(server, 'SCAN_OUTPUT_WAIT', 0):
+            server.scan_directory_impl("C:\\")
+            asyncio.run(server.scan_directory_async("C:\\"))
+        self.assertEqual(set(threads), {"hid-scheduler"})
+        self.assertEqual(len(threads), 4)
+
+    def test_resources_not_blocked_by_running_tool(self):
+        # A slow HID job must not delay resource reads on the event loop
+        self.mock_injector.type_text.side_effect = lambda *a, **kw: time.sleep(0.5)
+        self.target.ocr_log = ["log1"]
+
+        async def scenario():
+            job = asyncio.ensure_future(server.inject_keystrokes_async("slow", verify=False))
+            await asyncio.sleep(0.05)
+            start = time.perf_counter()
+            logs = await server.get_ocr_logs()
+            elapsed = time.perf_counter() - start
+            await job
+            return logs, elapsed, job.result()
+
+        logs, elapsed, result = asyncio.run(scenario())
+        self.assertEqual(logs, "log1")
+        self.assertLess(elapsed, 0.1)
+        self.assertIn("Successfully typed", result)
+
+    def test_auto_region_ocrs_text_blocks_only(self):
+        import numpy as np
+        self.mock_capture.capture_frame.return_value = np.zeros((480, 640, 3))
+        self.mock_pipeline.propose_regions.return_value = [
+            {"id": 0, "kind": "text", "x": 16, "y": 16, "width": 300, "height": 56, "score": 0.2},
+            {"id": 1, "kind": "dialog", "x": 296, "y": 200, "width": 304, "height": 200, "score": 1.0},
+        ]
+        self.mock_pipeline.read_text.return_value = "C:\\>"
+
+        res = server.capture_screen_impl(mode="ocr_text", region="auto")
+        self.assertEqual(res, "C:\\>")
+        self.assertEqual(self.mock_pipeline.read_text.call_args[0][1], [12, 12, 308, 64])
+
+    def test_get_screen_regions(self):
+        import json, numpy as np
+        self.mock_capture.capture_frame.return_value = np.zeros((480, 640, 3))
+        self.mock_pipeline.propose_regions.return_value = [{"id": 0, "kind": "text"}]
+        res = json.loads(server.get_screen_regions_impl())
+        self.assertEqual(res["width"], 640)
+        self.assertEqual(res["regions"][0]["kind"], "text")
+
+    def test_ocr_data_and_find_text(self):
+        import json
+        from vision import OCRResult
+        result = OCRResult([{"text": "dir", "x": 5, "y": 7, "width": 30, "height": 12, "conf": 90.0, "line": 0}],
+                           [{"text": "dir", "x": 5, "y": 7, "width": 30, "height": 12, "conf": 90.0}])
+        self.mock_pipeline.recognize.return_value = result
+
+        data = json.loads(server.capture_screen_impl(mode="ocr_data"))
+        self.assertEqual(data["words"][0]["x"], 5)
+        self.assertIn("dir", self.target.ocr_log[0])
+
+        matches = json.loads(server.find_text_impl("DIR"))
+        self.assertEqual(matches[0]["width"], 30)
+
+    def test_find_on_screen_searches_candidate_regions(self):
+        import json
+        self.mock_pipeline.propose_regions.return_value = [
+            {"id": 0, "kind": "dialog", "x": 100, "y": 50, "width": 200, "height": 80, "score": 1.0}]
+        library = MagicMock()
+        library.find_timed.return_value = {"hits": [{"template": "uac_prompt", "x": 104, "y": 52}], "elapsed_ms": 3.0}
+        with patch.object(server, 'template_library', library):
+            res = json.loads(server.find_on_screen_impl(["uac_prompt"]))
+        self.assertEqual(res["hits"][0]["template"], "uac_prompt")
+        self.assertEqual(library.find_timed.call_args[1]["regions"], [[84, 34, 232, 112]])
+
+    def test_get_screen_state(self):
+        import json
+        res = json.loads(server.get_screen_state_impl())
+        self.assertEqual(res["state"], "idle_prompt")
+        self.assertEqual(res["observations"], 2)  # first poll grabs a second frame
+
+    def test_verify_refuses_dead_screen(self):
+        import numpy as np
+        self.mock_capture.capture_frame.return_value = np.zeros((120, 160, 3))
+        res = server.inject_keystrokes_impl("secret", verify=True)
+        self.assertIn("no_signal", res)
+        self.mock_injector.type_text.assert_not_called()
+
+    def test_degraded_signal_skips_ocr(self):
+        self.target.health.observe(None, error="Failed to grab frame")
+        res = server.capture_screen_impl(mode="ocr_text")
+        self.assertIn("no_signal", res)
+        self.mock_pipeline.read_text.assert_not_called()
+
+    def test_metrics(self):
+        server.capture_screen_impl(mode="ocr_text")
+        metrics = json.loads(server.get_metrics_impl())
+        stages = {h["labels"]["stage"]: h for h in metrics["histograms"]["vhb_stage_seconds"]}
+        self.assertGreaterEqual(stages["tool.capture_screen"]["count"], 1)
+        self.assertIn("capture", stages)
+        self.assertEqual(metrics["histograms"]["vhb_frame_age_seconds"][0]["labels"], {"target": self.target.name})
+        gauges = {g["labels"]["target"]: g["value"] for g in metrics["gauges"]["vhb_hid_queue_depth"]}
+        self.assertEqual(gauges[self.target.name], 0)
+        text = server.get_metrics_impl(format="prometheus")
+        self.assertIn('vhb_stage_seconds_bucket{stage="tool.capture_screen",le="+Inf"}', text)
+        self.assertIn("# TYPE vhb_hid_queue_depth gauge", text)
+
+    def test_internal_captures_are_not_tool_calls(self):
+        # Scans and layout probes read the screen without counting as capture_screen calls
+        server.METRICS.reset()
+        self.target.harvester = MagicMock()
+        self.target.harvester.parse_directory_listing.return_value = {"files": []}
+        with patch.object(server, 'SCAN_OUTPUT_WAIT', 0):
+            server.scan_directory_impl("C:\\")
+        detector = self.target.__dict__.pop("layout_detector", None)
+        try:
+            self.assertEqual(self.target.layout_detector.capture_func(mode="ocr_text"), "C:\\Windows\\system32>")
+        finally:
+            if detector is not None:
+                self.target.layout_detector = detector
+        stages = {h["labels"]["stage"]: h["count"] for h in server.METRICS.snapshot()["histograms"]["vhb_stage_seconds"]}
+        self.assertEqual(stages["tool.scan_directory"], 1)
+        self.assertNotIn("tool.capture_screen", stages)
+
+    def test_vlm_stats_do_not_create_client(self):
+        with patch.object(server, "_vlm", None):
+            self.assertEqual(json.loads(server.get_vlm_stats_impl()), {})
+            self.assertNotIn("vhb_vlm_queued", json.loads(server.get_metrics_impl())["gauges"])
+            self.assertIsNone(server._vlm)
+        client = MagicMock()
+        client.stats.return_value = {"requests": 2, "queued": 0, "in_flight": 1, "cache_entries": 1}
+        with patch.object(server, "_vlm", client):
+            self.assertEqual(json.loads(server.get_vlm_stats_impl())["requests"], 2)
+
+    def test_state_usage(self):
+        server.capture_screen_impl(mode="raw_base64")
+        usage = json.loads(server.get_state_usage_impl())
+        self.assertEqual(list(usage["targets"]), [self.target.name])
+        self.assertEqual(usage["targets"][self.target.name]["screen_bytes"], len("base64data"))
+        self.assertGreaterEqual(usage["screen_cache"]["bytes"], len("base64data"))
+
+    def test_profiling_hooks(self):
+        from profiling import SlowCallCapture
+        logs_dir = self.target.logs_dir
+        with tempfile.TemporaryDirectory() as tmp:
+            self.target.logs_dir = tmp
+            try:
+                with patch.object(server, "slow_calls", SlowCallCapture(threshold_ms=0)):
+                    server.capture_screen_impl(mode="ocr_text", target=self.target.name)
+                profile = json.loads(server.profile_server_impl(seconds=0.05, interval_ms=1))
+            finally:
+                self.target.logs_dir = logs_dir
+            (call,) = os.listdir(os.path.join(tmp, "slow_calls"))
+            with open(os.path.join(tmp, "slow_calls", call, "call.json")) as f:
+                record = json.load(f)
+            self.assertEqual(record["args"], {"mode": "ocr_text", "target": self.target.name})
+            self.assertIn("tool.capture_screen", [s["stage"] for s in record["stages"]])
+            self.assertIn("frame", record["artifacts"])
+            self.assertTrue(os.path.exists(profile["path"]))
+            self.assertGreater(profile["samples"], 0)
+        self.assertIn("Error", server.profile_server_impl(seconds=0))
+        self.assertIn("Error", asyncio.run(server.profile_server_async(seconds=0)))
+        with server._profile_slot(1.0, 5.0, False):  # Both variants share the single profile slot
+            self.assertIn("already running", server.profile_server_impl(seconds=0.01))
+            self.assertIn("already running", asyncio.run(server.profile_server_async(seconds=0.01)))
+
+        # Every tool is timed and captured the same way, except the profiler itself
+        tools = [tool.name for tool in asyncio.run(server.mcp.list_tools())]
+        untimed = [name for name in tools if not hasattr(getattr(server, f"{name}_impl"), "__wrapped__")]
+        self.assertEqual(untimed, ["profile_server"])
+
+    def test_benchmark_capture(self):
+        best = {"fourcc": "MJPG", "width": 1920, "height": 1080, "fps": 30.0}
+        seen = []
+
+        def fake_negotiate(device_id, factory, frames, min_height):
+            # Other readers see a busy device while the benchmark owns it
+            seen.append(server.capture_screen_impl(mode="ocr_text"))
+            return {"device": "video0", "results": [], "best": best}
+
+        with patch.object(server, "negotiate", side_effect=fake_negotiate):
+            res = json.loads(server.benchmark_capture_impl(frames=5))
+        self.assertEqual(res["best"], best)
+        self.assertIn("busy", seen[0])
+        self.mock_capture.release.assert_called_once()
+        self.assertEqual(self.target.capture.mode.to_dict(), best)
+
+    def test_layout_detection_runs_in_background(self):
+        release = threading.Event()
+        lanes = []
+        detector = MagicMock()
+        detector.detect.side_effect = lambda: lanes.append(threading.current_thread().name) or release.wait(5) and "US"
+        detector.last_result = {"scores": {"US": 1.0, "UK": 0.7}}
+        self.target.layout_detector = detector
+
+        started = time.perf_counter()
+        futures = server.start_layout_detection()
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertEqual(self.target.describe()["layout_detection"], {"state": "detecting"})
+
+        # Capture tools answer at once; HID tools wait for the detection
+        self.assertEqual(server.capture_screen_impl(mode="ocr_text"), "C:\\Windows\\system32>")
+        with patch.object(server, "LAYOUT_WAIT", 0.05):
+            self.assertIn("layout detection still running", server.execute_shortcut_impl(["CTRL"], "C"))
+        self.mock_injector.press_sequence.assert_not_called()
+
+        release.set()
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual(lanes, ["hid-scheduler"])  # The probe types on the HID lane, not beside it
+        detector.apply_layout.assert_called_with("US")
+        self.assertEqual(self.target.layout_status,
+                         {"state": "done", "layout": "US", "scores": {"US": 1.0, "UK": 0.7}})
+        self.assertIn("Executed shortcut", server.execute_shortcut_impl(["CTRL"], "C"))
+
+    def test_import_defers_heavy_dependencies(self):
+        # A fresh interpreter: importing the server loads neither OpenCV, Tesseract nor a layout file
+        probe = ("import sys, server, hid; "
+                 "print(sorted(set(sys.modules) & {'cv2', 'pytesseract', 'requests'}), "
+                 "hid.compile_layout.cache_info().currsize)")
+        src = os.path.abspath(os.path.join(os.path.dirname(__file__), '../src'))
+        result = subprocess.run([sys.executable, "-c", probe], cwd=src, capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.stdout.strip(), "[] 0", result.stderr)
+
+    def test_unknown_target(self):
+        res = server.capture_screen_impl(mode="ocr_text", target="nope")
+        self.assertIn("Unknown target 'nope'", res)
+
+    def test_multiple_targets(self):
+        other = MagicMock()
+        other.name = "rack-b"
+        other.pipeline.read_text.return_value = "D:\\>"
+        other.scheduler.grab_frame.return_value = "frame"
+        other.describe.return_value = {"name": "rack-b"}
+        other.health.degraded.return_value = []
+        server.registry._targets["rack-b"] = other
+        try:
+            self.assertEqual(server.capture_screen_impl(mode="ocr_text", target="rack-b"), "D:\\>")
+            self.assertEqual(server.capture_screen_impl(mode="ocr_text"), "C:\\Windows\\system32>")
+            self.assertIn("rack-b", server.list_targets_impl())
+        finally:
+            del server.registry._targets["rack-b"]
+
 if __name__ == '__main__':
     unittest.main()
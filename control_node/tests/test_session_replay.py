@@ -0,0 +1,102 @@
+import unittest
+from unittest.mock import MagicMock
+import os
+import sys
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from session_replay import (SessionRecorder, SessionReader, RecordingCapture, ReplaySession,
+                            benchmark_session, compare_texts)
+from hid import KeyInjector, USLayout
+from targets import Target
+
+class FakeConsole:
+    """Capture stand-in: a console frame that gains one "glyph" per typed character."""
+    def __init__(self):
+        self.frame = np.zeros((60, 80, 3), dtype=np.uint8)
+        self.chars = 0
+
+    def type(self, modifiers, key_code):
+        if key_code:
+            self.frame[10:20, 4 + 6 * self.chars:8 + 6 * self.chars] = 200
+            self.chars += 1
+
+    def capture_frame(self):
+        return self.frame.copy()
+
+class TestSessionReplay(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "session.zip")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def record(self, keyframe_interval=50):
+        """Records: two idle frames, then 'ab' typed with a frame after each key."""
+        console = FakeConsole()
+        recorder = SessionRecorder(self.path, target="rack-a", layout="US", keyframe_interval=keyframe_interval)
+        capture = RecordingCapture(console, recorder)
+        injector = KeyInjector(device_path="/tmp/none_hidg0", layout=USLayout())
+        injector.add_listener(recorder.record_report)
+        injector.add_listener(console.type)
+        expected = [capture.capture_frame(), capture.capture_frame()]
+        for char in "ab":
+            injector.press_key(char)
+            expected.append(capture.capture_frame())
+        return recorder.close(), expected
+
+    def test_record_and_decode(self):
+        stats, expected = self.record(keyframe_interval=2)
+        self.assertEqual((stats["frames"], stats["reports"], stats["dropped_frames"]), (4, 4, 0))
+        self.assertEqual(stats["distinct_frames"], 3)  # The second idle frame is stored as "same"
+
+        reader = SessionReader(self.path)
+        self.assertEqual(reader.meta["layout"], "US")
+        self.assertEqual(reader.reports, [(0, 0x04), (0, 0), (0, 0x05), (0, 0)])
+        self.assertEqual([f["reports"] for f in reader.frames], [0, 0, 2, 4])
+        for index in (3, 0, 1, 2, 3, 1):  # Random and sequential access
+            np.testing.assert_array_equal(reader.frame(index), expected[index])
+        self.assertEqual([i for i, _ in reader.distinct_frames()], [0, 2, 3])
+
+    def test_deterministic_replay_waits_for_keystrokes(self):
+        _, expected = self.record()
+        session = ReplaySession(self.path, speed=0)
+        self.assertIsInstance(session.injector.layout, USLayout)
+        for index in (0, 1, 1):  # Frame 2 needs the first keystroke
+            np.testing.assert_array_equal(session.capture.capture_frame(), expected[index])
+        session.injector.press_key("a")
+        np.testing.assert_array_equal(session.capture.capture_frame(), expected[2])
+        session.injector.press_key("x")  # Differs from the recorded 'b'
+        np.testing.assert_array_equal(session.capture.capture_frame(), expected[3])
+        self.assertTrue(session.finished())
+        self.assertEqual(session.injector.diverged_at, 2)
+
+    def test_timed_replay(self):
+        _, expected = self.record()
+        session = ReplaySession(self.path, speed=1e6, sync_hid=False)
+        session.capture.capture_frame()
+        np.testing.assert_array_equal(session.capture.capture_frame(), expected[-1])
+
+    def test_benchmark_and_baseline(self):
+        self.record()
+        pipeline = MagicMock()
+        pipeline.read_text.side_effect = ["C:\\>", "C:\\>a", "C:\\>ab"]
+        result = benchmark_session(SessionReader(self.path), pipeline)
+        self.assertEqual((result["frames"], result["distinct_frames"]), (4, 3))
+        self.assertEqual(result["texts"], {"0": "C:\\>", "2": "C:\\>a", "3": "C:\\>ab"})
+        self.assertIsNotNone(result["ocr_ms"]["p95"])
+        self.assertEqual(compare_texts(result["texts"], dict(result["texts"], **{"2": "C:\\>q"})), ["2"])
+
+    def test_target_from_replay_config(self):
+        _, expected = self.record()
+        target = Target.from_dict({"name": "lab", "layout": "US", "logs_dir": self.tmp.name,
+                                   "replay": {"path": self.path, "speed": 0}})
+        self.assertIs(target.injector, target.replay.injector)
+        np.testing.assert_array_equal(target.scheduler.grab_frame(), expected[0])
+        self.assertEqual(target.describe()["replay"], self.path)
+
+if __name__ == '__main__':
+    unittest.main()
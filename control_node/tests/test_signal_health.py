@@ -0,0 +1,96 @@
+import unittest
+from unittest.mock import MagicMock
+import sys
+import os
+import time
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from signal_health import SignalHealthMonitor, chroma_sharpness
+from screen_state import ScreenStateClassifier
+
+class TestSignalHealth(unittest.TestCase):
+    def setUp(self):
+        self.frame = np.zeros((240, 320, 3), dtype=np.uint8)
+        self.frame[20:200:12, 10:300:3] = 200  # console text
+        self.events = []
+        self.monitor = SignalHealthMonitor("rack-a", MagicMock(return_value=self.frame))
+        self.monitor.add_listener(self.events.append)
+
+    def kinds(self):
+        return [e["kind"] for e in self.events]
+
+    def test_healthy_frame(self):
+        stats = self.monitor.observe(self.frame, decode_ms=20.0, timestamp=0.0)
+        self.assertTrue(stats["signal"])
+        self.assertEqual(stats["width"], 320)
+        self.assertEqual(self.monitor.degraded(), [])
+        self.assertEqual(self.events, [])
+
+    def test_black_screen_and_recovery(self):
+        self.monitor.observe(np.zeros((240, 320, 3), dtype=np.uint8), timestamp=0.0)
+        self.assertEqual(self.monitor.degraded(), ["black_screen"])
+        self.monitor.observe(self.frame, timestamp=1.0)
+        self.assertEqual(self.kinds(), ["black_screen", "recovered"])
+        self.assertEqual(self.monitor.degraded(), [])
+
+    def test_black_console_with_prompt_is_healthy(self):
+        # A 1080p CMD window showing only its prompt: near-black mean, tiny spread
+        console = np.zeros((1080, 1920, 3), dtype=np.uint8)
+        for i in range(15):  # 'C:\\Users\\Admin>' as thin glyph strokes
+            console[12:28, 10 + 11 * i] = 192
+            console[12, 10 + 11 * i:16 + 11 * i] = 192
+        stats = self.monitor.observe(console, timestamp=0.0)
+        self.assertLess(stats["mean_luma"], 8)
+        self.assertEqual(self.monitor.degraded(), [])
+        self.assertEqual(ScreenStateClassifier().update(console)["state"], "idle_prompt")
+
+    def test_no_signal_from_failed_grab(self):
+        self.monitor.frame_source.side_effect = RuntimeError("Failed to grab frame")
+        stats = self.monitor.sample()
+        self.assertFalse(stats["signal"])
+        self.assertEqual(self.monitor.degraded(), ["no_signal"])
+
+    def test_frozen_after_identical_frames(self):
+        for t in range(0, 12, 2):
+            self.monitor.observe(self.frame, timestamp=float(t))
+        self.assertEqual(self.monitor.report()["conditions"], ["frozen"])
+        self.assertEqual(self.monitor.degraded(), [])  # Reported, but a static screen may be legit
+        noisy = self.frame.copy()
+        noisy[0, 0] = 1
+        self.monitor.observe(noisy, timestamp=12.0)
+        self.assertEqual(self.kinds(), ["frozen", "recovered"])
+
+    def test_resolution_change_event(self):
+        self.monitor.observe(self.frame, timestamp=0.0)
+        self.monitor.observe(np.tile(self.frame, (2, 2, 1)), timestamp=1.0)
+        self.assertEqual(self.kinds(), ["resolution_change"])
+
+    def test_low_fps_and_slow_decode(self):
+        monitor = SignalHealthMonitor("rack-a", MagicMock(), fps_source=lambda: 5.0)
+        monitor.observe(self.frame, decode_ms=400.0, timestamp=0.0)
+        self.assertEqual(monitor.report()["conditions"], ["low_fps", "slow_decode"])
+        self.assertEqual(monitor.degraded(), [])  # Degraded, but OCR still works
+
+    def test_chroma_smear(self):
+        rng = np.random.default_rng(0)
+        colorful = np.zeros((256, 256, 3), dtype=np.uint8)
+        colorful[:, :, 2] = rng.integers(0, 2, (256, 256)) * 255  # red pixel noise
+        self.assertGreater(chroma_sharpness(colorful), 0.8)
+
+        smeared = colorful.copy()
+        smeared[:, 1::2] = smeared[:, 0::2]  # pixel pairs share their color
+        self.assertLess(chroma_sharpness(smeared), 0.1)
+        self.assertIsNone(chroma_sharpness(self.frame))  # gray text: nothing to judge
+
+    def test_monitor_thread(self):
+        self.monitor.interval = 0.01
+        self.monitor.start()
+        time.sleep(0.1)
+        self.monitor.stop()
+        self.assertGreater(self.monitor.frame_source.call_count, 1)
+        self.assertTrue(self.monitor.report()["stats"]["signal"])
+
+if __name__ == '__main__':
+    unittest.main()
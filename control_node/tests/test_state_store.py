@@ -0,0 +1,72 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import state_store
+from state_store import LRUCache, RingLog, StateStore, sizeof
+
+class TestStateStore(unittest.TestCase):
+    def test_ring_log(self):
+        log = RingLog(3)
+        for i in range(5):
+            log.append(f"line {i}")
+        self.assertEqual(log.lines(), ["line 2", "line 3", "line 4"])
+        self.assertEqual((log.dropped, log.nbytes()), (2, 18))
+        log.replace(["a", "b", "c", "d"])
+        self.assertEqual(list(log), ["b", "c", "d"])
+
+    def test_lru_byte_budget(self):
+        cache = LRUCache("test", max_bytes=10)
+        cache.put("a", "aaaa")
+        cache.put("b", "bbbb")
+        self.assertEqual(cache.get("a"), "aaaa")  # 'b' is now the least recently used
+        cache.put("c", "cccc")
+        self.assertNotIn("b", cache)
+        self.assertEqual((cache.nbytes, cache.evictions), (8, 1))
+        self.assertFalse(cache.put("big", "x" * 11))
+        self.assertEqual(sizeof(np.zeros((4, 4), dtype=np.uint8)), 16)
+
+        with patch("state_store.time.monotonic", return_value=0.0):
+            expiring = LRUCache("test", max_bytes=10, ttl=5.0)
+            expiring.put("a", "a")
+        with patch("state_store.time.monotonic", return_value=6.0):
+            self.assertIsNone(expiring.peek("a"))
+        self.assertEqual(len(expiring), 0)
+
+    def test_screen_encoding_reuse_and_eviction(self):
+        store = StateStore(ocr_log_lines=2, screen_cache_bytes=10)
+        a, b = store.open("a"), store.open("b")
+        encode = MagicMock(return_value="123456")
+        frame = np.zeros((2, 2), dtype=np.uint8)
+        self.assertEqual(a.encode_screen(frame, encode), "123456")
+        self.assertEqual(a.encode_screen(frame, encode), "123456")
+        self.assertEqual(encode.call_count, 1)
+        b.encode_screen(np.ones((2, 2), dtype=np.uint8), encode)  # Evicts the screen of 'a'
+        self.assertEqual((a.latest_screen(), b.latest_screen()), ("", "123456"))
+        a.ocr_log.append("x")
+        usage = store.usage()
+        self.assertEqual(usage["targets"]["a"]["ocr_log_lines"], 1)
+        self.assertEqual(usage["state_bytes"], 7)
+
+    def test_memory_budget(self):
+        store = StateStore(screen_cache_bytes=100)
+        a, b = store.open("a"), store.open("b")
+        a.set_latest_screen("abc")
+        store.memory_budget_bytes = 1  # Any process exceeds one byte
+        b.set_latest_screen("def")
+        # The screen that triggered the check survives; other targets lose theirs
+        self.assertEqual((a.latest_screen(), b.latest_screen()), ("", "def"))
+        self.assertEqual(store.screens.evictions, 1)
+        b.set_latest_screen("ghi")  # Still over budget, the newest screen is still served
+        self.assertEqual(b.latest_screen(), "ghi")
+        with patch("state_store.process_memory", return_value=None):
+            self.assertFalse(store.enforce())
+        self.assertFalse(StateStore().enforce())
+        self.assertIsInstance(state_store.process_memory(), int)
+
+if __name__ == '__main__':
+    unittest.main()
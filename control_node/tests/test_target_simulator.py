@@ -0,0 +1,89 @@
+import unittest
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from target_simulator import TerminalSimulator, SimulatedCapture
+from hid import KeyInjector, LAYOUTS
+from data_harvester import DataHarvester
+from targets import Target
+
+class TestTargetSimulator(unittest.TestCase):
+    def setUp(self):
+        self.sim = TerminalSimulator(width=640, height=360, key_latency=0.0, command_latency=0.0)
+        self.logs = tempfile.TemporaryDirectory()
+        self.addCleanup(self.logs.cleanup)
+
+    def type(self, text, layout="US", unicode_input="windows_alt"):
+        """Feeds the reports a KeyInjector would send for `text` straight into the simulator."""
+        injector = KeyInjector(device_path="/tmp/none_hidg0", layout=LAYOUTS[layout](), unicode_input=unicode_input)
+        for reports in injector.compile_text(text):
+            for modifiers, key_code in reports:
+                self.sim.feed_report(bytes([modifiers, 0, key_code, 0, 0, 0, 0, 0]))
+
+    def test_commands(self):
+        self.type("echo hello world\nfoo\ncd Documents\n")
+        lines = self.sim.screen_lines()
+        self.assertIn("hello world", lines)
+        self.assertIn("'foo' is not recognized as an internal or external command,", lines)
+        self.assertEqual(lines[-1], "C:\\Users\\sim\\Documents>")
+        self.assertEqual(self.sim.stats()["commands"], 3)
+
+    def test_dir_output_parses(self):
+        self.type("dir\n")
+        listing = DataHarvester(self.logs.name).parse_directory_listing("\n".join(self.sim.screen_lines()))
+        self.assertEqual([d["name"] for d in listing["directories"]], ["Documents"])
+        self.assertEqual({f["name"]: f["size"] for f in listing["files"]},
+                         {"config with spaces.json": 16, "notes.txt": 24})
+
+    def test_line_editing_dead_keys_and_alt_codes(self):
+        self.sim = TerminalSimulator(width=640, height=360, layout="DE", key_latency=0.0, command_latency=0.0)
+        self.type("echo abc\bê€", layout="DE")
+        self.assertEqual(self.sim.screen_lines()[-1], "C:\\Users\\sim>echo abê€")
+        self.type("✓", layout="DE", unicode_input="windows_hex")
+        self.assertTrue(self.sim.screen_lines()[-1].endswith("€✓"))
+
+    def test_latency_and_type_ahead(self):
+        sim = TerminalSimulator(width=640, height=360, key_latency=0.05, command_latency=0.2)
+        start = time.monotonic()
+        for code in (0x1B, 0x28, 0x04):  # 'x', Enter, 'a' typed during the command
+            sim.feed_report(bytes([0, 0, code, 0, 0, 0, 0, 0]), timestamp=start)
+            sim.feed_report(bytes(8), timestamp=start)
+        self.assertEqual(sim.screen_lines(start)[-1], "C:\\Users\\sim>")
+        self.assertEqual(sim.screen_lines(start + 0.1)[-1], "C:\\Users\\sim>x")  # Command still running
+        self.assertEqual(sim.screen_lines(start + 0.3)[-1], "C:\\Users\\sim>a")
+
+    def test_render_and_scroll(self):
+        frame = self.sim.render(now=0.0)
+        self.assertEqual(frame.shape, (360, 640, 3))
+        self.assertGreater(int(frame.max()), 100)
+        self.assertFalse(np.array_equal(frame, self.sim.render(now=0.6)))  # Cursor blink
+        self.type("echo " + "x" * 200 + "\n" + "echo line\n" * 40)
+        lines = self.sim.screen_lines()
+        self.assertEqual(len(lines), self.sim.rows)
+        self.assertTrue(all(len(line) <= self.sim.cols for line in lines))
+
+    def test_target_end_to_end(self):
+        target = Target.from_dict({"name": "sim", "layout": "US", "logs_dir": self.logs.name,
+                                   "simulator": {"width": 640, "height": 360, "fps": 50,
+                                                 "key_latency": 0.0, "command_latency": 0.0}})
+        try:
+            self.assertIsInstance(target.capture, SimulatedCapture)
+            self.assertFalse(target.injector.simulation_mode)
+            target.injector.type_text("echo ok\n", delay_mean=0.001, delay_std=0.0)
+            deadline = time.monotonic() + 2.0
+            while "ok" not in target.simulator.screen_lines() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertIn("ok", target.simulator.screen_lines())
+            self.assertEqual(target.scheduler.grab_frame().shape, (360, 640, 3))
+            self.assertEqual(target.describe()["simulator"]["fps"], 50)
+        finally:
+            target.simulator.stop()
+        self.assertFalse(os.path.exists(target.hid_path))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import tempfile
+import json
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from targets import Target, TargetRegistry
+from hid import USLayout, GermanISO
+
+class TestTargets(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.config = {
+            "default": "rack-b",
+            "targets": [
+                {"name": "rack-a", "device_id": 0, "hid_path": "/tmp/none_hidg0", "layout": "DE",
+                 "logs_dir": os.path.join(self.tmp.name, "a")},
+                {"name": "rack-b", "device_id": 2, "hid_path": "/tmp/none_hidg1", "layout": "US",
+                 "logs_dir": os.path.join(self.tmp.name, "b")},
+            ],
+        }
+        self.path = os.path.join(self.tmp.name, "targets.json")
+        with open(self.path, 'w') as f:
+            json.dump(self.config, f)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_from_config(self):
+        registry = TargetRegistry.from_config(self.path)
+        self.assertEqual(registry.names(), ["rack-a", "rack-b"])
+        self.assertEqual(registry.get().name, "rack-b")
+
+        a, b = registry.get("rack-a"), registry.get("rack-b")
+        self.assertIsInstance(a.injector.layout, GermanISO)
+        self.assertIsInstance(b.injector.layout, USLayout)
+        self.assertEqual(b.capture.device_id, 2)
+        self.assertEqual(b.describe()["layout"], "US")
+        self.assertTrue(os.path.isdir(b.harvester.logs_dir))
+        # Each target has its own scheduler and state
+        self.assertIsNot(a.scheduler, b.scheduler)
+        a.append_ocr_log("only a")
+        self.assertEqual(b.ocr_log, [])
+
+    def test_components_created_on_first_use(self):
+        target = Target("lazy", hid_path="/tmp/none_hidg9", logs_dir=os.path.join(self.tmp.name, "lazy"))
+        self.assertNotIn("injector", target.__dict__)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "lazy")))
+
+        self.assertIs(target.injector, target.injector)
+        self.assertTrue(os.path.isdir(target.harvester.logs_dir))
+        target.pipeline = "replaced"
+        self.assertEqual(target.pipeline, "replaced")
+        with self.assertRaises(AttributeError):
+            target.missing
+
+    def test_unknown_target_and_layout(self):
+        registry = TargetRegistry.from_config(self.path)
+        with self.assertRaises(ValueError):
+            registry.get("rack-z")
+        with self.assertRaises(ValueError):
+            Target("bad", layout="XX", logs_dir=self.tmp.name)
+        with self.assertRaises(ValueError):
+            Target("bad", unicode_input="morse", logs_dir=self.tmp.name)
+
+    def test_ocr_log_is_bounded(self):
+        target = Target("t", hid_path="/tmp/none_hidg0", logs_dir=self.tmp.name)
+        for i in range(150):
+            target.append_ocr_log(f"line {i}")
+        self.assertEqual(len(target.ocr_log), 100)
+        self.assertEqual(target.ocr_log[0], "line 50")
+
+if __name__ == '__main__':
+    unittest.main()
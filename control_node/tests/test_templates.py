@@ -0,0 +1,79 @@
+import unittest
+from unittest.mock import patch
+import importlib
+import sys
+import os
+import shutil
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import templates
+from templates import TemplateLibrary
+
+def load_real_cv2():
+    """Imports the real OpenCV even if another test module replaced it with a mock."""
+    mocked = sys.modules.pop('cv2', None)
+    try:
+        return importlib.import_module('cv2')
+    except ImportError:
+        return None
+    finally:
+        if mocked is not None:
+            sys.modules['cv2'] = mocked
+
+real_cv2 = load_real_cv2()
+
+@unittest.skipIf(real_cv2 is None, "OpenCV not installed")
+class TestTemplateLibrary(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(templates, 'cv2', real_cv2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+        rng = np.random.default_rng(7)
+        self.dialog = np.full((120, 300, 3), 200, dtype=np.uint8)
+        self.dialog[10:30, 10:290] = (150, 80, 0)  # title bar
+        self.dialog[50:100, 20:280] = rng.integers(0, 2, (50, 260, 1)) * 200  # "text"
+
+        self.frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+        self.frame[:] = (90, 40, 10)
+        self.frame[300:420, 500:800] = self.dialog
+
+    def test_finds_template(self):
+        library = TemplateLibrary(self.dir)
+        library.add("error_box", self.dialog)
+        hits = library.find(self.frame)
+        self.assertEqual(len(hits), 1)
+        self.assertEqual((hits[0]["template"], hits[0]["x"], hits[0]["y"]), ("error_box", 500, 300))
+        self.assertGreater(hits[0]["score"], 0.95)
+
+    def test_finds_scaled_template_in_region(self):
+        library = TemplateLibrary(self.dir)
+        library.add("error_box", self.dialog)
+        big = real_cv2.resize(self.dialog, None, fx=1.1, fy=1.1)
+        frame = self.frame.copy()
+        frame[40:40 + big.shape[0], 60:60 + big.shape[1]] = big
+
+        hits = library.find(frame, regions=[[30, 30, 400, 200]])
+        self.assertEqual(len(hits), 1)
+        self.assertEqual((hits[0]["x"], hits[0]["y"], hits[0]["scale"]), (60, 40, 1.1))
+
+    def test_absent_template(self):
+        library = TemplateLibrary(self.dir)
+        library.add("error_box", self.dialog)
+        self.assertEqual(library.find(np.zeros((720, 1280, 3), dtype=np.uint8)), [])
+        with self.assertRaises(ValueError):
+            library.find(self.frame, names=["login"])
+
+    def test_saved_templates_reload(self):
+        TemplateLibrary(self.dir).add("error_box", self.dialog, threshold=0.9)
+        library = TemplateLibrary(self.dir)
+        self.assertEqual(library.names(), ["error_box"])
+        self.assertEqual(library.find(self.frame)[0]["x"], 500)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,217 @@
+import unittest
+from unittest.mock import patch
+import ctypes
+import errno
+import importlib
+import mmap
+import os
+import sys
+import tempfile
+import time
+from collections import deque
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import v4l2_capture as v4l2
+from capture_modes import CaptureMode, fourcc_code
+
+def load_real_cv2():
+    """Imports the real OpenCV even if another test module replaced it with a mock."""
+    mocked = sys.modules.pop('cv2', None)
+    try:
+        return importlib.import_module('cv2')
+    except ImportError:
+        return None
+    finally:
+        if mocked is not None:
+            sys.modules['cv2'] = mocked
+
+real_cv2 = load_real_cv2()
+
+
+class FakeV4L2Device:
+    """File-backed stand-in for a V4L2 capture device (buffers are regions of a temp file)."""
+    FORMATS = {"BGR3": 3, "YUYV": 2, "GREY": 1}
+
+    def __init__(self, width=64, height=48, fourcc="BGR3", stride_padding=16):
+        self.file = tempfile.TemporaryFile()
+        self.width, self.height, self.fourcc = width, height, fourcc
+        self.stride_padding = stride_padding
+        self.fps = 30.0
+        self.buffer_size = 0
+        self.count = 0
+        self.queued, self.done = deque(), deque()
+        self.sequence = 0
+        self.streaming = False
+        self.closed = False
+        self.calls = []
+
+    @property
+    def bytesperline(self):
+        return self.width * self.FORMATS[self.fourcc] + self.stride_padding
+
+    # --- KernelDevice interface ---
+
+    def open(self, path):
+        return 42
+
+    def close(self, fd):
+        self.closed = True
+
+    def wait(self, fd, timeout):
+        return bool(self.done)
+
+    def mmap(self, fd, length, offset):
+        return mmap.mmap(self.file.fileno(), length, offset=offset)
+
+    def ioctl(self, fd, request, arg):
+        self.calls.append(request)
+        if request == v4l2.VIDIOC_QUERYCAP:
+            arg.card = b"Fake HDMI"
+            arg.capabilities = v4l2.V4L2_CAP_VIDEO_CAPTURE | v4l2.V4L2_CAP_STREAMING
+        elif request == v4l2.VIDIOC_G_FMT:
+            self._fill_format(arg.fmt.pix)
+        elif request == v4l2.VIDIOC_S_FMT:
+            pix = arg.fmt.pix
+            name = "".join(chr((pix.pixelformat >> (8 * i)) & 0xFF) for i in range(4))
+            if name in self.FORMATS:
+                self.fourcc = name
+            self.width, self.height = pix.width, pix.height
+            self._fill_format(pix)
+        elif request == v4l2.VIDIOC_G_PARM:
+            arg.parm.capture.capability = v4l2.V4L2_CAP_TIMEPERFRAME
+            arg.parm.capture.timeperframe.numerator = 1000
+            arg.parm.capture.timeperframe.denominator = int(self.fps * 1000)
+        elif request == v4l2.VIDIOC_S_PARM:
+            frac = arg.parm.capture.timeperframe
+            self.fps = frac.denominator / frac.numerator
+        elif request == v4l2.VIDIOC_REQBUFS:
+            self.count = arg.count
+            granularity = mmap.ALLOCATIONGRANULARITY
+            self.buffer_size = -(-self.bytesperline * self.height // granularity) * granularity
+            self.file.truncate(self.buffer_size * max(1, self.count))
+        elif request == v4l2.VIDIOC_QUERYBUF:
+            arg.length = self.buffer_size
+            arg.m.offset = arg.index * self.buffer_size
+        elif request == v4l2.VIDIOC_QBUF:
+            self.queued.append(arg.index)
+        elif request == v4l2.VIDIOC_DQBUF:
+            if not self.done:
+                raise OSError(errno.EAGAIN, "Resource temporarily unavailable")
+            index, sequence, timestamp, size = self.done.popleft()
+            arg.index, arg.sequence, arg.bytesused = index, sequence, size
+            arg.timestamp.tv_sec, arg.timestamp.tv_usec = int(timestamp), int((timestamp % 1) * 1e6)
+            arg.flags = v4l2.V4L2_BUF_FLAG_TIMESTAMP_MONOTONIC
+        elif request == v4l2.VIDIOC_STREAMON:
+            self.streaming = True
+        elif request == v4l2.VIDIOC_STREAMOFF:
+            self.streaming = False
+
+    def _fill_format(self, pix):
+        pix.width, pix.height = self.width, self.height
+        pix.pixelformat = fourcc_code(self.fourcc)
+        pix.bytesperline = self.bytesperline
+        pix.sizeimage = self.bytesperline * self.height
+
+    # --- Test helpers ---
+
+    def produce(self, image, timestamp=None):
+        """Writes one frame into the next queued buffer (dropped if none is queued)."""
+        sequence, self.sequence = self.sequence, self.sequence + 1
+        if not self.queued:
+            return
+        index = self.queued.popleft()
+        rows = image.reshape(self.height, -1)
+        padded = np.zeros((self.height, self.bytesperline), dtype=np.uint8)
+        padded[:, :rows.shape[1]] = rows
+        os.pwrite(self.file.fileno(), padded.tobytes(), index * self.buffer_size)
+        self.done.append((index, sequence, time.monotonic() if timestamp is None else timestamp, padded.size))
+
+
+class TestV4L2Capture(unittest.TestCase):
+    def setUp(self):
+        self.device = FakeV4L2Device()
+        self.capture = v4l2.V4L2Capture(0, mode=CaptureMode("BGR3", 64, 48, 60), buffers=4, timeout=0.05,
+                                        device=self.device)
+
+    def tearDown(self):
+        self.capture.release()
+        self.device.file.close()
+
+    def image(self, value):
+        return np.full((48, 64, 3), value, dtype=np.uint8)
+
+    def test_configures_mode_and_streams(self):
+        self.capture._open_camera()
+        self.assertEqual(self.capture.active_mode, CaptureMode("BGR3", 64, 48, 60))
+        self.assertTrue(self.device.streaming)
+        self.assertEqual(len(self.device.queued), 4)
+
+    def test_returns_newest_frame(self):
+        self.capture._open_camera()
+        self.device.produce(self.image(10))
+        self.assertEqual(int(self.capture.capture_frame()[0, 0, 0]), 10)
+        for value in (20, 30, 40):
+            self.device.produce(self.image(value))
+        frame = self.capture.capture_frame()
+        self.assertEqual(frame.shape, (48, 64, 3))
+        self.assertEqual(int(frame[0, 0, 0]), 40)
+        self.assertEqual(self.capture.last_sequence, 3)
+        self.assertEqual(self.capture.dropped, 2)
+        self.assertEqual(len(self.device.queued), 3)  # Stale buffers went back to the driver
+
+    def test_raw_view_is_zero_copy(self):
+        self.capture._open_camera()
+        self.device.produce(self.image(7))
+        raw = self.capture.capture_raw()
+        self.assertEqual(raw["bytesperline"], 64 * 3 + 16)
+        self.assertEqual(int(raw["data"][0]), 7)
+        # The driver writing into the mapped buffer is visible through the view
+        index = self.capture._held.index
+        os.pwrite(self.device.file.fileno(), b"\x63", index * self.device.buffer_size)
+        self.assertEqual(int(raw["data"][0]), 99)
+
+    def test_hardware_timestamps(self):
+        self.capture._open_camera()
+        start = time.monotonic() - 0.1
+        for i in range(4):
+            self.device.produce(self.image(i), timestamp=start + i / 60.0)
+            raw = self.capture.capture_raw()
+        self.assertAlmostEqual(raw["timestamp"], start + 3 / 60.0, places=5)
+        self.assertGreater(raw["age"], 0.0)
+        self.assertAlmostEqual(self.capture.measured_fps(), 60.0, delta=0.5)
+
+    def test_timeout_without_frames(self):
+        with self.assertRaises(RuntimeError) as cm:
+            self.capture.capture_frame()
+        self.assertIn("Failed to grab frame", str(cm.exception))
+
+    def test_release_with_outstanding_view(self):
+        self.capture._open_camera()
+        self.device.produce(self.image(5))
+        raw = self.capture.capture_raw()
+        self.capture.release()
+        self.assertFalse(self.device.streaming)
+        self.assertTrue(self.device.closed)
+        self.assertIn(v4l2.VIDIOC_REQBUFS, self.device.calls)
+        del raw
+
+    def test_grey_conversion(self):
+        gray = np.arange(48 * 64, dtype=np.uint8).reshape(48, 64)
+        data = np.zeros((48, 80), dtype=np.uint8)
+        data[:, :64] = gray
+        frame = v4l2.to_bgr(data.ravel(), CaptureMode("GREY", 64, 48), bytesperline=80)
+        self.assertTrue(np.array_equal(frame[..., 1], gray))
+
+    @unittest.skipIf(real_cv2 is None, "OpenCV not installed")
+    def test_yuyv_conversion(self):
+        # Y=200 with neutral chroma is a light gray (limited range: (200 - 16) * 255 / 219)
+        packed = np.tile(np.array([200, 128], dtype=np.uint8), 48 * 64)
+        with patch.object(v4l2, "cv2", real_cv2):
+            frame = v4l2.to_bgr(packed, CaptureMode("YUYV", 64, 48))
+        self.assertEqual(frame.shape, (48, 64, 3))
+        self.assertTrue(np.all(np.abs(frame.astype(int) - 214) <= 2))
+
+if __name__ == '__main__':
+    unittest.main()
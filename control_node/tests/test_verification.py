@@ -0,0 +1,90 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import sys
+import os
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from verification import TypingVerifier, find_changed_band
+
+PROMPT = "C:\\> "
+
+class FakeTarget:
+    """A one-line console: typed characters are drawn as columns in rows 20-30."""
+    def __init__(self, wrong_chars=None):
+        self.line = PROMPT
+        self.wrong_chars = dict(wrong_chars or {})
+        self.backspaces = 0
+
+    def type_text(self, text, delay_mean=0.0, delay_std=0.0):
+        for ch in text:
+            if ch == '\b':
+                self.backspaces += 1
+                if len(self.line) > len(PROMPT):
+                    self.line = self.line[:-1]
+            elif ch in self.wrong_chars:
+                # Mistyped once (e.g. layout mismatch), correct afterwards
+                self.line += self.wrong_chars.pop(ch)
+            else:
+                self.line += ch
+
+    def capture_frame(self):
+        frame = np.zeros((60, 200, 3), dtype=np.uint8)
+        for i, ch in enumerate(self.line):
+            frame[20:30, i] = 50 + ord(ch) % 200
+        return frame
+
+class TestVerification(unittest.TestCase):
+    def setUp(self):
+        self.pipeline = MagicMock()
+        self.ocr_heights = []
+
+        def ocr(frame, region=None):
+            self.ocr_heights.append(region[3] if region else frame.shape[0])
+            return self.target.line
+        self.pipeline.read_text.side_effect = ocr
+
+    def make_verifier(self, target):
+        self.target = target
+        return TypingVerifier(target, target, self.pipeline, chunk_size=8, settle=0)
+
+    def test_changed_band(self):
+        a = np.zeros((50, 50), dtype=np.uint8)
+        b = a.copy()
+        b[10:14, 5:20] = 255
+        b[40, 0] = 255  # small unrelated change
+        self.assertEqual(find_changed_band(a, b), (10, 14))
+        self.assertIsNone(find_changed_band(a, a))
+
+    @patch('verification.time.sleep')
+    def test_clean_typing_uses_strip_only(self, mock_sleep):
+        verifier = self.make_verifier(FakeTarget())
+        result = verifier.type_and_verify("echo hello world")
+        self.assertTrue(result["verified"])
+        self.assertEqual(result["corrections"], 0)
+        self.assertEqual(result["full_ocr_passes"], 0)
+        self.assertTrue(all(h < 60 for h in self.ocr_heights))
+        self.assertEqual(self.target.line, PROMPT + "echo hello world")
+
+    @patch('verification.time.sleep')
+    def test_only_wrong_suffix_is_corrected(self, mock_sleep):
+        verifier = self.make_verifier(FakeTarget(wrong_chars={'z': 'y'}))
+        result = verifier.type_and_verify("echo zebra")
+        self.assertTrue(result["verified"])
+        self.assertEqual(result["corrections"], 1)
+        # "echo yeb" was on screen: only "yeb" is erased, "echo " stays
+        self.assertEqual(self.target.backspaces, 3)
+        self.assertEqual(self.target.line, PROMPT + "echo zebra")
+
+    @patch('verification.time.sleep')
+    def test_gives_up_after_max_corrections(self, mock_sleep):
+        target = FakeTarget()
+        target.type_text = lambda text, **kw: setattr(target, 'line', target.line + text.replace('a', 'o'))
+        verifier = self.make_verifier(target)
+        result = verifier.type_and_verify("aaaa")
+        self.assertFalse(result["verified"])
+        self.assertEqual(result["corrections"], verifier.max_corrections)
+
+if __name__ == '__main__':
+    unittest.main()
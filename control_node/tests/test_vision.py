@@ -4,23 +4,27 @@ import sys
 import os
 import numpy as np
 
-# Mock cv2 and pytesseract BEFORE importing vision
-# We need to assign them to sys.modules so `import cv2` works inside vision.py
-# AND we need to ensure that when `from vision import ...` happens, it sees these mocks.
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+import vision
+import capture_modes
+from vision import VisionPipeline, ScreenCapture, OCRResult, propose_regions
 
+# cv2 and pytesseract are resolved through module attributes on first use,
+# so the mocks are patched in where vision and capture_modes look them up
 mock_cv2 = MagicMock()
 mock_pytesseract = MagicMock()
-sys.modules['cv2'] = mock_cv2
-sys.modules['pytesseract'] = mock_pytesseract
 
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+PATCHERS = [patch.object(vision, "cv2", mock_cv2), patch.object(capture_modes, "cv2", mock_cv2),
+            patch.object(vision, "pytesseract", mock_pytesseract)]
 
-# Force reload of vision to ensure it picks up the mocks if it was already imported
-import vision
-import importlib
-importlib.reload(vision)
+def setUpModule():
+    for patcher in PATCHERS:
+        patcher.start()
 
-from vision import VisionPipeline, ScreenCapture
+def tearDownModule():
+    for patcher in PATCHERS:
+        patcher.stop()
 
 class TestVision(unittest.TestCase):
     def setUp(self):
@@ -46,9 +50,6 @@ class TestVision(unittest.TestCase):
         mock_cv2.THRESH_BINARY = 0
         mock_cv2.THRESH_OTSU = 8
 
-        # When mocking modules in sys.modules, sometimes imports in SUT need reload
-        # but here we rely on existing import.
-
         res = self.pipeline.preprocess_for_ocr(img)
 
         # Check if chain was called
@@ -92,5 +93,118 @@ class TestVision(unittest.TestCase):
         self.capture.release()
         mock_cap.release.assert_called()
 
+def draw_text(frame, x, y, width, lines, color=200):
+    """Draws glyph-like strokes (vertical bar + top bar every 10 px) as fake text lines."""
+    for line in range(lines):
+        top = y + line * 20
+        for cx in range(x, x + width, 10):
+            frame[top:top + 12, cx:cx + 2] = color
+            frame[top:top + 2, cx:cx + 7] = color
+
+class TestRegionProposals(unittest.TestCase):
+    def setUp(self):
+        self.frame = np.zeros((480, 640, 3), dtype=np.uint8)
+        draw_text(self.frame, 16, 16, 300, 3)
+        self.frame[200:400, 300:600] = 180  # dialog box
+        draw_text(self.frame, 330, 240, 200, 2, color=0)
+
+    def test_text_blocks_and_dialog(self):
+        regions = propose_regions(self.frame)
+        kinds = [r["kind"] for r in regions]
+        self.assertEqual(kinds, ["text", "dialog", "text"])
+
+        prompt_block, dialog, dialog_text = regions
+        self.assertLessEqual(prompt_block["x"], 16)
+        self.assertGreaterEqual(prompt_block["x"] + prompt_block["width"], 300)
+        self.assertLessEqual(prompt_block["height"], 64)
+        # Dialog border is not mistaken for text, the dialog's own text is found inside it
+        self.assertTrue(dialog["x"] <= dialog_text["x"] and
+                        dialog_text["x"] + dialog_text["width"] <= dialog["x"] + dialog["width"])
+        self.assertLess(dialog_text["width"] * dialog_text["height"], dialog["width"] * dialog["height"] / 2)
+
+    def test_blank_frame_has_no_regions(self):
+        self.assertEqual(propose_regions(np.zeros((120, 160, 3), dtype=np.uint8)), [])
+
+    def test_regions_cached_per_frame(self):
+        pipeline = VisionPipeline()
+        first = pipeline.propose_regions(self.frame)
+        self.assertIs(pipeline.propose_regions(self.frame), first)
+        self.assertIsNot(pipeline.propose_regions(self.frame.copy()), first)
+
+def tesseract_data(words):
+    """Builds an image_to_data style dict from (text, left, top, width, height, conf, line) tuples."""
+    data = {k: [] for k in ("text", "left", "top", "width", "height", "conf", "block_num", "par_num", "line_num")}
+    # A non-word entry (conf -1) as Tesseract emits for blocks/lines
+    for k, v in zip(data, ("", 0, 0, 0, 0, -1, 1, 1, 0)):
+        data[k].append(v)
+    for text, left, top, width, height, conf, line in words:
+        for k, v in zip(data, (text, left, top, width, height, conf, 1, 1, line)):
+            data[k].append(v)
+    return data
+
+class TestStructuredOCR(unittest.TestCase):
+    def setUp(self):
+        # Coordinates of a 2x upscaled image
+        self.data = tesseract_data([
+            ("C:\\Users>", 20, 40, 200, 30, 91.0, 1),
+            ("Error:", 20, 100, 120, 30, 88.5, 2),
+            ("Access", 160, 100, 120, 30, 77.0, 2),
+            ("denied", 300, 100, 120, 30, 95.0, 2),
+        ])
+
+    def test_boxes_scaled_to_source(self):
+        result = OCRResult.from_tesseract(self.data, scale=0.5, offset=(100, 50))
+        self.assertEqual(result.text, "C:\\Users>\nError: Access denied")
+        self.assertEqual(len(result.words), 4)
+        first = result.words[0]
+        self.assertEqual((first["x"], first["y"], first["width"], first["height"]), (110, 70, 100, 15))
+        line = result.lines[1]
+        self.assertEqual((line["x"], line["width"], line["conf"]), (110, 200, 86.8))
+        self.assertEqual(result.mean_confidence, 87.9)
+
+    def test_find_spans_words(self):
+        result = OCRResult.from_tesseract(self.data, scale=0.5)
+        matches = result.find("access DENIED")
+        self.assertEqual(len(matches), 1)
+        self.assertEqual((matches[0]["x"], matches[0]["width"], matches[0]["conf"]), (80, 130, 77.0))
+        self.assertEqual(result.find("missing"), [])
+
+    def test_recognize_runs_once_per_frame(self):
+        global mock_pytesseract
+        mock_pytesseract.image_to_data.reset_mock()
+        mock_pytesseract.image_to_data.return_value = self.data
+        pipeline = VisionPipeline()
+        frame = np.zeros((100, 300, 3), dtype=np.uint8)
+        with patch.object(pipeline, 'preprocess_for_ocr', side_effect=lambda img: np.zeros((img.shape[0] * 2, img.shape[1] * 2))):
+            cropped = pipeline.recognize(frame, [10, 20, 100, 50])  # Region first: its own pass
+            first = pipeline.recognize(frame)
+            self.assertIs(pipeline.recognize(frame), first)
+        self.assertEqual(mock_pytesseract.image_to_data.call_count, 2)
+        self.assertEqual((first.words[0]["x"], cropped.words[0]["x"]), (10, 20))
+
+    def test_tesseract_runs_once_per_frame_for_all_readers(self):
+        from verification import TypingVerifier
+        from macro import MacroRunner
+        global mock_pytesseract
+        mock_pytesseract.image_to_data.reset_mock()
+        mock_pytesseract.image_to_string.reset_mock()
+        mock_pytesseract.image_to_data.return_value = self.data
+        pipeline = VisionPipeline()
+        frame = np.zeros((100, 300, 3), dtype=np.uint8)
+        with patch.object(pipeline, 'preprocess_for_ocr', side_effect=lambda img: np.zeros((img.shape[0] * 2, img.shape[1] * 2))):
+            full = pipeline.read_text(frame)  # capture_screen(mode="ocr_text")
+            data = pipeline.recognize(frame)  # capture_screen(mode="ocr_data"), find_text
+            band = TypingVerifier(MagicMock(), MagicMock(), pipeline)._ocr(frame, (45, 70))
+            region = MacroRunner(MagicMock(), lambda: frame, pipeline)._ocr([0, 0, 300, 40])
+        self.assertEqual(mock_pytesseract.image_to_data.call_count, 1)
+        mock_pytesseract.image_to_string.assert_not_called()
+        self.assertEqual(full, data.text)
+        self.assertEqual((band, region), ("Error: Access denied", "C:\\Users>"))
+
+    def test_within_regroups_lines(self):
+        result = OCRResult.from_tesseract(self.data, scale=0.5).within([70, 40, 200, 20])
+        self.assertEqual(result.text, "Access denied")
+        self.assertEqual((result.lines[0]["x"], result.words[0]["line"]), (80, 0))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,213 @@
+import unittest
+import json
+import sys
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from vlm_client import VLMClient, frame_hash
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Stand-in for Ollama's /api/generate, streaming NDJSON over chunked HTTP/1.1."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length))
+        server = self.server
+        server.requests.append(payload)
+        server.connections.add(self.client_address)
+        with server.lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            server.gate.wait(5)
+            self._respond(server, payload)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def _respond(self, server, payload):
+        if server.fail:
+            body = b'{"error": "model not found"}'
+            self.send_response(404)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        tokens = (server.tokens if not server.echo else [payload["images"][0]]) + [""]
+        for i, token in enumerate(tokens):
+            line = (json.dumps({"response": token, "done": i == len(tokens) - 1}) + "\n").encode()
+            self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class TestVLMClient(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllamaHandler)
+        self.server.requests = []
+        self.server.connections = set()
+        self.server.tokens = ["A command ", "prompt ", "is open."]
+        self.server.fail = False
+        self.server.echo = False
+        self.server.gate = threading.Event()
+        self.server.gate.set()
+        self.server.lock = threading.Lock()
+        self.server.active = 0
+        self.server.max_active = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.client = VLMClient(base_url=url, model="llava", api_key="", max_in_flight=1)
+
+        self.frame = np.zeros((60, 80, 3), dtype=np.uint8)
+        self.frame[10:20, 5:60] = 200  # a line of "text"
+
+    def tearDown(self):
+        self.client.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_streams_tokens_incrementally(self):
+        received = []
+        result = self.client.analyze_image("aW1n", frame=self.frame, on_token=received.append)
+        self.assertEqual(result, "A command prompt is open.")
+        self.assertEqual(received, ["A command ", "prompt ", "is open."])
+        self.assertTrue(self.server.requests[0]["stream"])
+        self.assertEqual(self.server.requests[0]["images"], ["aW1n"])
+
+    def test_unchanged_screen_hits_cache(self):
+        first = self.client.analyze_image("aW1n", frame=self.frame)
+        noisy = np.clip(self.frame.astype(int) + np.random.randint(-3, 4, self.frame.shape), 0, 255).astype(np.uint8)
+        second = self.client.analyze_image("b3RoZXJqcGVn", frame=noisy)
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.client.stats()["cache_hits"], 1)
+
+    def test_changed_screen_or_prompt_misses_cache(self):
+        self.client.analyze_image("aW1n", frame=self.frame)
+        self.client.analyze_image("aW1n", prompt="Is a dialog open?", frame=self.frame)
+        changed = self.frame.copy()
+        changed[35:45, 5:60] = 200  # a new line of output
+        self.client.analyze_image("aW1n", frame=changed)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_connection_reused(self):
+        self.client.clear_cache()
+        for i in range(3):
+            self.client.analyze_image(f"img{i}")
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_errors_not_cached(self):
+        self.server.fail = True
+        result = self.client.analyze_image("aW1n", frame=self.frame)
+        self.assertTrue(result.startswith("Error: Failed to contact VLM."))
+        self.server.fail = False
+        self.assertEqual(self.client.analyze_image("aW1n", frame=self.frame), "A command prompt is open.")
+        self.assertEqual(self.client.stats()["errors"], 1)
+
+    def _frame(self, row):
+        frame = np.zeros((60, 80, 3), dtype=np.uint8)
+        frame[row:row + 6, 5:60] = 200
+        return frame
+
+    def test_identical_requests_coalesced(self):
+        self.server.gate.clear()
+        received = []
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [pool.submit(self.client.analyze_image, "aW1n", frame=self.frame, on_token=received.append)
+                       for _ in range(4)]
+            time.sleep(0.2)
+            self.server.gate.set()
+            results = [f.result(timeout=5) for f in futures]
+
+        self.assertEqual(results, ["A command prompt is open."] * 4)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(len(received), 12)  # every caller sees the streamed tokens
+        self.assertEqual(self.client.stats()["coalesced"], 3)
+
+    def test_backend_concurrency_capped(self):
+        self.server.echo = True
+        self.server.gate.clear()
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            futures = [pool.submit(self.client.analyze_image, f"img{i}", frame=self._frame(10 * i), source=f"t{i}")
+                       for i in range(3)]
+            time.sleep(0.2)
+            self.assertEqual(self.client.stats()["queued"], 2)
+            self.server.gate.set()
+            results = [f.result(timeout=5) for f in futures]
+
+        self.assertEqual(results, ["img0", "img1", "img2"])
+        self.assertEqual(self.server.max_active, 1)
+
+    def test_stale_frames_superseded(self):
+        self.server.echo = True
+        self.server.gate.clear()
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            running = pool.submit(self.client.analyze_image, "frame1", frame=self._frame(5), source="rack-a")
+            time.sleep(0.1)
+            stale = pool.submit(self.client.analyze_image, "frame2", frame=self._frame(20), source="rack-a")
+            time.sleep(0.1)
+            newest = pool.submit(self.client.analyze_image, "frame3", frame=self._frame(35), source="rack-a")
+            time.sleep(0.1)
+            self.server.gate.set()
+            results = [f.result(timeout=5) for f in (running, stale, newest)]
+
+        # The stale frame never reaches the backend; its caller gets the newest answer
+        self.assertEqual(results, ["frame1", "frame3", "frame3"])
+        self.assertEqual([r["images"][0] for r in self.server.requests], ["frame1", "frame3"])
+        self.assertEqual(self.client.stats()["superseded"], 1)
+
+    def test_superseded_request_leaves_queue(self):
+        self.server.echo = True
+        self.server.gate.clear()
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            running = pool.submit(self.client.analyze_image, "frame1", frame=self._frame(5), source="rack-a")
+            time.sleep(0.1)
+            stale = pool.submit(self.client.analyze_image, "frame2", frame=self._frame(20), source="rack-a")
+            time.sleep(0.1)
+            newest = pool.submit(self.client.analyze_image, "frame3", frame=self._frame(35), source="rack-a")
+            time.sleep(0.1)
+            # The stale caller gave up its place while the first request is still running
+            self.assertEqual(self.client.stats()["queued"], 1)
+            self.assertFalse(running.done())
+            self.server.gate.set()
+            self.assertEqual(stale.result(timeout=5), newest.result(timeout=5))
+
+    def test_queue_full_rejects(self):
+        self.client.max_queued = 1
+        self.server.gate.clear()
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            first = pool.submit(self.client.analyze_image, "img0", frame=self._frame(5))
+            second = pool.submit(self.client.analyze_image, "img1", frame=self._frame(20))
+            time.sleep(0.2)
+            rejected = self.client.analyze_image("img2", frame=self._frame(35))
+            self.server.gate.set()
+            first.result(timeout=5)
+            second.result(timeout=5)
+        self.assertIn("VLM busy", rejected)
+        self.assertEqual(self.client.stats()["rejected"], 1)
+
+    def test_frame_hash_is_stable(self):
+        self.assertEqual(frame_hash(self.frame), frame_hash(self.frame.copy()))
+        self.assertEqual(len(frame_hash(self.frame)), 64)
+
+if __name__ == '__main__':
+    unittest.main()
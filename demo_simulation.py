@@ -30,6 +30,8 @@ from server import capture_screen_impl, inject_keystrokes_impl, execute_shortcut
 import server
 import hid
 
+target = server.registry.get()
+
 # 2. Configure Mock Behaviors
 # State Machine with specific behaviors
 current_screen_state = "cmd_prompt"
@@ -37,12 +39,12 @@ screen_text_buffer = "C:\\Users\\Admin>"
 layout_simulation_mode = "US" # The 'physical' keyboard layout of the target
 # The 'injector' layout is what we THINK we are sending.
 
-def mock_get_text(image, config=None):
+def mock_get_text(frame, region=None):
     global screen_text_buffer
     return screen_text_buffer
 
-server.pipeline.extract_text = mock_get_text
-server.pipeline.encode_image = lambda x: f"[IMAGE_DATA]"
+target.pipeline.read_text = mock_get_text
+target.pipeline.encode_image = lambda x: f"[IMAGE_DATA]"
 
 # Mock HID to update the buffer
 def mock_type_text(text, delay_mean=0.1, delay_std=0.0):
@@ -50,7 +52,7 @@ def mock_type_text(text, delay_mean=0.1, delay_std=0.0):
     print(f"   [HID] Typing: '{text}'")
 
     # Simulate Layout Mismatch
-    is_server_de = isinstance(server.injector.layout, hid.GermanISO)
+    is_server_de = isinstance(target.injector.layout, hid.GermanISO)
 
     output_text = ""
     for char in text:
@@ -64,7 +66,7 @@ def mock_type_text(text, delay_mean=0.1, delay_std=0.0):
 
     screen_text_buffer += output_text
 
-server.injector.type_text = mock_type_text
+target.injector.type_text = mock_type_text
 
 def mock_press_sequence(mods, key):
     global screen_text_buffer
@@ -76,21 +78,30 @@ def mock_press_sequence(mods, key):
          print("   [SIM] Ctrl+C received, clearing buffer")
          screen_text_buffer = "C:\\Users\\Admin>" # Clear screen
 
-server.injector.press_sequence = mock_press_sequence
+target.injector.press_sequence = mock_press_sequence
 
 # 3. Run the Agent Loop Scenario
+def succeeded(result):
+    """Tool implementations report failures as 'Error ...' strings instead of raising."""
+    return not str(result).startswith("Error")
+
 def run_scenario():
     print("\n--- Starting Agent Scenario ---")
 
     # Step 1: Type with verification (feature 1)
     print("\n1. Testing Visual Verification...")
     try:
-        inject_keystrokes_impl("echo test_verification", verify=True)
-        print("   [SUCCESS] Verification passed.")
+        result = inject_keystrokes_impl("echo test_verification", verify=True)
+        if succeeded(result):
+            print(f"   [SUCCESS] Verification passed: {result}")
+        else:
+            print(f"   [FAILURE] Verification failed: {result}")
     except Exception as e:
         print(f"   [FAILURE] Verification failed: {e}")
 
-    execute_shortcut_impl([], "ENTER")
+    result = execute_shortcut_impl([], "ENTER")
+    if not succeeded(result):
+        print(f"   [FAILURE] Shortcut failed: {result}")
 
     # Step 2: Directory Scan (feature 3)
     print("\n2. Testing Directory Scan...")
@@ -102,11 +113,14 @@ def run_scenario():
     try:
         result = scan_directory_impl(".")
         print(f"   [SCAN] Result: {result}")
+        if not succeeded(result):
+            print("   [FAILURE] Directory scan failed.")
+            return
 
         # Verify parser logic
         import json
-        last_log = sorted(os.listdir("logs"))[-1]
-        with open(f"logs/{last_log}", 'r') as f:
+        saved_path = result.split("Structure saved to ", 1)[1].split(". Found ", 1)[0]
+        with open(saved_path, 'r') as f:
             data = json.load(f)
             file_names = [f['name'] for f in data['files']]
             print(f"   [DEBUG] Files found: {file_names}")